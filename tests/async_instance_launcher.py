@@ -0,0 +1,32 @@
+"""The UnitTest asyncio Instance Launcher.
+
+An 'AsyncInstanceLauncher' that uses the UnitTest Instance Launcher
+(the 'UnitTestInstanceLauncher') to run Jobs. Jobs are run in a thread
+so they do not block the event loop, but only one at a time - every Job
+runs in the same (simulated) project directory.
+"""
+
+import asyncio
+import threading
+from typing import Any
+
+from tests.instance_launcher import UnitTestInstanceLauncher
+from workflow.workflow_abc import AsyncInstanceLauncher, LaunchParameters, LaunchResult
+
+
+class UnitTestAsyncInstanceLauncher(AsyncInstanceLauncher):
+    """A unit test asyncio instance launcher."""
+
+    def __init__(self, instance_launcher: UnitTestInstanceLauncher):
+        super().__init__()
+        self._instance_launcher = instance_launcher
+        self._lock = threading.Lock()
+
+    async def launch(
+        self, *, launch_parameters: LaunchParameters, **kwargs: Any
+    ) -> LaunchResult:
+        return await asyncio.to_thread(self._launch, launch_parameters)
+
+    def _launch(self, launch_parameters: LaunchParameters) -> LaunchResult:
+        with self._lock:
+            return self._instance_launcher.launch(launch_parameters=launch_parameters)
@@ -0,0 +1,146 @@
+"""The UnitTest asyncio API Adapter.
+
+An 'AsyncWorkflowAPIAdapter' that uses the UnitTest API Adapter
+(the 'UnitTestWorkflowAPIAdapter') to do the work. Each call can be delayed
+(to simulate the latency of a database query) and the adapter records the
+largest number of calls that were in progress at the same time - which is how
+tests can tell whether the engine made its calls concurrently.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+from tests.wapi_adapter import UnitTestWorkflowAPIAdapter
+from workflow.workflow_abc import AsyncWorkflowAPIAdapter
+
+
+class UnitTestAsyncWorkflowAPIAdapter(AsyncWorkflowAPIAdapter):
+    """A minimal asyncio API adapter, backed by a UnitTest API adapter."""
+
+    def __init__(self, wapi_adapter: UnitTestWorkflowAPIAdapter, latency_s=0.0):
+        super().__init__()
+        self._wapi_adapter = wapi_adapter
+        self._latency_s = latency_s
+        self._calls_in_progress = 0
+        self.max_concurrent_calls = 0
+
+    @asynccontextmanager
+    async def _call(self) -> AsyncIterator[None]:
+        """Wraps every call, simulating its latency."""
+        self._calls_in_progress += 1
+        self.max_concurrent_calls = max(
+            self.max_concurrent_calls, self._calls_in_progress
+        )
+        try:
+            await asyncio.sleep(self._latency_s)
+            yield
+        finally:
+            self._calls_in_progress -= 1
+
+    async def get_workflow(self, *, workflow_id: str) -> tuple[dict[str, Any], int]:
+        async with self._call():
+            return self._wapi_adapter.get_workflow(workflow_id=workflow_id)
+
+    async def get_running_workflow(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        async with self._call():
+            return self._wapi_adapter.get_running_workflow(
+                running_workflow_id=running_workflow_id
+            )
+
+    async def get_running_steps(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        async with self._call():
+            return self._wapi_adapter.get_running_steps(
+                running_workflow_id=running_workflow_id
+            )
+
+    async def get_status_of_all_step_instances_by_name(
+        self, *, name: str, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        async with self._call():
+            return self._wapi_adapter.get_status_of_all_step_instances_by_name(
+                name=name, running_workflow_id=running_workflow_id
+            )
+
+    async def get_status_of_all_step_instances(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        async with self._call():
+            return self._wapi_adapter.get_status_of_all_step_instances(
+                running_workflow_id=running_workflow_id
+            )
+
+    async def set_running_workflow_done(
+        self,
+        *,
+        running_workflow_id: str,
+        success: bool,
+        error_num: int | None = None,
+        error_msg: str | None = None,
+    ) -> None:
+        async with self._call():
+            self._wapi_adapter.set_running_workflow_done(
+                running_workflow_id=running_workflow_id,
+                success=success,
+                error_num=error_num,
+                error_msg=error_msg,
+            )
+
+    async def get_running_workflow_step(
+        self, *, running_workflow_step_id: str
+    ) -> tuple[dict[str, Any], int]:
+        async with self._call():
+            return self._wapi_adapter.get_running_workflow_step(
+                running_workflow_step_id=running_workflow_step_id
+            )
+
+    async def get_running_workflow_step_by_name(
+        self, *, name: str, running_workflow_id: str, replica: int = 0
+    ) -> tuple[dict[str, Any], int]:
+        async with self._call():
+            return self._wapi_adapter.get_running_workflow_step_by_name(
+                name=name, running_workflow_id=running_workflow_id, replica=replica
+            )
+
+    async def set_running_workflow_step_done(
+        self,
+        *,
+        running_workflow_step_id: str,
+        success: bool,
+        error_num: int | None = None,
+        error_msg: str | None = None,
+    ) -> None:
+        async with self._call():
+            self._wapi_adapter.set_running_workflow_step_done(
+                running_workflow_step_id=running_workflow_step_id,
+                success=success,
+                error_num=error_num,
+                error_msg=error_msg,
+            )
+
+    async def get_instance(self, *, instance_id: str) -> tuple[dict[str, Any], int]:
+        async with self._call():
+            return self._wapi_adapter.get_instance(instance_id=instance_id)
+
+    async def get_job(
+        self, *, collection: str, job: str, version: str
+    ) -> tuple[dict[str, Any], int]:
+        async with self._call():
+            return self._wapi_adapter.get_job(
+                collection=collection, job=job, version=version
+            )
+
+    async def get_running_workflow_step_output_values_for_output(
+        self, *, running_workflow_step_id: str, output_variable: str
+    ) -> tuple[dict[str, Any], int]:
+        async with self._call():
+            return (
+                self._wapi_adapter.get_running_workflow_step_output_values_for_output(
+                    running_workflow_step_id=running_workflow_step_id,
+                    output_variable=output_variable,
+                )
+            )
@@ -0,0 +1,521 @@
+"""The engine benchmark.
+
+Runs synthetic workflows (see 'tests/synthetic_workflows.py') through the
+'WorkflowEngine', using the in-memory (or SQLite) API adapter and a launcher
+that runs nothing (its Instances finish as soon as they're launched). The engine is given
+the START message of a running workflow, and then the Pod message of every
+Instance that's launched, until there are none left.
+
+For each workflow the benchmark reports (as JSON) the number of messages the
+engine handled per second, the number of API adapter calls it made for each
+message, and the peak memory it (and the adapter) allocated.
+The messages/second come from a run of its own - the calls and memory are
+measured in a second run, as measuring them slows the engine down.
+
+With '--workers' a number of copies of each workflow are run (at the same time)
+through a 'ShardedWorkflowEngine' with that many worker processes instead,
+using an SQLite database (file) the workers share. Each launch can be made to take
+a while ('--launch-latency'), like one that waits for a Kubernetes API call,
+which is what several workers help with. Only the messages/second are reported.
+
+Run it (from the project root) with: -
+
+    python -m tests.engine_benchmark --output benchmark.json
+
+or, to see what several workers do for a (slow) launcher: -
+
+    python -m tests.engine_benchmark chain:2 --workers 1 --launch-latency 0.1
+    python -m tests.engine_benchmark chain:2 --workers 4 --launch-latency 0.1
+
+and use '--help' to see how to choose the workflows and their sizes.
+Compare the output of two versions of the engine to see what a change did.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from importlib.metadata import PackageNotFoundError, version
+from multiprocessing import Queue
+from typing import Any, Callable
+
+from informaticsmatters.protobuf.datamanager.pod_message_pb2 import PodMessage
+from informaticsmatters.protobuf.datamanager.workflow_message_pb2 import WorkflowMessage
+
+from tests.config import TEST_PROJECT_ID
+from tests.memory_wapi_adapter import MemoryWorkflowAPIAdapter
+from tests.sqlite_wapi_adapter import SQLiteWorkflowAPIAdapter
+from tests.synthetic_workflows import (
+    SyntheticWorkflow,
+    get_chain,
+    get_dag,
+    get_diamond,
+    get_fan_out,
+)
+from workflow.sharded_workflow_engine import ShardedWorkflowEngine
+from workflow.workflow_abc import InstanceLauncher, LaunchParameters, LaunchResult
+from workflow.workflow_engine import WorkflowEngine
+from workflow.workflow_instrumentation import InstrumentedWorkflowAPIAdapter
+
+# The workflows (and their default sizes) the benchmark can run
+WORKFLOWS: dict[str, tuple[Callable[[int], SyntheticWorkflow], int]] = {
+    "chain": (get_chain, 200),
+    "diamond": (get_diamond, 500),
+    "dag": (get_dag, 1000),
+    "fan-out": (get_fan_out, 10000),
+}
+# The API adapters the benchmark can use
+ADAPTERS: tuple[str, ...] = ("memory", "sqlite")
+
+BenchmarkAdapter = MemoryWorkflowAPIAdapter | SQLiteWorkflowAPIAdapter
+
+
+class NoOpInstanceLauncher(InstanceLauncher):
+    """A launcher that creates the DM records of the Instances it's asked to launch
+    but runs nothing. Every Instance finishes (successfully) as soon as it's
+    launched - its ID is added to 'finished', for a Pod message to be sent."""
+
+    def __init__(self, *, wapi_adapter: BenchmarkAdapter):
+        self._wapi_adapter = wapi_adapter
+        self.finished: deque[str] = deque()
+
+    def launch(self, *, launch_parameters: LaunchParameters) -> LaunchResult:
+        instance_id = self._wapi_adapter.create_instance()["id"]
+        response, _ = self._wapi_adapter.create_running_workflow_step(
+            running_workflow_id=launch_parameters.running_workflow_id,
+            step=launch_parameters.step_name,
+            instance_id=instance_id,
+            replica=launch_parameters.step_replication_number,
+            replicas=launch_parameters.total_number_of_replicas,
+        )
+        if response.get("already_exists"):
+            return LaunchResult(
+                already_launched=True, running_workflow_step_id=response["id"]
+            )
+        self._wapi_adapter.set_running_workflow_step_variables(
+            running_workflow_step_id=response["id"],
+            variables=launch_parameters.variables,
+        )
+        self._wapi_adapter.set_instance_running_workflow_step_id(
+            instance_id=instance_id, running_workflow_step_id=response["id"]
+        )
+        self.finished.append(instance_id)
+        return LaunchResult(
+            running_workflow_step_id=response["id"], instance_id=instance_id
+        )
+
+
+class QueueingInstanceLauncher(NoOpInstanceLauncher):
+    """A 'NoOpInstanceLauncher' for the workers of a 'ShardedWorkflowEngine'.
+    Each launch takes (at least) 'launch_latency' seconds, and the IDs of
+    the (finished) Instances are put on a (multiprocessing) queue, for the process
+    that routes messages to send their Pod messages."""
+
+    def __init__(
+        self,
+        *,
+        wapi_adapter: BenchmarkAdapter,
+        launch_latency: float,
+        finished_queue: "Queue[str]",
+    ):
+        super().__init__(wapi_adapter=wapi_adapter)
+        self._launch_latency = launch_latency
+        self._finished_queue = finished_queue
+
+    def launch(self, *, launch_parameters: LaunchParameters) -> LaunchResult:
+        time.sleep(self._launch_latency)
+        result = super().launch(launch_parameters=launch_parameters)
+        while self.finished:
+            self._finished_queue.put(self.finished.popleft())
+        return result
+
+
+class ShardedEngineFactory:
+    """Creates the engines of a 'ShardedWorkflowEngine' (one for each worker,
+    and one that routes messages), each with its own connection to the database.
+    A class (rather than a closure) so that it can be pickled."""
+
+    def __init__(
+        self,
+        *,
+        database: str,
+        workflow: SyntheticWorkflow,
+        stateful: bool,
+        launch_latency: float,
+        finished_queue: "Queue[str]",
+    ):
+        self._database = database
+        self._job_definitions = workflow.job_definitions
+        self._stateful = stateful
+        self._launch_latency = launch_latency
+        self._finished_queue = finished_queue
+
+    def __call__(self) -> WorkflowEngine:
+        da = SQLiteWorkflowAPIAdapter(
+            database=self._database, job_definitions=self._job_definitions
+        )
+        launcher = QueueingInstanceLauncher(
+            wapi_adapter=da,
+            launch_latency=self._launch_latency,
+            finished_queue=self._finished_queue,
+        )
+        return WorkflowEngine(
+            wapi_adapter=da, instance_launcher=launcher, stateful=self._stateful
+        )
+
+
+def _get_start_message(r_wfid: str) -> WorkflowMessage:
+    msg = WorkflowMessage()
+    msg.timestamp = f"{datetime.now(timezone.utc).isoformat()}Z"
+    msg.action = "START"
+    msg.running_workflow = r_wfid
+    return msg
+
+
+def _get_pod_message(instance_id: str) -> PodMessage:
+    msg = PodMessage()
+    msg.timestamp = f"{datetime.now(timezone.utc).isoformat()}Z"
+    msg.phase = "Completed"
+    msg.instance = instance_id
+    msg.has_exit_code = True
+    msg.exit_code = 0
+    return msg
+
+
+def _run(
+    workflow: SyntheticWorkflow,
+    *,
+    stateful: bool,
+    batch_size: int,
+    latency: float,
+    adapter: str,
+    instrument: bool,
+) -> tuple[int, float, BenchmarkAdapter, InstrumentedWorkflowAPIAdapter | None]:
+    """Runs a workflow, returning the number of messages handled, the time
+    it took, the adapter, and (if 'instrument' is set) the instrumented adapter
+    the engine used."""
+    da: BenchmarkAdapter = (
+        SQLiteWorkflowAPIAdapter(job_definitions=workflow.job_definitions)
+        if adapter == "sqlite"
+        else MemoryWorkflowAPIAdapter(
+            job_definitions=workflow.job_definitions, latency=latency
+        )
+    )
+    ia: InstrumentedWorkflowAPIAdapter | None = (
+        InstrumentedWorkflowAPIAdapter(da) if instrument else None
+    )
+    launcher = NoOpInstanceLauncher(wapi_adapter=da)
+    engine = WorkflowEngine(
+        wapi_adapter=ia or da, instance_launcher=launcher, stateful=stateful
+    )
+
+    r_wfid: str = _create_running_workflows(da, workflow, 1)[0]
+
+    messages: int = 1
+    start: float = time.perf_counter()
+    with ia.message("START") if ia else nullcontext():
+        engine.handle_message(_get_start_message(r_wfid))
+    while launcher.finished:
+        batch: list[PodMessage] = [
+            _get_pod_message(launcher.finished.popleft())
+            for _ in range(min(batch_size, len(launcher.finished)))
+        ]
+        messages += len(batch)
+        with ia.message("Pod") if ia else nullcontext():
+            if len(batch) == 1:
+                engine.handle_message(batch[0])
+            else:
+                engine.handle_messages(batch)
+    seconds: float = time.perf_counter() - start
+
+    _assert_succeeded(da, workflow, r_wfid)
+    return messages, seconds, da, ia
+
+
+def _create_running_workflows(
+    da: BenchmarkAdapter, workflow: SyntheticWorkflow, count: int
+) -> list[str]:
+    """Creates 'count' running workflows (of one workflow), returning their IDs."""
+    wf_response = da.create_workflow(workflow_definition=workflow.definition)
+    r_wfids: list[str] = [
+        da.create_running_workflow(
+            user_id="benchmark",
+            workflow_id=wf_response["id"],
+            project_id=TEST_PROJECT_ID,
+            variables=workflow.variables,
+        )["id"]
+        for _ in range(count)
+    ]
+    for mock_output in workflow.mock_outputs:
+        da.mock_get_running_workflow_step_output_values_for_output(**mock_output)
+    return r_wfids
+
+
+def _assert_succeeded(
+    da: BenchmarkAdapter, workflow: SyntheticWorkflow, r_wfid: str
+) -> None:
+    rwf, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    assert rwf["done"] and rwf["success"], f"{workflow.name} failed: {rwf}"
+    launched: int = da.get_running_workflow_steps(running_workflow_id=r_wfid)["count"]
+    assert launched == workflow.instances
+
+
+def run_benchmark(
+    workflow: SyntheticWorkflow,
+    *,
+    stateful: bool = False,
+    batch_size: int = 1,
+    latency: float = 0.0,
+    adapter: str = "memory",
+) -> dict[str, Any]:
+    """Runs a workflow (twice), returning its results. Pod messages are given
+    to the engine 'batch_size' at a time ('handle_messages()'), or one at a time
+    ('handle_message()') if it's 1. With the 'memory' adapter every adapter call
+    takes (at least) 'latency' seconds, to simulate the DM's database,
+    the 'sqlite' adapter uses a real (in-memory) database."""
+    assert batch_size >= 1
+    assert adapter in ADAPTERS
+    assert adapter == "memory" or not latency
+    messages, seconds, _, _ = _run(
+        workflow,
+        stateful=stateful,
+        batch_size=batch_size,
+        latency=latency,
+        adapter=adapter,
+        instrument=False,
+    )
+
+    tracemalloc.start()
+    try:
+        _, _, _, ia = _run(
+            workflow,
+            stateful=stateful,
+            batch_size=batch_size,
+            latency=latency,
+            adapter=adapter,
+            instrument=True,
+        )
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert ia
+    calls: dict[str, int] = {}
+    for message_log in ia.message_logs:
+        for method, count in message_log.call_counts.items():
+            calls[method] = calls.get(method, 0) + count
+    total_calls: int = sum(calls.values())
+
+    return {
+        "workflow": workflow.name,
+        "steps": len(workflow.definition["steps"]),
+        "instances": workflow.instances,
+        "stateful": stateful,
+        "batch_size": batch_size,
+        "latency": latency,
+        "adapter": adapter,
+        "messages": messages,
+        "seconds": round(seconds, 6),
+        "messages_per_second": round(messages / seconds, 1),
+        "adapter_calls": total_calls,
+        "adapter_calls_per_message": round(total_calls / messages, 2),
+        "adapter_calls_by_method": dict(sorted(calls.items())),
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def run_sharded_benchmark(
+    workflow: SyntheticWorkflow,
+    *,
+    workers: int,
+    running_workflows: int = 8,
+    launch_latency: float = 0.0,
+    stateful: bool = False,
+    batch_size: int = 1,
+) -> dict[str, Any]:
+    """Runs 'running_workflows' copies of a workflow (at the same time)
+    through a 'ShardedWorkflowEngine' with 'workers' worker processes,
+    returning its results. Every launch takes (at least) 'launch_latency' seconds.
+    The time includes waiting for the workers to handle every message."""
+    assert workers >= 1
+    assert running_workflows >= 1
+    with tempfile.TemporaryDirectory() as directory:
+        database: str = os.path.join(directory, "wapi.db")
+        da = SQLiteWorkflowAPIAdapter(
+            database=database, job_definitions=workflow.job_definitions
+        )
+        r_wfids: list[str] = _create_running_workflows(da, workflow, running_workflows)
+        finished_queue: "Queue[str]" = Queue()
+        sharded_engine = ShardedWorkflowEngine(
+            engine_factory=ShardedEngineFactory(
+                database=database,
+                workflow=workflow,
+                stateful=stateful,
+                launch_latency=launch_latency,
+                finished_queue=finished_queue,
+            ),
+            workers=workers,
+            batch_size=batch_size,
+        )
+        sharded_engine.start()
+
+        start: float = time.perf_counter()
+        for r_wfid in r_wfids:
+            sharded_engine.handle_message(_get_start_message(r_wfid))
+        for _ in range(running_workflows * workflow.instances):
+            sharded_engine.handle_message(
+                _get_pod_message(finished_queue.get(timeout=60.0))
+            )
+        sharded_engine.stop()
+        seconds: float = time.perf_counter() - start
+
+        for r_wfid in r_wfids:
+            _assert_succeeded(da, workflow, r_wfid)
+
+    messages: int = running_workflows * (workflow.instances + 1)
+    return {
+        "workflow": workflow.name,
+        "steps": len(workflow.definition["steps"]),
+        "instances": workflow.instances,
+        "stateful": stateful,
+        "batch_size": batch_size,
+        "adapter": "sqlite",
+        "workers": workers,
+        "running_workflows": running_workflows,
+        "launch_latency": launch_latency,
+        "messages": messages,
+        "seconds": round(seconds, 6),
+        "messages_per_second": round(messages / seconds, 1),
+    }
+
+
+def _get_engine_version() -> str | None:
+    try:
+        return version("im-data-manager-workflow-engine")
+    except PackageNotFoundError:
+        return None
+
+
+def main(argv: list[str] | None = None) -> dict[str, Any]:
+    """Runs the benchmark (given command-line arguments),
+    writing and returning its report."""
+    parser = argparse.ArgumentParser(
+        prog="python -m tests.engine_benchmark",
+        description="Measures the throughput of the workflow engine"
+        " on synthetic workflows.",
+    )
+    parser.add_argument(
+        "workflows",
+        nargs="*",
+        metavar="WORKFLOW[:SIZE]",
+        help="The workflows to run (and their sizes). The workflows are"
+        f" {', '.join(f'{name} ({size})' for name, (_, size) in WORKFLOWS.items())}."
+        " All of them are run if none are named.",
+    )
+    parser.add_argument("--stateful", action="store_true", help="Use a stateful engine")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="The number of Pod messages the engine is given at a time",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="The time (in seconds) every (memory) adapter call takes,"
+        " to simulate the DM's database",
+    )
+    parser.add_argument(
+        "--adapter",
+        choices=ADAPTERS,
+        default="memory",
+        help="The API adapter to use",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Run copies of each workflow through a ShardedWorkflowEngine"
+        " with this many worker processes",
+    )
+    parser.add_argument(
+        "--running-workflows",
+        type=int,
+        default=8,
+        help="The number of copies of each workflow to run with --workers",
+    )
+    parser.add_argument(
+        "--launch-latency",
+        type=float,
+        default=0.0,
+        help="The time (in seconds) every launch takes with --workers",
+    )
+    parser.add_argument(
+        "--label", help="A label for the report (the engine version, say)"
+    )
+    parser.add_argument("--output", help="The file to write the report (JSON) to")
+    args = parser.parse_args(argv)
+    if args.latency and args.adapter != "memory":
+        parser.error("--latency can only be used with the memory adapter")
+    if args.workers is not None and args.latency:
+        parser.error("--workers uses a (shared) sqlite database, not --latency")
+
+    # The engine's INFO messages would swamp the benchmark
+    logging.getLogger("workflow").setLevel(logging.WARNING)
+
+    results: list[dict[str, Any]] = []
+    for workflow_arg in args.workflows or list(WORKFLOWS):
+        name, _, size = workflow_arg.partition(":")
+        if name not in WORKFLOWS:
+            parser.error(f"Unknown workflow '{name}'")
+        get_workflow, default_size = WORKFLOWS[name]
+        workflow: SyntheticWorkflow = get_workflow(int(size or default_size))
+        print(f"Running {workflow.name}...", file=sys.stderr)
+        if args.workers is not None:
+            results.append(
+                run_sharded_benchmark(
+                    workflow,
+                    workers=args.workers,
+                    running_workflows=args.running_workflows,
+                    launch_latency=args.launch_latency,
+                    stateful=args.stateful,
+                    batch_size=args.batch_size,
+                )
+            )
+            continue
+        results.append(
+            run_benchmark(
+                workflow,
+                stateful=args.stateful,
+                batch_size=args.batch_size,
+                latency=args.latency,
+                adapter=args.adapter,
+            )
+        )
+
+    report: dict[str, Any] = {
+        "label": args.label,
+        "engine_version": _get_engine_version(),
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "results": results,
+    }
+    text: str = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as output_file:
+            output_file.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""The import (startup) time benchmark.
+
+Every DM worker and command-line tool imports the package's modules when it
+starts, so the time they take to import matters. The benchmark imports each of
+the package's main modules in a fresh interpreter (with 'python -X importtime')
+and reports (as JSON) the time the import took, the number of modules it
+imported, and the imports that took the longest. Each module is imported a number
+of times and the fastest import is reported, as the times are noisy.
+
+Run it (from the project root) with: -
+
+    python -m tests.import_benchmark --output import-benchmark.json
+
+and use '--help' to see how to choose the modules.
+Compare the output of two versions of the package to see what a change did.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any
+
+# The modules the benchmark imports (by default)
+MODULES: tuple[str, ...] = (
+    "workflow.decoder",
+    "workflow.workflow_validator",
+    "workflow.workflow_engine",
+)
+
+# The project root, which the modules are imported from
+_PROJECT_ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class ImportTime:
+    """The time (in microseconds) it took to import a module,
+    excluding ('self_us') and including ('cumulative_us') its imports."""
+
+    name: str
+    self_us: int
+    cumulative_us: int
+
+
+def get_import_times(module: str) -> list[ImportTime]:
+    """Imports a module in a fresh interpreter, returning the time each module
+    it imported (in the order they finished importing, so the module's last)."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        cwd=_PROJECT_ROOT,
+        text=True,
+    )
+    times: list[ImportTime] = []
+    for line in process.stderr.splitlines():
+        # i.e. "import time:       289 |      25484 |     referencing"
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            # The header
+            continue
+        times.append(ImportTime(name.strip(), int(self_us), int(cumulative_us)))
+    assert times and times[-1].name == module
+    return times
+
+
+def run_benchmark(module: str, *, repeat: int = 5, top: int = 10) -> dict[str, Any]:
+    """Imports a module 'repeat' times, returning the results of the fastest."""
+    assert repeat >= 1
+    fastest: list[ImportTime] = min(
+        (get_import_times(module) for _ in range(repeat)),
+        key=lambda times: times[-1].cumulative_us,
+    )
+    return {
+        "module": module,
+        "repeat": repeat,
+        "cumulative_us": fastest[-1].cumulative_us,
+        "self_us": fastest[-1].self_us,
+        "modules_imported": len(fastest),
+        "slowest": [
+            {"module": time.name, "self_us": time.self_us}
+            for time in sorted(fastest, key=lambda time: time.self_us, reverse=True)[
+                :top
+            ]
+        ],
+    }
+
+
+def main(argv: list[str] | None = None) -> dict[str, Any]:
+    """Runs the benchmark (given command-line arguments),
+    writing and returning its report."""
+    parser = argparse.ArgumentParser(
+        prog="python -m tests.import_benchmark",
+        description="Measures the time it takes to import the package's modules.",
+    )
+    parser.add_argument(
+        "modules",
+        nargs="*",
+        metavar="MODULE",
+        help=f"The modules to import. The default is {', '.join(MODULES)}.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="The number of times each module is imported",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="The number of the slowest imports to report",
+    )
+    parser.add_argument(
+        "--label", help="A label for the report (the package version, say)"
+    )
+    parser.add_argument("--output", help="The file to write the report (JSON) to")
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    results: list[dict[str, Any]] = []
+    for module in args.modules or MODULES:
+        print(f"Importing {module}...", file=sys.stderr)
+        results.append(run_benchmark(module, repeat=args.repeat, top=args.top))
+
+    report: dict[str, Any] = {
+        "label": args.label,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "results": results,
+    }
+    text: str = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as output_file:
+            output_file.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
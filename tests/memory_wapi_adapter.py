@@ -0,0 +1,464 @@
+"""The in-memory API Adapter.
+
+Like the UnitTest API Adapter (in 'tests/wapi_adapter.py') this 'simulates' the
+sort of responses you can expect from the DM API/Model, but it keeps its
+'tables' in dictionaries (in memory) rather than in pickle files. That makes it
+fast, but the data cannot be shared between processes - use it where the engine,
+the launcher and the test all run in one process (the engine benchmark, say).
+The UnitTest API Adapter remains for the tests that run the engine in a
+separate process.
+
+It is a reference for how the DM's tables are expected to be used.
+Running workflow steps are indexed (as the DM's database indexes them)
+by running workflow, by (running workflow, step name), and by
+(running workflow, step name, replica) - which is also the uniqueness
+constraint that makes the launcher's 'launch a step once' guarantee real.
+No lookup involves every record in a table.
+
+The adapter is thread-safe, with locks that are fine-grained enough for several
+engine threads to work at the same time. Each table has its own lock, except the
+running workflow steps, which are protected by a lock for each running workflow.
+Where a method needs more than one lock they are acquired in the order
+instance, running workflow step.
+
+Every call can be made to take longer, to simulate the latency of a real
+database (or the DM's API). The latency can be set for all methods,
+or for each method (by name). Calls 'sleep' without holding a lock,
+so the latency of one call does not hold up another.
+
+Job definitions are given to the adapter (in the form of the content
+of the 'tests/job-definitions/job-definitions.yaml' file, which is used
+if none are given) and yielded through the 'get_job()' method.
+"""
+
+import copy
+import functools
+import os
+import threading
+import time
+from http import HTTPStatus
+from typing import Any, Callable, TypeVar, cast
+
+import yaml
+
+from workflow.workflow_abc import WorkflowAPIAdapter
+from workflow.workflow_engine import get_output_values
+
+_F = TypeVar("_F", bound=Callable[..., Any])
+
+# The Unit test Job Definitions file
+_JOB_DEFINITION_FILE: str = os.path.join(
+    os.path.dirname(__file__), "job-definitions", "job-definitions.yaml"
+)
+
+# Table UUID formats
+_INSTANCE_ID_FORMAT: str = "instance-00000000-0000-0000-0000-{id:012d}"
+_WORKFLOW_DEFINITION_ID_FORMAT: str = "workflow-00000000-0000-0000-0000-{id:012d}"
+_RUNNING_WORKFLOW_ID_FORMAT: str = "r-workflow-00000000-0000-0000-0000-{id:012d}"
+_RUNNING_WORKFLOW_STEP_ID_FORMAT: str = (
+    "r-workflow-step-00000000-0000-0000-0000-{id:012d}"
+)
+
+
+def _step_response(rwfs_id: str, record: dict[str, Any]) -> dict[str, Any]:
+    """A (shallow) copy of a running workflow step record, as the DM presents it
+    - with its ID, and without a 'replica' if it's the first replica."""
+    response: dict[str, Any] = dict(record, id=rwfs_id)
+    if response["replica"] == 0:
+        _ = response.pop("replica")
+    return response
+
+
+def _with_latency(method: _F) -> _F:
+    """Decorates an adapter method so that a call takes (at least)
+    the adapter's latency for it."""
+
+    @functools.wraps(method)
+    def wrapper(self: "MemoryWorkflowAPIAdapter", *args: Any, **kwargs: Any) -> Any:
+        if latency := self.get_latency(method.__name__):
+            time.sleep(latency)
+        return method(self, *args, **kwargs)
+
+    return cast(_F, wrapper)
+
+
+class MemoryWorkflowAPIAdapter(WorkflowAPIAdapter):
+    """An in-memory, thread-safe, API adapter, with the methods of the
+    UnitTest API adapter.
+
+    The latency (in seconds) of every call, or a map of latency by method name,
+    can be given. Methods that are not in the map have no latency unless
+    it has a 'default'."""
+
+    def __init__(
+        self,
+        *,
+        job_definitions: dict[str, Any] | None = None,
+        latency: float | dict[str, float] = 0.0,
+    ):
+        super().__init__()
+        if job_definitions is None:
+            with open(_JOB_DEFINITION_FILE, "r", encoding="utf8") as jd_file:
+                job_definitions = yaml.load(jd_file, Loader=yaml.FullLoader)
+        assert job_definitions
+        self._job_definitions: dict[str, Any] = job_definitions
+        self._latency: dict[str, float] = (
+            dict(latency) if isinstance(latency, dict) else {"default": latency}
+        )
+
+        self._workflow_lock: threading.Lock = threading.Lock()
+        self._workflow: dict[str, dict[str, Any]] = {}
+        self._running_workflow_lock: threading.Lock = threading.Lock()
+        self._running_workflow: dict[str, dict[str, Any]] = {}
+        self._instance_lock: threading.Lock = threading.Lock()
+        self._instance: dict[str, dict[str, Any]] = {}
+        self._mock_output_lock: threading.Lock = threading.Lock()
+        self._mock_output: dict[str, dict[str, Any]] = {}
+
+        # The running workflow steps of all running workflows, by ID.
+        # Records are only added (or changed) with the lock of their
+        # running workflow held, and they're never removed.
+        self._running_workflow_step: dict[str, dict[str, Any]] = {}
+        self._running_workflow_step_count: int = 0
+        self._running_workflow_step_count_lock: threading.Lock = threading.Lock()
+        # The lock (and indexes) of the steps of each running workflow
+        self._step_locks_lock: threading.Lock = threading.Lock()
+        self._step_locks: dict[str, threading.Lock] = {}
+        self._step_ids_by_running_workflow: dict[str, list[str]] = {}
+        self._step_ids_by_name: dict[tuple[str, str], list[str]] = {}
+        self._step_id_by_replica: dict[tuple[str, str, int], str] = {}
+
+    def get_latency(self, method_name: str) -> float:
+        """The latency (in seconds) of calls to the named method."""
+        return self._latency.get(method_name, self._latency.get("default", 0.0))
+
+    def _get_step_lock(self, running_workflow_id: str) -> threading.Lock:
+        """The lock that protects the steps of a running workflow."""
+        if (lock := self._step_locks.get(running_workflow_id)) is None:
+            with self._step_locks_lock:
+                lock = self._step_locks.setdefault(
+                    running_workflow_id, threading.Lock()
+                )
+        return lock
+
+    @_with_latency
+    def get_workflow(self, *, workflow_id: str) -> tuple[dict[str, Any], int]:
+        with self._workflow_lock:
+            if workflow_id not in self._workflow:
+                return {}, 0
+            return dict(self._workflow[workflow_id], id=workflow_id), 0
+
+    @_with_latency
+    def get_running_workflow(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        with self._running_workflow_lock:
+            if running_workflow_id not in self._running_workflow:
+                return {}, 0
+            record = self._running_workflow[running_workflow_id]
+            return dict(record, id=running_workflow_id), 0
+
+    @_with_latency
+    def get_running_steps(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        # Does nothing at the moment - this is used for the STOP logic.
+        return {"count": 0, "steps": []}, 0
+
+    @_with_latency
+    def get_status_of_all_step_instances_by_name(
+        self, *, running_workflow_id: str, name: str
+    ) -> tuple[dict[str, Any], int]:
+        with self._get_step_lock(running_workflow_id):
+            steps: list[dict[str, Any]] = [
+                _step_response(rwfs_id, self._running_workflow_step[rwfs_id])
+                for rwfs_id in self._step_ids_by_name.get(
+                    (running_workflow_id, name), []
+                )
+            ]
+        return {"count": len(steps), "status": steps}, 0
+
+    @_with_latency
+    def get_status_of_all_step_instances(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        steps: dict[str, dict[str, Any]] = {}
+        with self._get_step_lock(running_workflow_id):
+            for rwfs_id in self._step_ids_by_running_workflow.get(
+                running_workflow_id, []
+            ):
+                record = self._running_workflow_step[rwfs_id]
+                step = steps.setdefault(record["name"], {"count": 0, "status": []})
+                step["count"] += 1
+                step["status"].append(_step_response(rwfs_id, record))
+        return {"count": len(steps), "steps": steps}, 0
+
+    @_with_latency
+    def set_running_workflow_done(
+        self,
+        *,
+        running_workflow_id: str,
+        success: bool,
+        error_num: int | None = None,
+        error_msg: str | None = None,
+    ) -> None:
+        with self._running_workflow_lock:
+            assert running_workflow_id in self._running_workflow
+            self._running_workflow[running_workflow_id].update(
+                done=True, success=success, error_num=error_num, error_msg=error_msg
+            )
+
+    @_with_latency
+    def create_running_workflow_step(
+        self,
+        *,
+        running_workflow_id: str,
+        step: str,
+        instance_id: str,
+        replica: int = 0,
+        replicas: int = 1,
+    ) -> tuple[dict[str, Any], int]:
+        assert replica >= 0
+        assert replicas > replica
+
+        key: tuple[str, str, int] = (running_workflow_id, step, replica)
+        with self._get_step_lock(running_workflow_id):
+            # A step replica can only be created once for a running workflow
+            # (see the UnitTest API adapter). Return the original record's ID.
+            if rwfs_id := self._step_id_by_replica.get(key):
+                return {"id": rwfs_id, "already_exists": True}, 0
+
+            with self._running_workflow_step_count_lock:
+                self._running_workflow_step_count += 1
+                running_workflow_step_id: str = _RUNNING_WORKFLOW_STEP_ID_FORMAT.format(
+                    id=self._running_workflow_step_count
+                )
+            self._running_workflow_step[running_workflow_step_id] = {
+                "name": step,
+                "done": False,
+                "success": False,
+                "replica": replica,
+                "replicas": replicas,
+                "variables": {},
+                "running_workflow": {"id": running_workflow_id},
+                "instance_id": instance_id,
+            }
+            self._step_id_by_replica[key] = running_workflow_step_id
+            self._step_ids_by_name.setdefault((running_workflow_id, step), []).append(
+                running_workflow_step_id
+            )
+            self._step_ids_by_running_workflow.setdefault(
+                running_workflow_id, []
+            ).append(running_workflow_step_id)
+        return {"id": running_workflow_step_id}, 0
+
+    def _get_step_record(self, running_workflow_step_id: str) -> dict[str, Any] | None:
+        """The record of a running workflow step (if there is one).
+        It can only be used with the lock of its running workflow held."""
+        return self._running_workflow_step.get(running_workflow_step_id)
+
+    @_with_latency
+    def get_running_workflow_step(
+        self, *, running_workflow_step_id: str
+    ) -> tuple[dict[str, Any], int]:
+        record = self._get_step_record(running_workflow_step_id)
+        if record is None:
+            return {}, 0
+        with self._get_step_lock(record["running_workflow"]["id"]):
+            return _step_response(running_workflow_step_id, record), 0
+
+    @_with_latency
+    def get_running_workflow_step_by_name(
+        self, *, name: str, running_workflow_id: str, replica: int = 0
+    ) -> tuple[dict[str, Any], int]:
+        if replica:
+            assert replica > 0
+        with self._get_step_lock(running_workflow_id):
+            rwfs_id = self._step_id_by_replica.get((running_workflow_id, name, replica))
+            if rwfs_id is None:
+                return {}, 0
+            return _step_response(rwfs_id, self._running_workflow_step[rwfs_id]), 0
+
+    @_with_latency
+    def set_running_workflow_step_variables(
+        self,
+        *,
+        running_workflow_step_id: str,
+        variables: dict[str, Any],
+    ) -> None:
+        record = self._get_step_record(running_workflow_step_id)
+        assert record
+        with self._get_step_lock(record["running_workflow"]["id"]):
+            record["variables"] = variables
+
+    @_with_latency
+    def set_running_workflow_step_done(
+        self,
+        *,
+        running_workflow_step_id: str,
+        success: bool,
+        error_num: int | None = None,
+        error_msg: str | None = None,
+    ) -> None:
+        record = self._get_step_record(running_workflow_step_id)
+        assert record
+        with self._get_step_lock(record["running_workflow"]["id"]):
+            record.update(
+                done=True, success=success, error_num=error_num, error_msg=error_msg
+            )
+
+    @_with_latency
+    def get_instance(self, *, instance_id: str) -> tuple[dict[str, Any], int]:
+        with self._instance_lock:
+            return dict(self._instance.get(instance_id, {})), 0
+
+    @_with_latency
+    def get_job(
+        self, *, collection: str, job: str, version: str
+    ) -> tuple[dict[str, Any], int]:
+        if collection != self._job_definitions["collection"]:
+            return {}, 0
+        if job not in self._job_definitions["jobs"]:
+            return {}, 0
+        assert version
+
+        jd = self._job_definitions["jobs"][job]
+        response = {"command": jd["command"], "definition": jd}
+        if "variables" in jd:
+            response["variables"] = jd["variables"]
+        return response, 0
+
+    # Methods required for the instance launchers and other (internal) logic
+    # but not exposed to (or required by) the Workflow Engine...
+
+    @_with_latency
+    def create_workflow(self, *, workflow_definition: dict[str, Any]) -> dict[str, Any]:
+        with self._workflow_lock:
+            workflow_definition_id: str = _WORKFLOW_DEFINITION_ID_FORMAT.format(
+                id=len(self._workflow) + 1
+            )
+            self._workflow[workflow_definition_id] = workflow_definition
+        return {"id": workflow_definition_id}
+
+    @_with_latency
+    def create_running_workflow(
+        self,
+        *,
+        user_id: str,
+        workflow_id: str,
+        project_id: str,
+        variables: dict[str, Any],
+    ) -> dict[str, Any]:
+        assert user_id
+        assert isinstance(variables, dict)
+
+        with self._running_workflow_lock:
+            running_workflow_id: str = _RUNNING_WORKFLOW_ID_FORMAT.format(
+                id=len(self._running_workflow) + 1
+            )
+            self._running_workflow[running_workflow_id] = {
+                "name": "test-running-workflow",
+                "running_user": user_id,
+                "running_user_api_token": "123456789",
+                "done": False,
+                "success": False,
+                "workflow": {"id": workflow_id},
+                "project": {"id": project_id},
+                "variables": variables,
+            }
+        return {"id": running_workflow_id}
+
+    @_with_latency
+    def create_instance(self) -> dict[str, Any]:
+        with self._instance_lock:
+            instance_id: str = _INSTANCE_ID_FORMAT.format(id=len(self._instance) + 1)
+            self._instance[instance_id] = {
+                "id": instance_id,
+                "running_workflow_step_id": "",
+                "instance_directory": f".{instance_id}",
+            }
+        return {"id": instance_id}
+
+    @_with_latency
+    def set_instance_running_workflow_step_id(
+        self, *, instance_id: str, running_workflow_step_id: str
+    ) -> None:
+        record = self._get_step_record(running_workflow_step_id)
+        assert record
+        with self._instance_lock, self._get_step_lock(record["running_workflow"]["id"]):
+            assert instance_id in self._instance
+            self._instance[instance_id][
+                "running_workflow_step_id"
+            ] = running_workflow_step_id
+            # Use the instance ID as the step's instance-directory
+            # (prefixing with '.')
+            record["instance_directory"] = f".{instance_id}"
+
+    @_with_latency
+    def get_running_workflow_steps(self, *, running_workflow_id: str) -> dict[str, Any]:
+        with self._get_step_lock(running_workflow_id):
+            steps: list[dict[str, Any]] = [
+                dict(self._running_workflow_step[rwfs_id], id=rwfs_id)
+                for rwfs_id in self._step_ids_by_running_workflow.get(
+                    running_workflow_id, []
+                )
+            ]
+        return {"count": len(steps), "running_workflow_steps": steps}
+
+    @_with_latency
+    def get_running_workflow_step_output_values_for_output(
+        self, *, running_workflow_step_id: str, output_variable: str
+    ) -> tuple[dict[str, Any], int]:
+        """We use the 'mock' data to return output values, otherwise
+        we return an empty list."""
+        record = self._get_step_record(running_workflow_step_id)
+        assert record
+        with self._mock_output_lock:
+            if record["name"] not in self._mock_output:
+                return {"output": []}, 0
+            mock_output: dict[str, Any] = self._mock_output[record["name"]]
+        assert mock_output["output_variable"] == output_variable
+        return {"output": copy.copy(mock_output["output"])}, 0
+
+    @_with_latency
+    def get_running_workflow_step_output_values_page(
+        self,
+        *,
+        running_workflow_step_id: str,
+        output_variable: str,
+        offset: int,
+        limit: int,
+    ) -> tuple[dict[str, Any], int]:
+        """A page of the values 'get_running_workflow_step_output_values_for_output()'
+        returns, and their count."""
+        record = self._get_step_record(running_workflow_step_id)
+        assert record
+        with self._mock_output_lock:
+            mock_output: dict[str, Any] = self._mock_output.get(
+                record["name"], {"output_variable": output_variable, "output": []}
+            )
+        assert mock_output["output_variable"] == output_variable
+        output: list[str] = get_output_values(mock_output["output"])
+        return {"count": len(output), "output": output[offset : offset + limit]}, 0
+
+    @_with_latency
+    def realise_outputs(
+        self, *, running_workflow_step_id: str
+    ) -> tuple[dict[str, Any], int]:
+        del running_workflow_step_id
+        return {}, HTTPStatus.OK
+
+    # Custom (test) methods
+    # Methods not declared in the ABC
+
+    def mock_get_running_workflow_step_output_values_for_output(
+        self, *, step_name: str, output_variable: str, output: list[str] | str
+    ) -> None:
+        """Sets the output response for a step (see the UnitTest API adapter)."""
+        assert isinstance(step_name, str)
+        assert isinstance(output_variable, str)
+        with self._mock_output_lock:
+            self._mock_output[step_name] = {
+                "output_variable": output_variable,
+                "output": output,
+            }
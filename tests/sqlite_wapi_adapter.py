@@ -0,0 +1,568 @@
+"""The SQLite API Adapter.
+
+Like the UnitTest API Adapter (in 'tests/wapi_adapter.py') this 'simulates' the
+sort of responses you can expect from the DM API/Model, but its 'tables' are
+real (SQLite) database tables - for Workflow, RunningWorkflow, RunningWorkflowStep
+and Instance records. It's a serverless stand-in for the DM's database, which
+load tests and tests of several engine workers can be run against.
+
+The launcher's 'launch a step once' guarantee (see 'InstanceLauncher.launch()')
+is backed by a unique index on the (running workflow, name, replica)
+of running workflow steps - as it is expected to be in the DM. There are
+secondary indexes for the engine's other lookups.
+
+The database can be a file, which can be shared by threads and processes
+(it's used in WAL mode, so readers do not block the writer), or (by default)
+a private in-memory database that's shared by the threads of one process.
+Each thread has its own connection.
+
+Job definitions are not kept in the database. They are given to the adapter
+(in the form of the content of the 'tests/job-definitions/job-definitions.yaml'
+file, which is used if none are given) and yielded through the 'get_job()' method.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from http import HTTPStatus
+from typing import Any, Iterator
+
+import yaml
+
+from workflow.workflow_abc import WorkflowAPIAdapter
+from workflow.workflow_engine import get_output_values
+
+# The Unit test Job Definitions file
+_JOB_DEFINITION_FILE: str = os.path.join(
+    os.path.dirname(__file__), "job-definitions", "job-definitions.yaml"
+)
+
+# Table UUID formats.
+# The trailing number of each ID is the row's (integer) primary key.
+_INSTANCE_ID_FORMAT: str = "instance-00000000-0000-0000-0000-{id:012d}"
+_WORKFLOW_DEFINITION_ID_FORMAT: str = "workflow-00000000-0000-0000-0000-{id:012d}"
+_RUNNING_WORKFLOW_ID_FORMAT: str = "r-workflow-00000000-0000-0000-0000-{id:012d}"
+_RUNNING_WORKFLOW_STEP_ID_FORMAT: str = (
+    "r-workflow-step-00000000-0000-0000-0000-{id:012d}"
+)
+
+# How long (milliseconds) a connection waits for a lock held by another
+_BUSY_TIMEOUT_MS: int = 30_000
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS workflow (
+    pk INTEGER PRIMARY KEY,
+    definition TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS running_workflow (
+    pk INTEGER PRIMARY KEY,
+    workflow_pk INTEGER NOT NULL REFERENCES workflow (pk),
+    name TEXT NOT NULL,
+    running_user TEXT NOT NULL,
+    running_user_api_token TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    variables TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    success INTEGER NOT NULL DEFAULT 0,
+    error_num INTEGER,
+    error_msg TEXT
+);
+CREATE TABLE IF NOT EXISTS running_workflow_step (
+    pk INTEGER PRIMARY KEY,
+    running_workflow_pk INTEGER NOT NULL REFERENCES running_workflow (pk),
+    name TEXT NOT NULL,
+    replica INTEGER NOT NULL,
+    replicas INTEGER NOT NULL,
+    instance_id TEXT NOT NULL,
+    instance_directory TEXT,
+    variables TEXT NOT NULL DEFAULT '{}',
+    done INTEGER NOT NULL DEFAULT 0,
+    success INTEGER NOT NULL DEFAULT 0,
+    error_num INTEGER,
+    error_msg TEXT
+);
+-- A step replica can only be created once for a running workflow.
+-- Its prefixes also serve lookups by running workflow, and by step name.
+CREATE UNIQUE INDEX IF NOT EXISTS running_workflow_step_replica
+    ON running_workflow_step (running_workflow_pk, name, replica);
+CREATE INDEX IF NOT EXISTS running_workflow_step_instance
+    ON running_workflow_step (instance_id);
+CREATE TABLE IF NOT EXISTS instance (
+    pk INTEGER PRIMARY KEY,
+    running_workflow_step_pk INTEGER REFERENCES running_workflow_step (pk),
+    instance_directory TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS instance_running_workflow_step
+    ON instance (running_workflow_step_pk);
+CREATE TABLE IF NOT EXISTS mock_output (
+    step_name TEXT PRIMARY KEY,
+    output_variable TEXT NOT NULL,
+    output TEXT NOT NULL
+);
+"""
+
+_STEP_COLUMNS: str = (
+    "pk, running_workflow_pk, name, replica, replicas, instance_id,"
+    " instance_directory, variables, done, success, error_num, error_msg"
+)
+
+
+def _get_pk(record_id: str, id_format: str) -> int | None:
+    """The primary key of a record, given its ID (and the format of the IDs of
+    its table), or None if the ID is not one of the table's."""
+    prefix: str = id_format.split("{", maxsplit=1)[0]
+    number: str = record_id.removeprefix(prefix)
+    if number == record_id or not number.isdigit():
+        return None
+    return int(number)
+
+
+def _step_response(row: sqlite3.Row) -> dict[str, Any]:
+    """A running workflow step row, as the DM presents it
+    - without a 'replica' if it's the first replica."""
+    response: dict[str, Any] = {
+        "id": _RUNNING_WORKFLOW_STEP_ID_FORMAT.format(id=row["pk"]),
+        "name": row["name"],
+        "done": bool(row["done"]),
+        "success": bool(row["success"]),
+        "replicas": row["replicas"],
+        "variables": json.loads(row["variables"]),
+        "running_workflow": {
+            "id": _RUNNING_WORKFLOW_ID_FORMAT.format(id=row["running_workflow_pk"])
+        },
+        "instance_id": row["instance_id"],
+        "error_num": row["error_num"],
+        "error_msg": row["error_msg"],
+    }
+    if row["replica"]:
+        response["replica"] = row["replica"]
+    if row["instance_directory"] is not None:
+        response["instance_directory"] = row["instance_directory"]
+    return response
+
+
+class SQLiteWorkflowAPIAdapter(WorkflowAPIAdapter):
+    """An SQLite API adapter, with the methods of the UnitTest API adapter.
+    It uses the database file it's given (creating its tables if they're not
+    there), or a new (private) in-memory database."""
+
+    def __init__(
+        self,
+        *,
+        database: str | None = None,
+        job_definitions: dict[str, Any] | None = None,
+    ):
+        super().__init__()
+        if job_definitions is None:
+            with open(_JOB_DEFINITION_FILE, "r", encoding="utf8") as jd_file:
+                job_definitions = yaml.load(jd_file, Loader=yaml.FullLoader)
+        assert job_definitions
+        self._job_definitions: dict[str, Any] = job_definitions
+
+        # An in-memory database is shared (by connections in this process)
+        # if it's named, and lives as long as a connection to it is open.
+        self._database: str = (
+            f"file:{database}"
+            if database
+            else f"file:wapi-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        )
+        self._local: threading.local = threading.local()
+        self._connection: sqlite3.Connection = self._get_connection()
+        if database:
+            _ = self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SCHEMA)
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """The (autocommit) connection of the calling thread."""
+        connection: sqlite3.Connection | None = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self._database,
+                uri=True,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.row_factory = sqlite3.Row
+            _ = connection.execute(f"PRAGMA busy_timeout={_BUSY_TIMEOUT_MS}")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """A (write) transaction, committed if the context ends without an
+        exception (and rolled back if it does not)."""
+        connection: sqlite3.Connection = self._get_connection()
+        _ = connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            _ = connection.execute("ROLLBACK")
+            raise
+        _ = connection.execute("COMMIT")
+
+    def _fetch_one(self, sql: str, *parameters: Any) -> sqlite3.Row | None:
+        row: sqlite3.Row | None = (
+            self._get_connection().execute(sql, parameters).fetchone()
+        )
+        return row
+
+    def _fetch_all(self, sql: str, *parameters: Any) -> list[sqlite3.Row]:
+        return self._get_connection().execute(sql, parameters).fetchall()
+
+    def _execute(self, sql: str, *parameters: Any) -> sqlite3.Cursor:
+        return self._get_connection().execute(sql, parameters)
+
+    def get_workflow(self, *, workflow_id: str) -> tuple[dict[str, Any], int]:
+        pk: int | None = _get_pk(workflow_id, _WORKFLOW_DEFINITION_ID_FORMAT)
+        row = self._fetch_one("SELECT definition FROM workflow WHERE pk = ?", pk)
+        if row is None:
+            return {}, 0
+        response: dict[str, Any] = json.loads(row["definition"])
+        response["id"] = workflow_id
+        return response, 0
+
+    def get_running_workflow(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        pk: int | None = _get_pk(running_workflow_id, _RUNNING_WORKFLOW_ID_FORMAT)
+        row = self._fetch_one("SELECT * FROM running_workflow WHERE pk = ?", pk)
+        if row is None:
+            return {}, 0
+        return {
+            "id": running_workflow_id,
+            "name": row["name"],
+            "running_user": row["running_user"],
+            "running_user_api_token": row["running_user_api_token"],
+            "done": bool(row["done"]),
+            "success": bool(row["success"]),
+            "error_num": row["error_num"],
+            "error_msg": row["error_msg"],
+            "workflow": {
+                "id": _WORKFLOW_DEFINITION_ID_FORMAT.format(id=row["workflow_pk"])
+            },
+            "project": {"id": row["project_id"]},
+            "variables": json.loads(row["variables"]),
+        }, 0
+
+    def get_running_steps(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        # Does nothing at the moment - this is used for the STOP logic.
+        return {"count": 0, "steps": []}, 0
+
+    def get_status_of_all_step_instances_by_name(
+        self, *, running_workflow_id: str, name: str
+    ) -> tuple[dict[str, Any], int]:
+        rows = self._fetch_all(
+            f"SELECT {_STEP_COLUMNS} FROM running_workflow_step"
+            " WHERE running_workflow_pk = ? AND name = ? ORDER BY pk",
+            _get_pk(running_workflow_id, _RUNNING_WORKFLOW_ID_FORMAT),
+            name,
+        )
+        steps: list[dict[str, Any]] = [_step_response(row) for row in rows]
+        return {"count": len(steps), "status": steps}, 0
+
+    def get_status_of_all_step_instances(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        rows = self._fetch_all(
+            f"SELECT {_STEP_COLUMNS} FROM running_workflow_step"
+            " WHERE running_workflow_pk = ? ORDER BY pk",
+            _get_pk(running_workflow_id, _RUNNING_WORKFLOW_ID_FORMAT),
+        )
+        steps: dict[str, dict[str, Any]] = {}
+        for row in rows:
+            step = steps.setdefault(row["name"], {"count": 0, "status": []})
+            step["count"] += 1
+            step["status"].append(_step_response(row))
+        return {"count": len(steps), "steps": steps}, 0
+
+    def set_running_workflow_done(
+        self,
+        *,
+        running_workflow_id: str,
+        success: bool,
+        error_num: int | None = None,
+        error_msg: str | None = None,
+    ) -> None:
+        cursor = self._execute(
+            "UPDATE running_workflow SET done = 1, success = ?, error_num = ?,"
+            " error_msg = ? WHERE pk = ?",
+            success,
+            error_num,
+            error_msg,
+            _get_pk(running_workflow_id, _RUNNING_WORKFLOW_ID_FORMAT),
+        )
+        assert cursor.rowcount == 1
+
+    def create_running_workflow_step(
+        self,
+        *,
+        running_workflow_id: str,
+        step: str,
+        instance_id: str,
+        replica: int = 0,
+        replicas: int = 1,
+    ) -> tuple[dict[str, Any], int]:
+        assert replica >= 0
+        assert replicas > replica
+
+        rwf_pk: int | None = _get_pk(running_workflow_id, _RUNNING_WORKFLOW_ID_FORMAT)
+        try:
+            cursor = self._execute(
+                "INSERT INTO running_workflow_step"
+                " (running_workflow_pk, name, replica, replicas, instance_id)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rwf_pk,
+                step,
+                replica,
+                replicas,
+                instance_id,
+            )
+        except sqlite3.IntegrityError:
+            # The step replica has already been created (the unique index
+            # has stopped us creating it again). Return the original record's ID.
+            row = self._fetch_one(
+                "SELECT pk FROM running_workflow_step"
+                " WHERE running_workflow_pk = ? AND name = ? AND replica = ?",
+                rwf_pk,
+                step,
+                replica,
+            )
+            assert row
+            return {
+                "id": _RUNNING_WORKFLOW_STEP_ID_FORMAT.format(id=row["pk"]),
+                "already_exists": True,
+            }, 0
+        return {"id": _RUNNING_WORKFLOW_STEP_ID_FORMAT.format(id=cursor.lastrowid)}, 0
+
+    def get_running_workflow_step(
+        self, *, running_workflow_step_id: str
+    ) -> tuple[dict[str, Any], int]:
+        row = self._fetch_one(
+            f"SELECT {_STEP_COLUMNS} FROM running_workflow_step WHERE pk = ?",
+            _get_pk(running_workflow_step_id, _RUNNING_WORKFLOW_STEP_ID_FORMAT),
+        )
+        if row is None:
+            return {}, 0
+        return _step_response(row), 0
+
+    def get_running_workflow_step_by_name(
+        self, *, name: str, running_workflow_id: str, replica: int = 0
+    ) -> tuple[dict[str, Any], int]:
+        if replica:
+            assert replica > 0
+        row = self._fetch_one(
+            f"SELECT {_STEP_COLUMNS} FROM running_workflow_step"
+            " WHERE running_workflow_pk = ? AND name = ? AND replica = ?",
+            _get_pk(running_workflow_id, _RUNNING_WORKFLOW_ID_FORMAT),
+            name,
+            replica,
+        )
+        if row is None:
+            return {}, 0
+        return _step_response(row), 0
+
+    def set_running_workflow_step_variables(
+        self,
+        *,
+        running_workflow_step_id: str,
+        variables: dict[str, Any],
+    ) -> None:
+        cursor = self._execute(
+            "UPDATE running_workflow_step SET variables = ? WHERE pk = ?",
+            json.dumps(variables),
+            _get_pk(running_workflow_step_id, _RUNNING_WORKFLOW_STEP_ID_FORMAT),
+        )
+        assert cursor.rowcount == 1
+
+    def set_running_workflow_step_done(
+        self,
+        *,
+        running_workflow_step_id: str,
+        success: bool,
+        error_num: int | None = None,
+        error_msg: str | None = None,
+    ) -> None:
+        cursor = self._execute(
+            "UPDATE running_workflow_step SET done = 1, success = ?, error_num = ?,"
+            " error_msg = ? WHERE pk = ?",
+            success,
+            error_num,
+            error_msg,
+            _get_pk(running_workflow_step_id, _RUNNING_WORKFLOW_STEP_ID_FORMAT),
+        )
+        assert cursor.rowcount == 1
+
+    def get_instance(self, *, instance_id: str) -> tuple[dict[str, Any], int]:
+        row = self._fetch_one(
+            "SELECT * FROM instance WHERE pk = ?",
+            _get_pk(instance_id, _INSTANCE_ID_FORMAT),
+        )
+        if row is None:
+            return {}, 0
+        rwfs_pk: int | None = row["running_workflow_step_pk"]
+        return {
+            "id": instance_id,
+            "running_workflow_step_id": (
+                _RUNNING_WORKFLOW_STEP_ID_FORMAT.format(id=rwfs_pk)
+                if rwfs_pk is not None
+                else ""
+            ),
+            "instance_directory": row["instance_directory"],
+        }, 0
+
+    def get_job(
+        self, *, collection: str, job: str, version: str
+    ) -> tuple[dict[str, Any], int]:
+        if collection != self._job_definitions["collection"]:
+            return {}, 0
+        if job not in self._job_definitions["jobs"]:
+            return {}, 0
+        assert version
+
+        jd = self._job_definitions["jobs"][job]
+        response = {"command": jd["command"], "definition": jd}
+        if "variables" in jd:
+            response["variables"] = jd["variables"]
+        return response, 0
+
+    # Methods required for the instance launchers and other (internal) logic
+    # but not exposed to (or required by) the Workflow Engine...
+
+    def create_workflow(self, *, workflow_definition: dict[str, Any]) -> dict[str, Any]:
+        cursor = self._execute(
+            "INSERT INTO workflow (definition) VALUES (?)",
+            json.dumps(workflow_definition),
+        )
+        return {"id": _WORKFLOW_DEFINITION_ID_FORMAT.format(id=cursor.lastrowid)}
+
+    def create_running_workflow(
+        self,
+        *,
+        user_id: str,
+        workflow_id: str,
+        project_id: str,
+        variables: dict[str, Any],
+    ) -> dict[str, Any]:
+        assert user_id
+        assert isinstance(variables, dict)
+
+        cursor = self._execute(
+            "INSERT INTO running_workflow (workflow_pk, name, running_user,"
+            " running_user_api_token, project_id, variables)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            _get_pk(workflow_id, _WORKFLOW_DEFINITION_ID_FORMAT),
+            "test-running-workflow",
+            user_id,
+            "123456789",
+            project_id,
+            json.dumps(variables),
+        )
+        return {"id": _RUNNING_WORKFLOW_ID_FORMAT.format(id=cursor.lastrowid)}
+
+    def create_instance(self) -> dict[str, Any]:
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO instance (instance_directory) VALUES ('')"
+            )
+            instance_id: str = _INSTANCE_ID_FORMAT.format(id=cursor.lastrowid)
+            _ = connection.execute(
+                "UPDATE instance SET instance_directory = ? WHERE pk = ?",
+                (f".{instance_id}", cursor.lastrowid),
+            )
+        return {"id": instance_id}
+
+    def set_instance_running_workflow_step_id(
+        self, *, instance_id: str, running_workflow_step_id: str
+    ) -> None:
+        rwfs_pk: int | None = _get_pk(
+            running_workflow_step_id, _RUNNING_WORKFLOW_STEP_ID_FORMAT
+        )
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE instance SET running_workflow_step_pk = ? WHERE pk = ?",
+                (rwfs_pk, _get_pk(instance_id, _INSTANCE_ID_FORMAT)),
+            )
+            assert cursor.rowcount == 1
+            # Use the instance ID as the step's instance-directory
+            # (prefixing with '.')
+            cursor = connection.execute(
+                "UPDATE running_workflow_step SET instance_directory = ?"
+                " WHERE pk = ?",
+                (f".{instance_id}", rwfs_pk),
+            )
+            assert cursor.rowcount == 1
+
+    def get_running_workflow_steps(self, *, running_workflow_id: str) -> dict[str, Any]:
+        rows = self._fetch_all(
+            f"SELECT {_STEP_COLUMNS} FROM running_workflow_step"
+            " WHERE running_workflow_pk = ? ORDER BY pk",
+            _get_pk(running_workflow_id, _RUNNING_WORKFLOW_ID_FORMAT),
+        )
+        steps: list[dict[str, Any]] = []
+        for row in rows:
+            step: dict[str, Any] = _step_response(row)
+            step["replica"] = row["replica"]
+            steps.append(step)
+        return {"count": len(steps), "running_workflow_steps": steps}
+
+    def get_running_workflow_step_output_values_for_output(
+        self, *, running_workflow_step_id: str, output_variable: str
+    ) -> tuple[dict[str, Any], int]:
+        """We use the 'mock' data to return output values, otherwise
+        we return an empty list."""
+        step, _ = self.get_running_workflow_step(
+            running_workflow_step_id=running_workflow_step_id
+        )
+        assert step
+        row = self._fetch_one(
+            "SELECT * FROM mock_output WHERE step_name = ?", step["name"]
+        )
+        if row is None:
+            return {"output": []}, 0
+        assert row["output_variable"] == output_variable
+        return {"output": json.loads(row["output"])}, 0
+
+    def get_running_workflow_step_output_values_page(
+        self,
+        *,
+        running_workflow_step_id: str,
+        output_variable: str,
+        offset: int,
+        limit: int,
+    ) -> tuple[dict[str, Any], int]:
+        """A page of the values 'get_running_workflow_step_output_values_for_output()'
+        returns, and their count."""
+        response, _ = self.get_running_workflow_step_output_values_for_output(
+            running_workflow_step_id=running_workflow_step_id,
+            output_variable=output_variable,
+        )
+        output: list[str] = get_output_values(response["output"])
+        return {"count": len(output), "output": output[offset : offset + limit]}, 0
+
+    def realise_outputs(
+        self, *, running_workflow_step_id: str
+    ) -> tuple[dict[str, Any], int]:
+        del running_workflow_step_id
+        return {}, HTTPStatus.OK
+
+    # Custom (test) methods
+    # Methods not declared in the ABC
+
+    def mock_get_running_workflow_step_output_values_for_output(
+        self, *, step_name: str, output_variable: str, output: list[str] | str
+    ) -> None:
+        """Sets the output response for a step (see the UnitTest API adapter)."""
+        assert isinstance(step_name, str)
+        assert isinstance(output_variable, str)
+        _ = self._execute(
+            "INSERT OR REPLACE INTO mock_output (step_name, output_variable, output)"
+            " VALUES (?, ?, ?)",
+            step_name,
+            output_variable,
+            json.dumps(output),
+        )
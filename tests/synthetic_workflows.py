@@ -0,0 +1,274 @@
+"""Synthetic workflow definitions, for the engine benchmark.
+
+Each function returns a 'SyntheticWorkflow' - a workflow definition
+(of any size) along with the Job definitions its steps use (in the form of the
+'tests/job-definitions/job-definitions.yaml' file, so they can be given to an
+API adapter) and anything else needed to run it.
+
+The shapes are: -
+
+-   a chain (every step depends on the one before it)
+-   a diamond (one step fans out to a number of parallel steps,
+    which fan back in to a final step)
+-   a DAG (steps that depend on between one and three earlier steps)
+-   a fan-out (a step whose output files are each processed by a replica
+    of the next step, and then combined)
+
+None of the Jobs exist - the definitions are only good for an engine
+whose launcher does not run anything.
+"""
+
+import random
+from dataclasses import dataclass, field
+from typing import Any
+
+# The collection (and version) of the synthetic Jobs
+COLLECTION: str = "workflow-engine-benchmark-jobs"
+_VERSION: str = "1.0.0"
+
+_FILE_OUTPUT: dict[str, Any] = {
+    "outputs": {
+        "properties": {
+            "outputFile": {"creates": "{{ outputFile }}", "type": "file"},
+        }
+    }
+}
+
+
+@dataclass
+class SyntheticWorkflow:
+    """A synthetic workflow definition, the Job definitions of its steps,
+    the (running) workflow variables it needs, and any output values
+    (of steps that replicate the steps that follow them) that need
+    to be mocked. 'instances' is the number of Instances that running it
+    will launch."""
+
+    name: str
+    definition: dict[str, Any]
+    job_definitions: dict[str, Any]
+    instances: int
+    variables: dict[str, Any] = field(default_factory=dict)
+    mock_outputs: list[dict[str, Any]] = field(default_factory=list)
+
+
+def _get_join_job(inputs: int) -> dict[str, Any]:
+    """A Job that combines a number of input files into one."""
+    names: list[str] = [f"inputFile{number}" for number in range(1, inputs + 1)]
+    return {
+        "command": "join.py --outputFile {{ outputFile }} "
+        + " ".join(f"--{name} {{{{ {name} }}}}" for name in names),
+        "variables": {
+            "inputs": {"properties": {name: {"type": "file"} for name in names}},
+        }
+        | _FILE_OUTPUT,
+    }
+
+
+def _get_job_definitions(joins: set[int]) -> dict[str, Any]:
+    """The synthetic Job definitions, including a join for each of the given
+    numbers of inputs."""
+    jobs: dict[str, Any] = {
+        "source": {
+            "command": "source.py --outputFile {{ outputFile }}",
+            "variables": _FILE_OUTPUT,
+        },
+        "process": {
+            "command": "process.py --inputFile {{ inputFile }}"
+            " --outputFile {{ outputFile }}",
+            "variables": {"inputs": {"properties": {"inputFile": {"type": "file"}}}}
+            | _FILE_OUTPUT,
+        },
+        "split": {
+            "command": "split.py --outputBase {{ outputBase }}",
+            "variables": {
+                "outputs": {
+                    "properties": {
+                        "outputBase": {
+                            "creates": "{{ outputBase }}_*.smi",
+                            "type": "files",
+                        },
+                    }
+                }
+            },
+        },
+        "combine": {
+            "command": "combine.py --inputFile {{ inputFile }}"
+            " --outputFile {{ outputFile }}",
+            "variables": {
+                "inputs": {"properties": {"inputFile": {"type": "files"}}},
+                "options": {"properties": {"inputDirPrefix": {"type": "string"}}},
+            }
+            | _FILE_OUTPUT,
+        },
+    }
+    for inputs in joins:
+        jobs[f"join-{inputs}"] = _get_join_job(inputs)
+    return {"collection": COLLECTION, "jobs": jobs}
+
+
+def _get_step(
+    name: str, job: str, prior_steps: list[str] | None = None
+) -> dict[str, Any]:
+    """A step (that writes an 'outputFile') using the named Job, whose inputs
+    are the output files of the given prior steps."""
+    step: dict[str, Any] = {
+        "name": name,
+        "specification": {
+            "collection": COLLECTION,
+            "job": job,
+            "version": _VERSION,
+            "variables": {"outputFile": f"{name}.out"},
+        },
+    }
+    if prior_steps:
+        variables: list[str] = (
+            ["inputFile"]
+            if len(prior_steps) == 1
+            else [f"inputFile{number}" for number in range(1, len(prior_steps) + 1)]
+        )
+        step["plumbing"] = [
+            {
+                "variable": variable,
+                "from-step": {"name": prior_step, "variable": "outputFile"},
+            }
+            for variable, prior_step in zip(variables, prior_steps)
+        ]
+    return step
+
+
+def _get_definition(name: str, steps: list[dict[str, Any]]) -> dict[str, Any]:
+    return {
+        "kind": "DataManagerWorkflow",
+        "kind-version": "2025.2",
+        "name": name,
+        "description": f"A synthetic workflow of {len(steps)} steps",
+        "steps": steps,
+    }
+
+
+def get_chain(length: int) -> SyntheticWorkflow:
+    """A chain of steps, each depending on the one before it."""
+    assert length >= 1
+    steps: list[dict[str, Any]] = [_get_step("step-1", "source")]
+    for number in range(2, length + 1):
+        steps.append(_get_step(f"step-{number}", "process", [f"step-{number - 1}"]))
+    name: str = f"chain-{length}"
+    return SyntheticWorkflow(
+        name=name,
+        definition=_get_definition(name, steps),
+        job_definitions=_get_job_definitions(set()),
+        instances=length,
+    )
+
+
+def get_diamond(width: int) -> SyntheticWorkflow:
+    """A step that fans out to 'width' parallel steps,
+    which fan back in to a final step."""
+    assert width >= 2
+    branches: list[str] = [f"branch-{number}" for number in range(1, width + 1)]
+    steps: list[dict[str, Any]] = (
+        [_get_step("source", "source")]
+        + [_get_step(branch, "process", ["source"]) for branch in branches]
+        + [_get_step("join", f"join-{width}", branches)]
+    )
+    name: str = f"diamond-{width}"
+    return SyntheticWorkflow(
+        name=name,
+        definition=_get_definition(name, steps),
+        job_definitions=_get_job_definitions({width}),
+        instances=width + 2,
+    )
+
+
+def get_dag(size: int, *, window: int = 50, seed: int = 0) -> SyntheticWorkflow:
+    """A directed acyclic graph of 'size' steps. Every step (but the first)
+    depends on between one and three of the 'window' steps before it.
+    The same seed gives the same graph."""
+    assert size >= 1
+    rng: random.Random = random.Random(seed)
+    steps: list[dict[str, Any]] = [_get_step("step-1", "source")]
+    joins: set[int] = set()
+    for number in range(2, size + 1):
+        earlier: list[str] = [
+            f"step-{prior}" for prior in range(max(1, number - window), number)
+        ]
+        prior_steps: list[str] = rng.sample(
+            earlier, rng.randint(1, min(3, len(earlier)))
+        )
+        job: str = "process"
+        if len(prior_steps) > 1:
+            job = f"join-{len(prior_steps)}"
+            joins.add(len(prior_steps))
+        steps.append(_get_step(f"step-{number}", job, prior_steps))
+    name: str = f"dag-{size}"
+    return SyntheticWorkflow(
+        name=name,
+        definition=_get_definition(name, steps),
+        job_definitions=_get_job_definitions(joins),
+        instances=size,
+    )
+
+
+def get_fan_out(replicas: int) -> SyntheticWorkflow:
+    """A step whose 'replicas' output files are each processed by a replica
+    of the next step, whose outputs are then combined."""
+    assert replicas >= 1
+    steps: list[dict[str, Any]] = [
+        {
+            "name": "split",
+            "specification": {
+                "collection": COLLECTION,
+                "job": "split",
+                "version": _VERSION,
+                "variables": {"outputBase": "chunk"},
+            },
+        },
+        {
+            "name": "process",
+            "specification": {
+                "collection": COLLECTION,
+                "job": "process",
+                "version": _VERSION,
+                "variables": {"outputFile": "processed.smi"},
+            },
+            "plumbing": [
+                {
+                    "variable": "inputFile",
+                    "from-step": {"name": "split", "variable": "outputBase"},
+                }
+            ],
+        },
+        {
+            "name": "combine",
+            "specification": {
+                "collection": COLLECTION,
+                "job": "combine",
+                "version": _VERSION,
+                "variables": {"outputFile": "combined.smi"},
+            },
+            "plumbing": [
+                {
+                    "variable": "inputFile",
+                    "from-step": {"name": "process", "variable": "outputFile"},
+                },
+                {
+                    "variable": "inputDirPrefix",
+                    "from-predefined": {"variable": "instance-link-glob"},
+                },
+            ],
+        },
+    ]
+    name: str = f"fan-out-{replicas}"
+    return SyntheticWorkflow(
+        name=name,
+        definition=_get_definition(name, steps),
+        job_definitions=_get_job_definitions(set()),
+        instances=replicas + 2,
+        mock_outputs=[
+            {
+                "step_name": "split",
+                "output_variable": "outputBase",
+                "output": [f"chunk_{number}.smi" for number in range(replicas)],
+            }
+        ],
+    )
@@ -0,0 +1,340 @@
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+from tests.async_instance_launcher import UnitTestAsyncInstanceLauncher
+from tests.async_wapi_adapter import UnitTestAsyncWorkflowAPIAdapter
+from tests.instance_launcher import UnitTestInstanceLauncher
+from tests.test_workflow_engine_examples import (
+    assert_each_step_launched_once,
+    create_running_workflow,
+    start_message_for,
+)
+from tests.wapi_adapter import UnitTestWorkflowAPIAdapter
+from workflow.async_workflow_engine import AsyncWorkflowEngine
+from workflow.decoder import build_workflow_plan
+from workflow.workflow_abc import AsyncInstanceLauncher, LaunchParameters, LaunchResult
+
+
+class CollectingMessageDispatcher:
+    """A message dispatcher that keeps the messages it's given
+    (rather than putting them on a queue) so a test can hand them to the engine."""
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message) -> None:
+        self.messages.append(message)
+
+
+class PerStepStatusAsyncWorkflowAPIAdapter(UnitTestAsyncWorkflowAPIAdapter):
+    """An asyncio adapter without the optional bulk step status method."""
+
+    async def get_status_of_all_step_instances(self, *, running_workflow_id: str):
+        raise NotImplementedError
+
+
+def async_engine_for(
+    da, *, adapter_class=UnitTestAsyncWorkflowAPIAdapter, latency_s: float = 0.0
+):
+    """Creates an asyncio engine (and its asyncio API adapter) using the given
+    UnitTest API adapter, and the dispatcher that collects its Pod messages."""
+    message_dispatcher = CollectingMessageDispatcher()
+    instance_launcher = UnitTestAsyncInstanceLauncher(
+        UnitTestInstanceLauncher(wapi_adapter=da, msg_dispatcher=message_dispatcher)
+    )
+    async_da = adapter_class(da, latency_s=latency_s)
+    we = AsyncWorkflowEngine(wapi_adapter=async_da, instance_launcher=instance_launcher)
+    return we, async_da, message_dispatcher
+
+
+async def run_until_idle(we, message_dispatcher) -> None:
+    """Hands the engine the messages it has caused to be sent, all at once,
+    until there are none left."""
+    while message_dispatcher.messages:
+        messages = message_dispatcher.messages
+        message_dispatcher.messages = []
+        await asyncio.gather(*(we.handle_message(msg) for msg in messages))
+
+
+def test_async_workflow_engine_example_diamond():
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    we, _, md = async_engine_for(da)
+    r_wfid = create_running_workflow(da, "example-diamond")
+
+    # Act
+    async def run():
+        await we.handle_message(start_message_for(r_wfid))
+        await run_until_idle(we, md)
+
+    asyncio.run(run())
+
+    # Assert
+    response, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    assert response["done"]
+    assert response["success"]
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    assert steps["count"] == 4
+    assert_each_step_launched_once(da, r_wfid)
+
+
+def test_async_workflow_engine_example_nop_fail():
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    we, _, md = async_engine_for(da)
+    r_wfid = create_running_workflow(da, "example-nop-fail")
+
+    # Act
+    async def run():
+        await we.handle_message(start_message_for(r_wfid))
+        await run_until_idle(we, md)
+
+    asyncio.run(run())
+
+    # Assert
+    response, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    assert response["done"]
+    assert not response["success"]
+
+
+def test_async_workflow_engine_reads_step_status_concurrently():
+    """Without the bulk step status method the status of each step
+    of the workflow is read by name - and all four reads should overlap."""
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    we, async_da, _ = async_engine_for(
+        da, adapter_class=PerStepStatusAsyncWorkflowAPIAdapter, latency_s=0.01
+    )
+    r_wfid = create_running_workflow(da, "example-diamond")
+
+    # Act
+    asyncio.run(we.handle_message(start_message_for(r_wfid)))
+
+    # Assert
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    assert [step["name"] for step in steps["running_workflow_steps"]] == ["split"]
+    assert async_da.max_concurrent_calls >= 4
+
+
+def test_async_workflow_engine_handles_workflows_concurrently():
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    we, async_da, _ = async_engine_for(da, latency_s=0.01)
+    r_wfid_1 = create_running_workflow(da, "example-diamond")
+    r_wfid_2 = create_running_workflow(da, "example-diamond")
+
+    # Act
+    async def run():
+        await asyncio.gather(
+            we.handle_message(start_message_for(r_wfid_1)),
+            we.handle_message(start_message_for(r_wfid_2)),
+        )
+
+    asyncio.run(run())
+
+    # Assert
+    for r_wfid in [r_wfid_1, r_wfid_2]:
+        steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+        assert steps["count"] == 1
+    assert async_da.max_concurrent_calls >= 2
+
+
+class CountingAsyncInstanceLauncher(UnitTestAsyncInstanceLauncher):
+    """A UnitTest asyncio launcher that counts the launches of each step."""
+
+    def __init__(self, instance_launcher: UnitTestInstanceLauncher):
+        super().__init__(instance_launcher)
+        self.launches = {}
+
+    async def launch(self, *, launch_parameters: LaunchParameters, **kwargs):
+        step_name = launch_parameters.step_name
+        self.launches[step_name] = self.launches.get(step_name, 0) + 1
+        return await super().launch(launch_parameters=launch_parameters)
+
+
+def test_async_workflow_engine_handles_a_workflows_messages_in_turn():
+    """The Pod messages of both branches of a diamond arrive together. Handled
+    at the same time, both could find 'merge' READY (or one could find it
+    not yet launched, and nothing running, and fail the workflow as stalled)."""
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    md = CollectingMessageDispatcher()
+    launcher = CountingAsyncInstanceLauncher(
+        UnitTestInstanceLauncher(wapi_adapter=da, msg_dispatcher=md)
+    )
+    we = AsyncWorkflowEngine(
+        wapi_adapter=UnitTestAsyncWorkflowAPIAdapter(da, latency_s=0.01),
+        instance_launcher=launcher,
+    )
+    r_wfid = create_running_workflow(da, "example-diamond")
+
+    # Act
+    async def run():
+        await we.handle_message(start_message_for(r_wfid))
+        await run_until_idle(we, md)
+
+    asyncio.run(run())
+
+    # Assert
+    response, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    assert response["done"]
+    assert response["success"]
+    assert launcher.launches["merge"] == 1
+    # Locks are only kept while they're needed
+    assert not we._running_workflow_locks
+
+
+class RecordingAsyncInstanceLauncher(AsyncInstanceLauncher):
+    """A launcher that launches nothing, recording how many launches
+    were in progress at the same time."""
+
+    def __init__(self):
+        super().__init__()
+        self.max_concurrent_launches = 0
+        self._launches_in_progress = 0
+
+    async def launch(self, *, launch_parameters: LaunchParameters, **kwargs):
+        self._launches_in_progress += 1
+        self.max_concurrent_launches = max(
+            self.max_concurrent_launches, self._launches_in_progress
+        )
+        await asyncio.sleep(0.01)
+        self._launches_in_progress -= 1
+        return LaunchResult(
+            running_workflow_step_id="step",
+            instance_id=f"instance-{launch_parameters.step_replication_number}",
+        )
+
+
+def test_async_workflow_engine_limits_concurrent_launches():
+    # Arrange
+    launcher = RecordingAsyncInstanceLauncher()
+    we = AsyncWorkflowEngine(
+        wapi_adapter=UnitTestAsyncWorkflowAPIAdapter(UnitTestWorkflowAPIAdapter()),
+        instance_launcher=launcher,
+        launch_workers=3,
+    )
+    launch_parameters = [
+        LaunchParameters(
+            project_id="project",
+            name="step",
+            launching_user_name="dlister",
+            launching_user_api_token="token",
+            specification={},
+            variables={},
+            running_workflow_id="r-workflow",
+            step_name="step",
+            step_replication_number=replica,
+            total_number_of_replicas=10,
+        )
+        for replica in range(10)
+    ]
+
+    # Act
+    results = asyncio.run(we._launch_replicas(launch_parameters))
+
+    # Assert
+    assert len(results) == 10
+    assert launcher.max_concurrent_launches == 3
+
+
+class ReadCountingAsyncWorkflowAPIAdapter(PerStepStatusAsyncWorkflowAPIAdapter):
+    """An asyncio adapter (without the bulk step status method) that records
+    the step records, step statuses and Jobs it's asked for."""
+
+    def __init__(self, wapi_adapter, latency_s=0.0):
+        super().__init__(wapi_adapter, latency_s=latency_s)
+        self.reads = []
+
+    async def get_running_workflow_step_by_name(
+        self, *, name: str, running_workflow_id: str, replica: int = 0
+    ):
+        self.reads.append(("step", name))
+        return await super().get_running_workflow_step_by_name(
+            name=name, running_workflow_id=running_workflow_id, replica=replica
+        )
+
+    async def get_status_of_all_step_instances_by_name(
+        self, *, name: str, running_workflow_id: str
+    ):
+        self.reads.append(("status", name))
+        return await super().get_status_of_all_step_instances_by_name(
+            name=name, running_workflow_id=running_workflow_id
+        )
+
+    async def get_job(self, *, collection: str, job: str, version: str):
+        self.reads.append(("job", job))
+        return await super().get_job(collection=collection, job=job, version=version)
+
+
+def test_async_workflow_engine_reads_prior_steps_once():
+    """Both branches of a diamond depend on 'split'. Its record and status
+    are read once, for both of them, when it finishes."""
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    we, async_da, md = async_engine_for(
+        da, adapter_class=ReadCountingAsyncWorkflowAPIAdapter
+    )
+    r_wfid = create_running_workflow(da, "example-diamond")
+    asyncio.run(we.handle_message(start_message_for(r_wfid)))
+    (split_message,) = md.messages
+    async_da.reads = []
+
+    # Act
+    asyncio.run(we.handle_message(split_message))
+
+    # Assert
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    assert steps["count"] == 3
+    assert async_da.reads.count(("step", "split")) == 1
+    assert async_da.reads.count(("status", "split")) == 1
+
+
+def test_async_prepare_combiner_step_without_reads():
+    """A combiner is given the records and statuses of its prior step,
+    and does not need the Job of that step."""
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    we, async_da, _ = async_engine_for(
+        da, adapter_class=ReadCountingAsyncWorkflowAPIAdapter
+    )
+    r_wfid = create_running_workflow(
+        da,
+        "simple-python-split-combine",
+        variables={"candidateMolecules": "in.smi", "combination": "out.smi"},
+    )
+    rwf, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    wf_response, _ = da.get_workflow(workflow_id=rwf["workflow"]["id"])
+    plan = build_workflow_plan(wf_response)
+
+    # Act
+    sp_resp = asyncio.run(
+        we._prepare_step(
+            step_definition=plan.steps["combine"],
+            plan=plan,
+            rwf=rwf,
+            step_status_responses={
+                "parallel": {
+                    "status": [
+                        {"instance_id": "instance-0"},
+                        {"instance_id": "instance-1"},
+                    ]
+                }
+            },
+            prior_steps={
+                "parallel": {
+                    "id": "r-workflow-step-0",
+                    "instance_id": "instance-0",
+                    "variables": {"outputFile": "results.smi"},
+                }
+            },
+        )
+    )
+
+    # Assert
+    assert sp_resp.error_num == 0
+    assert sp_resp.dependent_instances == {"instance-0", "instance-1"}
+    assert async_da.reads == [("job", "concatenate")]
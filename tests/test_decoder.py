@@ -1,4 +1,7 @@
+import copy
+import json
 import os
+import pickle
 from typing import Any
 
 import pytest
@@ -57,6 +60,25 @@ with open(
 assert _STEP_SPECIFICATION_VARIABLE_NAMES_WORKFLOW
 
 
+_EXAMPLE_DIAMOND_WORKFLOW_FILE: str = os.path.join(
+    os.path.dirname(__file__), "workflow-definitions", "example-diamond.yaml"
+)
+with open(_EXAMPLE_DIAMOND_WORKFLOW_FILE, "r", encoding="utf8") as workflow_file:
+    _EXAMPLE_DIAMOND_WORKFLOW: dict[str, Any] = yaml.safe_load(workflow_file)
+assert _EXAMPLE_DIAMOND_WORKFLOW
+
+_EXAMPLE_UNSATISFIABLE_STEP_WORKFLOW_FILE: str = os.path.join(
+    os.path.dirname(__file__),
+    "workflow-definitions",
+    "example-unsatisfiable-step.yaml",
+)
+with open(
+    _EXAMPLE_UNSATISFIABLE_STEP_WORKFLOW_FILE, "r", encoding="utf8"
+) as workflow_file:
+    _EXAMPLE_UNSATISFIABLE_STEP_WORKFLOW: dict[str, Any] = yaml.safe_load(workflow_file)
+assert _EXAMPLE_UNSATISFIABLE_STEP_WORKFLOW
+
+
 def test_validate_schema_for_minimal():
     # Arrange
 
@@ -103,6 +125,46 @@ def test_workflow_name_with_spaces():
     )
 
 
+def test_validate_schema_for_step_max_concurrency():
+    # Arrange
+    workflow = copy.deepcopy(_MINIMAL_WORKFLOW)
+    workflow["steps"][0]["max-concurrency"] = 4
+
+    # Act
+    error = decoder.validate_schema(workflow)
+
+    # Assert
+    assert error is None
+    assert decoder.get_step_max_concurrency(step_definition=workflow["steps"][0]) == 4
+
+
+def test_validate_schema_for_step_max_concurrency_of_zero():
+    # Arrange
+    workflow = copy.deepcopy(_MINIMAL_WORKFLOW)
+    workflow["steps"][0]["max-concurrency"] = 0
+
+    # Act
+    error = decoder.validate_schema(workflow)
+
+    # Assert
+    assert error == "0 is less than the minimum of 1"
+
+
+def test_validate_schema_for_step_files_per_replica():
+    # Arrange
+    workflow = copy.deepcopy(_MINIMAL_WORKFLOW)
+    workflow["steps"][0]["files-per-replica"] = 10
+
+    # Act
+    error = decoder.validate_schema(workflow)
+
+    # Assert
+    assert error is None
+    assert (
+        decoder.get_step_files_per_replica(step_definition=workflow["steps"][0]) == 10
+    )
+
+
 def test_validate_schema_for_shortcut_example_1():
     # Arrange
 
@@ -209,3 +271,210 @@ def test_get_step_dependencies_when_step_has_no_plumbing():
 
     # Assert
     assert dependencies == set()
+
+
+def test_build_workflow_plan_for_diamond():
+    # Arrange
+
+    # Act
+    plan = decoder.build_workflow_plan(_EXAMPLE_DIAMOND_WORKFLOW)
+
+    # Assert
+    assert plan.step_names == ["split", "branch-a", "branch-b", "merge"]
+    assert plan.steps["merge"]["name"] == "merge"
+    assert plan.dependencies["split"] == set()
+    assert plan.dependencies["merge"] == {"branch-a", "branch-b"}
+    assert plan.dependents["split"] == ["branch-a", "branch-b"]
+    assert plan.dependents["branch-a"] == ["merge"]
+    assert plan.dependents["merge"] == []
+    assert plan.topological_order == ["split", "branch-a", "branch-b", "merge"]
+    assert plan.duplicate_step_names == []
+    connections = plan.prior_step_connections["merge"]
+    assert connections["branch-a"] == [
+        decoder.Connector(in_="outputFile", out="inputFileA")
+    ]
+    assert connections["branch-b"] == [
+        decoder.Connector(in_="outputFile", out="inputFileB")
+    ]
+
+
+def test_build_workflow_plan_orders_steps_by_dependency():
+    # Arrange
+    workflow = {
+        "name": "out-of-order",
+        "steps": [
+            {
+                "name": "consumer",
+                "plumbing": [
+                    {
+                        "variable": "inputFile",
+                        "from-step": {"name": "provider", "variable": "outputFile"},
+                    }
+                ],
+            },
+            {"name": "provider"},
+        ],
+    }
+
+    # Act
+    plan = decoder.build_workflow_plan(workflow)
+
+    # Assert
+    assert plan.step_names == ["consumer", "provider"]
+    assert plan.topological_order == ["provider", "consumer"]
+
+
+def test_build_workflow_plan_for_unsatisfiable_step():
+    # Arrange
+
+    # Act
+    plan = decoder.build_workflow_plan(_EXAMPLE_UNSATISFIABLE_STEP_WORKFLOW)
+
+    # Assert
+    assert plan.step_names == ["provider", "consumer"]
+    assert plan.dependencies["consumer"] == {"no-such-step"}
+    # A step that can never run has no place in the order
+    assert plan.topological_order == ["provider"]
+
+
+def test_build_workflow_plan_with_duplicate_step_names():
+    # Arrange
+    workflow = {
+        "name": "duplicates",
+        "steps": [
+            {"name": "step-1", "description": "first"},
+            {"name": "step-1", "description": "second"},
+            {"name": "step-2"},
+        ],
+    }
+
+    # Act
+    plan = decoder.build_workflow_plan(workflow)
+
+    # Assert
+    assert plan.step_names == ["step-1", "step-2"]
+    assert plan.steps["step-1"]["description"] == "first"
+    assert plan.duplicate_step_names == ["step-1"]
+
+
+def test_build_workflow_plan_for_simple_python_molprops():
+    # Arrange
+
+    # Act
+    plan = decoder.build_workflow_plan(_SIMPLE_PYTHON_MOLPROPS_WORKFLOW)
+
+    # Assert
+    assert plan.workflow_variable_names == {
+        "candidateMolecules",
+        "clusteredMolecules",
+    }
+    assert plan.workflow_variable_connections["step1"] == [
+        decoder.Connector(in_="candidateMolecules", out="inputFile")
+    ]
+
+
+def test_iter_schema_errors_for_minimal():
+    # Arrange
+
+    # Act
+    errors = list(decoder.iter_schema_errors(_MINIMAL_WORKFLOW))
+
+    # Assert
+    assert errors == []
+
+
+def test_iter_schema_errors_reports_every_error():
+    # Arrange
+    workflow = _MINIMAL_WORKFLOW.copy()
+    _ = workflow.pop("kind-version", None)
+    workflow["name"] = "workflow with spaces"
+    workflow["steps"] = [{"name": "step-1"}]
+
+    # Act
+    errors = list(decoder.iter_schema_errors(workflow))
+
+    # Assert
+    assert set(errors) == {
+        "$: 'kind-version' is a required property",
+        "$.name: 'workflow with spaces' does not match '^[a-z][a-z0-9-]{0,63}$(?<!-)'",
+        "$.steps[0]: 'specification' is a required property",
+    }
+
+
+def test_workflow_schema_json_is_up_to_date():
+    # Arrange
+    # The JSON schema is generated from the YAML schema
+    # (regenerate it with 'python -m workflow.decoder')
+
+    # Act
+    with open(decoder._WORKFLOW_SCHEMA_JSON_FILE, "r", encoding="utf8") as schema_file:
+        schema = json.load(schema_file)
+
+    # Assert
+    assert schema == decoder._load_yaml_schema()
+
+
+def test_load_workflow_from_a_path_bytes_and_a_stream():
+    # Arrange
+    with open(_EXAMPLE_DIAMOND_WORKFLOW_FILE, "rb") as workflow_file:
+        content = workflow_file.read()
+
+    # Act
+    from_path = decoder.load_workflow(_EXAMPLE_DIAMOND_WORKFLOW_FILE)
+    from_bytes = decoder.load_workflow(content)
+    with open(_EXAMPLE_DIAMOND_WORKFLOW_FILE, "r", encoding="utf8") as workflow_file:
+        from_stream = decoder.load_workflow(workflow_file)
+
+    # Assert
+    assert from_path == _EXAMPLE_DIAMOND_WORKFLOW
+    # The same content is only loaded once
+    assert from_bytes is from_path
+    assert from_stream is from_path
+    assert decoder.validate_schema(from_path) is None
+
+
+def test_load_workflow_is_immutable():
+    # Arrange
+    workflow = decoder.load_workflow(_MINIMAL_WORKFLOW_FILE)
+
+    # Act
+    with pytest.raises(TypeError):
+        workflow["name"] = "blob"
+    with pytest.raises(TypeError):
+        workflow["steps"].append({})
+    with pytest.raises(TypeError):
+        workflow["steps"][0].pop("name")
+    workflow_copy = decoder.copy_value(workflow)
+    workflow_copy["name"] = "blob"
+
+    # Assert
+    assert workflow == _MINIMAL_WORKFLOW
+    assert copy.deepcopy(workflow) == _MINIMAL_WORKFLOW
+    assert type(copy.deepcopy(workflow)["steps"]) is list
+    assert type(pickle.loads(pickle.dumps(workflow))) is dict
+    assert workflow_copy["name"] == "blob"
+
+
+def test_load_workflow_that_is_not_a_dictionary():
+    # Arrange
+
+    # Act
+    with pytest.raises(ValueError):
+        _ = decoder.load_workflow(b"- step-1\n")
+
+    # Assert
+
+
+def test_load_workflow_keeps_a_limited_number_of_definitions(monkeypatch):
+    # Arrange
+    monkeypatch.setattr(decoder, "_LOADED_WORKFLOWS_MAX_ENTRIES", 2)
+    decoder._LOADED_WORKFLOWS.clear()
+
+    # Act
+    first = decoder.load_workflow(b"name: workflow-1\n")
+    _ = decoder.load_workflow(b"name: workflow-2\n")
+    _ = decoder.load_workflow(b"name: workflow-3\n")
+
+    # Assert
+    assert len(decoder._LOADED_WORKFLOWS) == 2
+    assert decoder.load_workflow(b"name: workflow-1\n") is not first
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+from tests.engine_benchmark import main, run_benchmark, run_sharded_benchmark
+from tests.synthetic_workflows import get_chain, get_dag, get_diamond, get_fan_out
+from workflow import decoder
+
+
+@pytest.mark.parametrize(
+    "workflow",
+    [get_chain(10), get_diamond(10), get_dag(100), get_fan_out(10)],
+    ids=lambda workflow: workflow.name,
+)
+def test_synthetic_workflows_are_valid(workflow):
+    # Arrange
+
+    # Act
+    error = decoder.validate_schema(workflow.definition)
+    plan = decoder.build_workflow_plan(workflow.definition)
+
+    # Assert
+    assert error is None
+    assert len(plan.step_names) == len(workflow.definition["steps"])
+
+
+def test_synthetic_dag_is_repeatable():
+    # Arrange
+
+    # Act
+    dag = get_dag(100, seed=1)
+
+    # Assert
+    assert dag.definition == get_dag(100, seed=1).definition
+    assert dag.definition != get_dag(100, seed=2).definition
+
+
+@pytest.mark.parametrize("adapter", ["memory", "sqlite"])
+@pytest.mark.parametrize("stateful", [False, True])
+@pytest.mark.parametrize(
+    "workflow",
+    [get_chain(5), get_diamond(5), get_dag(20), get_fan_out(5)],
+    ids=lambda workflow: workflow.name,
+)
+def test_benchmark_runs_a_workflow(workflow, stateful, adapter):
+    # Arrange
+
+    # Act
+    result = run_benchmark(workflow, stateful=stateful, adapter=adapter)
+
+    # Assert
+    assert result["instances"] == workflow.instances
+    assert result["messages"] == workflow.instances + 1
+    assert result["messages_per_second"] > 0
+    assert result["adapter_calls"] == sum(result["adapter_calls_by_method"].values())
+    assert result["peak_memory_bytes"] > 0
+
+
+@pytest.mark.parametrize(
+    "workflow", [get_chain(3), get_fan_out(4)], ids=lambda workflow: workflow.name
+)
+def test_sharded_benchmark_runs_workflows(workflow):
+    # Arrange
+
+    # Act
+    result = run_sharded_benchmark(
+        workflow, workers=2, running_workflows=3, launch_latency=0.01
+    )
+
+    # Assert
+    assert result["workers"] == 2
+    assert result["messages"] == 3 * (workflow.instances + 1)
+    assert result["messages_per_second"] > 0
+
+
+def test_benchmark_report(tmp_path):
+    # Arrange
+    output = tmp_path / "benchmark.json"
+
+    # Act
+    report = main(
+        [
+            "chain:3",
+            "fan-out:4",
+            "--batch-size",
+            "4",
+            "--latency",
+            "0.001",
+            "--output",
+            str(output),
+        ]
+    )
+
+    # Assert
+    assert json.loads(output.read_text()) == report
+    assert [result["workflow"] for result in report["results"]] == [
+        "chain-3",
+        "fan-out-4",
+    ]
+    assert report["results"][1]["messages"] == 7
+    assert report["results"][1]["latency"] == 0.001
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+from tests.import_benchmark import get_import_times, main, run_benchmark
+
+
+@pytest.mark.parametrize(
+    "module, deferred",
+    [
+        ("workflow.decoder", ["decoder.decoder", "jsonschema", "yaml"]),
+        ("workflow.workflow_validator", ["decoder.decoder", "jsonschema", "yaml"]),
+        (
+            "workflow.workflow_engine",
+            [
+                "decoder.decoder",
+                "jsonschema",
+                "yaml",
+                "http.server",
+                "google.protobuf.message",
+                "informaticsmatters.protobuf.datamanager.pod_message_pb2",
+            ],
+        ),
+        (
+            "workflow.async_workflow_engine",
+            ["decoder.decoder", "jsonschema", "google.protobuf.message"],
+        ),
+    ],
+)
+def test_import_defers_slow_modules(module, deferred):
+    # Arrange
+
+    # Act
+    times = get_import_times(module)
+
+    # Assert
+    imported = {time.name for time in times}
+    assert module in imported
+    assert imported.isdisjoint(deferred)
+
+
+def test_benchmark_imports_a_module():
+    # Arrange
+
+    # Act
+    result = run_benchmark("workflow.decoder", repeat=2, top=3)
+
+    # Assert
+    assert result["module"] == "workflow.decoder"
+    assert result["cumulative_us"] >= result["self_us"] > 0
+    assert result["modules_imported"] > 1
+    assert len(result["slowest"]) == 3
+
+
+def test_benchmark_report(tmp_path):
+    # Arrange
+    output = tmp_path / "import-benchmark.json"
+
+    # Act
+    report = main(["workflow.decoder", "--repeat", "1", "--output", str(output)])
+
+    # Assert
+    assert json.loads(output.read_text()) == report
+    assert [result["module"] for result in report["results"]] == ["workflow.decoder"]
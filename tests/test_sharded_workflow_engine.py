@@ -0,0 +1,259 @@
+import time
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+from tests.instance_launcher import UnitTestInstanceLauncher
+from tests.message_dispatcher import UnitTestMessageDispatcher
+from tests.message_queue import UnitTestMessageQueue
+from tests.test_workflow_engine_examples import (
+    assert_each_step_launched_once,
+    create_running_workflow,
+    manual_engine,
+    pod_message_for,
+    start_message_for,
+)
+from tests.wapi_adapter import UnitTestWorkflowAPIAdapter
+from workflow.sharded_workflow_engine import ShardedWorkflowEngine, get_shard
+from workflow.workflow_engine import WorkflowEngine
+
+
+def run_workflows(workflow_file_name: str, count: int, *, workers: int) -> None:
+    """Runs 'count' copies of a workflow on a 'ShardedWorkflowEngine'
+    (fed by the UnitTest message queue)."""
+    da = UnitTestWorkflowAPIAdapter()
+    message_queue = UnitTestMessageQueue()
+    message_dispatcher = UnitTestMessageDispatcher(msg_queue=message_queue)
+    instance_launcher = UnitTestInstanceLauncher(
+        wapi_adapter=da, msg_dispatcher=message_dispatcher
+    )
+    engine = WorkflowEngine(wapi_adapter=da, instance_launcher=instance_launcher)
+    # Each worker (forked from us) gets its own copy of the engine
+    sharded_engine = ShardedWorkflowEngine(
+        engine_factory=lambda: engine, workers=workers, batch_size=8
+    )
+    sharded_engine.start()
+    message_queue.set_receiver(sharded_engine.handle_message)
+    message_queue.start()
+    r_wfids = [create_running_workflow(da, workflow_file_name) for _ in range(count)]
+
+    start = time.monotonic()
+    for r_wfid in r_wfids:
+        message_queue.put(start_message_for(r_wfid))
+    while not all(
+        da.get_running_workflow(running_workflow_id=r_wfid)[0]["done"]
+        for r_wfid in r_wfids
+    ):
+        assert time.monotonic() - start < 60.0
+        time.sleep(0.05)
+
+    message_queue.stop()
+    message_queue.join()
+    sharded_engine.stop()
+    for r_wfid in r_wfids:
+        response, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+        assert response["success"]
+        assert_each_step_launched_once(da, r_wfid)
+
+
+def test_get_shard_is_stable():
+    # Arrange
+    r_wfid = "r-workflow-00000000-0000-0000-0000-000000000001"
+
+    # Act
+    shard = get_shard(running_workflow_id=r_wfid, shards=4)
+
+    # Assert
+    assert 0 <= shard < 4
+    assert get_shard(running_workflow_id=r_wfid, shards=4) == shard
+    assert get_shard(running_workflow_id=r_wfid, shards=1) == 0
+
+
+def test_get_instance_step_of_a_pod_message(manual_engine):
+    # Arrange
+    we, da = manual_engine
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+    we.handle_message(start_message_for(r_wfid))
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    instance_id = steps["running_workflow_steps"][0]["instance_id"]
+
+    # Act
+    r_wfsid, rwfs_response = we.get_instance_step(pod_message_for(instance_id))
+
+    # Assert
+    assert r_wfsid == steps["running_workflow_steps"][0]["id"]
+    assert rwfs_response["running_workflow"]["id"] == r_wfid
+
+
+class InstanceCountingWorkflowAPIAdapter(UnitTestWorkflowAPIAdapter):
+    """An API adapter that counts the Instances it's asked for."""
+
+    def __init__(self):
+        super().__init__()
+        self.get_instance_calls = 0
+
+    def get_instance(self, *, instance_id: str):
+        self.get_instance_calls += 1
+        return super().get_instance(instance_id=instance_id)
+
+
+def test_handle_messages_with_instance_steps():
+    """The step a Pod message's Instance was launched for is not read again
+    if it's given (as the 'ShardedWorkflowEngine' does)."""
+    # Arrange
+    da = InstanceCountingWorkflowAPIAdapter()
+    message_dispatcher = UnitTestMessageDispatcher(msg_queue=UnitTestMessageQueue())
+    we = WorkflowEngine(
+        wapi_adapter=da,
+        instance_launcher=UnitTestInstanceLauncher(
+            wapi_adapter=da, msg_dispatcher=message_dispatcher
+        ),
+    )
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+    we.handle_message(start_message_for(r_wfid))
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    msg = pod_message_for(steps["running_workflow_steps"][0]["instance_id"])
+    instance_step = we.get_instance_step(msg)
+    da.get_instance_calls = 0
+
+    # Act
+    we.handle_messages([msg], {msg.instance: instance_step})
+
+    # Assert
+    assert da.get_instance_calls == 0
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    assert len(steps["running_workflow_steps"]) == 2
+
+
+def test_sharded_workflow_engine_runs_workflows():
+    # Arrange
+
+    # Act
+    run_workflows("example-diamond", 4, workers=2)
+
+    # Assert (see 'run_workflows()')
+
+
+def test_sharded_workflow_engine_routes_by_running_workflow(manual_engine):
+    """Messages for different running workflows go to different workers,
+    and the Pod messages of a running workflow go to the worker its START
+    message went to (with the step their Instance was launched for)."""
+    # Arrange
+    we, da = manual_engine
+    r_wfids = [create_running_workflow(da, "example-two-step-nop") for _ in range(8)]
+    shards = {get_shard(running_workflow_id=r_wfid, shards=2) for r_wfid in r_wfids}
+    assert shards == {0, 1}
+    r_wfid = r_wfids[0]
+    other_r_wfid = next(
+        other
+        for other in r_wfids
+        if get_shard(running_workflow_id=other, shards=2)
+        != get_shard(running_workflow_id=r_wfid, shards=2)
+    )
+    we.handle_message(start_message_for(r_wfid))
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    instance_id = steps["running_workflow_steps"][0]["instance_id"]
+    # The workers are not started, so the messages stay on their queues
+    sharded_engine = ShardedWorkflowEngine(engine_factory=lambda: we, workers=2)
+
+    # Act
+    sharded_engine.handle_message(start_message_for(r_wfid))
+    sharded_engine.handle_message(start_message_for(other_r_wfid))
+    sharded_engine.handle_message(pod_message_for(instance_id))
+
+    # Assert
+    shard = get_shard(running_workflow_id=r_wfid, shards=2)
+    items = [sharded_engine._queues[shard].get(timeout=5.0) for _ in range(2)]
+    other_item = sharded_engine._queues[1 - shard].get(timeout=5.0)
+    assert [item["class"] for item in items] == ["WorkflowMessage", "PodMessage"]
+    assert items[1]["instance_step"][0] == steps["running_workflow_steps"][0]["id"]
+    assert other_item["class"] == "WorkflowMessage"
+    assert sharded_engine._queues[0].empty()
+    assert sharded_engine._queues[1].empty()
+
+
+class FailingOnceWorkflowEngine(WorkflowEngine):
+    """An engine that fails to handle its first batch of messages."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._failed = False
+
+    def handle_messages(self, msgs, instance_steps=None):
+        if not self._failed:
+            self._failed = True
+            raise RuntimeError("Cannot handle messages")
+        super().handle_messages(msgs, instance_steps)
+
+
+def wait_for_workflows(da, r_wfids) -> None:
+    """Waits for running workflows to finish (successfully)."""
+    start = time.monotonic()
+    while not all(
+        da.get_running_workflow(running_workflow_id=r_wfid)[0]["done"]
+        for r_wfid in r_wfids
+    ):
+        assert time.monotonic() - start < 30.0
+        time.sleep(0.05)
+    for r_wfid in r_wfids:
+        response, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+        assert response["success"]
+
+
+def sharded_engine_for(da, engine_class=WorkflowEngine):
+    """Builds a one-worker 'ShardedWorkflowEngine' fed by the UnitTest message queue
+    (returning the queue too)."""
+    message_queue = UnitTestMessageQueue()
+    message_dispatcher = UnitTestMessageDispatcher(msg_queue=message_queue)
+    engine = engine_class(
+        wapi_adapter=da,
+        instance_launcher=UnitTestInstanceLauncher(
+            wapi_adapter=da, msg_dispatcher=message_dispatcher
+        ),
+    )
+    sharded_engine = ShardedWorkflowEngine(engine_factory=lambda: engine, workers=1)
+    message_queue.set_receiver(sharded_engine.handle_message)
+    return sharded_engine, message_queue
+
+
+def test_sharded_workflow_engine_worker_survives_a_failed_batch():
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    sharded_engine, message_queue = sharded_engine_for(
+        da, engine_class=FailingOnceWorkflowEngine
+    )
+    sharded_engine.start()
+    message_queue.start()
+    lost_r_wfid = create_running_workflow(da, "example-two-step-nop")
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+
+    # Act
+    message_queue.put(start_message_for(lost_r_wfid))
+    message_queue.put(start_message_for(r_wfid))
+    wait_for_workflows(da, [r_wfid])
+
+    # Assert
+    message_queue.stop()
+    message_queue.join()
+    sharded_engine.stop()
+    response, _ = da.get_running_workflow(running_workflow_id=lost_r_wfid)
+    assert not response["done"]
+
+
+def test_sharded_workflow_engine_fails_when_a_worker_dies():
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    sharded_engine, _ = sharded_engine_for(da)
+    sharded_engine.start()
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+
+    # Act
+    sharded_engine._processes[0].kill()
+    assert sharded_engine._worker_died.wait(10.0)
+
+    # Assert
+    with pytest.raises(RuntimeError):
+        sharded_engine.handle_message(start_message_for(r_wfid))
+    with pytest.raises(RuntimeError):
+        sharded_engine.stop()
@@ -1,16 +1,38 @@
+import multiprocessing
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
+from informaticsmatters.protobuf.datamanager.pod_message_pb2 import PodMessage
+from informaticsmatters.protobuf.datamanager.workflow_message_pb2 import WorkflowMessage
 
 pytestmark = pytest.mark.unit
 
 from tests.config import TEST_PROJECT_ID
+from tests.engine_benchmark import NoOpInstanceLauncher
+from tests.memory_wapi_adapter import MemoryWorkflowAPIAdapter
+from tests.sqlite_wapi_adapter import SQLiteWorkflowAPIAdapter
+from tests.synthetic_workflows import get_diamond
 from tests.wapi_adapter import UnitTestWorkflowAPIAdapter
+from workflow.workflow_engine import WorkflowEngine
 
 _I_ID: str = "instance-00000000-0000-0000-0000-000000000000"
 
 
-def test_get_nop_job():
+@pytest.fixture(params=["pickle", "memory", "sqlite"])
+def utaa(request, tmp_path):
+    """Each adapter - they must behave in the same way."""
+    if request.param == "memory":
+        return MemoryWorkflowAPIAdapter()
+    if request.param == "sqlite":
+        return SQLiteWorkflowAPIAdapter(database=str(tmp_path / "wapi.db"))
+    return UnitTestWorkflowAPIAdapter()
+
+
+def test_get_nop_job(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
 
     # Act
     jd, _ = utaa.get_job(
@@ -21,9 +43,8 @@ def test_get_nop_job():
     assert jd["command"] == "nop.py"
 
 
-def test_get_unknown_workflow():
+def test_get_unknown_workflow(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
 
     # Act
     wfd, _ = utaa.get_workflow(
@@ -34,9 +55,8 @@ def test_get_unknown_workflow():
     assert wfd == {}
 
 
-def test_create_workflow():
+def test_create_workflow(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
 
     # Act
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
@@ -45,9 +65,8 @@ def test_create_workflow():
     assert response["id"] == "workflow-00000000-0000-0000-0000-000000000001"
 
 
-def test_get_workflow():
+def test_get_workflow(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     wfid = response["id"]
 
@@ -58,9 +77,8 @@ def test_get_workflow():
     assert wf["name"] == "blah"
 
 
-def test_create_running_workflow():
+def test_create_running_workflow(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
 
     # Act
@@ -75,9 +93,8 @@ def test_create_running_workflow():
     assert response["id"] == "r-workflow-00000000-0000-0000-0000-000000000001"
 
 
-def test_get_running_workflow():
+def test_get_running_workflow(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     wfid = response["id"]
     response = utaa.create_running_workflow(
@@ -97,9 +114,8 @@ def test_get_running_workflow():
     assert response["variables"] == {"x": 1}
 
 
-def test_get_running_steps_when_none_running():
+def test_get_running_steps_when_none_running(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     wfid = response["id"]
     response = utaa.create_running_workflow(
@@ -118,9 +134,8 @@ def test_get_running_steps_when_none_running():
     assert response["steps"] == []
 
 
-def test_set_running_workflow_done_when_success():
+def test_set_running_workflow_done_when_success(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     response = utaa.create_running_workflow(
         user_id="dlister",
@@ -141,9 +156,8 @@ def test_set_running_workflow_done_when_success():
     assert response["error_msg"] is None
 
 
-def test_set_running_workflow_done_when_failed():
+def test_set_running_workflow_done_when_failed(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     response = utaa.create_running_workflow(
         user_id="dlister",
@@ -166,9 +180,8 @@ def test_set_running_workflow_done_when_failed():
     assert response["error_msg"] == "Bang!"
 
 
-def test_create_running_workflow_step():
+def test_create_running_workflow_step(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     response = utaa.create_running_workflow(
         user_id="dlister",
@@ -186,9 +199,8 @@ def test_create_running_workflow_step():
     assert response["id"] == "r-workflow-step-00000000-0000-0000-0000-000000000001"
 
 
-def test_set_running_workflow_step_variables():
+def test_set_running_workflow_step_variables(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     response = utaa.create_running_workflow(
         user_id="dlister",
@@ -211,9 +223,8 @@ def test_set_running_workflow_step_variables():
     assert response["variables"] == {"z": 42}
 
 
-def test_set_running_workflow_step_done_when_success():
+def test_set_running_workflow_step_done_when_success(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     response = utaa.create_running_workflow(
         user_id="dlister",
@@ -238,9 +249,8 @@ def test_set_running_workflow_step_done_when_success():
     assert response["variables"] == {}
 
 
-def test_set_running_workflow_step_done_when_failed():
+def test_set_running_workflow_step_done_when_failed(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     response = utaa.create_running_workflow(
         user_id="dlister",
@@ -266,9 +276,8 @@ def test_set_running_workflow_step_done_when_failed():
     assert response["error_msg"] == "Bang!"
 
 
-def test_get_running_workflow_step():
+def test_get_running_workflow_step(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     wfid = response["id"]
     response = utaa.create_running_workflow(
@@ -293,9 +302,8 @@ def test_get_running_workflow_step():
     assert "prior_running_workflow_step" not in response
 
 
-def test_get_running_workflow_step_with_prior_step():
+def test_get_running_workflow_step_with_prior_step(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     wfid = response["id"]
     response = utaa.create_running_workflow(
@@ -321,9 +329,8 @@ def test_get_running_workflow_step_with_prior_step():
     assert response["running_workflow"]["id"] == rwfid
 
 
-def test_create_instance():
+def test_create_instance(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
 
     # Act
     response = utaa.create_instance()
@@ -332,9 +339,8 @@ def test_create_instance():
     assert "id" in response
 
 
-def test_create_and_get_instance():
+def test_create_and_get_instance(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_instance()
     instance_id = response["id"]
 
@@ -345,9 +351,8 @@ def test_create_and_get_instance():
     assert response["running_workflow_step_id"] == ""
 
 
-def test_get_running_workflow_step_by_name():
+def test_get_running_workflow_step_by_name(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(
         workflow_definition={
             "name": "blah",
@@ -377,9 +382,8 @@ def test_get_running_workflow_step_by_name():
     assert response["id"] == rwfs_id
 
 
-def test_mock_get_running_workflow_step_output_values_for_output():
+def test_mock_get_running_workflow_step_output_values_for_output(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     response = utaa.create_running_workflow(
         user_id="dlister",
@@ -407,9 +411,10 @@ def test_mock_get_running_workflow_step_output_values_for_output():
     assert "b" in response["output"]
 
 
-def test_basic_get_running_workflow_step_output_values_for_output_when_step_variable_name_unknown():
+def test_basic_get_running_workflow_step_output_values_for_output_when_step_variable_name_unknown(
+    utaa,
+):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
     response = utaa.create_workflow(workflow_definition={"name": "blah"})
     response = utaa.create_running_workflow(
         user_id="dlister",
@@ -434,9 +439,10 @@ def test_basic_get_running_workflow_step_output_values_for_output_when_step_vari
         )
 
 
-def test_basic_get_running_workflow_step_output_values_for_output_when_step_unknown():
+def test_basic_get_running_workflow_step_output_values_for_output_when_step_unknown(
+    utaa,
+):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
 
     # Act
     with pytest.raises(AssertionError):
@@ -448,9 +454,8 @@ def test_basic_get_running_workflow_step_output_values_for_output_when_step_unkn
     # Assert
 
 
-def test_basic_realise():
+def test_basic_realise(utaa):
     # Arrange
-    utaa = UnitTestWorkflowAPIAdapter()
 
     # Act
     response, _ = utaa.realise_outputs(
@@ -459,3 +464,271 @@ def test_basic_realise():
 
     # Assert
     assert not response
+
+
+def test_get_status_of_all_step_instances(utaa):
+    # Arrange
+    response = utaa.create_workflow(workflow_definition={"name": "blah"})
+    response = utaa.create_running_workflow(
+        user_id="dlister",
+        workflow_id=response["id"],
+        project_id=TEST_PROJECT_ID,
+        variables={},
+    )
+    rwf_id = response["id"]
+    _, _ = utaa.create_running_workflow_step(
+        running_workflow_id=rwf_id, step="step-1", instance_id=_I_ID
+    )
+    _, _ = utaa.create_running_workflow_step(
+        running_workflow_id=rwf_id,
+        step="step-2",
+        instance_id=_I_ID,
+        replica=0,
+        replicas=2,
+    )
+    _, _ = utaa.create_running_workflow_step(
+        running_workflow_id=rwf_id,
+        step="step-2",
+        instance_id=_I_ID,
+        replica=1,
+        replicas=2,
+    )
+
+    # Act
+    response, _ = utaa.get_status_of_all_step_instances(running_workflow_id=rwf_id)
+
+    # Assert
+    assert response["count"] == 2
+    assert response["steps"]["step-1"]["count"] == 1
+    assert response["steps"]["step-2"]["count"] == 2
+    for status in response["steps"]["step-2"]["status"]:
+        assert status["replicas"] == 2
+        assert not status["done"]
+
+
+def test_get_status_of_all_step_instances_when_none_launched(utaa):
+    # Arrange
+    response = utaa.create_workflow(workflow_definition={"name": "blah"})
+    response = utaa.create_running_workflow(
+        user_id="dlister",
+        workflow_id=response["id"],
+        project_id=TEST_PROJECT_ID,
+        variables={},
+    )
+
+    # Act
+    response, _ = utaa.get_status_of_all_step_instances(
+        running_workflow_id=response["id"]
+    )
+
+    # Assert
+    assert response["count"] == 0
+    assert response["steps"] == {}
+
+
+def test_memory_adapter_creates_a_step_replica_once_from_many_threads():
+    # Arrange
+    utaa = MemoryWorkflowAPIAdapter()
+    response = utaa.create_workflow(workflow_definition={"name": "blah"})
+    rwf_id = utaa.create_running_workflow(
+        user_id="dlister",
+        workflow_id=response["id"],
+        project_id=TEST_PROJECT_ID,
+        variables={},
+    )["id"]
+    barrier = threading.Barrier(8)
+
+    def create(replica: int) -> dict:
+        barrier.wait()
+        response, _ = utaa.create_running_workflow_step(
+            running_workflow_id=rwf_id,
+            step="step-1",
+            instance_id=_I_ID,
+            replica=replica,
+            replicas=2,
+        )
+        return response
+
+    # Act
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(create, [0, 1] * 4))
+
+    # Assert
+    created = [response for response in responses if "already_exists" not in response]
+    assert len(created) == 2
+    assert {response["id"] for response in responses} == {
+        response["id"] for response in created
+    }
+    status, _ = utaa.get_status_of_all_step_instances_by_name(
+        running_workflow_id=rwf_id, name="step-1"
+    )
+    assert status["count"] == 2
+
+
+def test_memory_adapter_latency():
+    # Arrange
+    utaa = MemoryWorkflowAPIAdapter(latency={"default": 0.0, "get_workflow": 0.1})
+    wfid = utaa.create_workflow(workflow_definition={"name": "blah"})["id"]
+
+    # Act
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        workflows = list(
+            executor.map(lambda _: utaa.get_workflow(workflow_id=wfid), range(4))
+        )
+    seconds = time.perf_counter() - start
+
+    # Assert
+    assert utaa.get_latency("get_workflow") == 0.1
+    assert utaa.get_latency("get_instance") == 0.0
+    assert all(workflow["name"] == "blah" for workflow, _ in workflows)
+    # The calls wait at the same time
+    assert 0.1 <= seconds < 0.4
+
+
+def _create_step_replicas(database: str, rwf_id: str, results) -> None:
+    """Creates the replicas of a step, as an engine worker (process) would,
+    putting the number created (not found to exist) on the results queue."""
+    utaa = SQLiteWorkflowAPIAdapter(database=database)
+    created = 0
+    for replica in range(4):
+        response, _ = utaa.create_running_workflow_step(
+            running_workflow_id=rwf_id,
+            step="step-1",
+            instance_id=_I_ID,
+            replica=replica,
+            replicas=4,
+        )
+        created += "already_exists" not in response
+    results.put(created)
+
+
+def test_sqlite_adapter_creates_a_step_replica_once_from_many_processes(tmp_path):
+    # Arrange
+    database = str(tmp_path / "wapi.db")
+    utaa = SQLiteWorkflowAPIAdapter(database=database)
+    response = utaa.create_workflow(workflow_definition={"name": "blah"})
+    rwf_id = utaa.create_running_workflow(
+        user_id="dlister",
+        workflow_id=response["id"],
+        project_id=TEST_PROJECT_ID,
+        variables={},
+    )["id"]
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=_create_step_replicas, args=(database, rwf_id, results)
+        )
+        for _ in range(4)
+    ]
+
+    # Act
+    for process in processes:
+        process.start()
+    created = sum(results.get(timeout=30) for _ in processes)
+    for process in processes:
+        process.join()
+
+    # Assert
+    assert created == 4
+    status, _ = utaa.get_status_of_all_step_instances_by_name(
+        running_workflow_id=rwf_id, name="step-1"
+    )
+    assert sorted(step.get("replica", 0) for step in status["status"]) == [0, 1, 2, 3]
+
+
+def test_sqlite_adapter_database(tmp_path):
+    # Arrange
+    database = str(tmp_path / "wapi.db")
+
+    # Act
+    _ = SQLiteWorkflowAPIAdapter(database=database)
+
+    # Assert
+    connection = sqlite3.connect(database)
+    (journal_mode,) = connection.execute("PRAGMA journal_mode").fetchone()
+    indexes = dict(
+        connection.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index'"
+            " AND tbl_name = 'running_workflow_step'"
+        ).fetchall()
+    )
+    connection.close()
+    assert journal_mode == "wal"
+    assert "UNIQUE" in indexes["running_workflow_step_replica"]
+    assert (
+        "running_workflow_pk, name, replica" in indexes["running_workflow_step_replica"]
+    )
+
+
+def test_sqlite_adapter_in_memory_is_shared_by_threads():
+    # Arrange
+    utaa = SQLiteWorkflowAPIAdapter()
+    wfid = utaa.create_workflow(workflow_definition={"name": "blah"})["id"]
+
+    # Act
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        workflow, _ = executor.submit(utaa.get_workflow, workflow_id=wfid).result()
+
+    # Assert
+    assert workflow["name"] == "blah"
+    assert SQLiteWorkflowAPIAdapter().get_workflow(workflow_id=wfid)[0] == {}
+
+
+def test_sqlite_adapter_engine_workers_launch_each_step_once(tmp_path):
+    # Arrange
+    # Engine workers (with adapters of their own, on the same database)
+    # are all given the same message at the same time
+    database = str(tmp_path / "wapi.db")
+    workflow = get_diamond(8)
+    utaa = SQLiteWorkflowAPIAdapter(
+        database=database, job_definitions=workflow.job_definitions
+    )
+    wfid = utaa.create_workflow(workflow_definition=workflow.definition)["id"]
+    rwf_id = utaa.create_running_workflow(
+        user_id="dlister",
+        workflow_id=wfid,
+        project_id=TEST_PROJECT_ID,
+        variables=workflow.variables,
+    )["id"]
+    barrier = threading.Barrier(4)
+
+    def handle_message(msg) -> None:
+        worker_adapter = SQLiteWorkflowAPIAdapter(
+            database=database, job_definitions=workflow.job_definitions
+        )
+        engine = WorkflowEngine(
+            wapi_adapter=worker_adapter,
+            instance_launcher=NoOpInstanceLauncher(wapi_adapter=worker_adapter),
+        )
+        barrier.wait()
+        engine.handle_message(msg)
+
+    def deliver(msg) -> None:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for future in [executor.submit(handle_message, msg) for _ in range(4)]:
+                future.result()
+
+    start_msg = WorkflowMessage()
+    start_msg.action = "START"
+    start_msg.running_workflow = rwf_id
+
+    # Act
+    deliver(start_msg)
+    source_steps = utaa.get_running_workflow_steps(running_workflow_id=rwf_id)
+    pod_msg = PodMessage()
+    pod_msg.phase = "Completed"
+    pod_msg.instance = utaa.get_running_workflow_step(
+        running_workflow_step_id=source_steps["running_workflow_steps"][0]["id"]
+    )[0]["instance_id"]
+    pod_msg.has_exit_code = True
+    pod_msg.exit_code = 0
+    deliver(pod_msg)
+
+    # Assert
+    assert source_steps["count"] == 1
+    steps = utaa.get_running_workflow_steps(running_workflow_id=rwf_id)
+    assert steps["count"] == 9
+    assert sorted(step["name"] for step in steps["running_workflow_steps"]) == sorted(
+        ["source"] + [f"branch-{number}" for number in range(1, 9)]
+    )
@@ -0,0 +1,265 @@
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+from workflow.workflow_cache import (
+    JobDefinitionCache,
+    WorkflowDefinitionCache,
+    get_definition_hash,
+)
+
+_WF_ID: str = "workflow-00000000-0000-0000-0000-000000000001"
+_DEFINITION: dict = {
+    "name": "blah",
+    "steps": [{"name": "step-1"}, {"name": "step-2"}],
+}
+
+
+def test_get_when_empty():
+    # Arrange
+    cache = WorkflowDefinitionCache()
+
+    # Act
+    entry = cache.get(workflow_id=_WF_ID, fingerprint="a")
+
+    # Assert
+    assert entry is None
+    assert cache.statistics.misses == 1
+    assert cache.statistics.hits == 0
+
+
+def test_put_and_get():
+    # Arrange
+    cache = WorkflowDefinitionCache()
+    _ = cache.put(workflow_id=_WF_ID, fingerprint="a", definition=_DEFINITION)
+
+    # Act
+    entry = cache.get(workflow_id=_WF_ID, fingerprint="a")
+
+    # Assert
+    assert entry
+    assert entry.definition is _DEFINITION
+    assert entry.plan.step_names == ["step-1", "step-2"]
+    assert cache.statistics.hits == 1
+    assert cache.statistics.misses == 0
+
+
+def test_get_with_different_fingerprint():
+    # Arrange
+    cache = WorkflowDefinitionCache()
+    _ = cache.put(workflow_id=_WF_ID, fingerprint="a", definition=_DEFINITION)
+
+    # Act
+    entry = cache.get(workflow_id=_WF_ID, fingerprint="b")
+
+    # Assert
+    assert entry is None
+    assert cache.statistics.misses == 1
+
+
+def definition_named(name: str) -> dict:
+    """A definition with its own content."""
+    return _DEFINITION | {"name": name}
+
+
+def test_least_recently_used_is_evicted():
+    # Arrange
+    cache = WorkflowDefinitionCache(max_entries=2)
+    _ = cache.put(workflow_id=_WF_ID, fingerprint="a", definition=definition_named("a"))
+    _ = cache.put(workflow_id=_WF_ID, fingerprint="b", definition=definition_named("b"))
+    # Use 'a' so that 'b' becomes the least recently used
+    assert cache.get(workflow_id=_WF_ID, fingerprint="a")
+
+    # Act
+    _ = cache.put(workflow_id=_WF_ID, fingerprint="c", definition=definition_named("c"))
+
+    # Assert
+    assert len(cache) == 2
+    assert cache.statistics.evictions == 1
+    assert cache.get(workflow_id=_WF_ID, fingerprint="a")
+    assert cache.get(workflow_id=_WF_ID, fingerprint="b") is None
+    assert cache.get(workflow_id=_WF_ID, fingerprint="c")
+
+
+def test_definitions_with_the_same_content_share_a_plan():
+    # Arrange
+    cache = WorkflowDefinitionCache()
+    first = cache.put(workflow_id=_WF_ID, fingerprint="a", definition=_DEFINITION)
+
+    # Act
+    second = cache.put(
+        workflow_id="workflow-2", fingerprint="b", definition=dict(_DEFINITION)
+    )
+
+    # Assert
+    assert len(cache) == 1
+    assert second is first
+    assert cache.get(workflow_id="workflow-2", fingerprint="b") is first
+
+
+def test_definition_hash_is_of_its_content():
+    # Arrange
+    reordered = {"steps": _DEFINITION["steps"], "name": _DEFINITION["name"]}
+
+    # Act
+    definition_hash = get_definition_hash(_DEFINITION)
+
+    # Assert
+    assert definition_hash == get_definition_hash(reordered)
+    assert definition_hash != get_definition_hash(definition_named("other"))
+    assert len(definition_hash) == 64
+
+
+def test_cache_with_no_entries():
+    # Arrange
+    cache = WorkflowDefinitionCache(max_entries=0)
+
+    # Act
+    entry = cache.put(workflow_id=_WF_ID, fingerprint="a", definition=_DEFINITION)
+
+    # Assert
+    assert entry.plan.step_names == ["step-1", "step-2"]
+    assert len(cache) == 0
+    assert cache.get(workflow_id=_WF_ID, fingerprint="a") is None
+
+
+class JobCountingAdapter:
+    """Just enough of an API adapter to serve (and count) Job definitions."""
+
+    def __init__(self):
+        self.get_job_calls = 0
+
+    def get_job(self, *, collection: str, job: str, version: str):
+        self.get_job_calls += 1
+        if job == "missing":
+            return {}, 0
+        return {"command": f"{job}.py", "version": version}, 0
+
+
+class AsyncJobCountingAdapter(JobCountingAdapter):
+    """The asyncio variant of the 'JobCountingAdapter'."""
+
+    async def get_job(self, *, collection: str, job: str, version: str):
+        return super().get_job(collection=collection, job=job, version=version)
+
+
+class FakeClock:
+    """A clock the test can move forward."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_get_job_is_cached():
+    # Arrange
+    adapter = JobCountingAdapter()
+    cache = JobDefinitionCache()
+    _ = cache.get_job(wapi_adapter=adapter, collection="c", job="j", version="1")
+
+    # Act
+    job = cache.get_job(wapi_adapter=adapter, collection="c", job="j", version="1")
+
+    # Assert
+    assert job["command"] == "j.py"
+    assert adapter.get_job_calls == 1
+    assert cache.statistics.hits == 1
+    assert cache.statistics.misses == 1
+
+
+def test_get_job_versions_are_cached_separately():
+    # Arrange
+    adapter = JobCountingAdapter()
+    cache = JobDefinitionCache()
+    _ = cache.get_job(wapi_adapter=adapter, collection="c", job="j", version="1")
+
+    # Act
+    job = cache.get_job(wapi_adapter=adapter, collection="c", job="j", version="2")
+
+    # Assert
+    assert job["version"] == "2"
+    assert adapter.get_job_calls == 2
+
+
+def test_get_job_when_missing_is_not_cached():
+    # Arrange
+    adapter = JobCountingAdapter()
+    cache = JobDefinitionCache()
+    _ = cache.get_job(wapi_adapter=adapter, collection="c", job="missing", version="1")
+
+    # Act
+    job = cache.get_job(
+        wapi_adapter=adapter, collection="c", job="missing", version="1"
+    )
+
+    # Assert
+    assert job == {}
+    assert adapter.get_job_calls == 2
+    assert len(cache) == 0
+
+
+def test_get_job_after_expiry():
+    # Arrange
+    adapter = JobCountingAdapter()
+    clock = FakeClock()
+    cache = JobDefinitionCache(ttl_s=10.0, clock=clock)
+    _ = cache.get_job(wapi_adapter=adapter, collection="c", job="j", version="1")
+    clock.now = 10.0
+
+    # Act
+    _ = cache.get_job(wapi_adapter=adapter, collection="c", job="j", version="1")
+
+    # Assert
+    assert adapter.get_job_calls == 2
+    assert cache.statistics.misses == 2
+
+
+def test_get_job_after_invalidate():
+    # Arrange
+    adapter = JobCountingAdapter()
+    cache = JobDefinitionCache()
+    _ = cache.get_job(wapi_adapter=adapter, collection="c", job="j", version="1")
+    cache.invalidate(collection="c", job="j", version="1")
+
+    # Act
+    _ = cache.get_job(wapi_adapter=adapter, collection="c", job="j", version="1")
+
+    # Assert
+    assert adapter.get_job_calls == 2
+
+
+def test_get_job_evicts_least_recently_used():
+    # Arrange
+    adapter = JobCountingAdapter()
+    cache = JobDefinitionCache(max_entries=1)
+    _ = cache.get_job(wapi_adapter=adapter, collection="c", job="a", version="1")
+
+    # Act
+    _ = cache.get_job(wapi_adapter=adapter, collection="c", job="b", version="1")
+
+    # Assert
+    assert len(cache) == 1
+    assert cache.statistics.evictions == 1
+
+
+def test_get_job_async_is_cached():
+    # Arrange
+    adapter = AsyncJobCountingAdapter()
+    cache = JobDefinitionCache()
+    _ = asyncio.run(
+        cache.get_job_async(wapi_adapter=adapter, collection="c", job="j", version="1")
+    )
+
+    # Act
+    job = asyncio.run(
+        cache.get_job_async(wapi_adapter=adapter, collection="c", job="j", version="1")
+    )
+
+    # Assert
+    assert job["command"] == "j.py"
+    assert adapter.get_job_calls == 1
+    assert cache.statistics.hits == 1
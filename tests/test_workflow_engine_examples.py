@@ -365,6 +365,398 @@ def test_workflow_engine_example_fan_in_waits_for_every_branch(manual_engine):
     assert not running_workflow["done"]
 
 
+class StatusCountingWorkflowAPIAdapter(UnitTestWorkflowAPIAdapter):
+    """An adapter that counts the per-step status calls it's asked to make."""
+
+    def __init__(self):
+        super().__init__()
+        self.status_calls = 0
+        self.status_by_name_calls = 0
+
+    def get_status_of_all_step_instances(self, *, running_workflow_id: str):
+        self.status_calls += 1
+        return super().get_status_of_all_step_instances(
+            running_workflow_id=running_workflow_id
+        )
+
+    def get_status_of_all_step_instances_by_name(
+        self, *, running_workflow_id: str, name: str
+    ):
+        self.status_by_name_calls += 1
+        return super().get_status_of_all_step_instances_by_name(
+            running_workflow_id=running_workflow_id, name=name
+        )
+
+
+class PerStepStatusWorkflowAPIAdapter(StatusCountingWorkflowAPIAdapter):
+    """An adapter without the optional bulk step status method."""
+
+    def get_status_of_all_step_instances(self, *, running_workflow_id: str):
+        raise NotImplementedError
+
+
+def manual_engine_for(da, *, stateful: bool = False):
+    """Like the 'manual_engine' fixture, but for a given API adapter."""
+    message_queue = UnitTestMessageQueue()
+    message_dispatcher = UnitTestMessageDispatcher(msg_queue=message_queue)
+    instance_launcher = UnitTestInstanceLauncher(
+        wapi_adapter=da, msg_dispatcher=message_dispatcher
+    )
+    return WorkflowEngine(
+        wapi_adapter=da, instance_launcher=instance_launcher, stateful=stateful
+    )
+
+
+def start_message_for(r_wfid: str) -> WorkflowMessage:
+    """Builds the WorkflowMessage the DM would send to start a running workflow."""
+    msg = WorkflowMessage()
+    msg.timestamp = f"{datetime.now(timezone.utc).isoformat()}Z"
+    msg.action = "START"
+    msg.running_workflow = r_wfid
+    return msg
+
+
+def test_workflow_engine_uses_bulk_step_status():
+    """With an adapter that provides all step statuses in one call the engine
+    must not ask for the status of each step by name. Neither step here depends
+    on another, so nothing else needs a step's status either."""
+    # Arrange
+    da = StatusCountingWorkflowAPIAdapter()
+    we = manual_engine_for(da)
+    r_wfid = create_running_workflow(da, "example-two-independent-nops")
+
+    # Act
+    we.handle_message(start_message_for(r_wfid))
+
+    # Assert
+    response = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    assert response["count"] == 2
+    assert da.status_by_name_calls == 0
+
+
+def test_workflow_engine_falls_back_to_per_step_status():
+    """An adapter that does not implement the bulk step status method
+    must still be able to run a workflow, one status call per step."""
+    # Arrange
+    da = PerStepStatusWorkflowAPIAdapter()
+    we = manual_engine_for(da)
+    r_wfid = create_running_workflow(da, "example-diamond")
+    we.handle_message(start_message_for(r_wfid))
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    assert steps["count"] == 1
+    split = steps["running_workflow_steps"][0]
+
+    # Act
+    we.handle_message(pod_message_for(split["instance_id"]))
+
+    # Assert
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    assert {s["name"] for s in steps["running_workflow_steps"]} == {
+        "split",
+        "branch-a",
+        "branch-b",
+    }
+    assert da.status_by_name_calls > 0
+
+
+def test_workflow_engine_only_assesses_dependents_of_a_finished_step():
+    """When 'branch-a' finishes only 'merge' depends on it, so only 'merge'
+    and the steps it depends on ('branch-a' and 'branch-b') need their status."""
+    # Arrange
+    da = PerStepStatusWorkflowAPIAdapter()
+    we = manual_engine_for(da)
+    r_wfid = create_running_workflow(da, "example-diamond")
+    we.handle_message(start_message_for(r_wfid))
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    split = steps["running_workflow_steps"][0]
+    we.handle_message(pod_message_for(split["instance_id"]))
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    branch_a = next(
+        s for s in steps["running_workflow_steps"] if s["name"] == "branch-a"
+    )
+    da.status_by_name_calls = 0
+
+    # Act
+    we.handle_message(pod_message_for(branch_a["instance_id"]))
+
+    # Assert
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    assert "merge" not in {s["name"] for s in steps["running_workflow_steps"]}
+    # Nothing is launched, so the engine also checks whether the workflow
+    # has stalled, which needs the status of every step (4 calls).
+    assert da.status_by_name_calls == 3 + 4
+
+
+class WorkflowCountingWorkflowAPIAdapter(UnitTestWorkflowAPIAdapter):
+    """An adapter that counts the workflow definitions it's asked for."""
+
+    def __init__(self):
+        super().__init__()
+        self.get_workflow_calls = 0
+
+    def get_workflow(self, *, workflow_id: str):
+        self.get_workflow_calls += 1
+        return super().get_workflow(workflow_id=workflow_id)
+
+
+def test_workflow_engine_fetches_workflow_definition_once():
+    """The definition of a running workflow cannot change, so the engine
+    should fetch it for the START message and re-use it for Pod messages."""
+    # Arrange
+    da = WorkflowCountingWorkflowAPIAdapter()
+    we = manual_engine_for(da)
+    r_wfid = create_running_workflow(da, "example-diamond")
+    we.handle_message(start_message_for(r_wfid))
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    split = steps["running_workflow_steps"][0]
+
+    # Act
+    we.handle_message(pod_message_for(split["instance_id"]))
+
+    # Assert
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    assert steps["count"] == 3
+    assert da.get_workflow_calls == 1
+    assert we.workflow_cache_statistics.misses == 1
+    assert we.workflow_cache_statistics.hits == 1
+
+
+def test_workflow_engine_compiles_a_workflow_definition_once():
+    """Runs of a workflow without a fingerprint each fetch its definition,
+    but they share its plan (the definitions have the same content)."""
+    # Arrange
+    da = WorkflowCountingWorkflowAPIAdapter()
+    we = manual_engine_for(da)
+    r_wfid = create_running_workflow(da, "example-diamond")
+    rwf, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    other_r_wfid = da.create_running_workflow(
+        user_id="dlister",
+        workflow_id=rwf["workflow"]["id"],
+        project_id=TEST_PROJECT_ID,
+        variables={},
+    )["id"]
+    r_wfids = [r_wfid, other_r_wfid]
+
+    # Act
+    for r_wfid in r_wfids:
+        we.handle_message(start_message_for(r_wfid))
+
+    # Assert
+    assert da.get_workflow_calls == 2
+    assert len(we._workflow_cache) == 1
+
+
+def complete_steps(we, da, r_wfid, names: set[str]) -> None:
+    """Hands the engine a (successful) Pod message for each named step."""
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    for step in steps["running_workflow_steps"]:
+        if step["name"] in names:
+            we.handle_message(pod_message_for(step["instance_id"]))
+
+
+def test_workflow_engine_stateful_reads_step_state_once():
+    """A stateful engine only needs the DM's step state when a workflow starts.
+    After that it keeps track of the steps itself."""
+    # Arrange
+    da = StatusCountingWorkflowAPIAdapter()
+    we = manual_engine_for(da, stateful=True)
+    r_wfid = create_running_workflow(da, "example-diamond")
+    we.handle_message(start_message_for(r_wfid))
+    complete_steps(we, da, r_wfid, {"split"})
+    complete_steps(we, da, r_wfid, {"branch-a", "branch-b"})
+
+    # Act
+    complete_steps(we, da, r_wfid, {"merge"})
+
+    # Assert
+    response, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    assert response["done"]
+    assert response["success"]
+    assert_each_step_launched_once(da, r_wfid)
+    assert da.status_calls == 1
+    # The finished workflow has been forgotten
+    assert we.step_state_cache_statistics.misses == 1
+    assert r_wfid not in we._step_state_cache
+
+
+def test_workflow_engine_stateful_rebuilds_state_after_restart():
+    """A new stateful engine must be able to continue a workflow
+    started by another, rebuilding its state from the DM."""
+    # Arrange
+    da = StatusCountingWorkflowAPIAdapter()
+    we = manual_engine_for(da, stateful=True)
+    r_wfid = create_running_workflow(da, "example-diamond")
+    we.handle_message(start_message_for(r_wfid))
+    complete_steps(we, da, r_wfid, {"split"})
+    restarted_we = manual_engine_for(da, stateful=True)
+
+    # Act
+    complete_steps(restarted_we, da, r_wfid, {"branch-a", "branch-b"})
+    complete_steps(restarted_we, da, r_wfid, {"merge"})
+
+    # Assert
+    response, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    assert response["done"]
+    assert response["success"]
+    assert_each_step_launched_once(da, r_wfid)
+    assert restarted_we.step_state_cache_statistics.misses == 1
+
+
+def test_workflow_engine_is_not_stateful_by_default(manual_engine):
+    # Arrange
+    we, _ = manual_engine
+
+    # Act
+    statistics = we.step_state_cache_statistics
+
+    # Assert
+    assert statistics is None
+
+
+def pod_messages_for(da, r_wfid, names: set[str], exit_code: int = 0) -> list:
+    """Builds a Pod message for each named step."""
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    return [
+        pod_message_for(step["instance_id"], exit_code)
+        for step in steps["running_workflow_steps"]
+        if step["name"] in names
+    ]
+
+
+def test_workflow_engine_handle_messages_assesses_a_workflow_once():
+    """Both branches of the diamond finishing in one batch should cost
+    a single assessment of 'merge' (and the steps it depends on)."""
+    # Arrange
+    da = PerStepStatusWorkflowAPIAdapter()
+    we = manual_engine_for(da)
+    r_wfid = create_running_workflow(da, "example-diamond")
+    we.handle_messages([start_message_for(r_wfid)])
+    we.handle_messages(pod_messages_for(da, r_wfid, {"split"}))
+    da.status_by_name_calls = 0
+
+    # Act
+    we.handle_messages(pod_messages_for(da, r_wfid, {"branch-a", "branch-b"}))
+
+    # Assert
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    assert "merge" in {s["name"] for s in steps["running_workflow_steps"]}
+    assert_each_step_launched_once(da, r_wfid)
+    # Preparing 'merge' uses the status of its 2 prior steps read to assess it.
+    # Handled one at a time the branches would need another 3 (for the first branch).
+    assert da.status_by_name_calls == 3
+
+
+def test_workflow_engine_handle_messages_for_several_workflows():
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    we = manual_engine_for(da)
+    r_wfids = [create_running_workflow(da, "example-diamond") for _ in range(2)]
+    we.handle_messages([start_message_for(r_wfid) for r_wfid in r_wfids])
+
+    # Act
+    we.handle_messages(
+        [msg for r_wfid in r_wfids for msg in pod_messages_for(da, r_wfid, {"split"})]
+    )
+
+    # Assert
+    for r_wfid in r_wfids:
+        steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+        assert {s["name"] for s in steps["running_workflow_steps"]} == {
+            "split",
+            "branch-a",
+            "branch-b",
+        }
+
+
+def test_workflow_engine_handle_messages_with_a_failed_step():
+    """A step failing in the same batch as another finishes must fail the workflow,
+    and 'merge' (which needs both) must not be launched."""
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    we = manual_engine_for(da)
+    r_wfid = create_running_workflow(da, "example-diamond")
+    we.handle_messages([start_message_for(r_wfid)])
+    we.handle_messages(pod_messages_for(da, r_wfid, {"split"}))
+
+    # Act
+    we.handle_messages(
+        pod_messages_for(da, r_wfid, {"branch-a"})
+        + pod_messages_for(da, r_wfid, {"branch-b"}, exit_code=1)
+    )
+
+    # Assert
+    response, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    assert response["done"]
+    assert not response["success"]
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    assert "merge" not in {s["name"] for s in steps["running_workflow_steps"]}
+
+
+def test_workflow_engine_handle_messages_survives_a_bad_message():
+    """A message the engine cannot handle (here a Pod message for an unknown
+    Instance) must not stop the rest of the batch being handled."""
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    we = manual_engine_for(da)
+    r_wfid = create_running_workflow(da, "example-diamond")
+    we.handle_messages([start_message_for(r_wfid)])
+
+    # Act
+    we.handle_messages(
+        [pod_message_for("instance-00000000-0000-0000-0000-000000000000")]
+        + pod_messages_for(da, r_wfid, {"split"})
+    )
+
+    # Assert
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    assert {s["name"] for s in steps["running_workflow_steps"]} == {
+        "split",
+        "branch-a",
+        "branch-b",
+    }
+
+
+class FailingWorkflowAPIAdapter(UnitTestWorkflowAPIAdapter):
+    """An API adapter that cannot read the steps of one running workflow by name."""
+
+    def __init__(self):
+        super().__init__()
+        self.failing_running_workflow_id = None
+
+    def get_running_workflow_step_by_name(
+        self, *, name: str, running_workflow_id: str, replica: int = 0
+    ) -> tuple[dict[str, Any], int]:
+        if running_workflow_id == self.failing_running_workflow_id:
+            raise RuntimeError("The DM is not available")
+        return super().get_running_workflow_step_by_name(
+            name=name, running_workflow_id=running_workflow_id, replica=replica
+        )
+
+
+def test_workflow_engine_handle_messages_survives_a_failed_assessment():
+    """A running workflow that cannot be assessed must not stop
+    the other running workflows in the batch being assessed."""
+    # Arrange
+    da = FailingWorkflowAPIAdapter()
+    we = manual_engine_for(da)
+    r_wfids = [create_running_workflow(da, "example-diamond") for _ in range(2)]
+    we.handle_messages([start_message_for(r_wfid) for r_wfid in r_wfids])
+    da.failing_running_workflow_id = r_wfids[0]
+
+    # Act
+    we.handle_messages(
+        [msg for r_wfid in r_wfids for msg in pod_messages_for(da, r_wfid, {"split"})]
+    )
+
+    # Assert
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfids[1])
+    assert {s["name"] for s in steps["running_workflow_steps"]} == {
+        "split",
+        "branch-a",
+        "branch-b",
+    }
+
+
 def test_workflow_engine_example_unsatisfiable_step(basic_engine):
     """A step that can never become READY must fail the running workflow,
     not leave it hanging and not be mistaken for a successful finish."""
@@ -0,0 +1,709 @@
+import threading
+import time
+
+import pytest
+import yaml
+
+pytestmark = pytest.mark.unit
+
+from tests.config import TEST_PROJECT_ID
+from tests.test_workflow_engine_examples import (
+    create_running_workflow,
+    pod_message_for,
+    start_message_for,
+)
+from tests.wapi_adapter import UnitTestWorkflowAPIAdapter
+from workflow.decoder import build_workflow_plan
+from workflow.workflow_abc import InstanceLauncher, LaunchParameters, LaunchResult
+from workflow.workflow_engine import (
+    StepPreparationResponse,
+    StepState,
+    WorkflowEngine,
+    get_number_of_replicas,
+    get_replica_releases,
+    get_step_names_to_assess,
+)
+
+_STEP_DEFINITION: dict = {
+    "name": "step",
+    "specification": {"collection": "c", "job": "j", "version": "1"},
+}
+
+
+class RecordingInstanceLauncher(InstanceLauncher):
+    """A (thread-safe) launcher that launches nothing. It records what it's
+    asked to launch and how many launches were in progress at the same time.
+    It can be told which replicas fail, and which have already been launched."""
+
+    def __init__(self, *, failing_replicas=(), launched_replicas=()):
+        self.launch_parameters = []
+        self.max_concurrent_launches = 0
+        self._failing_replicas = failing_replicas
+        self._launched_replicas = launched_replicas
+        self._launches_in_progress = 0
+        self._lock = threading.Lock()
+
+    def launch(self, *, launch_parameters: LaunchParameters, **kwargs) -> LaunchResult:
+        with self._lock:
+            self.launch_parameters.append(launch_parameters)
+            self._launches_in_progress += 1
+            self.max_concurrent_launches = max(
+                self.max_concurrent_launches, self._launches_in_progress
+            )
+        time.sleep(0.01)
+        with self._lock:
+            self._launches_in_progress -= 1
+
+        replica = launch_parameters.step_replication_number
+        if replica in self._failing_replicas:
+            return LaunchResult(error_num=1, error_msg="Launch failed")
+        if replica in self._launched_replicas:
+            return LaunchResult(already_launched=True)
+        return LaunchResult(
+            running_workflow_step_id=f"step-{replica}",
+            instance_id=f"instance-{replica}",
+        )
+
+
+def replicated_step(replicas: int) -> StepPreparationResponse:
+    """A prepared step that's replicated over a number of files."""
+    return StepPreparationResponse(
+        replicas=replicas,
+        variables={"inputFile": "unset", "outputFile": "out.smi"},
+        replica_variable="inputFile",
+        replica_values=[f"chunk_{replica}.smi" for replica in range(replicas)],
+        replica_instance_id="instance-0",
+    )
+
+
+def engine_with(launcher, **kwargs):
+    """Returns an engine (given a launcher, and any other engine arguments),
+    its API adapter, and the record of a running workflow to launch steps for."""
+    da = UnitTestWorkflowAPIAdapter()
+    we = WorkflowEngine(wapi_adapter=da, instance_launcher=launcher, **kwargs)
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+    rwf, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    return we, da, rwf
+
+
+def test_launch_replicas_concurrently():
+    # Arrange
+    launcher = RecordingInstanceLauncher()
+    we, da, rwf = engine_with(launcher, launch_workers=4)
+
+    # Act
+    launched, _ = we._launch(
+        rwf=rwf,
+        step_definition=_STEP_DEFINITION,
+        step_preparation_response=replicated_step(8),
+    )
+
+    # Assert
+    assert launched
+    assert 1 < launcher.max_concurrent_launches <= 4
+    by_replica = {
+        lp.step_replication_number: lp.variables for lp in launcher.launch_parameters
+    }
+    assert sorted(by_replica) == list(range(8))
+    for replica, variables in by_replica.items():
+        assert variables["inputFile"] == f".instance-0/chunk_{replica}.smi"
+        assert variables["outputFile"] == "out.smi"
+
+
+def test_launch_replicas_one_at_a_time_by_default():
+    # Arrange
+    launcher = RecordingInstanceLauncher()
+    we, da, rwf = engine_with(launcher)
+
+    # Act
+    launched, _ = we._launch(
+        rwf=rwf,
+        step_definition=_STEP_DEFINITION,
+        step_preparation_response=replicated_step(3),
+    )
+
+    # Assert
+    assert launched
+    assert launcher.max_concurrent_launches == 1
+    assert [lp.step_replication_number for lp in launcher.launch_parameters] == [
+        0,
+        1,
+        2,
+    ]
+    # Each replica was given its own variables
+    assert [lp.variables["inputFile"] for lp in launcher.launch_parameters] == [
+        ".instance-0/chunk_0.smi",
+        ".instance-0/chunk_1.smi",
+        ".instance-0/chunk_2.smi",
+    ]
+
+
+def test_launch_replicas_concurrently_with_errors():
+    # Arrange
+    launcher = RecordingInstanceLauncher(failing_replicas={1}, launched_replicas={2})
+    we, da, rwf = engine_with(launcher, launch_workers=4)
+
+    # Act
+    launched, _ = we._launch(
+        rwf=rwf,
+        step_definition=_STEP_DEFINITION,
+        step_preparation_response=replicated_step(4),
+    )
+
+    # Assert
+    assert launched
+    assert len(launcher.launch_parameters) == 4
+    response, _ = da.get_running_workflow(running_workflow_id=rwf["id"])
+    assert response["done"]
+    assert not response["success"]
+    assert response["error_msg"] == "Step 'step' ERROR(1): Launch failed"
+
+
+def test_launch_replicas_when_all_already_launched():
+    # Arrange
+    launcher = RecordingInstanceLauncher(launched_replicas={0, 1})
+    we, da, rwf = engine_with(launcher, launch_workers=4)
+
+    # Act
+    launched, already_launched = we._launch(
+        rwf=rwf,
+        step_definition=_STEP_DEFINITION,
+        step_preparation_response=replicated_step(2),
+    )
+
+    # Assert
+    assert not launched
+    assert already_launched
+    response, _ = da.get_running_workflow(running_workflow_id=rwf["id"])
+    assert not response["done"]
+
+
+class BatchRecordingInstanceLauncher(RecordingInstanceLauncher):
+    """A recording launcher that also launches replicas in batches."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    def launch_many(self, *, launch_parameters, **kwargs):
+        self.batches.append(len(launch_parameters))
+        return [self.launch(launch_parameters=lp) for lp in launch_parameters]
+
+
+def test_launch_replicas_in_a_batch():
+    # Arrange
+    launcher = BatchRecordingInstanceLauncher(launched_replicas={1})
+    we, da, rwf = engine_with(launcher, launch_workers=4)
+
+    # Act
+    launched, _ = we._launch(
+        rwf=rwf,
+        step_definition=_STEP_DEFINITION,
+        step_preparation_response=replicated_step(3),
+    )
+
+    # Assert
+    assert launched
+    assert launcher.batches == [3]
+    assert [lp.step_replication_number for lp in launcher.launch_parameters] == [
+        0,
+        1,
+        2,
+    ]
+    response, _ = da.get_running_workflow(running_workflow_id=rwf["id"])
+    assert not response["done"]
+
+
+def test_launch_single_replica_without_a_batch():
+    # Arrange
+    launcher = BatchRecordingInstanceLauncher()
+    we, da, rwf = engine_with(launcher)
+
+    # Act
+    launched, _ = we._launch(
+        rwf=rwf,
+        step_definition=_STEP_DEFINITION,
+        step_preparation_response=StepPreparationResponse(replicas=1),
+    )
+
+    # Assert
+    assert launched
+    assert launcher.batches == []
+    assert len(launcher.launch_parameters) == 1
+
+
+def test_launch_replicas_up_to_max_concurrency():
+    # Arrange
+    launcher = RecordingInstanceLauncher()
+    we, da, rwf = engine_with(launcher)
+
+    # Act
+    launched, _ = we._launch(
+        rwf=rwf,
+        step_definition=_STEP_DEFINITION | {"max-concurrency": 2},
+        step_preparation_response=replicated_step(5),
+    )
+
+    # Assert
+    assert launched
+    assert [lp.step_replication_number for lp in launcher.launch_parameters] == [
+        0,
+        1,
+    ]
+    # Each replica knows how many there are to be
+    assert {lp.total_number_of_replicas for lp in launcher.launch_parameters} == {5}
+
+
+def test_launch_given_replicas():
+    # Arrange
+    launcher = RecordingInstanceLauncher()
+    we, da, rwf = engine_with(launcher)
+
+    # Act
+    launched, _ = we._launch(
+        rwf=rwf,
+        step_definition=_STEP_DEFINITION | {"max-concurrency": 2},
+        step_preparation_response=replicated_step(5),
+        replicas=range(3, 6),
+    )
+
+    # Assert
+    assert launched
+    assert [lp.variables["inputFile"] for lp in launcher.launch_parameters] == [
+        ".instance-0/chunk_3.smi",
+        ".instance-0/chunk_4.smi",
+    ]
+
+
+def step_from(name: str, *providers: str) -> dict:
+    """A step definition that takes a variable from each of its providers."""
+    return {
+        "name": name,
+        "plumbing": [
+            {"variable": "inputFile", "from-step": {"name": p, "variable": "out"}}
+            for p in providers
+        ],
+    }
+
+
+def test_get_step_names_to_assess_in_topological_order():
+    # Arrange
+    plan = build_workflow_plan(
+        {
+            "steps": [
+                step_from("merge", "first", "second"),
+                step_from("second", "first"),
+                step_from("first"),
+                step_from("orphan", "no-such-step"),
+            ]
+        }
+    )
+
+    # Act
+    candidates, step_names = get_step_names_to_assess(plan=plan)
+
+    # Assert
+    assert candidates == ["first", "second", "merge"]
+    assert set(step_names) == {"first", "second", "merge"}
+
+
+def test_get_step_names_to_assess_after_steps_finish():
+    # Arrange
+    plan = build_workflow_plan(
+        {
+            "steps": [
+                step_from("merge", "first", "second"),
+                step_from("second", "first"),
+                step_from("first"),
+            ]
+        }
+    )
+
+    # Act
+    candidates, step_names = get_step_names_to_assess(
+        plan=plan, finished_steps=["second", "first"]
+    )
+
+    # Assert
+    assert candidates == ["second", "merge"]
+    assert set(step_names) == {"first", "second", "merge"}
+
+
+def test_get_replica_releases():
+    # Arrange
+    plan = build_workflow_plan(
+        {"steps": [_STEP_DEFINITION | {"max-concurrency": 3}, {"name": "other"}]}
+    )
+    step_states = {
+        "step": StepState(
+            launched=True,
+            done=False,
+            success=False,
+            replicas=10,
+            launched_replicas=4,
+            running_replicas=2,
+        ),
+        "other": StepState(
+            launched=True,
+            done=False,
+            success=False,
+            replicas=10,
+            launched_replicas=4,
+            running_replicas=0,
+        ),
+    }
+
+    # Act
+    releases = get_replica_releases(
+        plan=plan, step_states=step_states, finished_steps=["step", "other"]
+    )
+
+    # Assert
+    assert releases == {"step": range(4, 5)}
+
+
+def test_get_replica_releases_when_every_replica_is_launched():
+    # Arrange
+    plan = build_workflow_plan({"steps": [_STEP_DEFINITION | {"max-concurrency": 3}]})
+    step_states = {
+        "step": StepState(
+            launched=True,
+            done=False,
+            success=False,
+            replicas=10,
+            launched_replicas=10,
+            running_replicas=1,
+        )
+    }
+
+    # Act
+    releases = get_replica_releases(
+        plan=plan, step_states=step_states, finished_steps=["step"]
+    )
+
+    # Assert
+    assert releases == {}
+
+
+class RecordOnlyInstanceLauncher(InstanceLauncher):
+    """A launcher that creates the DM records of the Instances it's asked to launch
+    (like the 'UnitTestInstanceLauncher') but runs nothing and sends no
+    Pod messages - the test does that."""
+
+    def __init__(self, *, wapi_adapter: UnitTestWorkflowAPIAdapter):
+        self._wapi_adapter = wapi_adapter
+
+    def launch(self, *, launch_parameters: LaunchParameters, **kwargs) -> LaunchResult:
+        instance_id = self._wapi_adapter.create_instance()["id"]
+        response, _ = self._wapi_adapter.create_running_workflow_step(
+            running_workflow_id=launch_parameters.running_workflow_id,
+            step=launch_parameters.step_name,
+            instance_id=instance_id,
+            replica=launch_parameters.step_replication_number,
+            replicas=launch_parameters.total_number_of_replicas,
+        )
+        if response.get("already_exists"):
+            return LaunchResult(
+                already_launched=True, running_workflow_step_id=response["id"]
+            )
+        _ = self._wapi_adapter.set_running_workflow_step_variables(
+            running_workflow_step_id=response["id"],
+            variables=launch_parameters.variables,
+        )
+        self._wapi_adapter.set_instance_running_workflow_step_id(
+            instance_id=instance_id, running_workflow_step_id=response["id"]
+        )
+        return LaunchResult(
+            running_workflow_step_id=response["id"], instance_id=instance_id
+        )
+
+
+def record_only_engine(da, **kwargs) -> WorkflowEngine:
+    """An engine (given any other engine arguments)
+    with a 'RecordOnlyInstanceLauncher'."""
+    return WorkflowEngine(
+        wapi_adapter=da,
+        instance_launcher=RecordOnlyInstanceLauncher(wapi_adapter=da),
+        **kwargs,
+    )
+
+
+def load_split_combine() -> dict:
+    """Loads the 'simple-python-split-combine' workflow definition
+    (to be changed by a test)."""
+    with open(
+        "tests/workflow-definitions/simple-python-split-combine.yaml", encoding="utf8"
+    ) as wf_file:
+        return yaml.safe_load(wf_file)
+
+
+def start_split_combine(
+    da, we, *, split_output, wf_definition: dict | None = None
+) -> tuple[str, dict]:
+    """Starts a running workflow of the 'simple-python-split-combine' definition
+    (or a changed one) whose 'split' step outputs 'split_output'. Returns
+    the running workflow ID and the (running) 'split' step, which has not finished."""
+    wf_response = da.create_workflow(
+        workflow_definition=wf_definition or load_split_combine()
+    )
+    r_wfid = da.create_running_workflow(
+        user_id="dlister",
+        workflow_id=wf_response["id"],
+        project_id=TEST_PROJECT_ID,
+        variables={"candidateMolecules": "in.smi", "combination": "out.smi"},
+    )["id"]
+    da.mock_get_running_workflow_step_output_values_for_output(
+        step_name="split", output_variable="outputBase", output=split_output
+    )
+    we.handle_message(start_message_for(r_wfid))
+    (split,) = running_replicas(da, r_wfid, "split")
+    return r_wfid, split
+
+
+def running_replicas(da, r_wfid, step_name: str) -> list[dict]:
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    return [
+        step
+        for step in steps["running_workflow_steps"]
+        if step["name"] == step_name and not step["done"]
+    ]
+
+
+@pytest.mark.parametrize("stateful", [False, True])
+def test_replicas_are_released_as_earlier_replicas_finish(stateful):
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    we = record_only_engine(da, stateful=stateful)
+    wf_definition = load_split_combine()
+    wf_definition["steps"][1]["max-concurrency"] = 2
+    r_wfid, split = start_split_combine(
+        da,
+        we,
+        split_output=[f"chunk_{chunk}.smi" for chunk in range(5)],
+        wf_definition=wf_definition,
+    )
+    we.handle_message(pod_message_for(split["instance_id"]))
+
+    # Act
+    running_counts = []
+    while running := running_replicas(da, r_wfid, "parallel"):
+        running_counts.append(len(running))
+        we.handle_message(pod_message_for(running[0]["instance_id"]))
+
+    # Assert
+    # No more than 2 are ever running, until the last one
+    assert running_counts == [2, 2, 2, 2, 1]
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    replicas = sorted(
+        step.get("replica", 0)
+        for step in steps["running_workflow_steps"]
+        if step["name"] == "parallel"
+    )
+    assert replicas == [0, 1, 2, 3, 4]
+    # Only when every replica has finished is the combining step launched
+    assert running_replicas(da, r_wfid, "combine")
+
+
+class AlreadyLaunchedInstanceLauncher(RecordOnlyInstanceLauncher):
+    """A launcher that finds each step it's asked to launch has already been
+    launched (as it would if another engine had just launched it)."""
+
+    def launch(self, *, launch_parameters: LaunchParameters, **kwargs) -> LaunchResult:
+        result = super().launch(launch_parameters=launch_parameters)
+        return LaunchResult(
+            already_launched=True,
+            running_workflow_step_id=result.running_workflow_step_id,
+        )
+
+
+def test_already_launched_steps_do_not_stall_a_workflow():
+    """The step states read before launching are out of date if a step has
+    already been launched, so they must not be used to decide that the
+    workflow has stalled."""
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    we = WorkflowEngine(
+        wapi_adapter=da,
+        instance_launcher=AlreadyLaunchedInstanceLauncher(wapi_adapter=da),
+    )
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+
+    # Act
+    we.handle_message(start_message_for(r_wfid))
+
+    # Assert
+    response, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    assert not response["done"]
+
+
+def test_launched_specification_is_a_copy():
+    """A launcher that alters the specification it's given must not
+    alter the plan the engine has cached."""
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    launcher = RecordingInstanceLauncher()
+    we = WorkflowEngine(wapi_adapter=da, instance_launcher=launcher)
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+    we.handle_message(start_message_for(r_wfid))
+    specification = launcher.launch_parameters[0].specification
+
+    # Act
+    specification["job"] = "altered"
+
+    # Assert
+    rwf, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    cached = we._workflow_cache.get(
+        workflow_id=rwf["workflow"]["id"], fingerprint=r_wfid
+    )
+    step_name = launcher.launch_parameters[0].step_name
+    assert cached.plan.steps[step_name]["specification"]["job"] != "altered"
+
+
+def test_launch_replicas_with_several_files_each():
+    # Arrange
+    launcher = RecordingInstanceLauncher()
+    we, da, rwf = engine_with(launcher)
+    values = [f"chunk_{chunk}.smi" for chunk in range(5)]
+
+    # Act
+    launched, _ = we._launch(
+        rwf=rwf,
+        step_definition=_STEP_DEFINITION,
+        step_preparation_response=StepPreparationResponse(
+            replicas=get_number_of_replicas(replica_values=values, files_per_replica=2),
+            variables={"inputFile": "unset", "files": ""},
+            replica_variable="inputFile",
+            replica_values=values,
+            replica_instance_id="instance-0",
+            files_per_replica=2,
+            replica_files_variables=["files"],
+        ),
+    )
+
+    # Assert
+    assert launched
+    assert [lp.variables["inputFile"] for lp in launcher.launch_parameters] == [
+        [".instance-0/chunk_0.smi", ".instance-0/chunk_1.smi"],
+        [".instance-0/chunk_2.smi", ".instance-0/chunk_3.smi"],
+        [".instance-0/chunk_4.smi"],
+    ]
+    assert [lp.variables["files"] for lp in launcher.launch_parameters] == [
+        ".instance-0/chunk_0.smi .instance-0/chunk_1.smi",
+        ".instance-0/chunk_2.smi .instance-0/chunk_3.smi",
+        ".instance-0/chunk_4.smi",
+    ]
+    assert {lp.total_number_of_replicas for lp in launcher.launch_parameters} == {3}
+
+
+@pytest.mark.parametrize(
+    "number_of_values,files_per_replica,expected_replicas",
+    [(0, None, 1), (5, None, 5), (5, 1, 5), (5, 2, 3), (6, 2, 3), (5, 10, 1)],
+)
+def test_get_number_of_replicas(number_of_values, files_per_replica, expected_replicas):
+    # Arrange
+    values = [f"chunk_{chunk}.smi" for chunk in range(number_of_values)]
+
+    # Act
+    replicas = get_number_of_replicas(
+        replica_values=values, files_per_replica=files_per_replica
+    )
+
+    # Assert
+    assert replicas == expected_replicas
+
+
+def test_replicated_step_with_files_per_replica():
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    we = record_only_engine(da)
+    wf_definition = load_split_combine()
+    wf_definition["steps"][1]["files-per-replica"] = 2
+    wf_definition["steps"][1]["plumbing"].append(
+        {"variable": "chunkFiles", "from-predefined": {"variable": "replica-files"}}
+    )
+    r_wfid, split = start_split_combine(
+        da,
+        we,
+        split_output=[f"chunk_{chunk}.smi" for chunk in range(5)],
+        wf_definition=wf_definition,
+    )
+
+    # Act
+    we.handle_message(pod_message_for(split["instance_id"]))
+
+    # Assert
+    parallel = running_replicas(da, r_wfid, "parallel")
+    assert len(parallel) == 3
+    assert {step["replicas"] for step in parallel} == {3}
+    split_dir = f".{split['instance_id']}"
+    assert sorted(step["variables"]["chunkFiles"] for step in parallel) == [
+        f"{split_dir}/chunk_0.smi {split_dir}/chunk_1.smi",
+        f"{split_dir}/chunk_2.smi {split_dir}/chunk_3.smi",
+        f"{split_dir}/chunk_4.smi",
+    ]
+
+
+class PageCountingWorkflowAPIAdapter(UnitTestWorkflowAPIAdapter):
+    """An adapter that records the offset of every page of output values
+    it's asked for."""
+
+    def __init__(self):
+        super().__init__()
+        self.page_offsets = []
+
+    def get_running_workflow_step_output_values_page(self, **kwargs):
+        self.page_offsets.append(kwargs["offset"])
+        return super().get_running_workflow_step_output_values_page(**kwargs)
+
+
+class NoPagesWorkflowAPIAdapter(PageCountingWorkflowAPIAdapter):
+    """An adapter that cannot page output values."""
+
+    def get_running_workflow_step_output_values_page(self, **kwargs):
+        super().get_running_workflow_step_output_values_page(**kwargs)
+        raise NotImplementedError
+
+
+@pytest.mark.parametrize(
+    "adapter_class,expected_page_offsets",
+    [(PageCountingWorkflowAPIAdapter, [0, 2, 4]), (NoPagesWorkflowAPIAdapter, [0])],
+)
+def test_replicated_step_output_values_are_read_a_page_at_a_time(
+    adapter_class, expected_page_offsets
+):
+    # Arrange
+    da = adapter_class()
+    we = record_only_engine(da, output_values_page_size=2)
+    r_wfid, split = start_split_combine(
+        da, we, split_output=[f"chunk_{chunk}.smi" for chunk in range(5)]
+    )
+
+    # Act
+    we.handle_message(pod_message_for(split["instance_id"]))
+
+    # Assert
+    assert da.page_offsets == expected_page_offsets
+    parallel = running_replicas(da, r_wfid, "parallel")
+    assert {step["replicas"] for step in parallel} == {5}
+    split_dir = f".{split['instance_id']}"
+    assert sorted(
+        (step["replica"], step["variables"]["inputFile"]) for step in parallel
+    ) == [(replica, f"{split_dir}/chunk_{replica}.smi") for replica in range(5)]
+
+
+@pytest.mark.parametrize(
+    "adapter_class", [PageCountingWorkflowAPIAdapter, NoPagesWorkflowAPIAdapter]
+)
+def test_replicated_step_with_a_single_output_value(adapter_class):
+    # Arrange
+    da = adapter_class()
+    we = record_only_engine(da)
+    r_wfid, split = start_split_combine(da, we, split_output="chunk_0.smi")
+
+    # Act
+    we.handle_message(pod_message_for(split["instance_id"]))
+
+    # Assert
+    (parallel,) = running_replicas(da, r_wfid, "parallel")
+    assert parallel["replicas"] == 1
+    assert parallel["variables"]["inputFile"] == f".{split['instance_id']}/chunk_0.smi"
@@ -0,0 +1,156 @@
+import logging
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+from tests.test_workflow_engine_examples import (
+    create_running_workflow,
+    pod_message_for,
+    start_message_for,
+)
+from tests.test_workflow_engine_launch import RecordOnlyInstanceLauncher
+from tests.wapi_adapter import UnitTestWorkflowAPIAdapter
+from workflow.workflow_engine import WorkflowEngine
+from workflow.workflow_instrumentation import (
+    AdapterCall,
+    InstrumentedWorkflowAPIAdapter,
+    MessageCallLog,
+    get_arguments_fingerprint,
+)
+
+_SPLIT_COMBINE_VARIABLES = {"candidateMolecules": "in.smi", "combination": "out.smi"}
+_MOLPROPS_VARIABLES = {"candidateMolecules": "in.smi", "clusteredMolecules": "out.smi"}
+
+
+def run_workflow(
+    workflow_file_name: str,
+    *,
+    variables=None,
+    outputs=None,
+    stateful: bool = False,
+) -> InstrumentedWorkflowAPIAdapter:
+    """Runs a workflow to its end (one Pod message at a time),
+    returning the instrumented adapter the engine used."""
+    da = UnitTestWorkflowAPIAdapter()
+    ia = InstrumentedWorkflowAPIAdapter(da)
+    we = WorkflowEngine(
+        wapi_adapter=ia,
+        instance_launcher=RecordOnlyInstanceLauncher(wapi_adapter=da),
+        stateful=stateful,
+    )
+    r_wfid = create_running_workflow(da, workflow_file_name, variables)
+    if outputs:
+        da.mock_get_running_workflow_step_output_values_for_output(**outputs)
+
+    with ia.message("START"):
+        we.handle_message(start_message_for(r_wfid))
+    while running := [
+        step
+        for step in da.get_running_workflow_steps(running_workflow_id=r_wfid)[
+            "running_workflow_steps"
+        ]
+        if not step["done"]
+    ]:
+        with ia.message(f"Pod {running[0]['name']}"):
+            we.handle_message(pod_message_for(running[0]["instance_id"]))
+
+    rwf, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+    assert rwf["done"]
+    assert rwf["success"]
+    return ia
+
+
+def test_arguments_fingerprint():
+    # Arrange
+
+    # Act
+    fingerprint = get_arguments_fingerprint((), {"a": 1, "b": "2"})
+
+    # Assert
+    assert fingerprint == get_arguments_fingerprint((), {"b": "2", "a": 1})
+    assert fingerprint != get_arguments_fingerprint((), {"a": 1, "b": 2})
+    assert len(fingerprint) == 16
+
+
+def test_repeated_reads_are_those_without_a_write_between_them():
+    # Arrange
+    read = AdapterCall(method="get_running_workflow", fingerprint="1")
+    other_read = AdapterCall(method="get_running_workflow", fingerprint="2")
+    write = AdapterCall(method="set_running_workflow_done", fingerprint="1")
+
+    # Act
+    log = MessageCallLog(
+        label="message",
+        calls=[read, other_read, write, read, read, other_read, read],
+    )
+
+    # Assert
+    assert log.repeated_reads == {read: 2}
+    assert log.call_counts == {
+        "get_running_workflow": 6,
+        "set_running_workflow_done": 1,
+    }
+
+
+def test_calls_are_recorded_by_message(caplog):
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    ia = InstrumentedWorkflowAPIAdapter(da)
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+
+    # Act
+    _ = ia.get_running_workflow(running_workflow_id=r_wfid)
+    with ia.message("first"):
+        rwf, _ = ia.get_running_workflow(running_workflow_id=r_wfid)
+        _ = ia.get_running_workflow(running_workflow_id=r_wfid)
+
+    # Assert
+    assert rwf["id"] == r_wfid
+    assert [call.method for call in ia.unattributed_calls] == ["get_running_workflow"]
+    (log,) = ia.message_logs
+    assert log.label == "first"
+    assert len(ia.calls) == 2
+    (record,) = [r for r in caplog.records if r.levelno == logging.WARNING]
+    assert record.getMessage().startswith(
+        "Repeated read while handling first: get_running_workflow"
+    )
+
+
+@pytest.mark.parametrize("stateful", [False, True])
+@pytest.mark.parametrize(
+    "workflow_file_name,variables,outputs,budget,stateful_budget",
+    [
+        ("example-two-step-nop", None, None, 17, 15),
+        ("example-two-independent-nops", None, None, 17, 15),
+        ("example-diamond", None, None, 32, 28),
+        (
+            "simple-python-split-combine",
+            _SPLIT_COMBINE_VARIABLES,
+            {
+                "step_name": "split",
+                "output_variable": "outputBase",
+                "output": ["a.smi", "b.smi", "c.smi"],
+            },
+            38,
+            33,
+        ),
+        ("simple-python-molprops", _MOLPROPS_VARIABLES, None, 18, 16),
+    ],
+)
+def test_example_workflow_call_budget(
+    workflow_file_name, variables, outputs, budget, stateful_budget, stateful
+):
+    # Arrange
+
+    # Act
+    ia = run_workflow(
+        workflow_file_name, variables=variables, outputs=outputs, stateful=stateful
+    )
+
+    # Assert
+    assert len(ia.calls) <= (stateful_budget if stateful else budget)
+    assert not ia.unattributed_calls
+    assert {
+        log.label: log.repeated_reads for log in ia.message_logs if log.repeated_reads
+    } == {}
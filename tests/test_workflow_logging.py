@@ -0,0 +1,148 @@
+import logging
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+from tests.test_workflow_engine_examples import (
+    create_running_workflow,
+    start_message_for,
+)
+from tests.test_workflow_engine_launch import (
+    _STEP_DEFINITION,
+    RecordingInstanceLauncher,
+    replicated_step,
+)
+from tests.wapi_adapter import UnitTestWorkflowAPIAdapter
+from workflow.workflow_engine import WorkflowEngine
+from workflow.workflow_logging import RunningWorkflowLogger
+
+_LOGGER_NAME: str = "workflow.workflow_engine"
+
+
+class StrCounter:
+    """An object that counts the number of times it's turned into a string."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return "StrCounter"
+
+
+def test_engine_modules_add_no_handlers():
+    # Arrange
+    import workflow.async_workflow_engine
+    import workflow.sharded_workflow_engine
+
+    # Act
+    handlers = [
+        logging.getLogger(name).handlers
+        for name in (
+            "workflow.workflow_engine",
+            "workflow.async_workflow_engine",
+            "workflow.sharded_workflow_engine",
+        )
+    ]
+
+    # Assert
+    assert handlers == [[], [], []]
+
+
+def test_engine_modules_leave_their_level_to_the_application():
+    # Arrange
+    import workflow.async_workflow_engine
+    import workflow.sharded_workflow_engine
+
+    # Act
+    levels = [
+        logging.getLogger(name).level
+        for name in (
+            "workflow.workflow_engine",
+            "workflow.async_workflow_engine",
+            "workflow.sharded_workflow_engine",
+        )
+    ]
+
+    # Assert
+    assert levels == [logging.NOTSET] * 3
+
+
+def test_debug_arguments_are_not_formatted_when_debug_is_off(caplog):
+    # Arrange
+    caplog.set_level(logging.INFO, logger=_LOGGER_NAME)
+    log = RunningWorkflowLogger(logging.getLogger(_LOGGER_NAME), {"id": "r-wf-1"})
+    response = StrCounter()
+
+    # Act
+    log.debug("Response %s", response)
+
+    # Assert
+    assert response.count == 0
+    assert not caplog.records
+
+
+def test_running_workflow_is_traced_when_its_debug_is_set(caplog):
+    # Arrange
+    caplog.set_level(logging.INFO, logger=_LOGGER_NAME)
+    log = RunningWorkflowLogger(
+        logging.getLogger(_LOGGER_NAME), {"id": "r-wf-1", "debug": "1"}
+    )
+
+    # Act
+    log.debug("Response %s", "traced")
+
+    # Assert
+    (record,) = caplog.records
+    assert record.levelno == logging.INFO
+    assert record.getMessage() == "Response traced"
+    assert record.running_workflow_id == "r-wf-1"
+    assert record.workflow_trace
+
+
+def test_launched_replicas_are_summarised(caplog):
+    # Arrange
+    caplog.set_level(logging.INFO, logger=_LOGGER_NAME)
+    da = UnitTestWorkflowAPIAdapter()
+    launcher = RecordingInstanceLauncher(launched_replicas=(3,))
+    we = WorkflowEngine(wapi_adapter=da, instance_launcher=launcher)
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+    rwf, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+
+    # Act
+    _ = we._launch(
+        rwf=rwf,
+        step_definition=_STEP_DEFINITION,
+        step_preparation_response=replicated_step(5),
+    )
+
+    # Assert
+    assert len(launcher.launch_parameters) == 5
+    (record,) = caplog.records
+    assert record.filename == "workflow_engine.py"
+    assert record.running_workflow_id == r_wfid
+    assert record.getMessage() == (
+        f"Launched step 'step' replicas 0-4 (of 5) RunningWorkflow={r_wfid}:"
+        " 4 launched, 1 already launched, 0 failed"
+    )
+
+
+def test_running_workflow_records_have_its_id(caplog):
+    # Arrange
+    caplog.set_level(logging.DEBUG, logger="workflow")
+    da = UnitTestWorkflowAPIAdapter()
+    we = WorkflowEngine(wapi_adapter=da, instance_launcher=RecordingInstanceLauncher())
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+
+    # Act
+    we.handle_message(start_message_for(r_wfid))
+
+    # Assert
+    records = [
+        record
+        for record in caplog.records
+        if record.name == _LOGGER_NAME and record.funcName != "handle_message"
+    ]
+    assert records
+    assert {record.running_workflow_id for record in records} == {r_wfid}
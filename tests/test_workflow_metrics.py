@@ -0,0 +1,127 @@
+import urllib.request
+from datetime import datetime, timezone
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+from tests.test_workflow_engine_examples import (
+    create_running_workflow,
+    pod_message_for,
+    start_message_for,
+)
+from tests.test_workflow_engine_launch import RecordOnlyInstanceLauncher
+from tests.wapi_adapter import UnitTestWorkflowAPIAdapter
+from workflow.workflow_engine import WorkflowEngine
+from workflow.workflow_metrics import (
+    ADAPTER_CALL_SECONDS,
+    LAUNCH_SECONDS,
+    LAUNCHER_CALL_SECONDS,
+    MESSAGE_LAG_SECONDS,
+    MESSAGE_SECONDS,
+    PREPARE_STEP_SECONDS,
+    READY_STEPS_TOTAL,
+    REPLICAS_LAUNCHED_TOTAL,
+    InMemoryMetricsSink,
+    PrometheusMetricsSink,
+    get_message_lag,
+)
+
+_NOW: datetime = datetime(2025, 6, 1, 12, 0, 10, tzinfo=timezone.utc)
+
+
+def test_engine_records_metrics():
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    metrics = InMemoryMetricsSink()
+    we = WorkflowEngine(
+        wapi_adapter=da,
+        instance_launcher=RecordOnlyInstanceLauncher(wapi_adapter=da),
+        metrics=metrics,
+    )
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+    we.handle_message(start_message_for(r_wfid))
+    steps = da.get_running_workflow_steps(running_workflow_id=r_wfid)
+    instance_id = steps["running_workflow_steps"][0]["instance_id"]
+
+    # Act
+    we.handle_message(pod_message_for(instance_id))
+
+    # Assert
+    for message_type in ("WorkflowMessage", "PodMessage"):
+        labels = {"message_type": message_type, "outcome": "ok"}
+        assert len(metrics.get_observations(MESSAGE_SECONDS, labels)) == 1
+    assert len(metrics.get_observations(MESSAGE_LAG_SECONDS)) == 1
+    assert len(metrics.get_observations(PREPARE_STEP_SECONDS)) == 2
+    assert len(metrics.get_observations(LAUNCH_SECONDS)) == 2
+    assert metrics.get_count(READY_STEPS_TOTAL) == 2
+    assert metrics.get_count(REPLICAS_LAUNCHED_TOTAL) == 2
+    assert metrics.get_observations(
+        ADAPTER_CALL_SECONDS, {"method": "get_running_workflow"}
+    )
+    assert (
+        len(metrics.get_observations(LAUNCHER_CALL_SECONDS, {"method": "launch"})) == 2
+    )
+
+
+@pytest.mark.parametrize(
+    "timestamp,expected_lag",
+    [
+        ("2025-06-01T12:00:00Z", 10.0),
+        ("2025-06-01T12:00:07.500000+00:00Z", 2.5),
+        ("2025-06-01T12:00:09", 1.0),
+        ("yesterday", None),
+    ],
+)
+def test_get_message_lag(timestamp, expected_lag):
+    # Arrange
+
+    # Act
+    lag = get_message_lag(timestamp=timestamp, now=_NOW)
+
+    # Assert
+    assert lag == expected_lag
+
+
+def test_prometheus_render():
+    # Arrange
+    metrics = PrometheusMetricsSink(buckets=(0.1, 1.0))
+    metrics.observe(MESSAGE_SECONDS, 0.05, {"message_type": "PodMessage"})
+    metrics.observe(MESSAGE_SECONDS, 0.5, {"message_type": "PodMessage"})
+    metrics.observe(MESSAGE_SECONDS, 2.0, {"message_type": "PodMessage"})
+    metrics.increment(REPLICAS_LAUNCHED_TOTAL, 3)
+
+    # Act
+    text = metrics.render()
+
+    # Assert
+    assert text == (
+        "# TYPE workflow_engine_message_seconds histogram\n"
+        'workflow_engine_message_seconds_bucket{message_type="PodMessage",le="0.1"} 1\n'
+        'workflow_engine_message_seconds_bucket{message_type="PodMessage",le="1.0"} 2\n'
+        'workflow_engine_message_seconds_bucket{message_type="PodMessage",le="+Inf"} 3\n'
+        'workflow_engine_message_seconds_sum{message_type="PodMessage"} 2.55\n'
+        'workflow_engine_message_seconds_count{message_type="PodMessage"} 3\n'
+        "# TYPE workflow_engine_replicas_launched_total counter\n"
+        "workflow_engine_replicas_launched_total 3\n"
+    )
+
+
+def test_prometheus_serve():
+    # Arrange
+    metrics = PrometheusMetricsSink()
+    metrics.increment(READY_STEPS_TOTAL)
+    server = metrics.serve(port=0, address="127.0.0.1")
+
+    # Act
+    try:
+        with urllib.request.urlopen(
+            f"http://127.0.0.1:{server.server_port}/metrics", timeout=5
+        ) as response:
+            body = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+
+    # Assert
+    assert body == metrics.render()
+    assert "workflow_engine_ready_steps_total 1\n" in body
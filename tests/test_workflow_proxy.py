@@ -0,0 +1,100 @@
+import pytest
+
+pytestmark = pytest.mark.unit
+
+from workflow.workflow_metrics import InMemoryMetricsSink, get_timed_proxy
+from workflow.workflow_proxy import (
+    INSTRUMENTATION_LAYER,
+    METRICS_LAYER,
+    TRACING_LAYER,
+    CallWrapper,
+    MethodProxy,
+    get_proxy,
+)
+from workflow.workflow_tracing import InMemorySpanExporter, Tracer, get_traced_proxy
+
+
+class Target:
+    """An object with a method, a private method, and an attribute."""
+
+    size = 3
+
+    def add(self, a, *, b):
+        return a + b
+
+    def _private(self):
+        return "private"
+
+
+class RecordingCallWrapper(CallWrapper):
+    """A wrapper that records (in a shared list) the calls it wraps."""
+
+    def __init__(self, name, layer, records):
+        self.name = name
+        self.layer = layer
+        self._records = records
+
+    def call(self, method, function, args, kwargs):
+        self._records.append(f"{self.name}>{method}")
+        result = function(*args, **kwargs)
+        self._records.append(f"{self.name}<{method}")
+        return result
+
+
+def test_proxy_calls_methods_through_its_wrappers():
+    # Arrange
+    records = []
+    proxy = get_proxy(Target(), RecordingCallWrapper("w", METRICS_LAYER, records))
+
+    # Act
+    result = proxy.add(1, b=2)
+
+    # Assert
+    assert result == 3
+    assert records == ["w>add", "w<add"]
+    assert proxy.size == 3
+    assert proxy._private() == "private"
+    assert records == ["w>add", "w<add"]
+
+
+def test_proxy_wrappers_are_layered():
+    """Wrappers are called in the order of their layer,
+    whatever the order they're added in, through one proxy."""
+    # Arrange
+    records = []
+    proxy = get_proxy(
+        Target(),
+        RecordingCallWrapper("instrumentation", INSTRUMENTATION_LAYER, records),
+    )
+    proxy = get_proxy(proxy, RecordingCallWrapper("metrics", METRICS_LAYER, records))
+    proxy = get_proxy(proxy, RecordingCallWrapper("tracing", TRACING_LAYER, records))
+
+    # Act
+    _ = proxy.add(1, b=2)
+
+    # Assert
+    assert isinstance(proxy._target, Target)
+    assert records == [
+        "metrics>add",
+        "tracing>add",
+        "instrumentation>add",
+        "instrumentation<add",
+        "tracing<add",
+        "metrics<add",
+    ]
+
+
+def test_timed_and_traced_proxy():
+    # Arrange
+    metrics = InMemoryMetricsSink()
+    exporter = InMemorySpanExporter()
+    proxy = get_traced_proxy(Target(), tracer=Tracer(exporter), prefix="Target")
+
+    # Act
+    proxy = get_timed_proxy(proxy, metrics=metrics, name="call_seconds")
+    _ = proxy.add(1, b=2)
+
+    # Assert
+    assert type(proxy) is MethodProxy
+    assert len(metrics.get_observations("call_seconds", {"method": "add"})) == 1
+    assert [span.name for span in exporter.spans] == ["Target.add"]
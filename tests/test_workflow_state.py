@@ -0,0 +1,155 @@
+import pytest
+
+pytestmark = pytest.mark.unit
+
+from workflow.workflow_state import RunningWorkflowStateCache
+
+_RWF_ID: str = "r-workflow-00000000-0000-0000-0000-000000000001"
+_RESPONSES: dict = {
+    "step-1": {
+        "count": 1,
+        "status": [
+            {
+                "done": True,
+                "success": True,
+                "replicas": 1,
+                "instance_id": "instance-1",
+            }
+        ],
+    },
+    "step-2": {
+        "count": 1,
+        "status": [
+            {
+                "done": False,
+                "success": False,
+                "replicas": 2,
+                "instance_id": "instance-2",
+            }
+        ],
+    },
+}
+
+
+def test_get_when_empty():
+    # Arrange
+    cache = RunningWorkflowStateCache()
+
+    # Act
+    responses = cache.get_step_status_responses(running_workflow_id=_RWF_ID)
+
+    # Assert
+    assert responses is None
+    assert cache.statistics.misses == 1
+
+
+def test_put_and_get():
+    # Arrange
+    cache = RunningWorkflowStateCache()
+    cache.put_step_status_responses(running_workflow_id=_RWF_ID, responses=_RESPONSES)
+
+    # Act
+    responses = cache.get_step_status_responses(running_workflow_id=_RWF_ID)
+
+    # Assert
+    assert responses == _RESPONSES
+    assert cache.statistics.hits == 1
+
+
+def test_put_with_no_launched_steps():
+    # Arrange
+    cache = RunningWorkflowStateCache()
+    cache.put_step_status_responses(running_workflow_id=_RWF_ID, responses={})
+
+    # Act
+    responses = cache.get_step_status_responses(running_workflow_id=_RWF_ID)
+
+    # Assert
+    assert responses == {}
+
+
+def test_record_launch_and_done():
+    # Arrange
+    cache = RunningWorkflowStateCache()
+    cache.put_step_status_responses(running_workflow_id=_RWF_ID, responses=_RESPONSES)
+    cache.record_launch(
+        running_workflow_id=_RWF_ID,
+        step_name="step-2",
+        instance_id="instance-3",
+        replicas=2,
+    )
+
+    # Act
+    known = cache.record_done(
+        running_workflow_id=_RWF_ID, instance_id="instance-3", success=True
+    )
+
+    # Assert
+    assert known
+    responses = cache.get_step_status_responses(running_workflow_id=_RWF_ID)
+    assert responses
+    assert responses["step-2"]["count"] == 2
+    assert responses["step-2"]["status"][1] == {
+        "done": True,
+        "success": True,
+        "replicas": 2,
+        "instance_id": "instance-3",
+    }
+
+
+def test_record_launch_when_not_cached():
+    # Arrange
+    cache = RunningWorkflowStateCache()
+
+    # Act
+    cache.record_launch(
+        running_workflow_id=_RWF_ID,
+        step_name="step-1",
+        instance_id="instance-1",
+        replicas=1,
+    )
+
+    # Assert
+    assert len(cache) == 0
+
+
+def test_record_done_for_unknown_instance_forgets_workflow():
+    # Arrange
+    cache = RunningWorkflowStateCache()
+    cache.put_step_status_responses(running_workflow_id=_RWF_ID, responses=_RESPONSES)
+
+    # Act
+    known = cache.record_done(
+        running_workflow_id=_RWF_ID, instance_id="instance-4", success=True
+    )
+
+    # Assert
+    assert not known
+    assert _RWF_ID not in cache
+
+
+def test_evict():
+    # Arrange
+    cache = RunningWorkflowStateCache()
+    cache.put_step_status_responses(running_workflow_id=_RWF_ID, responses=_RESPONSES)
+
+    # Act
+    cache.evict(running_workflow_id=_RWF_ID)
+
+    # Assert
+    assert len(cache) == 0
+    assert cache.statistics.evictions == 0
+
+
+def test_least_recently_used_is_evicted():
+    # Arrange
+    cache = RunningWorkflowStateCache(max_entries=1)
+    cache.put_step_status_responses(running_workflow_id="a", responses=_RESPONSES)
+
+    # Act
+    cache.put_step_status_responses(running_workflow_id="b", responses=_RESPONSES)
+
+    # Assert
+    assert "a" not in cache
+    assert "b" in cache
+    assert cache.statistics.evictions == 1
@@ -0,0 +1,207 @@
+import pytest
+
+pytestmark = pytest.mark.unit
+
+from tests.test_workflow_engine_examples import (
+    create_running_workflow,
+    start_message_for,
+)
+from tests.test_workflow_engine_launch import (
+    _STEP_DEFINITION,
+    RecordingInstanceLauncher,
+    replicated_step,
+)
+from tests.wapi_adapter import UnitTestWorkflowAPIAdapter
+from workflow.workflow_abc import LaunchParameters
+from workflow.workflow_engine import WorkflowEngine
+from workflow.workflow_tracing import (
+    InMemorySpanExporter,
+    Tracer,
+    get_current_span,
+    get_trace_context,
+    get_traced_proxy,
+)
+
+
+def test_spans_are_nested():
+    # Arrange
+    exporter = InMemorySpanExporter()
+    tracer = Tracer(exporter)
+
+    # Act
+    with tracer.span("outer", {"running_workflow_id": "r-wf-1"}) as outer:
+        with tracer.span("inner") as inner:
+            trace_context = get_trace_context()
+
+    # Assert
+    assert [span.name for span in exporter.spans] == ["inner", "outer"]
+    assert inner.trace_id == outer.trace_id
+    assert inner.parent_span_id == outer.span_id
+    assert outer.parent_span_id is None
+    assert outer.attributes == {"running_workflow_id": "r-wf-1"}
+    assert outer.start_time_ns <= inner.start_time_ns <= inner.end_time_ns
+    assert trace_context == {"traceparent": f"00-{inner.trace_id}-{inner.span_id}-01"}
+    assert get_current_span() is None
+
+
+def test_span_of_a_failure():
+    # Arrange
+    exporter = InMemorySpanExporter()
+    tracer = Tracer(exporter)
+
+    # Act
+    with pytest.raises(ValueError):
+        with tracer.span("failing"):
+            raise ValueError("Failed")
+
+    # Assert
+    (span,) = exporter.spans
+    assert span.status == "ERROR"
+    assert span.end_time_ns
+
+
+def test_tracer_without_an_exporter_records_nothing():
+    # Arrange
+    tracer = Tracer()
+
+    # Act
+    with tracer.span("nothing") as span:
+        trace_context = get_trace_context()
+
+    # Assert
+    assert not tracer.enabled
+    assert span is None
+    assert trace_context is None
+
+
+def test_engine_records_spans():
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    exporter = InMemorySpanExporter()
+    launcher = RecordingInstanceLauncher()
+    we = WorkflowEngine(
+        wapi_adapter=da, instance_launcher=launcher, tracer=Tracer(exporter)
+    )
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+
+    # Act
+    we.handle_message(start_message_for(r_wfid))
+
+    # Assert
+    (root,) = exporter.get_spans("handle_message")
+    assert root.attributes == {
+        "message_type": "WorkflowMessage",
+        "running_workflow_id": r_wfid,
+    }
+    assert {span.trace_id for span in exporter.spans} == {root.trace_id}
+    assert exporter.get_spans("get_step_states")
+    assert exporter.get_spans("get_ready_steps")
+    assert exporter.get_spans("WorkflowAPIAdapter.get_running_workflow")
+    prepare = exporter.get_spans("prepare_step")[0]
+    assert prepare.attributes == {"running_workflow_id": r_wfid, "step_name": "step-1"}
+    launch_step = exporter.get_spans("launch_step")[0]
+    launch = exporter.get_spans("InstanceLauncher.launch")[0]
+    assert launch.parent_span_id == launch_step.span_id
+    assert launch.attributes == {
+        "running_workflow_id": r_wfid,
+        "step_name": "step-1",
+        "replica": 0,
+    }
+    # The Instance is given the context of the trace
+    launch_parameters = launcher.launch_parameters[0]
+    assert launch_parameters.trace_context == {
+        "traceparent": f"00-{root.trace_id}-{launch_step.span_id}-01"
+    }
+
+
+def test_concurrent_launches_are_in_the_same_trace():
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    exporter = InMemorySpanExporter()
+    tracer = Tracer(exporter)
+    we = WorkflowEngine(
+        wapi_adapter=da,
+        instance_launcher=RecordingInstanceLauncher(),
+        launch_workers=4,
+        tracer=tracer,
+    )
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+    rwf, _ = da.get_running_workflow(running_workflow_id=r_wfid)
+
+    # Act
+    with tracer.span("launch") as parent:
+        _ = we._launch(
+            rwf=rwf,
+            step_definition=_STEP_DEFINITION,
+            step_preparation_response=replicated_step(5),
+        )
+
+    # Assert
+    launches = exporter.get_spans("InstanceLauncher.launch")
+    assert sorted(span.attributes["replica"] for span in launches) == [0, 1, 2, 3, 4]
+    assert {span.parent_span_id for span in launches} == {parent.span_id}
+
+
+def test_adapter_spans_have_the_step_they_are_for():
+    # Arrange
+    da = UnitTestWorkflowAPIAdapter()
+    exporter = InMemorySpanExporter()
+    we = WorkflowEngine(
+        wapi_adapter=da,
+        instance_launcher=RecordingInstanceLauncher(),
+        tracer=Tracer(exporter),
+    )
+    r_wfid = create_running_workflow(da, "example-two-step-nop")
+
+    # Act
+    we.handle_message(start_message_for(r_wfid))
+
+    # Assert
+    get_running_workflow, *_ = exporter.get_spans(
+        "WorkflowAPIAdapter.get_running_workflow"
+    )
+    assert get_running_workflow.attributes == {"running_workflow_id": r_wfid}
+    prepare = exporter.get_spans("prepare_step")[0]
+    prepare_calls = [
+        span
+        for span in exporter.spans
+        if span.name.startswith("WorkflowAPIAdapter.")
+        and span.parent_span_id == prepare.span_id
+    ]
+    assert prepare_calls
+    for span in prepare_calls:
+        assert span.attributes["running_workflow_id"] == r_wfid
+        assert span.attributes["step_name"] == "step-1"
+
+
+def test_launcher_spans_have_the_replica_they_launch():
+    # Arrange
+    exporter = InMemorySpanExporter()
+    tracer = Tracer(exporter)
+    launcher = get_traced_proxy(
+        RecordingInstanceLauncher(), tracer=tracer, prefix="InstanceLauncher"
+    )
+    launch_parameters = LaunchParameters(
+        project_id="project",
+        name="step",
+        launching_user_name="dlister",
+        launching_user_api_token="token",
+        specification={},
+        variables={},
+        running_workflow_id="r-workflow",
+        step_name="step",
+        step_replication_number=3,
+        total_number_of_replicas=5,
+    )
+
+    # Act
+    with tracer.span("launch_step", {"running_workflow_id": "r-workflow"}):
+        _ = launcher.launch(launch_parameters=launch_parameters)
+
+    # Assert
+    (launch,) = exporter.get_spans("InstanceLauncher.launch")
+    assert launch.attributes == {
+        "running_workflow_id": "r-workflow",
+        "step_name": "step",
+        "replica": 3,
+    }
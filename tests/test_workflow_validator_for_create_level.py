@@ -188,3 +188,22 @@ def test_validate_simple_python_molprops_with_options(wapi):
     # Assert
     assert error.error_num == 0
     assert error.error_msg is None
+
+
+def test_validate_reports_the_best_schema_error(wapi):
+    # Arrange
+    wapi_adapter = wapi
+    workflow = _MINIMAL_WORKFLOW.copy()
+    _ = workflow.pop("kind-version", None)
+    workflow["name"] = "workflow with spaces"
+
+    # Act
+    error = WorkflowValidator.validate(
+        level=ValidationLevel.CREATE,
+        workflow_definition=workflow,
+        wapi_adapter=wapi_adapter,
+    )
+
+    # Assert
+    assert error.error_num == 1
+    assert error.error_msg == ["'kind-version' is a required property"]
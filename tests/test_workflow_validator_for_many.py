@@ -0,0 +1,165 @@
+import os
+from typing import Any
+
+import pytest
+import yaml
+
+pytestmark = pytest.mark.unit
+
+from tests.test_decoder import _MINIMAL_WORKFLOW
+from tests.wapi_adapter import UnitTestWorkflowAPIAdapter
+from workflow.workflow_instrumentation import InstrumentedWorkflowAPIAdapter
+from workflow.workflow_validator import ValidationLevel, WorkflowValidator
+from workflow.workflow_validator_cli import main
+
+_WORKFLOW_DEFINITIONS_DIR: str = os.path.join(
+    os.path.dirname(__file__), "workflow-definitions"
+)
+
+
+def _load_workflow(name: str) -> dict[str, Any]:
+    with open(
+        os.path.join(_WORKFLOW_DEFINITIONS_DIR, f"{name}.yaml"), "r", encoding="utf8"
+    ) as workflow_file:
+        workflow: dict[str, Any] = yaml.safe_load(workflow_file)
+    assert workflow
+    return workflow
+
+
+@pytest.fixture
+def wapi():
+    wapi_adapter = UnitTestWorkflowAPIAdapter()
+    yield wapi_adapter
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_validate_many_returns_a_result_for_each_definition(wapi, max_workers):
+    # Arrange
+    wapi_adapter = wapi
+    no_name = _MINIMAL_WORKFLOW.copy()
+    _ = no_name.pop("name", None)
+    definitions = [
+        _load_workflow("example-diamond"),
+        no_name,
+        _load_workflow("duplicate-step-names"),
+        _load_workflow("no-such-job"),
+        _load_workflow("example-two-step-nop"),
+    ]
+
+    # Act
+    results = WorkflowValidator.validate_many(
+        level=ValidationLevel.RUN,
+        workflow_definitions=definitions,
+        wapi_adapter=wapi_adapter,
+        max_workers=max_workers,
+    )
+
+    # Assert
+    assert [result.error_num for result in results] == [0, 1, 2, 9, 0]
+    assert results[1].error_msg == ["'name' is a required property"]
+    assert results[3].error_msg == [
+        "The job for step 'step-1' is not present (a|no-such-job|1.0.0)"
+    ]
+
+
+@pytest.mark.parametrize(
+    "level", [ValidationLevel.CREATE, ValidationLevel.TAG, ValidationLevel.RUN]
+)
+def test_validate_many_matches_validate(wapi, level):
+    # Arrange
+    wapi_adapter = wapi
+    definitions = [
+        _load_workflow(os.path.splitext(file_name)[0])
+        for file_name in sorted(os.listdir(_WORKFLOW_DEFINITIONS_DIR))
+    ]
+
+    # Act
+    results = WorkflowValidator.validate_many(
+        level=level,
+        workflow_definitions=definitions,
+        wapi_adapter=wapi_adapter,
+        max_workers=2,
+    )
+
+    # Assert
+    assert results == [
+        WorkflowValidator.validate(
+            level=level, workflow_definition=definition, wapi_adapter=wapi_adapter
+        )
+        for definition in definitions
+    ]
+
+
+def test_validate_many_gets_each_job_once(wapi):
+    # Arrange
+    ia = InstrumentedWorkflowAPIAdapter(wapi)
+    # The definitions use three jobs between them,
+    # one of which is not known (and not cached)
+    definitions = [
+        _load_workflow("example-diamond"),
+        _load_workflow("example-diamond"),
+        _load_workflow("no-such-job"),
+        _load_workflow("no-such-job"),
+    ]
+
+    # Act
+    with ia.message("validate_many") as log:
+        results = WorkflowValidator.validate_many(
+            level=ValidationLevel.RUN,
+            workflow_definitions=definitions,
+            wapi_adapter=ia,
+            max_workers=1,
+        )
+
+    # Assert
+    assert [result.error_num for result in results] == [0, 0, 9, 9]
+    assert log.call_counts == {"get_job": 4}
+
+
+def test_validate_many_without_definitions():
+    # Arrange
+
+    # Act
+    results = WorkflowValidator.validate_many(
+        level=ValidationLevel.TAG, workflow_definitions=[]
+    )
+
+    # Assert
+    assert results == []
+
+
+def test_workflow_validate_command(tmp_path, capsys):
+    # Arrange
+    for name in ["example-diamond", "duplicate-step-names"]:
+        (tmp_path / f"{name}.yaml").write_text(
+            yaml.safe_dump(_load_workflow(name)), encoding="utf8"
+        )
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "nested" / "not-a-workflow.yml").write_text("- a\n", encoding="utf8")
+
+    # Act
+    status = main([str(tmp_path), "--workers", "2"])
+
+    # Assert
+    assert status == 1
+    output = capsys.readouterr().out.splitlines()
+    assert output == [
+        f"{tmp_path / 'duplicate-step-names.yaml'}:",
+        "  Duplicate step names found: step-1",
+        f"{tmp_path / 'nested' / 'not-a-workflow.yml'}:",
+        "  The file does not contain a workflow definition",
+        "1 of 3 workflow definitions are valid (TAG level)",
+    ]
+
+
+def test_workflow_validate_command_for_create_level(capsys):
+    # Arrange
+
+    # Act
+    status = main([_WORKFLOW_DEFINITIONS_DIR, "--level", "create"])
+
+    # Assert
+    assert status == 0
+    assert capsys.readouterr().out.endswith(
+        " workflow definitions are valid (CREATE level)\n"
+    )
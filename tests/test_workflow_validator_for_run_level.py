@@ -7,6 +7,7 @@ import yaml
 pytestmark = pytest.mark.unit
 
 from tests.wapi_adapter import UnitTestWorkflowAPIAdapter
+from workflow.workflow_cache import JobDefinitionCache
 from workflow.workflow_validator import ValidationLevel, WorkflowValidator
 
 _NO_SUCH_JOB_WORKFLOW_FILE: str = os.path.join(
@@ -268,3 +269,30 @@ def test_validate_simple_python_molprops_with_missing_input(wapi):
     assert error.error_msg == [
         "Missing workflow variable values for: candidateMolecules"
     ]
+
+
+def test_validate_example_diamond_with_job_cache(wapi):
+    # Arrange
+    wapi_adapter = wapi
+    workflow_filename: str = os.path.join(
+        os.path.dirname(__file__), "workflow-definitions", "example-diamond.yaml"
+    )
+    with open(workflow_filename, "r", encoding="utf8") as workflow_file:
+        workflow: dict[str, Any] = yaml.load(workflow_file, Loader=yaml.FullLoader)
+    assert workflow
+    job_cache = JobDefinitionCache()
+
+    # Act
+    error = WorkflowValidator.validate(
+        level=ValidationLevel.RUN,
+        workflow_definition=workflow,
+        wapi_adapter=wapi_adapter,
+        job_cache=job_cache,
+    )
+
+    # Assert
+    assert error.error_num == 0
+    # Four steps use three different jobs
+    assert job_cache.statistics.misses == 3
+    assert job_cache.statistics.hits == 1
+    assert len(job_cache) == 3
@@ -25,6 +25,7 @@ from typing import Any
 import yaml
 
 from workflow.workflow_abc import WorkflowAPIAdapter
+from workflow.workflow_engine import get_output_values
 
 # Load the Unit test Job Definitions file now.
 _JOB_DEFINITION_FILE: str = os.path.join(
@@ -132,6 +133,27 @@ class UnitTestWorkflowAPIAdapter(WorkflowAPIAdapter):
                 steps.append(response)
         return {"count": len(steps), "status": steps}, 0
 
+    def get_status_of_all_step_instances(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        UnitTestWorkflowAPIAdapter.lock.acquire()
+        with open(_RUNNING_WORKFLOW_STEP_PICKLE_FILE, "rb") as pickle_file:
+            running_workflow_step = Unpickler(pickle_file).load()
+        UnitTestWorkflowAPIAdapter.lock.release()
+
+        steps: dict[str, dict[str, Any]] = {}
+        for rwfs_id, record in running_workflow_step.items():
+            if record["running_workflow"]["id"] != running_workflow_id:
+                continue
+            response = record
+            response["id"] = rwfs_id
+            if record["replica"] == 0:
+                _ = response.pop("replica")
+            step = steps.setdefault(record["name"], {"count": 0, "status": []})
+            step["count"] += 1
+            step["status"].append(response)
+        return {"count": len(steps), "steps": steps}, 0
+
     def set_running_workflow_done(
         self,
         *,
@@ -446,6 +468,23 @@ class UnitTestWorkflowAPIAdapter(WorkflowAPIAdapter):
         response = {"output": copy.copy(mock_output[step_name]["output"])}
         return response, 0
 
+    def get_running_workflow_step_output_values_page(
+        self,
+        *,
+        running_workflow_step_id: str,
+        output_variable: str,
+        offset: int,
+        limit: int,
+    ) -> tuple[dict[str, Any], int]:
+        """A page of the values 'get_running_workflow_step_output_values_for_output()'
+        returns, and their count."""
+        response, _ = self.get_running_workflow_step_output_values_for_output(
+            running_workflow_step_id=running_workflow_step_id,
+            output_variable=output_variable,
+        )
+        output: list[str] = get_output_values(response["output"])
+        return {"count": len(output), "output": output[offset : offset + limit]}, 0
+
     def realise_outputs(
         self, *, running_workflow_step_id: str
     ) -> tuple[dict[str, Any], int]:
@@ -0,0 +1,914 @@
+"""The AsyncWorkflowEngine - an asyncio variant of the WorkflowEngine.
+
+The 'WorkflowEngine' handles one message at a time, and all of its I/O (API adapter
+reads and writes and Instance launches) is synchronous and sequential. One slow
+database query or Kubernetes API call delays the handling of every other
+running workflow's messages.
+
+This engine runs workflows in exactly the same way (see 'workflow_engine.py',
+which describes how) but its 'handle_message()' method is a coroutine, and it uses
+an 'AsyncInstanceLauncher'. The messages of many running workflows can be handled
+at the same time on one event loop, and while a message is handled the reads
+that do not depend on each other are made concurrently - the status of each step,
+and the records and Job definitions of the steps a step depends on. The replicas
+of a step are launched together, with up to 'launch_workers' launches
+(across every running workflow) in progress at the same time.
+
+Module philosophy
+-----------------
+Only I/O is implemented here. The logic that does no I/O (which steps are READY,
+how a step's variables are compiled, what is launched) is provided by the functions
+of 'workflow_engine.py' so that the two engines cannot drift apart. Like the
+'WorkflowEngine' this engine keeps no running workflow state between messages
+(other than its caches of definitions).
+
+Messages for the same running workflow are NOT handled concurrently. Each running
+workflow has a lock (an 'asyncio.Lock', held only while it has messages being
+handled) and its messages are handled one at a time, in the order they arrived.
+Without it, in a diamond, the Pod message of one branch could find nothing to launch
+and nothing running, and fail the workflow as stalled while the Pod message
+of the other branch is still launching the step that joins them. A Pod message
+only identifies an Instance, so the records that identify its running workflow
+are read before the lock is taken.
+
+A step's output values are not paged (see 'OutputValuesReader'). The
+'AsyncWorkflowAPIAdapter' has no paging method, so every value of the output
+a step is replicated over is read (and all of its replicas are launched)
+at once. Paging them here is out of scope, and a step that is replicated over
+very many values is best run by the 'WorkflowEngine'.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Optional
+
+from workflow.workflow_abc import (
+    AsyncInstanceLauncher,
+    AsyncWorkflowAPIAdapter,
+    LaunchParameters,
+    LaunchResult,
+)
+
+from .decoder import (
+    Connector,
+    WorkflowPlan,
+    build_workflow_plan,
+    get_step_files_per_replica,
+)
+from .workflow_cache import (
+    CacheStatistics,
+    JobDefinitionCache,
+    WorkflowDefinitionCache,
+)
+from .workflow_engine import (
+    StepPreparationResponse,
+    StepState,
+    add_prior_step_variables,
+    get_first_replicas,
+    get_launch_parameters,
+    get_number_of_replicas,
+    get_output_values,
+    get_prime_variables,
+    get_ready_steps,
+    get_replica_files_variables,
+    get_replica_releases,
+    get_replica_variables,
+    get_replication_connection,
+    get_step_names_to_assess,
+    get_step_states,
+    get_unlaunched_steps,
+    is_combiner,
+    is_pod_message,
+)
+from .workflow_logging import RunningWorkflowLogger
+
+if TYPE_CHECKING:
+    from google.protobuf.message import Message
+    from informaticsmatters.protobuf.datamanager.pod_message_pb2 import PodMessage
+    from informaticsmatters.protobuf.datamanager.workflow_message_pb2 import (
+        WorkflowMessage,
+    )
+
+_LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+class AsyncWorkflowEngine:
+    """The asyncio workflow engine."""
+
+    def __init__(
+        self,
+        *,
+        wapi_adapter: AsyncWorkflowAPIAdapter,
+        instance_launcher: AsyncInstanceLauncher,
+        instance_link_glob: str = ".instance-*",
+        instance_id_dir_prefix: str = ".",
+        workflow_cache_size: int = 128,
+        job_cache: JobDefinitionCache | None = None,
+        launch_workers: int = 8,
+    ):
+        """Initialiser, taking the same arguments as the 'WorkflowEngine'
+        but with an asyncio Workflow API adapter and Instance launcher.
+
+        No more than 'launch_workers' Instance launches (of any running workflow)
+        are in progress at the same time."""
+        assert launch_workers >= 1
+        self._wapi_adapter: AsyncWorkflowAPIAdapter = wapi_adapter
+        self._instance_launcher: AsyncInstanceLauncher = instance_launcher
+        self._instance_link_glob: str = instance_link_glob
+        self._instance_id_dir_prefix: str = instance_id_dir_prefix
+
+        self._predefined_variables: dict[str, Any] = {
+            "instance-link-glob": instance_link_glob
+        }
+
+        # Cleared the first time the adapter tells us it has no
+        # 'get_status_of_all_step_instances()' method.
+        self._bulk_step_status_supported: bool = True
+        # Cleared the first time the launcher tells us it has no
+        # 'launch_many()' method.
+        self._launch_many_supported: bool = True
+
+        self._workflow_cache: WorkflowDefinitionCache = WorkflowDefinitionCache(
+            max_entries=workflow_cache_size
+        )
+        self._job_cache: JobDefinitionCache = job_cache or JobDefinitionCache()
+
+        self._launch_semaphore: asyncio.Semaphore = asyncio.Semaphore(launch_workers)
+        # The lock of each running workflow with messages being handled
+        # (and the number of messages that hold it or are waiting for it).
+        self._running_workflow_locks: dict[str, tuple[asyncio.Lock, int]] = {}
+
+    @property
+    def workflow_cache_statistics(self) -> CacheStatistics:
+        """The usage counters of the engine's workflow definition cache."""
+        return self._workflow_cache.statistics
+
+    async def handle_message(self, msg: "Message") -> None:
+        """Expect Workflow and Pod messages (see 'WorkflowEngine.handle_message()')."""
+        assert msg
+
+        _LOGGER.debug("Message:\n%s", msg)
+
+        if is_pod_message(msg):
+            await self._handle_pod_message(msg)
+        else:
+            async with self._running_workflow_lock(msg.running_workflow):
+                await self._handle_workflow_message(msg)
+
+    @asynccontextmanager
+    async def _running_workflow_lock(
+        self, running_workflow_id: str
+    ) -> AsyncIterator[None]:
+        """Holds the lock of a running workflow, so that its messages are handled
+        one at a time. A lock is discarded once no message needs it."""
+        lock, users = self._running_workflow_locks.get(
+            running_workflow_id, (asyncio.Lock(), 0)
+        )
+        self._running_workflow_locks[running_workflow_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._running_workflow_locks[running_workflow_id]
+            if users == 1:
+                del self._running_workflow_locks[running_workflow_id]
+            else:
+                self._running_workflow_locks[running_workflow_id] = (lock, users - 1)
+
+    async def _handle_workflow_message(self, msg: "WorkflowMessage") -> None:
+        """WorkflowMessages signal the need to start (or stop) a workflow using its
+        'action' string field (one of 'START' or 'STOP')."""
+        assert msg
+
+        r_wfid = msg.running_workflow
+        log: RunningWorkflowLogger = RunningWorkflowLogger(_LOGGER, {"id": r_wfid})
+        log.info("WorkflowMessage:\n%s", msg)
+        if msg.action not in ["START", "STOP"]:
+            log.error("Ignoring unsupported action (%s)", msg.action)
+            return
+
+        if msg.action == "START":
+            await self._handle_workflow_start_message(r_wfid)
+        else:
+            await self._handle_workflow_stop_message(r_wfid)
+
+    async def _handle_workflow_start_message(self, r_wfid: str) -> None:
+        """Logic to handle a START message - we launch every step that is READY."""
+        rwf_response, _ = await self._wapi_adapter.get_running_workflow(
+            running_workflow_id=r_wfid
+        )
+        RunningWorkflowLogger(_LOGGER, rwf_response).debug(
+            "API.get_running_workflow(%s) returned: -\n%s", r_wfid, rwf_response
+        )
+        assert "running_user" in rwf_response
+        plan: WorkflowPlan = await self._get_workflow_plan(rwf=rwf_response)
+
+        if not await self._launch_ready_steps(plan=plan, rwf=rwf_response):
+            # Nothing could be started, so nothing will ever send us a Pod message
+            # to move this workflow on.
+            await self._set_running_workflow_done_if_stalled(
+                plan=plan, rwf=rwf_response
+            )
+
+    async def _handle_workflow_stop_message(self, r_wfid: str) -> None:
+        """Logic to handle a STOP message."""
+        # Do nothing if the running workflow has already stopped.
+        rwf_response, _ = await self._wapi_adapter.get_running_workflow(
+            running_workflow_id=r_wfid
+        )
+        log: RunningWorkflowLogger = RunningWorkflowLogger(
+            _LOGGER, rwf_response or {"id": r_wfid}
+        )
+        log.debug("API.get_running_workflow(%s) returned: -\n%s", r_wfid, rwf_response)
+        if not rwf_response:
+            log.debug("Running workflow does not exist (%s)", r_wfid)
+            return
+        elif rwf_response["done"] is True:
+            log.debug("Running workflow already stopped (%s)", r_wfid)
+            return
+
+        # For this version all we can do is check that no steps are running.
+        # If no steps are running we can safely mark the running workflow as stopped.
+        response, _ = await self._wapi_adapter.get_running_steps(
+            running_workflow_id=r_wfid
+        )
+        log.debug("API.get_running_steps(%s) returned: -\n%s", r_wfid, response)
+        if response:
+            if count := response["count"]:
+                msg: str = "1 step is" if count == 1 else f"{count} steps are"
+                log.debug("Ignoring STOP for %s. %s still running", r_wfid, msg)
+            else:
+                await self._wapi_adapter.set_running_workflow_done(
+                    running_workflow_id=r_wfid,
+                    success=False,
+                    error_num=1,
+                    error_msg="User stopped",
+                )
+
+    async def _handle_pod_message(self, msg: "PodMessage") -> None:
+        """Handles a PodMessage, which signals the completion of a
+        step Job (Instance) within an existing running workflow."""
+        assert msg
+
+        # Ignore anything without an exit code.
+        if not msg.has_exit_code:
+            _LOGGER.error("Ignoring PodMessage without an exit code:\n%s", msg)
+            return
+
+        # Each record identifies the next, so these reads cannot be concurrent.
+        instance_id: str = msg.instance
+        exit_code: int = msg.exit_code
+        response, _ = await self._wapi_adapter.get_instance(instance_id=instance_id)
+        _LOGGER.debug("API.get_instance(%s) returned: -\n%s", instance_id, response)
+        r_wfsid: str | None = response.get("running_workflow_step_id")
+        assert r_wfsid
+        rwfs_response, _ = await self._wapi_adapter.get_running_workflow_step(
+            running_workflow_step_id=r_wfsid
+        )
+        step_name: str = rwfs_response["name"]
+
+        r_wfid: str = rwfs_response["running_workflow"]["id"]
+        assert r_wfid
+        log: RunningWorkflowLogger = RunningWorkflowLogger(_LOGGER, {"id": r_wfid})
+        log.info("PodMessage:\n%s", msg)
+        log.debug(
+            "API.get_running_workflow_step(%s) returned: -\n%s",
+            r_wfsid,
+            rwfs_response,
+        )
+        async with self._running_workflow_lock(r_wfid):
+            await self._handle_pod_step(
+                r_wfid=r_wfid, r_wfsid=r_wfsid, step_name=step_name, exit_code=exit_code
+            )
+
+    async def _handle_pod_step(
+        self, *, r_wfid: str, r_wfsid: str, step_name: str, exit_code: int
+    ) -> None:
+        """Records the end of the step (replica) a Pod message is for and,
+        if it was successful, launches whatever is now READY."""
+        rwf_response, _ = await self._wapi_adapter.get_running_workflow(
+            running_workflow_id=r_wfid
+        )
+        log: RunningWorkflowLogger = RunningWorkflowLogger(
+            _LOGGER, rwf_response or {"id": r_wfid}
+        )
+        log.debug("API.get_running_workflow(%s) returned: -\n%s", r_wfid, rwf_response)
+
+        if exit_code:
+            # The job was launched but it failed.
+            await self._set_step_error(
+                step_name, r_wfid, r_wfsid, exit_code, "Job failed"
+            )
+            return
+
+        plan: WorkflowPlan = await self._get_workflow_plan(rwf=rwf_response)
+
+        log.debug("End of RunningWorkflowStep %s (%s)", r_wfsid, r_wfid)
+        await self._wapi_adapter.set_running_workflow_step_done(
+            running_workflow_step_id=r_wfsid,
+            success=True,
+        )
+
+        # Launch whatever depends on the step and is now READY.
+        if await self._launch_ready_steps(
+            plan=plan, rwf=rwf_response, finished_steps=[step_name]
+        ):
+            return
+
+        await self._set_running_workflow_done_if_stalled(plan=plan, rwf=rwf_response)
+
+    async def _get_workflow_plan(self, *, rwf: dict[str, Any]) -> WorkflowPlan:
+        """Returns the plan of a running workflow's Workflow definition
+        (see 'WorkflowEngine._get_workflow_plan()')."""
+        wfid: str = rwf["workflow"]["id"]
+        assert wfid
+        fingerprint: str = rwf["workflow"].get("fingerprint") or rwf["id"]
+        if cached := self._workflow_cache.get(
+            workflow_id=wfid, fingerprint=fingerprint
+        ):
+            return cached.plan
+
+        wf_response, _ = await self._wapi_adapter.get_workflow(workflow_id=wfid)
+        RunningWorkflowLogger(_LOGGER, rwf).debug(
+            "API.get_workflow(%s) returned: -\n%s", wfid, wf_response
+        )
+        if not wf_response:
+            # Never cache a definition that is missing
+            return build_workflow_plan(wf_response)
+        return self._workflow_cache.put(
+            workflow_id=wfid, fingerprint=fingerprint, definition=wf_response
+        ).plan
+
+    async def _set_running_workflow_done_if_stalled(
+        self, *, plan: WorkflowPlan, rwf: dict[str, Any]
+    ) -> None:
+        """Called when nothing could be launched. Sets the running workflow done
+        unless a step is still running (see the 'WorkflowEngine' equivalent).
+        The caller must hold the running workflow's lock, otherwise a step
+        that's being launched for another message could be taken for a stall."""
+        r_wfid: str = rwf["id"]
+        log: RunningWorkflowLogger = RunningWorkflowLogger(_LOGGER, rwf)
+
+        (rwf_response, _), step_states = await asyncio.gather(
+            self._wapi_adapter.get_running_workflow(running_workflow_id=r_wfid),
+            self._get_step_states(plan=plan, rwf_id=r_wfid),
+        )
+        if rwf_response.get("done"):
+            log.debug("Running workflow already stopped (%s)", r_wfid)
+            return
+
+        if (unrunnable := get_unlaunched_steps(step_states=step_states)) is None:
+            log.debug("Steps are still running for %s", r_wfid)
+            return
+
+        if unrunnable:
+            msg: str = f"The following steps could not be run: {', '.join(unrunnable)}"
+            log.warning("%s (%s)", msg, r_wfid)
+            await self._wapi_adapter.set_running_workflow_done(
+                running_workflow_id=r_wfid,
+                success=False,
+                error_num=6,
+                error_msg=msg,
+            )
+            return
+
+        log.debug("End of RunningWorkflow %s", r_wfid)
+        await self._wapi_adapter.set_running_workflow_done(
+            running_workflow_id=r_wfid,
+            success=True,
+        )
+
+    async def _get_step_states(
+        self, *, plan: WorkflowPlan, rwf_id: str
+    ) -> dict[str, StepState]:
+        """Returns the execution state of every Step in the given Workflow,
+        indexed by step name."""
+        responses: dict[str, dict[str, Any]] = await self._get_step_status_responses(
+            rwf_id=rwf_id, step_names=plan.step_names
+        )
+        return get_step_states(step_names=plan.step_names, responses=responses)
+
+    async def _get_step_status_responses(
+        self, *, rwf_id: str, step_names: list[str]
+    ) -> dict[str, dict[str, Any]]:
+        """Returns the DM's step status response for the named steps of a
+        running workflow, indexed by step name. We use the adapter's bulk method
+        if it has one, otherwise we ask for the steps (concurrently) by name."""
+        if self._bulk_step_status_supported:
+            try:
+                response, _ = await self._wapi_adapter.get_status_of_all_step_instances(
+                    running_workflow_id=rwf_id
+                )
+            except NotImplementedError:
+                _LOGGER.debug(
+                    "API.get_status_of_all_step_instances() is not implemented"
+                )
+                self._bulk_step_status_supported = False
+            else:
+                assert "steps" in response
+                steps: dict[str, dict[str, Any]] = response["steps"]
+                return steps
+
+        responses: list[tuple[dict[str, Any], int]] = await asyncio.gather(
+            *(
+                self._wapi_adapter.get_status_of_all_step_instances_by_name(
+                    name=step_name, running_workflow_id=rwf_id
+                )
+                for step_name in step_names
+            )
+        )
+        return {
+            step_name: response
+            for step_name, (response, _) in zip(step_names, responses)
+        }
+
+    async def _launch_ready_steps(
+        self,
+        *,
+        plan: WorkflowPlan,
+        rwf: dict[str, Any],
+        finished_steps: list[str] | None = None,
+    ) -> int:
+        """Finds every READY Step (and the replicas of finished steps that are
+        waiting for a place) and launches it, returning the number of steps
+        that were launched.
+
+        The steps are prepared concurrently. If a step cannot be prepared
+        the steps before it are launched and then the running workflow is failed."""
+        rwf_id: str = rwf["id"]
+        log: RunningWorkflowLogger = RunningWorkflowLogger(_LOGGER, rwf)
+        candidates, step_names = get_step_names_to_assess(
+            plan=plan, finished_steps=finished_steps
+        )
+        if not step_names:
+            return 0
+        # The responses are kept, to prepare the READY steps
+        responses: dict[str, dict[str, Any]] = await self._get_step_status_responses(
+            rwf_id=rwf_id, step_names=step_names
+        )
+        step_states: dict[str, StepState] = get_step_states(
+            step_names=step_names, responses=responses
+        )
+        releases: dict[str, range] = get_replica_releases(
+            plan=plan, step_states=step_states, finished_steps=finished_steps
+        )
+        ready_steps: list[dict[str, Any]] = get_ready_steps(
+            plan=plan, step_states=step_states, candidates=candidates
+        )
+        log.info(
+            "Ready steps for %s: %s",
+            rwf_id,
+            [step["name"] for step in ready_steps],
+        )
+        if releases:
+            log.info("Released replicas for %s: %s", rwf_id, releases)
+        launches: list[tuple[dict[str, Any], range | None]] = [
+            (plan.steps[step_name], replicas)
+            for step_name, replicas in releases.items()
+        ] + [(step, None) for step in ready_steps]
+
+        # Steps prepared together often share a prior step (read its record once)
+        prior_steps: dict[str, dict[str, Any]] = await self._get_prior_steps(
+            plan=plan,
+            rwf_id=rwf_id,
+            step_names=[step["name"] for step, _ in launches],
+        )
+        sp_responses: list[StepPreparationResponse] = await asyncio.gather(
+            *(
+                self._prepare_step(
+                    plan=plan,
+                    step_definition=step,
+                    rwf=rwf,
+                    step_status_responses=responses,
+                    prior_steps=prior_steps,
+                )
+                for step, _ in launches
+            )
+        )
+        launchable: list[
+            tuple[dict[str, Any], StepPreparationResponse, range | None]
+        ] = []
+        error: StepPreparationResponse | None = None
+        for (step, replicas), sp_resp in zip(launches, sp_responses):
+            if sp_resp.error_num:
+                error = sp_resp
+                break
+            if sp_resp.replicas == 0:
+                # Not an error - the step cannot be prepared yet,
+                # so we'll re-assess it when a later message arrives.
+                log.info("Step '%s' is not yet preparable - deferring", step["name"])
+                continue
+            launchable.append((step, sp_resp, replicas))
+
+        launched: list[bool] = await asyncio.gather(
+            *(
+                self._launch(
+                    rwf=rwf,
+                    step_definition=step,
+                    step_preparation_response=sp_resp,
+                    replicas=replicas,
+                )
+                for step, sp_resp, replicas in launchable
+            )
+        )
+        if error:
+            await self._wapi_adapter.set_running_workflow_done(
+                running_workflow_id=rwf_id,
+                success=False,
+                error_num=error.error_num,
+                error_msg=error.error_msg,
+            )
+        return sum(launched)
+
+    async def _get_step_job(self, *, step: dict[str, Any]) -> dict[str, Any]:
+        """Gets the Job definition for a given Step (via our cache)."""
+        assert "specification" in step
+        step_spec: dict[str, Any] = step["specification"]
+        return await self._job_cache.get_job_async(
+            wapi_adapter=self._wapi_adapter,
+            collection=step_spec["collection"],
+            job=step_spec["job"],
+            version=step_spec["version"],
+        )
+
+    async def _get_prior_steps(
+        self, *, plan: WorkflowPlan, rwf_id: str, step_names: list[str]
+    ) -> dict[str, dict[str, Any]]:
+        """Returns the (first) running step record of each step the named steps
+        depend on, indexed by step name. Each record is read once (concurrently)."""
+        prior_step_names: list[str] = list(
+            dict.fromkeys(
+                p_step_name
+                for step_name in step_names
+                for p_step_name in plan.prior_step_connections[step_name]
+            )
+        )
+        responses: list[tuple[dict[str, Any], int]] = await asyncio.gather(
+            *(
+                self._wapi_adapter.get_running_workflow_step_by_name(
+                    name=p_step_name, running_workflow_id=rwf_id
+                )
+                for p_step_name in prior_step_names
+            )
+        )
+        return {
+            p_step_name: response
+            for p_step_name, (response, _) in zip(prior_step_names, responses)
+        }
+
+    async def _prepare_step(
+        self,
+        *,
+        step_definition: dict[str, Any],
+        plan: WorkflowPlan,
+        rwf: dict[str, Any],
+        step_status_responses: dict[str, dict[str, Any]] | None = None,
+        prior_steps: dict[str, dict[str, Any]] | None = None,
+    ) -> StepPreparationResponse:
+        """Attempts to prepare a map of step variables
+        (see 'WorkflowEngine._prepare_step()').
+
+        As there, the step status responses that were used to decide the step
+        is READY, and the records of its prior steps, can be given (indexed by
+        step name) so they're not read again. Whatever else we need from the DM,
+        other than the values of a prior step output that replicates us,
+        is read concurrently. The Jobs of prior steps are only read if we're
+        not a combiner."""
+        # pylint: disable-next=import-outside-toplevel
+        import decoder.decoder as job_definition_decoder
+
+        step_name: str = step_definition["name"]
+        rwf_id: str = rwf["id"]
+        log: RunningWorkflowLogger = RunningWorkflowLogger(_LOGGER, rwf)
+        plumbing_of_prior_steps: dict[str, list[Connector]] = (
+            plan.prior_step_connections[step_name]
+        )
+        prior_step_names: list[str] = list(plumbing_of_prior_steps)
+
+        log.info("Preparing step '%s'...", step_name)
+
+        # Our Job, and the first running step record and instance statuses
+        # of each prior step (that we've not been given).
+        if step_status_responses is None:
+            step_status_responses = {}
+        if prior_steps is None:
+            prior_steps = {}
+        unread_steps: list[str] = [
+            p_step_name
+            for p_step_name in prior_step_names
+            if p_step_name not in prior_steps
+        ]
+        unread_statuses: list[str] = [
+            p_step_name
+            for p_step_name in prior_step_names
+            if p_step_name not in step_status_responses
+        ]
+        our_job_definition, *prior_reads = await asyncio.gather(
+            self._get_step_job(step=step_definition),
+            *(
+                self._wapi_adapter.get_running_workflow_step_by_name(
+                    name=p_step_name, running_workflow_id=rwf_id
+                )
+                for p_step_name in unread_steps
+            ),
+            *(
+                self._wapi_adapter.get_status_of_all_step_instances_by_name(
+                    name=p_step_name, running_workflow_id=rwf_id
+                )
+                for p_step_name in unread_statuses
+            ),
+        )
+        prior_steps = prior_steps | {
+            p_step_name: response
+            for p_step_name, (response, _) in zip(
+                unread_steps, prior_reads[: len(unread_steps)]
+            )
+        }
+        prior_statuses: list[dict[str, Any]] = [
+            step_status_responses[p_step_name]
+            for p_step_name in prior_step_names
+            if p_step_name in step_status_responses
+        ] + [response for response, _ in prior_reads[len(unread_steps) :]]
+
+        if not our_job_definition:
+            return StepPreparationResponse(
+                replicas=0,
+                error_num=1,
+                error_msg=f"The Job for step '{step_name}' is not present",
+            )
+        our_inputs: dict[str, Any] = job_definition_decoder.get_inputs(
+            our_job_definition
+        )
+        we_are_a_combiner: bool = is_combiner(
+            our_inputs=our_inputs, plumbing_of_prior_steps=plumbing_of_prior_steps
+        )
+        log.debug("Step '%s' is combiner (%s)", step_name, we_are_a_combiner)
+        # The Jobs of our prior steps (to look for their outputs that are our inputs)
+        prior_jobs: dict[str, dict[str, Any]] = (
+            {}
+            if we_are_a_combiner
+            else dict(
+                zip(
+                    prior_step_names,
+                    await asyncio.gather(
+                        *(
+                            self._get_step_job(step=plan.steps[p_step_name])
+                            for p_step_name in prior_step_names
+                        )
+                    ),
+                )
+            )
+        )
+
+        prime_variables, inputs, outputs = get_prime_variables(
+            plan=plan,
+            step_definition=step_definition,
+            rwf=rwf,
+            predefined_variables=self._predefined_variables,
+        )
+
+        prior_job_outputs: dict[str, dict[str, Any]] = {}
+        for p_step_name, connections in plumbing_of_prior_steps.items():
+            prior_step: dict[str, Any] = prior_steps[p_step_name]
+            assert prior_step
+            assert "instance_id" in prior_step
+            if not we_are_a_combiner:
+                if not prior_jobs[p_step_name]:
+                    return StepPreparationResponse(
+                        replicas=0,
+                        error_num=4,
+                        error_msg=f"The Job for step '{p_step_name}' is not present",
+                    )
+                prior_job_outputs[p_step_name] = job_definition_decoder.get_outputs(
+                    prior_jobs[p_step_name]
+                )
+            add_prior_step_variables(
+                prime_variables=prime_variables,
+                prior_step=prior_step,
+                connections=connections,
+                prior_job_outputs=prior_job_outputs.get(p_step_name, {}),
+                prior_instance_directory=(
+                    f"{self._instance_id_dir_prefix}{prior_step['instance_id']}"
+                ),
+            )
+
+        message, success = job_definition_decoder.decode(
+            our_job_definition["command"],
+            prime_variables,
+            "command",
+            job_definition_decoder.TextEncoding.JINJA2_3_0,
+        )
+        if not success:
+            msg = f"Failed command validation for step {step_name} error_msg={message}"
+            log.warning(msg)
+            return StepPreparationResponse(replicas=0, error_num=3, error_msg=msg)
+
+        iter_values: list[str] = []
+        iter_variable: str | None = None
+        iter_instance_id: str | None = None
+        if not we_are_a_combiner and (
+            replication := get_replication_connection(
+                plumbing_of_prior_steps=plumbing_of_prior_steps,
+                prior_job_outputs=prior_job_outputs,
+            )
+        ):
+            p_step_name, connector = replication
+            iter_variable = connector.out
+            rwfs_id: str = prior_steps[p_step_name]["id"]
+            assert rwfs_id
+            iter_instance_id = prior_steps[p_step_name]["instance_id"]
+            result, _ = (
+                await self._wapi_adapter.get_running_workflow_step_output_values_for_output(
+                    running_workflow_step_id=rwfs_id,
+                    output_variable=connector.in_,
+                )
+            )
+            iter_values = get_output_values(result["output"])
+
+        if iter_variable and len(iter_values) == 0:
+            msg = f"The step prior to step '{step_name}' had no outputs. At least one is needed"
+            log.warning(msg)
+            return StepPreparationResponse(replicas=0, error_num=5, error_msg=msg)
+
+        dependent_instances: set[str] = {
+            status["instance_id"]
+            for response in prior_statuses
+            for status in response["status"]
+        }
+
+        files_per_replica: int | None = get_step_files_per_replica(
+            step_definition=step_definition
+        )
+        return StepPreparationResponse(
+            variables=prime_variables,
+            replicas=get_number_of_replicas(
+                replica_values=iter_values, files_per_replica=files_per_replica
+            ),
+            replica_variable=iter_variable,
+            replica_values=iter_values,
+            replica_instance_id=iter_instance_id,
+            files_per_replica=files_per_replica,
+            replica_files_variables=get_replica_files_variables(
+                plan=plan, step_name=step_name
+            ),
+            dependent_instances=dependent_instances,
+            outputs=outputs,
+            inputs=inputs,
+        )
+
+    async def _launch(
+        self,
+        *,
+        rwf: dict[str, Any],
+        step_definition: dict[str, Any],
+        step_preparation_response: StepPreparationResponse,
+        replicas: range | None = None,
+    ) -> bool:
+        """Launches the given replicas of a prepared step (concurrently),
+        or its first replicas (see 'get_first_replicas()').
+        Returns True if at least one instance was launched."""
+        step_name: str = step_definition["name"]
+        rwf_id: str = rwf["id"]
+        log: RunningWorkflowLogger = RunningWorkflowLogger(_LOGGER, rwf)
+        total_replicas: int = step_preparation_response.replicas
+        assert total_replicas >= 1
+        if replicas is None:
+            replicas = get_first_replicas(
+                step_definition=step_definition, total_replicas=total_replicas
+            )
+        replicas = range(replicas.start, min(replicas.stop, total_replicas))
+
+        # Each replica has its own variables.
+        replica_variables: list[dict[str, Any]] = [
+            get_replica_variables(
+                step_preparation_response=step_preparation_response,
+                replica=replica,
+                instance_id_dir_prefix=self._instance_id_dir_prefix,
+            )
+            for replica in replicas
+        ]
+
+        log.debug(
+            "Launching step: %s RunningWorkflow=%s replicas=%s (of %s)",
+            step_name,
+            rwf_id,
+            replicas,
+            total_replicas,
+        )
+        results: list[LaunchResult] = await self._launch_replicas(
+            [
+                get_launch_parameters(
+                    rwf=rwf,
+                    step_definition=step_definition,
+                    step_preparation_response=step_preparation_response,
+                    variables=variables,
+                    replica=replica,
+                )
+                for replica, variables in zip(replicas, replica_variables)
+            ]
+        )
+
+        launched: int = 0
+        already_launched: int = 0
+        for replica, lr in zip(replicas, results):
+            if lr.error_num:
+                await self._set_step_error(
+                    step_name,
+                    rwf_id,
+                    lr.running_workflow_step_id,
+                    lr.error_num,
+                    lr.error_msg,
+                )
+            elif lr.already_launched:
+                # Not an error - we lost a race with another launch.
+                already_launched += 1
+                log.debug(
+                    "Step '%s' (replica %s) was already launched - ignoring",
+                    step_name,
+                    replica,
+                )
+            else:
+                assert lr.running_workflow_step_id
+                launched += 1
+                log.debug(
+                    "Launched step '%s' step_id=%s (command=%s)",
+                    step_name,
+                    lr.running_workflow_step_id,
+                    lr.command,
+                )
+        log.info(
+            "Launched step '%s' replicas %s-%s (of %s) RunningWorkflow=%s:"
+            " %s launched, %s already launched, %s failed",
+            step_name,
+            replicas.start,
+            replicas.stop - 1,
+            total_replicas,
+            rwf_id,
+            launched,
+            already_launched,
+            len(replicas) - launched - already_launched,
+        )
+        return launched > 0
+
+    async def _launch_replicas(
+        self, launch_parameters: list[LaunchParameters]
+    ) -> list[LaunchResult]:
+        """Launches every replica of a step (with 'launch_many()' if the launcher
+        has it), returning the launch results in replica order."""
+        if self._launch_many_supported and len(launch_parameters) > 1:
+            try:
+                results: list[LaunchResult] = await self._instance_launcher.launch_many(
+                    launch_parameters=launch_parameters
+                )
+            except NotImplementedError:
+                _LOGGER.debug("InstanceLauncher.launch_many() is not implemented")
+                self._launch_many_supported = False
+            else:
+                assert len(results) == len(launch_parameters)
+                return results
+
+        return await asyncio.gather(
+            *(self._launch_replica(lp) for lp in launch_parameters)
+        )
+
+    async def _launch_replica(
+        self, launch_parameters: LaunchParameters
+    ) -> LaunchResult:
+        """Launches one replica of a step, once fewer than 'launch_workers'
+        launches are in progress."""
+        async with self._launch_semaphore:
+            return await self._instance_launcher.launch(
+                launch_parameters=launch_parameters
+            )
+
+    async def _set_step_error(
+        self,
+        step_name: str,
+        r_wfid: str,
+        r_wfsid: str | None,
+        error_num: Optional[int],
+        error_msg: Optional[str],
+    ) -> None:
+        """Set the error state for a running workflow step (and the running workflow).
+        Calling this method essentially 'ends' the running workflow."""
+        RunningWorkflowLogger(_LOGGER, {"id": r_wfid}).warning(
+            "Failed to launch step '%s' (error_num=%d error_msg=%s)",
+            step_name,
+            error_num,
+            error_msg,
+        )
+        r_wf_error: str = f"Step '{step_name}' ERROR({error_num}): {error_msg}"
+        if r_wfsid:
+            await self._wapi_adapter.set_running_workflow_step_done(
+                running_workflow_step_id=r_wfsid,
+                success=False,
+                error_num=error_num,
+                error_msg=r_wf_error,
+            )
+        await self._wapi_adapter.set_running_workflow_done(
+            running_workflow_id=r_wfid,
+            success=False,
+            error_num=error_num,
+            error_msg=r_wf_error,
+        )
@@ -14,28 +14,122 @@ is supposed to know _where_ to get content should be encoded as a function here.
 For example, rather than external code navigating the 'plumbing' blocks
 we have a function 'get_workflow_variable_names()' that returns the names of workflow
 variables.
+
+The functions that take a definition have to walk its steps to find what they
+are asked for. Code that needs to make many such lookups (the engine and the
+validator) should use 'build_workflow_plan()' instead, which walks the definition
+once and returns a 'WorkflowPlan' - the same information, indexed by step name.
+
+Nothing expensive happens when the module is imported. The schema is loaded
+(and its validator built) when a definition is first validated, and the modules
+we depend on ('jsonschema', 'yaml' and the Job decoder) are imported by the
+functions that use them - code that never validates (or decodes) doesn't pay for
+them. The engines import the Job decoder in the same way.
+The schema is loaded from 'workflow-schema.json', which is generated from
+the YAML schema (with 'python -m workflow.decoder') so it can be loaded without
+parsing YAML. The YAML schema is only used if the JSON is missing.
+
+Definitions should be loaded with 'load_workflow()', rather than by parsing
+their YAML directly. It uses the fastest YAML loader available and keeps what it
+loads, so the same (stored) definition isn't parsed again and again.
 """
 
+import functools
+import hashlib
+import heapq
+import json
 import os
-from dataclasses import dataclass
-from typing import Any
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from typing import IO, TYPE_CHECKING, Any, NoReturn
+
+# Type checkers see ordinary imports. Otherwise the modules are imported
+# (in the functions that use them) when they're first used.
+if TYPE_CHECKING:
+    import jsonschema
+    import yaml
 
-import decoder.decoder as job_definition_decoder
-import jsonschema
-import yaml
 
 # The (built-in) schemas...
 # from the same directory as us.
+# The JSON schema is generated from the YAML schema.
 _WORKFLOW_SCHEMA_FILE: str = os.path.join(
     os.path.dirname(__file__), "workflow-schema.yaml"
 )
+_WORKFLOW_SCHEMA_JSON_FILE: str = os.path.join(
+    os.path.dirname(__file__), "workflow-schema.json"
+)
+
+
+# The maximum number of definitions 'load_workflow()' keeps
+_LOADED_WORKFLOWS_MAX_ENTRIES: int = 128
+# The definitions 'load_workflow()' has loaded (the least recently used first),
+# keyed by the SHA-256 digest of their content
+_LOADED_WORKFLOWS: OrderedDict[bytes, dict[str, Any]] = OrderedDict()
+_LOADED_WORKFLOWS_LOCK: threading.Lock = threading.Lock()
+
+
+def _get_yaml_loader() -> type["yaml.SafeLoader"]:
+    """Returns the YAML (safe) loader to use - the libyaml-based loader
+    if PyYAML was built with it (it's much faster), otherwise the Python one."""
+    # pylint: disable-next=import-outside-toplevel
+    import yaml
+
+    loader: type[yaml.SafeLoader] = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    return loader
+
+
+def _load_yaml_schema() -> dict[str, Any]:
+    """Loads the Workflow schema from its YAML file."""
+    # pylint: disable-next=import-outside-toplevel
+    import yaml
+
+    with open(_WORKFLOW_SCHEMA_FILE, "r", encoding="utf8") as schema_file:
+        schema: dict[str, Any] = yaml.load(schema_file, Loader=_get_yaml_loader())
+    return schema
+
+
+@functools.cache
+def _get_schema() -> dict[str, Any]:
+    """Loads the Workflow schema (once), from the JSON file if there is one.
+    This must work as the files are installed along with this module."""
+    schema: dict[str, Any]
+    if os.path.isfile(_WORKFLOW_SCHEMA_JSON_FILE):
+        with open(_WORKFLOW_SCHEMA_JSON_FILE, "r", encoding="utf8") as schema_file:
+            schema = json.load(schema_file)
+    else:
+        schema = _load_yaml_schema()
+    assert schema
+    return schema
+
 
-# Load the Workflow schema YAML file now.
-# This must work as the file is installed along with this module.
-assert os.path.isfile(_WORKFLOW_SCHEMA_FILE)
-with open(_WORKFLOW_SCHEMA_FILE, "r", encoding="utf8") as schema_file:
-    _WORKFLOW_SCHEMA: dict[str, Any] = yaml.load(schema_file, Loader=yaml.FullLoader)
-assert _WORKFLOW_SCHEMA
+@functools.cache
+def _get_validator() -> "jsonschema.Draft7Validator":
+    """Builds the schema's (draft-07) validator (once), checking the schema against
+    its meta-schema, rather than for every definition we're asked to validate."""
+    # pylint: disable-next=import-outside-toplevel
+    import jsonschema
+
+    schema: dict[str, Any] = _get_schema()
+    jsonschema.Draft7Validator.check_schema(schema)
+    return jsonschema.Draft7Validator(schema)
+
+
+def write_schema_json() -> bool:
+    """Writes the JSON form of the Workflow schema (generated from the YAML),
+    returning True if the file has changed. Run (when the YAML schema has been
+    changed) with 'python -m workflow.decoder'."""
+    text: str = json.dumps(_load_yaml_schema(), indent=2) + "\n"
+    if os.path.isfile(_WORKFLOW_SCHEMA_JSON_FILE):
+        with open(_WORKFLOW_SCHEMA_JSON_FILE, "r", encoding="utf8") as schema_file:
+            if schema_file.read() == text:
+                return False
+    with open(_WORKFLOW_SCHEMA_JSON_FILE, "w", encoding="utf8") as schema_file:
+        schema_file.write(text)
+    return True
 
 
 @dataclass
@@ -47,21 +141,177 @@ class Connector:
     out: str
 
 
+@dataclass
+class WorkflowPlan:
+    """A compiled (indexed) form of a workflow definition, built by
+    'build_workflow_plan()'. Every helper above that takes a definition
+    has to walk its steps to find anything. The plan walks them once, so the
+    engine and validator can look things up by step name.
+
+    Steps are indexed by name. If names are duplicated (which TAG-level
+    validation rejects) the first definition of a step is used and the names are
+    listed in 'duplicate_step_names'.
+
+    'dependencies' maps each step to the names of the steps it depends on
+    (the steps it takes variables from), and 'dependents' is its reverse - it maps
+    each step to the steps that depend on it (in definition order). When a step
+    finishes, its dependents are the only steps that can have become READY.
+    'topological_order' lists step names so
+    that every step follows the steps it depends on, using definition order
+    where there's a choice. Steps that can never run (because they depend on a
+    step that does not exist, or on themselves via a cycle) are absent from it.
+    The engine assesses (and launches) steps in this order."""
+
+    definition: dict[str, Any]
+    step_names: list[str] = field(default_factory=list)
+    steps: dict[str, dict[str, Any]] = field(default_factory=dict)
+    duplicate_step_names: list[str] = field(default_factory=list)
+    workflow_variable_connections: dict[str, list[Connector]] = field(
+        default_factory=dict
+    )
+    predefined_variable_connections: dict[str, list[Connector]] = field(
+        default_factory=dict
+    )
+    prior_step_connections: dict[str, dict[str, list[Connector]]] = field(
+        default_factory=dict
+    )
+    dependencies: dict[str, set[str]] = field(default_factory=dict)
+    dependents: dict[str, list[str]] = field(default_factory=dict)
+    topological_order: list[str] = field(default_factory=list)
+    workflow_variable_names: set[str] = field(default_factory=set)
+    workflow_input_names: set[str] = field(default_factory=set)
+    workflow_output_names: set[str] = field(default_factory=set)
+
+
 def validate_schema(workflow: dict[str, Any]) -> str | None:
     """Checks the Workflow Definition against the built-in schema.
     If there's an error the error text is returned, otherwise None.
     """
+    # pylint: disable-next=import-outside-toplevel
+    import jsonschema
+
     assert isinstance(workflow, dict)
 
-    try:
-        jsonschema.validate(workflow, schema=_WORKFLOW_SCHEMA)
-    except jsonschema.ValidationError as ex:
-        return str(ex.message)
+    # The error 'jsonschema.validate()' would raise
+    if error := jsonschema.exceptions.best_match(
+        _get_validator().iter_errors(workflow)
+    ):
+        return str(error.message)
 
     # OK if we get here
     return None
 
 
+def iter_schema_errors(workflow: dict[str, Any]) -> Iterator[str]:
+    """Checks the Workflow Definition against the built-in schema,
+    yielding every error (not just the first), in one pass over the definition.
+    Each error is prefixed with the (JSON) path of the offending value,
+    i.e. "$.steps[0].name: 'Step 1' does not match ...".
+    """
+    assert isinstance(workflow, dict)
+
+    for error in _get_validator().iter_errors(workflow):
+        yield f"{error.json_path}: {error.message}"
+
+
+def _immutable(*_: Any, **__: Any) -> NoReturn:
+    raise TypeError("A loaded workflow definition cannot be modified")
+
+
+class _ImmutableDict(dict[str, Any]):
+    """A dictionary that cannot be modified. It is a 'dict' (so it can be
+    validated and used like one) but copies of it (and its pickles) are ordinary
+    (modifiable) dictionaries."""
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return dict, (dict(self),)
+
+    def __deepcopy__(self, memo: dict[int, Any]) -> dict[str, Any]:
+        return {key: copy_value(value) for key, value in self.items()}
+
+
+class _ImmutableList(list[Any]):
+    """A list that cannot be modified. Like '_ImmutableDict' its copies
+    (and pickles) are ordinary lists."""
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+    append = extend = insert = pop = remove = clear = sort = reverse = _immutable
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return list, (list(self),)
+
+    def __deepcopy__(self, memo: dict[int, Any]) -> list[Any]:
+        return [copy_value(value) for value in self]
+
+
+def _make_immutable(value: Any) -> Any:
+    """Returns an immutable form of a value (loaded from YAML)."""
+    if isinstance(value, dict):
+        return _ImmutableDict(
+            (key, _make_immutable(item)) for key, item in value.items()
+        )
+    if isinstance(value, list):
+        return _ImmutableList(_make_immutable(item) for item in value)
+    return value
+
+
+def copy_value(value: Any) -> Any:
+    """Returns a (deep) copy of a value of a workflow definition
+    (or a whole definition) that can be modified."""
+    if isinstance(value, dict):
+        return {key: copy_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_value(item) for item in value]
+    return value
+
+
+def load_workflow(source: str | os.PathLike[str] | bytes | IO[Any]) -> dict[str, Any]:
+    """Loads a workflow definition (YAML) from a file (given its path),
+    its content (bytes), or a stream (a file object), using PyYAML's
+    libyaml-based safe loader if it's available.
+
+    Definitions are kept (by the digest of their content), so loading the same
+    definition again (from anywhere) is cheap, and returns the same object.
+    The definition is therefore immutable - any attempt to modify it raises
+    a TypeError. 'copy_value()' (or 'copy.deepcopy()') returns a copy that can be
+    modified. A 'yaml.YAMLError' is raised if the content is not YAML
+    and a ValueError if it is not a dictionary (a definition).
+    """
+    # pylint: disable-next=import-outside-toplevel
+    import yaml
+
+    content: bytes
+    if isinstance(source, bytes):
+        content = source
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as workflow_file:
+            content = workflow_file.read()
+    else:
+        read: str | bytes = source.read()
+        content = read.encode("utf8") if isinstance(read, str) else read
+
+    digest: bytes = hashlib.sha256(content).digest()
+    with _LOADED_WORKFLOWS_LOCK:
+        if (definition := _LOADED_WORKFLOWS.get(digest)) is not None:
+            _LOADED_WORKFLOWS.move_to_end(digest)
+            return definition
+
+    # Load outside the lock, so a large definition doesn't block other loads.
+    # Two threads may load the same definition - which is harmless.
+    loaded: Any = yaml.load(content, Loader=_get_yaml_loader())
+    if not isinstance(loaded, dict):
+        raise ValueError("The content is not a workflow definition (a dictionary)")
+    immutable_definition: dict[str, Any] = _make_immutable(loaded)
+    with _LOADED_WORKFLOWS_LOCK:
+        _LOADED_WORKFLOWS[digest] = immutable_definition
+        if len(_LOADED_WORKFLOWS) > _LOADED_WORKFLOWS_MAX_ENTRIES:
+            _ = _LOADED_WORKFLOWS.popitem(last=False)
+    return immutable_definition
+
+
 def get_step_names(definition: dict[str, Any]) -> list[str]:
     """Given a Workflow definition this function returns the list of
     step names, in the order they are defined.
@@ -109,6 +359,9 @@ def get_description(definition: dict[str, Any]) -> str | None:
 
 def is_workflow_output_variable(definition: dict[str, Any], variable_name: str) -> bool:
     """True if the variable name is in the workflow variables outputs list."""
+    # pylint: disable-next=import-outside-toplevel
+    import decoder.decoder as job_definition_decoder
+
     # We can safely pass on the workflow definition as its
     # root-level 'variables' block complies with job-definition variables.
     return variable_name in job_definition_decoder.get_outputs(definition)
@@ -116,6 +369,9 @@ def is_workflow_output_variable(definition: dict[str, Any], variable_name: str)
 
 def is_workflow_input_variable(definition: dict[str, Any], variable_name: str) -> bool:
     """True if the variable name is in the workflow variables inputs list."""
+    # pylint: disable-next=import-outside-toplevel
+    import decoder.decoder as job_definition_decoder
+
     # We can safely pass on the workflow definition as its
     # root-level 'variables' block complies with job-definition variables.
     return variable_name in job_definition_decoder.get_inputs(definition)
@@ -179,6 +435,18 @@ def get_step_dependencies(*, step_definition: dict[str, Any]) -> set[str]:
     return set(get_step_prior_step_connections(step_definition=step_definition))
 
 
+def get_step_files_per_replica(*, step_definition: dict[str, Any]) -> int | None:
+    """Returns the number of files each of the step's replicas is given,
+    None if each replica is given one file (as a single value)."""
+    return step_definition.get("files-per-replica")
+
+
+def get_step_max_concurrency(*, step_definition: dict[str, Any]) -> int | None:
+    """Returns the maximum number of the step's replicas that can run at once,
+    None if there is no limit."""
+    return step_definition.get("max-concurrency")
+
+
 def get_step_prior_step_connections(
     *, step_definition: dict[str, Any]
 ) -> dict[str, list[Connector]]:
@@ -201,3 +469,70 @@ def get_step_prior_step_connections(
                         Connector(in_=step_variable, out=v_map["variable"])
                     ]
     return plumbing
+
+
+def build_workflow_plan(definition: dict[str, Any]) -> WorkflowPlan:
+    """Given a Workflow definition this function returns its compiled
+    'WorkflowPlan'. The definition is expected to have passed schema validation.
+    The plan refers to (it does not copy) the definition's content,
+    which must not be modified while the plan is in use."""
+    # pylint: disable-next=import-outside-toplevel
+    import decoder.decoder as job_definition_decoder
+
+    plan: WorkflowPlan = WorkflowPlan(
+        definition=definition,
+        workflow_variable_names=get_workflow_variable_names(definition),
+        # We can safely pass on the workflow definition as its
+        # root-level 'variables' block complies with job-definition variables.
+        workflow_input_names=set(job_definition_decoder.get_inputs(definition)),
+        workflow_output_names=set(job_definition_decoder.get_outputs(definition)),
+    )
+    for step in get_steps(definition):
+        name: str = step["name"]
+        if name in plan.steps:
+            if name not in plan.duplicate_step_names:
+                plan.duplicate_step_names.append(name)
+            continue
+        plan.step_names.append(name)
+        plan.steps[name] = step
+        plan.workflow_variable_connections[name] = (
+            get_step_workflow_variable_connections(step_definition=step)
+        )
+        plan.predefined_variable_connections[name] = (
+            get_step_predefined_variable_connections(step_definition=step)
+        )
+        plan.prior_step_connections[name] = get_step_prior_step_connections(
+            step_definition=step
+        )
+        plan.dependencies[name] = set(plan.prior_step_connections[name])
+
+    # Topological order (Kahn's algorithm), where the next step placed is always
+    # the earliest defined of those whose dependencies have all been placed.
+    # A dependency on an unknown step is never placed, so neither is its dependent.
+    plan.dependents = {name: [] for name in plan.step_names}
+    unplaced_dependencies: dict[str, int] = {}
+    for name in plan.step_names:
+        unplaced_dependencies[name] = len(plan.dependencies[name])
+        for dependency in plan.dependencies[name]:
+            if dependency in plan.dependents:
+                plan.dependents[dependency].append(name)
+    position: dict[str, int] = {name: i for i, name in enumerate(plan.step_names)}
+    placeable: list[int] = [
+        position[name] for name, count in unplaced_dependencies.items() if not count
+    ]
+    heapq.heapify(placeable)
+    while placeable:
+        name = plan.step_names[heapq.heappop(placeable)]
+        plan.topological_order.append(name)
+        for dependent in plan.dependents[name]:
+            unplaced_dependencies[dependent] -= 1
+            if not unplaced_dependencies[dependent]:
+                heapq.heappush(placeable, position[dependent])
+
+    return plan
+
+
+if __name__ == "__main__":
+    # Exit with an error if the JSON schema had to be (re)written,
+    # so a pre-commit hook fails until it has been added.
+    sys.exit(1 if write_schema_json() else 0)
@@ -0,0 +1,238 @@
+"""The ShardedWorkflowEngine - running workflows across several processes.
+
+The 'WorkflowEngine' handles one message at a time, so however many workflows
+are running they share a single core. This module's 'ShardedWorkflowEngine' runs
+a number of engines, each in its own (worker) process, and partitions the messages
+given to its 'handle_message()' method between them by running workflow ID.
+It can be used wherever a 'WorkflowEngine' is, as the receiver of the DM's
+Workflow and Pod messages.
+
+Every message for a running workflow is given to the same worker, and each
+worker handles its messages in the order they arrived, so the messages of one
+running workflow are handled in order, exactly as they would be by a single engine.
+Messages for different running workflows are handled at the same time.
+As a running workflow's messages always reach the same engine, its engine
+can also be 'stateful' (see 'workflow_state.py').
+
+Module philosophy
+-----------------
+The engines are created in their worker processes by a factory function
+given to the 'ShardedWorkflowEngine', so nothing that cannot cross a process
+boundary (database connections, Kubernetes clients) has to. With the 'spawn'
+start method the factory must be picklable (a module-level function).
+Messages cross to the workers as serialised Protocol Buffers.
+
+Workflow messages name their running workflow, but a Pod message only identifies
+an Instance. Before a Pod message is routed its running workflow is found through
+the Instance's RunningWorkflowStep record (see 'WorkflowEngine.get_instance_step()'),
+using an engine the 'ShardedWorkflowEngine' creates (with the same factory)
+in the process that is routing messages. The record is passed to the worker
+with the message, so the worker's engine does not read it again.
+
+A worker takes up to 'batch_size' waiting messages at a time and gives them to its
+engine's 'handle_messages()', so a running workflow with many Pod messages waiting
+is assessed once rather than once for each of them. A batch that cannot be handled
+is logged, and the worker carries on.
+
+A worker that dies (it's killed, or its engine cannot be created) is not replaced.
+The messages it was handling are lost, and a worker killed while it's waiting
+for messages can leave its queue unusable, so its running workflows cannot be
+moved on. Instead the death is logged, and 'handle_message()' (and 'stop()')
+raise a RuntimeError from then on - the engine must be replaced.
+"""
+
+import logging
+import threading
+import zlib
+from contextlib import suppress
+from multiprocessing import Event, Process, Queue
+from multiprocessing.connection import wait
+from multiprocessing.synchronize import Event as EventType
+from queue import Empty
+from typing import Any, Callable
+
+from google.protobuf.message import DecodeError, Message
+from informaticsmatters.protobuf.datamanager.pod_message_pb2 import PodMessage
+from informaticsmatters.protobuf.datamanager.workflow_message_pb2 import WorkflowMessage
+
+from .workflow_engine import WorkflowEngine
+
+_LOGGER: logging.Logger = logging.getLogger(__name__)
+
+# The message types a worker can be given, indexed by class name
+_MESSAGE_TYPES: dict[str, type[Message]] = {
+    "WorkflowMessage": WorkflowMessage,
+    "PodMessage": PodMessage,
+}
+
+
+def get_shard(*, running_workflow_id: str, shards: int) -> int:
+    """Returns the shard (0 to 'shards' - 1) of a running workflow.
+    The hash is stable, so every process agrees on it."""
+    assert shards > 0
+    return zlib.crc32(running_workflow_id.encode("utf-8")) % shards
+
+
+def _run_worker(
+    engine_factory: Callable[[], WorkflowEngine],
+    queue: "Queue[dict[str, Any] | None]",
+    batch_size: int,
+) -> None:
+    """The body of a worker process. Messages are handled (in batches) until
+    a None is taken from the queue. A message (or batch) that cannot be handled
+    is logged and the worker moves on to the next."""
+    engine: WorkflowEngine = engine_factory()
+    stopping: bool = False
+    while not stopping:
+        items: list[dict[str, Any] | None] = [queue.get()]
+        with suppress(Empty):
+            while len(items) < batch_size:
+                items.append(queue.get_nowait())
+        msgs: list[Message] = []
+        instance_steps: dict[str, tuple[str, dict[str, Any]]] = {}
+        for item in items:
+            if item is None:
+                stopping = True
+                break
+            msg: Message = _MESSAGE_TYPES[item["class"]]()
+            try:
+                msg.ParseFromString(item["bytes"])
+            except DecodeError:
+                _LOGGER.exception("Ignoring a %s that cannot be parsed", item["class"])
+                continue
+            msgs.append(msg)
+            if item["instance_step"]:
+                instance_steps[msg.instance] = item["instance_step"]
+        if not msgs:
+            continue
+        try:
+            engine.handle_messages(msgs, instance_steps)
+        except Exception:  # pylint: disable=broad-exception-caught
+            _LOGGER.exception(
+                "Failed to handle a batch of %d messages:\n%s", len(msgs), msgs
+            )
+
+
+class ShardedWorkflowEngine:
+    """Runs 'workers' engines (each created by 'engine_factory') in worker processes,
+    routing each message to a worker using the ID of its running workflow.
+
+    The workers are started by 'start()' and stopped (once they've handled
+    every message they've been given) by 'stop()'."""
+
+    def __init__(
+        self,
+        *,
+        engine_factory: Callable[[], WorkflowEngine],
+        workers: int = 2,
+        batch_size: int = 1,
+    ):
+        """Initialiser, given a function that creates (and returns) an engine,
+        the number of worker processes, and the maximum number of waiting
+        messages a worker gives to its engine at once."""
+        assert workers >= 1
+        assert batch_size >= 1
+
+        self._engine_factory: Callable[[], WorkflowEngine] = engine_factory
+        self._batch_size: int = batch_size
+        self._queues: list["Queue[dict[str, Any] | None]"] = [
+            Queue() for _ in range(workers)
+        ]
+        self._processes: list[Process] = []
+        # Set (in whichever process is routing messages) when a worker dies
+        self._worker_died: EventType = Event()
+        # The thread (in the process that started the workers) that watches them
+        self._watcher: threading.Thread | None = None
+        self._stopping: threading.Event = threading.Event()
+        # The engine used to route Pod messages (created when it's first needed)
+        self._router: WorkflowEngine | None = None
+
+    @property
+    def workers(self) -> int:
+        """The number of worker processes."""
+        return len(self._queues)
+
+    def start(self) -> None:
+        """Starts the worker processes (and the thread that watches them)."""
+        assert not self._processes
+        self._stopping.clear()
+        for queue in self._queues:
+            process: Process = Process(
+                target=_run_worker,
+                args=(self._engine_factory, queue, self._batch_size),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+        self._watcher = threading.Thread(
+            target=self._watch_workers, name="worker-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def _watch_workers(self) -> None:
+        """Waits for the worker processes to end. A worker that ends before
+        it's been stopped has died, which is logged and recorded (so that
+        messages are no longer accepted)."""
+        sentinels: dict[Any, int] = {
+            process.sentinel: shard for shard, process in enumerate(self._processes)
+        }
+        ended: list[Any] = wait(list(sentinels))
+        if self._stopping.is_set():
+            return
+        for sentinel in ended:
+            shard: int = sentinels[sentinel]
+            _LOGGER.critical(
+                "Worker %d (pid %s) has died (exitcode=%s)",
+                shard,
+                self._processes[shard].pid,
+                self._processes[shard].exitcode,
+            )
+        self._worker_died.set()
+
+    def stop(self) -> None:
+        """Stops the worker processes, waiting for them to handle every message
+        they've been given. A RuntimeError is raised if a worker died,
+        or did not stop cleanly."""
+        self._stopping.set()
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            process.join()
+        if self._watcher:
+            self._watcher.join()
+            self._watcher = None
+        failed: dict[int, int | None] = {
+            shard: process.exitcode
+            for shard, process in enumerate(self._processes)
+            if process.exitcode
+        }
+        self._processes = []
+        if failed:
+            raise RuntimeError(f"Workers did not stop cleanly (exitcodes={failed})")
+
+    def handle_message(self, msg: Message) -> None:
+        """Gives a Workflow or Pod message to the worker that handles
+        its running workflow. A RuntimeError is raised if a worker has died."""
+        assert msg
+        if self._worker_died.is_set():
+            raise RuntimeError("A worker has died - messages cannot be handled")
+
+        if self._router is None:
+            self._router = self._engine_factory()
+        instance_step: tuple[str, dict[str, Any]] | None = None
+        if not isinstance(msg, PodMessage):
+            r_wfid: str = msg.running_workflow
+        elif msg.has_exit_code:
+            instance_step = self._router.get_instance_step(msg)
+            r_wfid = instance_step[1]["running_workflow"]["id"]
+        else:
+            _LOGGER.error("Ignoring PodMessage without an exit code:\n%s", msg)
+            return
+        shard: int = get_shard(running_workflow_id=r_wfid, shards=self.workers)
+        self._queues[shard].put(
+            {
+                "class": type(msg).__name__,
+                "bytes": msg.SerializeToString(),
+                "instance_step": instance_step,
+            }
+        )
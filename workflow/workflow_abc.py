@@ -48,12 +48,19 @@ to start a Step.
 
 The instance launcher is controlled by a complex set of 'parameters' (a
 'LaunchParameters' dataclass object) that comprehensively describe the Job -
-it's variables, and inputs and outputs. The instance launcher provides just one method:
-'launch()'. It takes a parameters object, and in return the yields a 'LaunchResult'
+it's variables, and inputs and outputs. The instance launcher's main method is
+'launch()' (it can also provide 'launch_many()' to launch several Instances
+at once). 'launch()' takes a parameters object, and in return the yields a 'LaunchResult'
 dataclass object that contains the record IDs of the instance created, and the
 corresponding RunningWorkflowStep. The result also describes any launch error.
 If there is a launch error the step can assume to have not started. if there is
 no error the step will (probably) start.
+
+Both interfaces also have an asyncio variant ('AsyncInstanceLauncher' and
+'AsyncWorkflowAPIAdapter'), used by the 'AsyncWorkflowEngine'. Their methods are
+coroutines but otherwise they are identical - they take the same arguments and
+return the same responses as their synchronous counterparts, which is where
+they are documented.
 """
 
 from abc import ABC, abstractmethod
@@ -118,6 +125,10 @@ class LaunchParameters:
     # used to identify the 'type' of Instance to create.
     # For DM Jobs this will be 'datamanagerjobs.squonk.it'
     application_id: str = "datamanagerjobs.squonk.it"
+    # The context of the trace the Instance is launched in (if the engine
+    # is tracing), a W3C 'traceparent' keyed by its (HTTP header) name.
+    # The Instance's Pod can use it to record its own spans in the same trace.
+    trace_context: dict[str, str] | None = None
 
 
 @dataclass
@@ -192,6 +203,26 @@ class InstanceLauncher(ABC):
         # "input Handlers" that manipulate the specification variables.
         # See _instance_preamble() in the DM's api_instance.py module.
 
+    def launch_many(
+        self,
+        *,
+        launch_parameters: list[LaunchParameters],
+        **kwargs: Any,
+    ) -> list[LaunchResult]:
+        """Launch several (Job) Instances, typically the replicas of one step,
+        returning a result for each, in the same order as the parameters.
+
+        This method is optional. It allows a launcher to create the records
+        for every replica in one transaction and submit their Pods together,
+        rather than one 'launch()' call per replica. The rules of 'launch()' apply
+        to every launch - in particular a (running workflow, step name, replica)
+        combination that has already been launched must not be launched again,
+        its result must have 'already_launched' set. A launcher that does not
+        implement it must leave this method raising 'NotImplementedError',
+        and the engine will call 'launch()' for each replica instead."""
+        del launch_parameters, kwargs
+        raise NotImplementedError
+
 
 class WorkflowAPIAdapter(ABC):
     """The APIAdapter providing read/write access to various Workflow tables and records
@@ -252,6 +283,16 @@ class WorkflowAPIAdapter(ABC):
         #       },
         # }
         # If not present an empty dictionary should be returned.
+        #
+        # The "workflow" block can also contain a "fingerprint" - any string that
+        # changes whenever the Workflow's definition changes (a content hash
+        # or a revision number for example). The engine uses it to recognise
+        # definitions it has already fetched for other running workflows.
+        #
+        #       "workflow": {
+        #          "id": "workflow-000",
+        #          "fingerprint": "3a7bd3e2360a3d29eea436fcfb7e44c735d117c4",
+        #       },
 
     @abstractmethod
     def get_running_steps(
@@ -305,6 +346,42 @@ class WorkflowAPIAdapter(ABC):
         #    ]
         # }
 
+    def get_status_of_all_step_instances(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        """Get the step execution statuses of every step of a RunningWorkflow,
+        grouped by step name. Each group is exactly what
+        'get_status_of_all_step_instances_by_name()' would return for that step,
+        so the same 'replicas' rules apply. Steps that have no records
+        (because they have not been launched) can be omitted.
+
+        This method is optional. The engine needs the state of every step each time
+        it handles a message, and this allows the DM to provide it with one query
+        rather than one per step. An adapter that does not implement it
+        must leave this method raising 'NotImplementedError', and the engine
+        will use 'get_status_of_all_step_instances_by_name()' instead.
+        """
+        # Should return:
+        # {
+        #    "count": 1,
+        #    "steps": {
+        #       "step-1234": {
+        #          "count": 1,
+        #          "status": [
+        #             {
+        #                "done": True,
+        #                "success": True,
+        #                "replicas": 1,
+        #                "running_workflow_step_id": "step-0001",
+        #                "instance_id": "instance-0001"
+        #             }
+        #          ]
+        #       }
+        #    }
+        # }
+        del running_workflow_id
+        raise NotImplementedError
+
     @abstractmethod
     def set_running_workflow_done(
         self,
@@ -435,3 +512,158 @@ class WorkflowAPIAdapter(ABC):
         # {
         #   "output": ["dir/file1.sdf", "dir/file2.sdf"]
         # }
+
+    def get_running_workflow_step_output_values_page(
+        self,
+        *,
+        running_workflow_step_id: str,
+        output_variable: str,
+        offset: int,
+        limit: int,
+    ) -> tuple[dict[str, Any], int]:
+        """Gets a page of the outputs that
+        'get_running_workflow_step_output_values_for_output()' would return - up to
+        'limit' values, starting at the 'offset' value (the first is 0),
+        along with the total number of values. The values must be returned
+        in the same order every time they are asked for.
+
+        This method is optional. A step replicated over a prior step's outputs has
+        a replica for every value, and there can be a great many of them.
+        With this the engine reads the values one page at a time, as it launches
+        the replicas, rather than all at once. An adapter that does not implement
+        it must leave this method raising 'NotImplementedError', and the engine
+        will use 'get_running_workflow_step_output_values_for_output()' instead.
+        """
+        # Should return the total number of values and a (possibly empty) page:
+        # {
+        #   "count": 2000,
+        #   "output": ["dir/file1001.sdf", "dir/file1002.sdf"]
+        # }
+        del running_workflow_step_id, output_variable, offset, limit
+        raise NotImplementedError
+
+
+class AsyncInstanceLauncher(ABC):
+    """The asyncio variant of the 'InstanceLauncher'. The engine may await
+    several launches at once, and the launch rules of 'InstanceLauncher.launch()'
+    (in particular launching a step replica only once) apply."""
+
+    @abstractmethod
+    async def launch(
+        self,
+        *,
+        launch_parameters: LaunchParameters,
+        **kwargs: Any,
+    ) -> LaunchResult:
+        """Launch a (Job) Instance."""
+
+    async def launch_many(
+        self,
+        *,
+        launch_parameters: list[LaunchParameters],
+        **kwargs: Any,
+    ) -> list[LaunchResult]:
+        """Launch several (Job) Instances. Like its synchronous counterpart this
+        method is optional - a launcher that does not implement it must leave
+        this method raising 'NotImplementedError'."""
+        del launch_parameters, kwargs
+        raise NotImplementedError
+
+
+class AsyncWorkflowAPIAdapter(ABC):
+    """The asyncio variant of the 'WorkflowAPIAdapter'. The engine may await
+    several of its methods at once."""
+
+    @abstractmethod
+    async def get_workflow(
+        self,
+        *,
+        workflow_id: str,
+    ) -> tuple[dict[str, Any], int]:
+        """Get a Workflow Record by ID."""
+
+    @abstractmethod
+    async def get_running_workflow(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        """Get a RunningWorkflow Record"""
+
+    @abstractmethod
+    async def get_running_steps(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        """Get a list of steps (their names) that are currently running for the
+        given RunningWorkflow Record"""
+
+    @abstractmethod
+    async def get_status_of_all_step_instances_by_name(
+        self, *, name: str, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        """Get a list of step execution statuses for the named step."""
+
+    async def get_status_of_all_step_instances(
+        self, *, running_workflow_id: str
+    ) -> tuple[dict[str, Any], int]:
+        """Get the step execution statuses of every step of a RunningWorkflow,
+        grouped by step name. Like its synchronous counterpart this method
+        is optional - an adapter that does not implement it must leave this method
+        raising 'NotImplementedError'."""
+        del running_workflow_id
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_running_workflow_done(
+        self,
+        *,
+        running_workflow_id: str,
+        success: bool,
+        error_num: int | None = None,
+        error_msg: str | None = None,
+    ) -> None:
+        """Set the success value for a RunningWorkflow Record.
+        If not successful an error code and message should be provided."""
+
+    @abstractmethod
+    async def get_running_workflow_step(
+        self, *, running_workflow_step_id: str
+    ) -> tuple[dict[str, Any], int]:
+        """Get a RunningWorkflowStep Record"""
+
+    @abstractmethod
+    async def get_running_workflow_step_by_name(
+        self, *, name: str, running_workflow_id: str, replica: int = 0
+    ) -> tuple[dict[str, Any], int]:
+        """Get a RunningWorkflowStep Record given a step name
+        (and its RunningWorkflow ID)."""
+
+    @abstractmethod
+    async def set_running_workflow_step_done(
+        self,
+        *,
+        running_workflow_step_id: str,
+        success: bool,
+        error_num: int | None = None,
+        error_msg: str | None = None,
+    ) -> None:
+        """Set the success value for a RunningWorkflowStep Record,
+        If not successful an error code and message should be provided."""
+
+    @abstractmethod
+    async def get_instance(self, *, instance_id: str) -> tuple[dict[str, Any], int]:
+        """Get an Instance Record"""
+
+    @abstractmethod
+    async def get_job(
+        self,
+        *,
+        collection: str,
+        job: str,
+        version: str,
+    ) -> tuple[dict[str, Any], int]:
+        """Get a Job"""
+
+    @abstractmethod
+    async def get_running_workflow_step_output_values_for_output(
+        self, *, running_workflow_step_id: str, output_variable: str
+    ) -> tuple[dict[str, Any], int]:
+        """Gets the set of outputs generated for the output variable of a given step."""
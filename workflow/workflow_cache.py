@@ -0,0 +1,275 @@
+"""Workflow caches.
+
+A module that provides bounded, in-memory caches of records the engine
+would otherwise fetch from the Data Manager every time it handles a message.
+
+The engine re-assesses a running workflow each time it handles a message, and that
+requires the workflow's definition. A definition cannot change while a workflow
+is running, so fetching it again (and compiling it into a 'WorkflowPlan')
+for every Pod message a running workflow generates is wasted effort.
+
+Job definitions are much the same. A Job's definition is fixed for a given
+collection, job, and version, but preparing one step can need the definitions
+of several Jobs (its own and those of the steps it depends on) and RUN-level
+validation needs the definition of every Job in the workflow. A Job can be
+re-imported into the DM, so job definitions are only kept for a limited time,
+and the DM can remove one from a cache when it knows it has changed.
+
+Module philosophy
+-----------------
+Caches here only hold records that do not change while they are in use.
+Each cache is bounded (the least recently used entry is evicted when it is full),
+safe to use from more than one thread, and records its hits, misses, and evictions
+in a 'CacheStatistics' dataclass object so that its effectiveness can be observed.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Callable
+
+from workflow.workflow_abc import AsyncWorkflowAPIAdapter, WorkflowAPIAdapter
+
+from .decoder import WorkflowPlan, build_workflow_plan
+
+# The number of (workflow ID and fingerprint) content hashes
+# the workflow definition cache remembers for each of its entries
+_HASHES_PER_ENTRY: int = 8
+
+
+@dataclass
+class CacheStatistics:
+    """Cache usage counters."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+@dataclass
+class CachedWorkflow:
+    """A cached workflow definition and the plan compiled from it."""
+
+    definition: dict[str, Any]
+    plan: WorkflowPlan
+
+
+def get_definition_hash(definition: dict[str, Any]) -> str:
+    """Returns a stable hash of the content of a workflow definition,
+    the SHA-256 of its canonical JSON (sorted keys and no whitespace).
+    Definitions with the same content have the same hash."""
+    text: str = json.dumps(
+        definition, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class WorkflowDefinitionCache:
+    """A least-recently-used cache of workflow definitions (and their plans).
+
+    Entries are keyed by the content hash of the definition (see
+    'get_definition_hash()') so definitions with the same content, from any
+    workflow, share one plan. The hash of the definition fetched for a workflow ID
+    and a 'fingerprint' (that identifies its content) is remembered, so it
+    need not be fetched again. A workflow that is edited must present a new
+    fingerprint, so stale content is never returned. A 'max_entries' of zero
+    disables the cache."""
+
+    def __init__(self, *, max_entries: int = 128):
+        assert max_entries >= 0
+
+        self._max_entries: int = max_entries
+        self._entries: OrderedDict[str, CachedWorkflow] = OrderedDict()
+        # The content hash of the definition fetched for each workflow ID
+        # and fingerprint. Many can refer to one entry, so there can be more
+        # of them (and an entry they refer to may have been evicted).
+        self._content_hashes: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._statistics: CacheStatistics = CacheStatistics()
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def max_entries(self) -> int:
+        """The maximum number of entries the cache holds."""
+        return self._max_entries
+
+    @property
+    def statistics(self) -> CacheStatistics:
+        """A copy of the cache's usage counters."""
+        with self._lock:
+            return replace(self._statistics)
+
+    def get(self, *, workflow_id: str, fingerprint: str) -> CachedWorkflow | None:
+        """Returns the cached workflow, or None if it is not in the cache."""
+        with self._lock:
+            content_hash: str | None = self._content_hashes.get(
+                (workflow_id, fingerprint)
+            )
+            entry: CachedWorkflow | None = (
+                self._entries.get(content_hash) if content_hash else None
+            )
+            if entry is None:
+                self._statistics.misses += 1
+                return None
+            assert content_hash
+            self._content_hashes.move_to_end((workflow_id, fingerprint))
+            self._entries.move_to_end(content_hash)
+            self._statistics.hits += 1
+            return entry
+
+    def put(
+        self, *, workflow_id: str, fingerprint: str, definition: dict[str, Any]
+    ) -> CachedWorkflow:
+        """Caches a definition and returns it with its plan. The plan is only
+        compiled if no definition with the same content is cached. The least
+        recently used entry is evicted if the cache is full."""
+        content_hash: str = get_definition_hash(definition)
+        with self._lock:
+            entry: CachedWorkflow | None = self._entries.get(content_hash)
+        if entry is None:
+            entry = CachedWorkflow(
+                definition=definition, plan=build_workflow_plan(definition)
+            )
+        if not self._max_entries:
+            return entry
+        with self._lock:
+            entry = self._entries.setdefault(content_hash, entry)
+            self._entries.move_to_end(content_hash)
+            while len(self._entries) > self._max_entries:
+                _ = self._entries.popitem(last=False)
+                self._statistics.evictions += 1
+            self._content_hashes[(workflow_id, fingerprint)] = content_hash
+            self._content_hashes.move_to_end((workflow_id, fingerprint))
+            while len(self._content_hashes) > self._max_entries * _HASHES_PER_ENTRY:
+                _ = self._content_hashes.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        """Removes every entry (the statistics are retained)."""
+        with self._lock:
+            self._entries.clear()
+            self._content_hashes.clear()
+
+
+class JobDefinitionCache:
+    """A least-recently-used cache of Job definitions, keyed by collection,
+    job and version, where entries expire 'ttl_s' seconds after they were fetched.
+
+    The cache is read-through - 'get_job()' is given the API adapter to use
+    if the Job is not cached. A Job that the adapter does not return is not cached,
+    so it will be fetched again if it is asked for again.
+
+    One cache can be shared by the engine and the validator. When the DM
+    re-imports a Job it should call 'invalidate()' with the Job's details.
+    A 'max_entries' of zero disables the cache."""
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = 256,
+        ttl_s: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        assert max_entries >= 0
+        assert ttl_s > 0
+
+        self._max_entries: int = max_entries
+        self._ttl_s: float = ttl_s
+        self._clock: Callable[[], float] = clock
+        # Each entry is the time the definition expires and the definition
+        self._entries: OrderedDict[
+            tuple[str, str, str], tuple[float, dict[str, Any]]
+        ] = OrderedDict()
+        self._statistics: CacheStatistics = CacheStatistics()
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def statistics(self) -> CacheStatistics:
+        """A copy of the cache's usage counters."""
+        with self._lock:
+            return replace(self._statistics)
+
+    def get_job(
+        self,
+        *,
+        wapi_adapter: WorkflowAPIAdapter,
+        collection: str,
+        job: str,
+        version: str,
+    ) -> dict[str, Any]:
+        """Returns the Job definition (as 'WorkflowAPIAdapter.get_job()' would),
+        fetching it with the given adapter if it is not cached (or has expired).
+        An empty dictionary is returned if the Job does not exist.
+        The definition is shared - it must not be modified."""
+        key: tuple[str, str, str] = (collection, job, version)
+        if (definition := self._lookup(key)) is not None:
+            return definition
+
+        # Fetch outside the lock, so a slow adapter doesn't block other lookups.
+        # Two threads may fetch the same Job - which is harmless.
+        definition, _ = wapi_adapter.get_job(
+            collection=collection, job=job, version=version
+        )
+        self._store(key, definition)
+        return definition
+
+    async def get_job_async(
+        self,
+        *,
+        wapi_adapter: AsyncWorkflowAPIAdapter,
+        collection: str,
+        job: str,
+        version: str,
+    ) -> dict[str, Any]:
+        """The 'get_job()' method for an 'AsyncWorkflowAPIAdapter'."""
+        key: tuple[str, str, str] = (collection, job, version)
+        if (definition := self._lookup(key)) is not None:
+            return definition
+
+        definition, _ = await wapi_adapter.get_job(
+            collection=collection, job=job, version=version
+        )
+        self._store(key, definition)
+        return definition
+
+    def _lookup(self, key: tuple[str, str, str]) -> dict[str, Any] | None:
+        """Returns the cached (unexpired) definition, or None."""
+        with self._lock:
+            if entry := self._entries.get(key):
+                expires_at, definition = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self._statistics.hits += 1
+                    return definition
+                del self._entries[key]
+            self._statistics.misses += 1
+        return None
+
+    def _store(self, key: tuple[str, str, str], definition: dict[str, Any]) -> None:
+        """Caches a definition that's been fetched (unless it's empty)."""
+        if not definition or not self._max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self._ttl_s, definition)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                _ = self._entries.popitem(last=False)
+                self._statistics.evictions += 1
+
+    def invalidate(self, *, collection: str, job: str, version: str) -> None:
+        """Removes a Job from the cache (if it is present)."""
+        with self._lock:
+            _ = self._entries.pop((collection, job, version), None)
+
+    def clear(self) -> None:
+        """Removes every entry (the statistics are retained)."""
+        with self._lock:
+            self._entries.clear()
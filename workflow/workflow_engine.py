@@ -20,7 +20,7 @@ appropriately by: -
 
 Both message types are handled the same way - the engine works out which Steps
 are READY and launches all of them. This logic lives in '_launch_ready_steps()',
-supported by '_get_step_states()' and '_get_ready_steps()'.
+supported by '_get_step_states()' and 'get_ready_steps()'.
 
 When running a workflow, once the engine determines the action (the Steps to run)
 its most complex logic lies in the preparation of a set variables for the Step (Job).
@@ -41,8 +41,10 @@ Pod messages signal the end of a previously launched step and carry the exit cod
 of the executed Job.
 
 The engine does not follow the order the steps happen to be written in. Instead,
-each time it handles a message it examines every step in the workflow and launches
-those that are READY. A step is READY when it has not already been launched and
+when a workflow starts it examines every step in the workflow and launches
+those that are READY. When a step finishes it examines the steps that depend on
+it (found using the workflow's 'WorkflowPlan'), as they are the only steps
+that can have become READY. A step is READY when it has not already been launched and
 every step it depends on has finished successfully. Dependencies come from the
 step's "plumbing" - a step that takes no values from another step depends on
 nothing and so is READY the moment the workflow starts. This means a workflow can
@@ -71,6 +73,9 @@ reconstructing its state based on Workflow, RunningWorkflow, and RunningWorkflow
 records maintained by the DM. There's no real 'pattern' here - it's simply complex
 custom logic that is executed from the context of 'handle_message()'
 that has to translate a workflow definition into running Job Instances.
+The exceptions are Workflow and Job definitions, which do not change while
+a workflow is running. The engine keeps small caches of definitions
+(see 'workflow_cache.py') rather than fetching them for every message.
 
 If there is a pattern its closest approximation is probably a State pattern, closely
 related to a Finite State Machine with the function 'handle_message()' used to alter
@@ -85,18 +90,45 @@ in this single module. There is no need to introduce level of redirection that s
 reduce the size of the file. There is a level of complexity that cannot be avoided -
 the need to understand how to move a workflow forward and how to prepare a set of
 variables for the next 'Step'.
+
+The functions here that do no I/O (which steps are READY, how a step's variables
+are compiled, what each replica is launched with) are also used by the
+'AsyncWorkflowEngine' (see 'async_workflow_engine.py'), which runs the same logic
+on an asyncio event loop. The 'ShardedWorkflowEngine' (see 'sharded_workflow_engine.py')
+runs several engines in separate processes, routing every message for a running
+workflow to the same one.
+
+Handling a message is kept cheap in a number of ways, all of them in this module: -
+
+-   Steps are assessed in the order of the workflow's 'WorkflowPlan', and a Pod
+    message only re-assesses the steps that depend on the step that finished
+-   In its (optional) 'stateful' mode the engine keeps the state of each running
+    workflow's steps in memory (see 'workflow_state.py') rather than reading it
+    for every message, so every message for a running workflow must reach
+    the same engine
+-   Messages given to 'handle_messages()' are handled as a batch
+    ('MessageBatch'), and each running workflow is assessed once for all of its
+    finished steps
+-   The values a step is replicated over are read a page at a time
+    ('OutputValuesReader'), and its replicas are launched in batches of the same
+    size ('ReplicaLauncher'), with the launcher's 'launch_many()' or a pool of threads
+
+Supporting concerns - the definition caches, step state cache, and what the engine
+logs, measures, and traces - are provided by 'workflow_cache.py', 'workflow_state.py',
+'workflow_logging.py', 'workflow_metrics.py' and 'workflow_tracing.py'. The calls
+the engine makes to its API adapter and Instance launcher are measured and traced
+through one proxy (see 'workflow_proxy.py').
 """
 
+import contextvars
+import copy
 import logging
-import sys
+import math
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import Any, Optional
-
-import decoder.decoder as job_definition_decoder
-from decoder.decoder import TextEncoding
-from google.protobuf.message import Message
-from informaticsmatters.protobuf.datamanager.pod_message_pb2 import PodMessage
-from informaticsmatters.protobuf.datamanager.workflow_message_pb2 import WorkflowMessage
+from typing import TYPE_CHECKING, Any, Iterator, Optional, Protocol, overload
 
 from workflow.workflow_abc import (
     InstanceLauncher,
@@ -107,21 +139,42 @@ from workflow.workflow_abc import (
 
 from .decoder import (
     Connector,
-    get_step,
-    get_step_dependencies,
-    get_step_names,
-    get_step_predefined_variable_connections,
-    get_step_prior_step_connections,
-    get_step_specification,
-    get_step_workflow_variable_connections,
-    get_steps,
-    is_workflow_input_variable,
-    is_workflow_output_variable,
+    WorkflowPlan,
+    build_workflow_plan,
+    get_step_files_per_replica,
+    get_step_max_concurrency,
+)
+from .workflow_cache import (
+    CacheStatistics,
+    JobDefinitionCache,
+    WorkflowDefinitionCache,
 )
+from .workflow_logging import RunningWorkflowLogger
+from .workflow_metrics import (
+    ADAPTER_CALL_SECONDS,
+    LAUNCH_SECONDS,
+    LAUNCHER_CALL_SECONDS,
+    MESSAGE_BATCH_SECONDS,
+    MESSAGE_LAG_SECONDS,
+    MESSAGE_SECONDS,
+    PREPARE_STEP_SECONDS,
+    READY_STEPS_TOTAL,
+    REPLICAS_LAUNCHED_TOTAL,
+    MetricsSink,
+    get_message_lag,
+    get_timed_proxy,
+)
+from .workflow_state import RunningWorkflowStateCache
+from .workflow_tracing import Tracer, get_trace_context, get_traced_proxy
+
+if TYPE_CHECKING:
+    from google.protobuf.message import Message
+    from informaticsmatters.protobuf.datamanager.pod_message_pb2 import PodMessage
+    from informaticsmatters.protobuf.datamanager.workflow_message_pb2 import (
+        WorkflowMessage,
+    )
 
 _LOGGER: logging.Logger = logging.getLogger(__name__)
-_LOGGER.setLevel(logging.INFO)
-_LOGGER.addHandler(logging.StreamHandler(sys.stdout))
 
 # The variable expected to bu used by "combiner" steps,
 # those that take inputs from multiple prior steps.
@@ -129,6 +182,11 @@ _LOGGER.addHandler(logging.StreamHandler(sys.stdout))
 # pre-defined variable
 _INSTANCE_LINK_GLOB_VARIABLE: str = "dirsGlob"
 
+# The pre-defined variable whose value is the files given to a step replica
+# (separated by spaces). Unlike other pre-defined variables
+# its value is different for each replica.
+_REPLICA_FILES_PREDEFINED_VARIABLE: str = "replica-files"
+
 
 @dataclass
 class StepState:
@@ -140,6 +198,11 @@ class StepState:
     launched: bool
     done: bool
     success: bool
+    # The number of replicas the Step was launched with,
+    # how many of them exist, and how many of those are still running.
+    replicas: int = 0
+    launched_replicas: int = 0
+    running_replicas: int = 0
 
 
 @dataclass
@@ -151,7 +214,10 @@ class StepPreparationResponse:
     will be a list containing a value for each step instance. If the step
     depends on a prior step the instance UUIDs of the steps will be listed
     in the 'dependent_instances' string list. If a step's outputs (files) are expected
-    in the project directory they will be listed in 'outputs'.
+    in the project directory they will be listed in 'outputs'. If the step has
+    'files-per-replica' the 'replica_values' are shared out in chunks of that size,
+    and there is a replica for each chunk. A large set of 'replica_values'
+    may be read a page at a time (see 'OutputValuesReader').
 
     If preparation fails 'error_num' wil be set, and 'error_msg'
     should contain something useful."""
@@ -160,7 +226,13 @@ class StepPreparationResponse:
     replica_variable: str | None = None
     replica_instance_id: str | None = None
     variables: dict[str, Any] = field(default_factory=dict)
-    replica_values: list[str] = field(default_factory=list)
+    replica_values: Sequence[str] = field(default_factory=list)
+    # If set each replica is given (a list of) up to this number of
+    # the 'replica_values', rather than one value.
+    files_per_replica: int | None = None
+    # The step's variables that are given the replica's files
+    # (the 'replica-files' pre-defined variable)
+    replica_files_variables: list[str] = field(default_factory=list)
     dependent_instances: set[str] = field(default_factory=set)
     outputs: set[str] = field(default_factory=set)
     inputs: set[str] = field(default_factory=set)
@@ -168,6 +240,925 @@ class StepPreparationResponse:
     error_msg: str | None = None
 
 
+def get_step_names_to_assess(
+    *, plan: WorkflowPlan, finished_steps: list[str] | None = None
+) -> tuple[list[str], list[str]]:
+    """Returns the names of the steps that might be READY (the candidates),
+    and the names of the steps whose state is needed to decide (the candidates
+    and the steps they depend on).
+
+    If we're told which steps have just finished, only the steps that depend on
+    them are candidates - nothing else can have become READY. Otherwise
+    (when a workflow starts) every step is a candidate. Candidates are in the
+    plan's topological order, and a step that can never run (it is not in that
+    order) is never a candidate.
+
+    A finished step with a 'max-concurrency' may have replicas that are waiting
+    to be launched, so its state is needed too (see 'get_replica_releases()')."""
+    candidates: list[str] = plan.topological_order
+    if finished_steps is not None:
+        dependents: set[str] = {
+            dependent
+            for finished_step in finished_steps
+            for dependent in plan.dependents.get(finished_step, [])
+        }
+        candidates = [name for name in candidates if name in dependents]
+    # A dependency on a step that isn't in the workflow has no state.
+    step_names: list[str] = list(
+        dict.fromkeys(
+            [
+                *candidates,
+                *(
+                    dependency
+                    for candidate in candidates
+                    for dependency in plan.dependencies[candidate]
+                    if dependency in plan.steps
+                ),
+                *(
+                    finished_step
+                    for finished_step in finished_steps or []
+                    if get_step_max_concurrency(
+                        step_definition=plan.steps[finished_step]
+                    )
+                ),
+            ]
+        )
+    )
+    return candidates, step_names
+
+
+def get_step_states(
+    *, step_names: list[str], responses: dict[str, dict[str, Any]]
+) -> dict[str, StepState]:
+    """Returns the execution state of the named Steps, indexed by step name,
+    given the DM's step status responses (also indexed by step name).
+    A step without a response has not been launched."""
+    states: dict[str, StepState] = {}
+    for step_name in step_names:
+        response: dict[str, Any] = responses.get(step_name, {"count": 0, "status": []})
+        assert "count" in response
+        count: int = response["count"]
+        if not count:
+            states[step_name] = StepState(launched=False, done=False, success=False)
+            continue
+        # Every replica that was launched must exist and have finished
+        # before we can call the step 'done'. The 'replicas' value tells us
+        # how many to expect - a step that is still being fanned out will
+        # have fewer records than that.
+        statuses: list[dict[str, Any]] = response["status"]
+        expected_replicas: int = statuses[0].get("replicas", count)
+        done: bool = count == expected_replicas and all(
+            status["done"] for status in statuses
+        )
+        states[step_name] = StepState(
+            launched=True,
+            done=done,
+            success=done and all(status["success"] for status in statuses),
+            replicas=expected_replicas,
+            launched_replicas=count,
+            running_replicas=sum(not status["done"] for status in statuses),
+        )
+    return states
+
+
+def get_unlaunched_steps(*, step_states: dict[str, StepState]) -> list[str] | None:
+    """Returns the names of the steps that have not been launched (in name order)
+    when nothing more can be launched, or None if a step is still running
+    (its Pod message will bring us back).
+
+    Every step launched and finished (an empty list) is a successful workflow.
+    Anything else means steps remain that will never become READY."""
+    if any(state.launched and not state.done for state in step_states.values()):
+        return None
+    return sorted(
+        step_name for step_name, state in step_states.items() if not state.launched
+    )
+
+
+def get_ready_steps(
+    *,
+    plan: WorkflowPlan,
+    step_states: dict[str, StepState],
+    candidates: list[str],
+) -> list[dict[str, Any]]:
+    """Returns the definitions of every candidate Step that can be launched
+    right now. 'step_states' must contain the state of every candidate
+    and of every step they depend on.
+
+    A Step is READY when it has not already been launched and every step it
+    depends on has finished successfully. A Step that depends on nothing is
+    therefore READY the moment its workflow starts. Steps are returned in
+    the order of the candidates (see 'get_step_names_to_assess()') so that
+    launches are deterministic."""
+    ready: list[dict[str, Any]] = []
+    for step_name in candidates:
+        # Never launch a step twice. The engine re-assesses steps that have
+        # already run, so they can still be sitting here.
+        if step_states[step_name].launched:
+            continue
+        # A dependency on a step that isn't in the workflow can never be
+        # satisfied, so the step is never READY. Validation should stop a
+        # definition like that reaching us, but if one does we leave the
+        # step unlaunched and let the caller report a stalled workflow -
+        # which is far kinder than launching it and failing an assertion
+        # while preparing its variables.
+        if all(
+            dependency in step_states and step_states[dependency].success
+            for dependency in plan.dependencies[step_name]
+        ):
+            ready.append(plan.steps[step_name])
+    return ready
+
+
+def get_replica_releases(
+    *,
+    plan: WorkflowPlan,
+    step_states: dict[str, StepState],
+    finished_steps: list[str] | None,
+) -> dict[str, range]:
+    """Returns the replicas of the finished steps that can now be launched,
+    indexed by step name.
+
+    A step with a 'max-concurrency' is launched with no more than that number of
+    replicas running. The rest are launched (in replica order) as the running ones
+    finish, so the replicas that exist are always the first ones. The step's
+    'replicas' value still tells us how many replicas to expect, so the step
+    is not 'done' until every one of them has been launched and has finished."""
+    releases: dict[str, range] = {}
+    for step_name in finished_steps or []:
+        max_concurrency: int | None = get_step_max_concurrency(
+            step_definition=plan.steps[step_name]
+        )
+        state: StepState | None = step_states.get(step_name)
+        if not max_concurrency or not state or not state.launched:
+            continue
+        count: int = min(
+            max_concurrency - state.running_replicas,
+            state.replicas - state.launched_replicas,
+        )
+        if count > 0:
+            releases[step_name] = range(
+                state.launched_replicas, state.launched_replicas + count
+            )
+    return releases
+
+
+def get_first_replicas(
+    *, step_definition: dict[str, Any], total_replicas: int
+) -> range:
+    """Returns the replicas of a step to launch when it becomes READY -
+    all of them, unless the step has a 'max-concurrency'."""
+    max_concurrency: int | None = get_step_max_concurrency(
+        step_definition=step_definition
+    )
+    return range(min(total_replicas, max_concurrency or total_replicas))
+
+
+def is_combiner(
+    *,
+    our_inputs: dict[str, Any],
+    plumbing_of_prior_steps: dict[str, list[Connector]],
+) -> bool:
+    """A step is a combiner if a variable in its "plumbing" refers to one of
+    its own (Job) inputs whose type is 'files'. Combiners handle their prior-step
+    inputs differently (a directory glob rather than named files) and are
+    never replicated.
+
+    We do not need to check here that the steps being combined have finished.
+    A step is only prepared once it is READY, and READY already requires
+    every step it depends on to have completed successfully."""
+    return any(
+        our_inputs.get(connector.out, {}).get("type") == "files"
+        for connections in plumbing_of_prior_steps.values()
+        for connector in connections
+    )
+
+
+def get_prime_variables(
+    *,
+    plan: WorkflowPlan,
+    step_definition: dict[str, Any],
+    rwf: dict[str, Any],
+    predefined_variables: dict[str, Any],
+) -> tuple[dict[str, Any], set[str], set[str]]:
+    """Returns a step's initial variables (its 'prime variables'), and the
+    project files that are its workflow inputs and outputs.
+
+    The variables begin with those provided in the step's specification,
+    to which we add any workflow (running workflow) variables and pre-defined
+    variables that are mentioned in the step's "plumbing"."""
+    step_name: str = step_definition["name"]
+    # Inputs - a list of step files that are workflow inputs.
+    # These are project files that are copied into the step instance.
+    inputs: set[str] = set()
+    # Outputs - a list of step files that are workflow outputs.
+    # Any step can write files to the Project directory
+    # but this only consists of job outputs that are also workflow outputs.
+    outputs: set[str] = set()
+
+    # It's a copy - the definition's own variables must not be altered.
+    prime_variables: dict[str, Any] = dict(
+        step_definition["specification"].get("variables", {})
+    )
+    # The variables provided by the user when running the workflow
+    # (the running workflow variables)...
+    rwf_variables: dict[str, Any] = rwf.get("variables", {})
+
+    # The decoder gives us a list of 'Connectors' that are a par of variable
+    # names representing "in" (workflow) and "out" (step) variable names.
+    # "in" variables are workflow variables, and "out" variables
+    # are expected Step (Job) variables. We use these connections to
+    # take workflow variables and put them in our variables map.
+    for connector in plan.workflow_variable_connections[step_name]:
+        assert connector.in_ in rwf_variables
+        prime_variables[connector.out] = rwf_variables[connector.in_]
+        if connector.in_ in plan.workflow_output_names:
+            outputs.add(rwf_variables[connector.in_])
+        elif connector.in_ in plan.workflow_input_names:
+            inputs.add(rwf_variables[connector.in_])
+
+    for connector in plan.predefined_variable_connections[step_name]:
+        if connector.in_ == _REPLICA_FILES_PREDEFINED_VARIABLE:
+            # Set for each replica (see 'get_replica_variables()')
+            prime_variables[connector.out] = ""
+            continue
+        assert connector.in_ in predefined_variables
+        prime_variables[connector.out] = predefined_variables[connector.in_]
+
+    return prime_variables, inputs, outputs
+
+
+def add_prior_step_variables(
+    *,
+    prime_variables: dict[str, Any],
+    prior_step: dict[str, Any],
+    connections: list[Connector],
+    prior_job_outputs: dict[str, Any],
+    prior_instance_directory: str,
+) -> None:
+    """Adds the values of a prior (running) step's variables that are
+    connected to our step to our prime variables.
+
+    Values of the prior step's Job outputs (combiners pass no outputs)
+    are prefixed with the prior step's instance directory, e.g. "file.txt"
+    will become ".instance-0000/file.txt"."""
+    assert "variables" in prior_step
+    for connector in connections:
+        assert connector.in_ in prior_step["variables"]
+        value: str = prior_step["variables"][connector.in_]
+        if connector.in_ in prior_job_outputs:
+            # Prefix with prior-step's instance directory
+            value = f"{prior_instance_directory}/{value}"
+        prime_variables[connector.out] = value
+
+
+def get_replication_connection(
+    *,
+    plumbing_of_prior_steps: dict[str, list[Connector]],
+    prior_job_outputs: dict[str, dict[str, Any]],
+) -> tuple[str, Connector] | None:
+    """Returns the prior step name and connection that replicates a step,
+    or None if the step is not replicated. 'prior_job_outputs' are the outputs
+    of the prior steps' Jobs, indexed by prior step name.
+
+    A (non-combiner) step is replicated if a variable in its "plumbing" refers to
+    a variable of type "files" in a prior step. We only act on the _first_ match,
+    i.e. we do not expect and will not act on more than one prior step variable
+    that is of type "files"."""
+    for p_step_name, connections in plumbing_of_prior_steps.items():
+        jd_outputs: dict[str, Any] = prior_job_outputs[p_step_name]
+        for connector in connections:
+            if jd_outputs.get(connector.in_, {}).get("type") == "files":
+                return p_step_name, connector
+    return None
+
+
+def get_replica_files_variables(*, plan: WorkflowPlan, step_name: str) -> list[str]:
+    """Returns the names of the step's variables that are given the files
+    of each replica (through the 'replica-files' pre-defined variable)."""
+    return [
+        connector.out
+        for connector in plan.predefined_variable_connections[step_name]
+        if connector.in_ == _REPLICA_FILES_PREDEFINED_VARIABLE
+    ]
+
+
+def get_number_of_replicas(
+    *, replica_values: Sequence[str], files_per_replica: int | None
+) -> int:
+    """Returns the number of replicas of a step, given the values (files)
+    it's replicated over - one for each value, or one for each chunk of
+    'files_per_replica' values. A step with no values has one replica."""
+    return max(1, math.ceil(len(replica_values) / (files_per_replica or 1)))
+
+
+def get_replica_variables(
+    *,
+    step_preparation_response: StepPreparationResponse,
+    replica: int,
+    instance_id_dir_prefix: str,
+) -> dict[str, Any]:
+    """Returns (a copy of) the variables for one replica of a prepared step.
+
+    If we are replicating the step the 'replica_variable' will be set, and we
+    replace that variable with the value expected for this replica - the replica's
+    value prefixed with the directory of the instance that produced it.
+    If the step has 'files-per-replica' the replica is given a list of the values
+    in its chunk instead. Variables connected to the 'replica-files'
+    pre-defined variable are given the replica's files (separated by spaces)."""
+    spr: StepPreparationResponse = step_preparation_response
+    variables: dict[str, Any] = dict(spr.variables)
+    if spr.replica_variable:
+        assert spr.replica_values
+        files_per_replica: int = spr.files_per_replica or 1
+        files: list[str] = [
+            f"{instance_id_dir_prefix}{spr.replica_instance_id}/{value}"
+            for value in spr.replica_values[
+                replica * files_per_replica : (replica + 1) * files_per_replica
+            ]
+        ]
+        assert files
+        variables[spr.replica_variable] = files if spr.files_per_replica else files[0]
+        for variable in spr.replica_files_variables:
+            variables[variable] = " ".join(files)
+    return variables
+
+
+def get_launch_parameters(
+    *,
+    rwf: dict[str, Any],
+    step_definition: dict[str, Any],
+    step_preparation_response: StepPreparationResponse,
+    variables: dict[str, Any],
+    replica: int,
+    trace_context: dict[str, str] | None = None,
+) -> LaunchParameters:
+    """Returns the parameters used to launch one replica of a prepared step
+    (and the context of the trace it's launched in). The step's specification
+    is a copy, so the launcher cannot alter the (cached) plan it comes from."""
+    step_name: str = step_definition["name"]
+    return LaunchParameters(
+        project_id=rwf["project"]["id"],
+        name=step_name,
+        debug=rwf.get("debug"),
+        launching_user_name=rwf["running_user"],
+        launching_user_api_token=rwf["running_user_api_token"],
+        specification=copy.deepcopy(step_definition["specification"]),
+        variables=variables,
+        running_workflow_id=rwf["id"],
+        step_name=step_name,
+        step_replication_number=replica,
+        total_number_of_replicas=step_preparation_response.replicas,
+        step_dependent_instances=list(step_preparation_response.dependent_instances),
+        step_project_inputs=list(step_preparation_response.inputs),
+        step_project_outputs=list(step_preparation_response.outputs),
+        trace_context=trace_context,
+    )
+
+
+def get_output_values(output: list[str] | str) -> list[str]:
+    """Returns the values of an output (the 'output' of an adapter's response)
+    as a list. A single value (a string) is one value, not a list of characters."""
+    return [output] if isinstance(output, str) else list(output)
+
+
+class PagedOutputValues(Sequence[str]):
+    """The output values of a running workflow step, read a page at a time
+    (using the adapter's 'get_running_workflow_step_output_values_page()').
+    Its length is the total number of values, but only the page holding
+    the last value asked for is kept, so values are best read in order."""
+
+    def __init__(
+        self,
+        *,
+        wapi_adapter: WorkflowAPIAdapter,
+        running_workflow_step_id: str,
+        output_variable: str,
+        count: int,
+        page_size: int,
+        first_page: list[str],
+    ):
+        assert page_size >= 1
+        self._wapi_adapter: WorkflowAPIAdapter = wapi_adapter
+        self._running_workflow_step_id: str = running_workflow_step_id
+        self._output_variable: str = output_variable
+        self._count: int = count
+        self._page_size: int = page_size
+        self._page_offset: int = 0
+        self._page: list[str] = first_page
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __repr__(self) -> str:
+        return f"PagedOutputValues(count={self._count})"
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        if not self._page_offset <= index < self._page_offset + len(self._page):
+            self._page_offset = index - index % self._page_size
+            response, _ = (
+                self._wapi_adapter.get_running_workflow_step_output_values_page(
+                    running_workflow_step_id=self._running_workflow_step_id,
+                    output_variable=self._output_variable,
+                    offset=self._page_offset,
+                    limit=self._page_size,
+                )
+            )
+            self._page = get_output_values(response["output"])
+            assert index < self._page_offset + len(self._page)
+        return self._page[index - self._page_offset]
+
+
+class OutputValuesReader:
+    """Reads the values of running workflow step outputs, using an API adapter,
+    'page_size' at a time if the adapter can page them."""
+
+    def __init__(self, *, wapi_adapter: WorkflowAPIAdapter, page_size: int):
+        assert page_size >= 1
+        self._wapi_adapter: WorkflowAPIAdapter = wapi_adapter
+        self._page_size: int = page_size
+        # Cleared the first time the adapter tells us it has no
+        # 'get_running_workflow_step_output_values_page()' method.
+        self._pages_supported: bool = True
+
+    def read(
+        self, *, running_workflow_step_id: str, output_variable: str
+    ) -> Sequence[str]:
+        """Returns the values of a running workflow step's output.
+
+        If the adapter can, we read the first page of values (and their count).
+        If there are more values than fit in a page the rest are read as they're
+        needed (see 'PagedOutputValues'). If the adapter cannot page the values
+        we remember that, and read them all."""
+        if self._pages_supported:
+            try:
+                response, _ = (
+                    self._wapi_adapter.get_running_workflow_step_output_values_page(
+                        running_workflow_step_id=running_workflow_step_id,
+                        output_variable=output_variable,
+                        offset=0,
+                        limit=self._page_size,
+                    )
+                )
+            except NotImplementedError:
+                _LOGGER.debug(
+                    "API has no get_running_workflow_step_output_values_page()"
+                    " - reading every value"
+                )
+                self._pages_supported = False
+            else:
+                first_page: list[str] = get_output_values(response["output"])
+                _LOGGER.debug(
+                    "API.get_running_workflow_step_output_values_page() got %s values"
+                    " (of %s)\n",
+                    len(first_page),
+                    response["count"],
+                )
+                if response["count"] <= len(first_page):
+                    return first_page
+                return PagedOutputValues(
+                    wapi_adapter=self._wapi_adapter,
+                    running_workflow_step_id=running_workflow_step_id,
+                    output_variable=output_variable,
+                    count=response["count"],
+                    page_size=self._page_size,
+                    first_page=first_page,
+                )
+
+        result, _ = (
+            self._wapi_adapter.get_running_workflow_step_output_values_for_output(
+                running_workflow_step_id=running_workflow_step_id,
+                output_variable=output_variable,
+            )
+        )
+        _LOGGER.debug(
+            "API.get_running_workflow_step_output_values_for_output() got %s\n",
+            result,
+        )
+        return get_output_values(result["output"])
+
+
+class StepStatusReader:
+    """Reads the DM's step status responses for the steps of running workflows
+    (using an API adapter), or the state kept in a 'state_cache' if one is given."""
+
+    def __init__(
+        self,
+        *,
+        wapi_adapter: WorkflowAPIAdapter,
+        state_cache: RunningWorkflowStateCache | None = None,
+    ):
+        self._wapi_adapter: WorkflowAPIAdapter = wapi_adapter
+        self._state_cache: RunningWorkflowStateCache | None = state_cache
+        # Cleared the first time the adapter tells us it has no
+        # 'get_status_of_all_step_instances()' method.
+        self._bulk_supported: bool = True
+
+    def is_complete(self, *, plan: WorkflowPlan, step_names: list[str]) -> bool:
+        """True if the responses 'read()' returns for the named steps
+        include every step of the workflow - they do unless we can only
+        ask for steps by name, and weren't asked for all of them."""
+        return (
+            self._state_cache is not None
+            or self._bulk_supported
+            or set(step_names) == set(plan.step_names)
+        )
+
+    def read(
+        self, *, plan: WorkflowPlan, running_workflow_id: str, step_names: list[str]
+    ) -> dict[str, dict[str, Any]]:
+        """Returns the DM's step status response for the named steps of a
+        running workflow, indexed by step name. Steps that have not been
+        launched may be missing (and the response may include steps
+        that were not asked for).
+
+        If we have a state cache we use the state it has for the running workflow.
+        If it doesn't have any we get the status of every step from the DM
+        and keep that."""
+        if self._state_cache is None:
+            return self._fetch(
+                running_workflow_id=running_workflow_id, step_names=step_names
+            )
+        if (
+            cached := self._state_cache.get_step_status_responses(
+                running_workflow_id=running_workflow_id
+            )
+        ) is not None:
+            return cached
+        responses: dict[str, dict[str, Any]] = self._fetch(
+            running_workflow_id=running_workflow_id, step_names=plan.step_names
+        )
+        self._state_cache.put_step_status_responses(
+            running_workflow_id=running_workflow_id, responses=responses
+        )
+        return responses
+
+    def _fetch(
+        self, *, running_workflow_id: str, step_names: list[str]
+    ) -> dict[str, dict[str, Any]]:
+        """Gets the step status response for the named steps of a
+        running workflow from the DM, indexed by step name.
+
+        We use the adapter's (optional) bulk method if it has one - one query
+        rather than one for every step. If it does not, we remember that,
+        and ask for each step by name."""
+        if self._bulk_supported:
+            try:
+                response, _ = self._wapi_adapter.get_status_of_all_step_instances(
+                    running_workflow_id=running_workflow_id
+                )
+            except NotImplementedError:
+                _LOGGER.debug(
+                    "API.get_status_of_all_step_instances() is not implemented"
+                )
+                self._bulk_supported = False
+            else:
+                assert "steps" in response
+                steps: dict[str, dict[str, Any]] = response["steps"]
+                return steps
+
+        responses: dict[str, dict[str, Any]] = {}
+        for step_name in step_names:
+            responses[step_name], _ = (
+                self._wapi_adapter.get_status_of_all_step_instances_by_name(
+                    name=step_name,
+                    running_workflow_id=running_workflow_id,
+                )
+            )
+        return responses
+
+
+@dataclass
+class PodStep:
+    """The step replica (Instance) a Pod message is for,
+    and the running workflow it belongs to."""
+
+    instance_id: str
+    exit_code: int
+    running_workflow_step_id: str
+    step_name: str
+    rwf: dict[str, Any]
+
+
+def get_instance_step(
+    *, wapi_adapter: WorkflowAPIAdapter, instance_id: str
+) -> tuple[str, dict[str, Any]]:
+    """Returns the ID and the record of the RunningWorkflowStep
+    an Instance was launched for."""
+    response, _ = wapi_adapter.get_instance(instance_id=instance_id)
+    _LOGGER.debug("API.get_instance(%s) returned: -\n%s", instance_id, response)
+    r_wfsid: str | None = response.get("running_workflow_step_id")
+    assert r_wfsid
+    rwfs_response, _ = wapi_adapter.get_running_workflow_step(
+        running_workflow_step_id=r_wfsid
+    )
+    RunningWorkflowLogger(_LOGGER, rwfs_response.get("running_workflow", {})).debug(
+        "API.get_running_workflow_step(%s) returned: -\n%s",
+        r_wfsid,
+        rwfs_response,
+    )
+    return r_wfsid, rwfs_response
+
+
+def get_pod_step(
+    *,
+    wapi_adapter: WorkflowAPIAdapter,
+    msg: "PodMessage",
+    instance_step: tuple[str, dict[str, Any]] | None = None,
+) -> PodStep | None:
+    """Returns the step (and running workflow) a Pod message is for,
+    or None if the message has no exit code. The step its Instance was launched
+    for can be given, if it's already been read (see 'get_instance_step()')."""
+    # The PodMessage has an 'instance', 'has_exit_code', and 'exit_code' values.
+    # Ignore anything without an exit code.
+    if not msg.has_exit_code:
+        _LOGGER.error("Ignoring PodMessage without an exit code:\n%s", msg)
+        return None
+
+    # The Instance tells us whether the Step (Job) was successful
+    # (i.e. we can simply check the 'exit_code').
+    instance_id: str = msg.instance
+    r_wfsid, rwfs_response = instance_step or get_instance_step(
+        wapi_adapter=wapi_adapter, instance_id=instance_id
+    )
+
+    # Get the step's running workflow record.
+    r_wfid: str = rwfs_response["running_workflow"]["id"]
+    assert r_wfid
+    rwf_response, _ = wapi_adapter.get_running_workflow(running_workflow_id=r_wfid)
+    log: RunningWorkflowLogger = RunningWorkflowLogger(
+        _LOGGER, rwf_response or {"id": r_wfid}
+    )
+    log.info("PodMessage:\n%s", msg)
+    log.debug("API.get_running_workflow(%s) returned: -\n%s", r_wfid, rwf_response)
+    return PodStep(
+        instance_id=instance_id,
+        exit_code=msg.exit_code,
+        running_workflow_step_id=r_wfsid,
+        step_name=rwfs_response["name"],
+        rwf=rwf_response,
+    )
+
+
+def is_pod_message(msg: "Message") -> bool:
+    """True if the message is a PodMessage (otherwise it's a WorkflowMessage).
+    The message classes are imported here (not when the module is imported)
+    as only the processes that handle messages need them."""
+    # pylint: disable-next=import-outside-toplevel
+    from informaticsmatters.protobuf.datamanager.pod_message_pb2 import PodMessage
+
+    return isinstance(msg, PodMessage)
+
+
+def record_message_lag(*, metrics: MetricsSink, msg: "Message") -> None:
+    """Records the time since a Pod message was sent (if it has a timestamp)."""
+    if is_pod_message(msg) and msg.timestamp:
+        lag: float | None = get_message_lag(timestamp=msg.timestamp)
+        if lag is not None:
+            metrics.observe(MESSAGE_LAG_SECONDS, lag)
+
+
+class RunningWorkflowProgressor(Protocol):
+    """The function that assesses a running workflow, given the names
+    of its steps that have finished."""
+
+    def __call__(
+        self, *, plan: WorkflowPlan, rwf: dict[str, Any], finished_steps: list[str]
+    ) -> None: ...
+
+
+class MessageBatch:
+    """The running workflows that a batch of messages has moved on,
+    waiting to be assessed (by 'progressor')."""
+
+    def __init__(self, progressor: RunningWorkflowProgressor):
+        self._progressor: RunningWorkflowProgressor = progressor
+        # The running workflows waiting to be assessed (in the order we found them)
+        # with the names of their steps that have finished.
+        self._pending: dict[str, tuple[WorkflowPlan, dict[str, Any], list[str]]] = {}
+
+    def add_finished_step(
+        self, *, plan: WorkflowPlan, rwf: dict[str, Any], step_name: str
+    ) -> None:
+        """Records that a step of a running workflow has finished (successfully)."""
+        _, _, finished_steps = self._pending.setdefault(rwf["id"], (plan, rwf, []))
+        if step_name not in finished_steps:
+            finished_steps.append(step_name)
+
+    def progress(self, running_workflow_id: str) -> None:
+        """Assesses a running workflow, if it's waiting to be assessed."""
+        if running_workflow_id in self._pending:
+            plan, rwf, finished_steps = self._pending.pop(running_workflow_id)
+            self._progressor(plan=plan, rwf=rwf, finished_steps=finished_steps)
+
+    def progress_all(self) -> int:
+        """Assesses every running workflow that's waiting to be assessed,
+        returning the number of assessments that failed. A failure is logged,
+        and does not stop the other running workflows being assessed."""
+        failures: int = 0
+        while self._pending:
+            running_workflow_id: str = next(iter(self._pending))
+            rwf: dict[str, Any] = self._pending[running_workflow_id][1]
+            try:
+                self.progress(running_workflow_id)
+            except Exception:  # pylint: disable=broad-exception-caught
+                failures += 1
+                RunningWorkflowLogger(_LOGGER, rwf).exception(
+                    "Failed to progress running workflow %s", running_workflow_id
+                )
+        return failures
+
+
+class ReplicaLauncher:
+    """Launches the replicas of prepared steps using an Instance launcher,
+    'batch_size' replicas at a time, with up to 'launch_workers' launches
+    at the same time."""
+
+    def __init__(
+        self,
+        *,
+        instance_launcher: InstanceLauncher,
+        instance_id_dir_prefix: str,
+        launch_workers: int,
+        batch_size: int,
+        tracer: Tracer,
+    ):
+        assert launch_workers >= 1
+        assert batch_size >= 1
+        self._instance_launcher: InstanceLauncher = instance_launcher
+        self._instance_id_dir_prefix: str = instance_id_dir_prefix
+        self._launch_workers: int = launch_workers
+        self._batch_size: int = batch_size
+        self._tracer: Tracer = tracer
+        # Cleared the first time the launcher tells us it has no
+        # 'launch_many()' method.
+        self._launch_many_supported: bool = True
+
+    def launch_step_replicas(
+        self,
+        *,
+        rwf: dict[str, Any],
+        step_definition: dict[str, Any],
+        step_preparation_response: StepPreparationResponse,
+        replicas: range | None = None,
+    ) -> Iterator[tuple[range, list[LaunchResult]]]:
+        """Launches the given replicas of a prepared step in batches, yielding
+        each batch of replicas with their launch results (in replica order).
+        If the replicas are not given the step's first replicas are launched
+        (see 'get_first_replicas()')."""
+        spr: StepPreparationResponse = step_preparation_response
+        RunningWorkflowLogger(_LOGGER, rwf).debug(
+            "Prepared step '%s' variables=%s replica_variable=%s replicas=%s"
+            " dependent_instances=%s inputs=%s outputs=%s",
+            step_definition["name"],
+            spr.variables,
+            spr.replica_variable,
+            spr.replicas,
+            spr.dependent_instances,
+            spr.inputs,
+            spr.outputs,
+        )
+
+        # Total replicas must be 1 or more
+        total_replicas: int = spr.replicas
+        assert total_replicas >= 1
+        if replicas is None:
+            replicas = get_first_replicas(
+                step_definition=step_definition, total_replicas=total_replicas
+            )
+        replicas = range(replicas.start, min(replicas.stop, total_replicas))
+
+        for first_replica in range(replicas.start, replicas.stop, self._batch_size):
+            batch: range = range(
+                first_replica, min(first_replica + self._batch_size, replicas.stop)
+            )
+            yield batch, self._launch_batch(
+                rwf=rwf,
+                step_definition=step_definition,
+                step_preparation_response=step_preparation_response,
+                replicas=batch,
+            )
+
+    def _launch_batch(
+        self,
+        *,
+        rwf: dict[str, Any],
+        step_definition: dict[str, Any],
+        step_preparation_response: StepPreparationResponse,
+        replicas: range,
+    ) -> list[LaunchResult]:
+        """Launches a batch of the replicas of a prepared step. Each replica
+        is given its own variables, which are logged at DEBUG level."""
+        step_name: str = step_definition["name"]
+        spr: StepPreparationResponse = step_preparation_response
+        log: RunningWorkflowLogger = RunningWorkflowLogger(_LOGGER, rwf)
+
+        launch_parameters: list[LaunchParameters] = []
+        for replica in replicas:
+            variables: dict[str, Any] = get_replica_variables(
+                step_preparation_response=spr,
+                replica=replica,
+                instance_id_dir_prefix=self._instance_id_dir_prefix,
+            )
+            if spr.replica_variable:
+                log.debug(
+                    "Replicating step: %s replica=%s variable=%s value=%s origin=%s",
+                    step_name,
+                    replica,
+                    spr.replica_variable,
+                    variables[spr.replica_variable],
+                    spr.replica_instance_id,
+                )
+            log.debug(
+                "Launching step: %s RunningWorkflow=%s (name=%s)"
+                " step_variables=%s project=%s",
+                step_name,
+                rwf["id"],
+                rwf["name"],
+                variables,
+                rwf["project"]["id"],
+            )
+            launch_parameters.append(
+                get_launch_parameters(
+                    rwf=rwf,
+                    step_definition=step_definition,
+                    step_preparation_response=spr,
+                    variables=variables,
+                    replica=replica,
+                    trace_context=get_trace_context(),
+                )
+            )
+        return self.launch(launch_parameters)
+
+    def launch(self, launch_parameters: list[LaunchParameters]) -> list[LaunchResult]:
+        """Launches every replica of a step, returning the launch results
+        in replica order.
+
+        We use the launcher's (optional) 'launch_many()' method to launch
+        more than one replica if it has one. If it does not, we remember that,
+        and launch each replica. If we have more than one launch worker
+        replicas are launched concurrently, using (at most) that many threads."""
+        if self._launch_many_supported and len(launch_parameters) > 1:
+            try:
+                with self._tracer.span(
+                    "InstanceLauncher.launch_many",
+                    {
+                        "running_workflow_id": launch_parameters[0].running_workflow_id,
+                        "step_name": launch_parameters[0].step_name,
+                        "replicas": len(launch_parameters),
+                    },
+                ):
+                    results: list[LaunchResult] = self._instance_launcher.launch_many(
+                        launch_parameters=launch_parameters
+                    )
+            except NotImplementedError:
+                _LOGGER.debug("InstanceLauncher.launch_many() is not implemented")
+                self._launch_many_supported = False
+            else:
+                assert len(results) == len(launch_parameters)
+                return results
+
+        workers: int = min(self._launch_workers, len(launch_parameters))
+        if workers <= 1:
+            return [self._launch_replica(lp) for lp in launch_parameters]
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="launch"
+        ) as executor:
+            # Each launch runs in (a copy of) our context,
+            # so its span has the same parent as it would here.
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run, self._launch_replica, lp
+                )
+                for lp in launch_parameters
+            ]
+            return [future.result() for future in futures]
+
+    def _launch_replica(self, launch_parameters: LaunchParameters) -> LaunchResult:
+        """Launches one replica of a step."""
+        with self._tracer.span(
+            "InstanceLauncher.launch",
+            {
+                "running_workflow_id": launch_parameters.running_workflow_id,
+                "step_name": launch_parameters.step_name,
+                "replica": launch_parameters.step_replication_number,
+            },
+        ):
+            return self._instance_launcher.launch(launch_parameters=launch_parameters)
+
+
 class WorkflowEngine:
     """The workflow engine."""
 
@@ -178,22 +1169,105 @@ class WorkflowEngine:
         instance_launcher: InstanceLauncher,
         instance_link_glob: str = ".instance-*",
         instance_id_dir_prefix: str = ".",
+        workflow_cache_size: int = 128,
+        job_cache: JobDefinitionCache | None = None,
+        stateful: bool = False,
+        launch_workers: int = 1,
+        output_values_page_size: int = 1000,
+        metrics: MetricsSink | None = None,
+        tracer: Tracer | None = None,
     ):
         """Initialiser, given a Workflow API adapter, Instance launcher,
         and a step (directory) link 'glob' (a convenient directory glob to
         locate the DM hard-link directories of prior instances inserted into a
-        step's instance directory, typically '.instance-*')"""
+        step's instance directory, typically '.instance-*').
+
+        'workflow_cache_size' is the maximum number of workflow definitions
+        the engine keeps (zero disables the cache). Job definitions are cached in
+        'job_cache', which can be shared with the validator. If one isn't provided
+        the engine creates its own.
+
+        If 'stateful' is set the engine keeps the step state of running workflows
+        in memory (rather than reading it from the DM for every message).
+        Only use this if every message for a running workflow is given
+        to this engine.
+
+        The replicas of a step are launched one after another unless 'launch_workers'
+        is more than 1, when up to that many are launched at the same time
+        (using a pool of threads). The Instance launcher must be thread-safe
+        to use this.
+
+        The outputs a step is replicated over are read (and its replicas launched)
+        'output_values_page_size' at a time, if the adapter can page them.
+
+        If a 'metrics' sink is provided the engine records its measurements in it
+        (see 'workflow_metrics.py'), including the duration of every call it makes
+        to the API adapter and Instance launcher.
+
+        If a 'tracer' is provided the engine records spans around the phases
+        of handling a message, and every API adapter call and Instance launch
+        (see 'workflow_tracing.py')."""
+        assert launch_workers >= 1
+        assert output_values_page_size >= 1
         # Keep the dependent objects
+        self._metrics: MetricsSink = metrics or MetricsSink()
+        self._tracer: Tracer = tracer or Tracer()
+        if self._tracer.enabled:
+            wapi_adapter = get_traced_proxy(
+                wapi_adapter, tracer=self._tracer, prefix="WorkflowAPIAdapter"
+            )
+        if metrics:
+            wapi_adapter = get_timed_proxy(
+                wapi_adapter, metrics=metrics, name=ADAPTER_CALL_SECONDS
+            )
+            instance_launcher = get_timed_proxy(
+                instance_launcher, metrics=metrics, name=LAUNCHER_CALL_SECONDS
+            )
         self._wapi_adapter: WorkflowAPIAdapter = wapi_adapter
-        self._instance_launcher: InstanceLauncher = instance_launcher
         self._instance_link_glob: str = instance_link_glob
         self._instance_id_dir_prefix: str = instance_id_dir_prefix
+        self._replica_launcher: ReplicaLauncher = ReplicaLauncher(
+            instance_launcher=instance_launcher,
+            instance_id_dir_prefix=instance_id_dir_prefix,
+            launch_workers=launch_workers,
+            batch_size=output_values_page_size,
+            tracer=self._tracer,
+        )
+        self._output_values_reader: OutputValuesReader = OutputValuesReader(
+            wapi_adapter=wapi_adapter, page_size=output_values_page_size
+        )
 
         self._predefined_variables: dict[str, Any] = {
             "instance-link-glob": instance_link_glob
         }
 
-    def handle_message(self, msg: Message) -> None:
+        # Workflow definitions (and their plans) that we've already fetched.
+        self._workflow_cache: WorkflowDefinitionCache = WorkflowDefinitionCache(
+            max_entries=workflow_cache_size
+        )
+        self._job_cache: JobDefinitionCache = job_cache or JobDefinitionCache()
+        # The step state of running workflows (only used in stateful mode)
+        self._step_state_cache: RunningWorkflowStateCache | None = (
+            RunningWorkflowStateCache() if stateful else None
+        )
+        self._step_status_reader: StepStatusReader = StepStatusReader(
+            wapi_adapter=wapi_adapter, state_cache=self._step_state_cache
+        )
+
+    @property
+    def workflow_cache_statistics(self) -> CacheStatistics:
+        """The usage counters of the engine's workflow definition cache."""
+        return self._workflow_cache.statistics
+
+    @property
+    def step_state_cache_statistics(self) -> CacheStatistics | None:
+        """The usage counters of the engine's running workflow step state,
+        None if the engine is not stateful."""
+        if self._step_state_cache is None:
+            return None
+        return self._step_state_cache.statistics
+
+    def handle_message(self, msg: "Message") -> None:
         """Expect Workflow and Pod messages.
 
         Only pod messages relating to workflow instances will be delivered to this method.
@@ -203,14 +1277,111 @@ class WorkflowEngine:
         """
         assert msg
 
-        _LOGGER.debug("Message:\n%s", str(msg))
+        _LOGGER.debug("Message:\n%s", msg)
+        record_message_lag(metrics=self._metrics, msg=msg)
 
-        if isinstance(msg, PodMessage):
-            self._handle_pod_message(msg)
+        attributes: dict[str, Any] = {"message_type": type(msg).__name__}
+        pod_message: bool = is_pod_message(msg)
+        if pod_message:
+            attributes["instance_id"] = msg.instance
         else:
+            attributes["running_workflow_id"] = msg.running_workflow
+
+        start: float = time.perf_counter()
+        outcome: str = "error"
+        try:
+            with self._tracer.span("handle_message", attributes):
+                if pod_message:
+                    self._handle_pod_message(msg)
+                else:
+                    self._handle_workflow_message(msg)
+            outcome = "ok"
+        finally:
+            self._metrics.observe(
+                MESSAGE_SECONDS,
+                time.perf_counter() - start,
+                {"message_type": type(msg).__name__, "outcome": outcome},
+            )
+
+    def handle_messages(
+        self,
+        msgs: list["Message"],
+        instance_steps: dict[str, tuple[str, dict[str, Any]]] | None = None,
+    ) -> None:
+        """Handles a batch of Workflow and Pod messages, as if each had been given
+        to 'handle_message()' in turn, but with less work.
+
+        The steps that successful Pod messages are for are marked DONE first,
+        and then each running workflow they belong to is assessed once
+        (for all of its finished steps) rather than once for every message.
+        So the Pod messages of the replicas of a step, or of steps on parallel
+        branches, cost a single assessment.
+
+        Messages for a running workflow are still handled in the order they're given.
+        Before a Workflow (START or STOP) message, or an unsuccessful Pod message,
+        is handled, any assessment that's due for its running workflow is made.
+
+        A message (or an assessment) that fails is logged, and does not stop
+        the rest of the batch from being handled.
+
+        The steps that the Instances of Pod messages were launched for can be given,
+        indexed by Instance ID, if they've already been read
+        (see 'get_instance_step()')."""
+        batch: MessageBatch = MessageBatch(self._progress_running_workflow)
+
+        start: float = time.perf_counter()
+        failures: int = 0
+        try:
+            with self._tracer.span("handle_messages", {"messages": len(msgs)}):
+                try:
+                    for msg in msgs:
+                        assert msg
+                        try:
+                            self._add_message_to_batch(msg, batch, instance_steps)
+                        except Exception:  # pylint: disable=broad-exception-caught
+                            failures += 1
+                            _LOGGER.exception("Failed to handle message:\n%s", msg)
+                finally:
+                    failures += batch.progress_all()
+        finally:
+            self._metrics.observe(
+                MESSAGE_BATCH_SECONDS,
+                time.perf_counter() - start,
+                {"outcome": "error" if failures else "ok"},
+            )
+
+    def _add_message_to_batch(
+        self,
+        msg: "Message",
+        batch: MessageBatch,
+        instance_steps: dict[str, tuple[str, dict[str, Any]]] | None,
+    ) -> None:
+        """Handles a message of a batch, recording the step a successful
+        Pod message is for in the batch (rather than assessing its workflow)."""
+        _LOGGER.debug("Message:\n%s", msg)
+        record_message_lag(metrics=self._metrics, msg=msg)
+
+        if not is_pod_message(msg):
+            batch.progress(msg.running_workflow)
             self._handle_workflow_message(msg)
+            return
+
+        if not (
+            pod_step := get_pod_step(
+                wapi_adapter=self._wapi_adapter,
+                msg=msg,
+                instance_step=(instance_steps or {}).get(msg.instance),
+            )
+        ):
+            return
+        if pod_step.exit_code:
+            batch.progress(pod_step.rwf["id"])
+        if plan := self._set_pod_step_done(pod_step):
+            batch.add_finished_step(
+                plan=plan, rwf=pod_step.rwf, step_name=pod_step.step_name
+            )
 
-    def _handle_workflow_message(self, msg: WorkflowMessage) -> None:
+    def _handle_workflow_message(self, msg: "WorkflowMessage") -> None:
         """WorkflowMessages signal the need to start (or stop) a workflow using its
         'action' string field (one of 'START' or 'STOP').
         The message contains a 'running_workflow' field that contains the UUID
@@ -219,12 +1390,13 @@ class WorkflowEngine:
         step (or steps) to launch (run) first."""
         assert msg
 
-        _LOGGER.info("WorkflowMessage:\n%s", str(msg))
+        r_wfid = msg.running_workflow
+        log: RunningWorkflowLogger = RunningWorkflowLogger(_LOGGER, {"id": r_wfid})
+        log.info("WorkflowMessage:\n%s", msg)
         if msg.action not in ["START", "STOP"]:
-            _LOGGER.error("Ignoring unsupported action (%s)", msg.action)
+            log.error("Ignoring unsupported action (%s)", msg.action)
             return
 
-        r_wfid = msg.running_workflow
         if msg.action == "START":
             self._handle_workflow_start_message(r_wfid)
         else:
@@ -246,23 +1418,18 @@ class WorkflowEngine:
         rwf_response, _ = self._wapi_adapter.get_running_workflow(
             running_workflow_id=r_wfid
         )
-        _LOGGER.debug(
-            "API.get_running_workflow(%s) returned: -\n%s", r_wfid, str(rwf_response)
+        RunningWorkflowLogger(_LOGGER, rwf_response).debug(
+            "API.get_running_workflow(%s) returned: -\n%s", r_wfid, rwf_response
         )
         assert "running_user" in rwf_response
         # Now get the workflow definition (to get all the steps)
-        wfid = rwf_response["workflow"]["id"]
-        wf_response, _ = self._wapi_adapter.get_workflow(workflow_id=wfid)
-        _LOGGER.debug("API.get_workflow(%s) returned: -\n%s", wfid, str(wf_response))
+        plan: WorkflowPlan = self._get_workflow_plan(rwf=rwf_response)
 
         # Launch whatever's READY.
         # If there's a launch problem the step (and running workflow) will have
         # an error, stopping it. There will be no Pod event as the launch has failed.
-        if not self._launch_ready_steps(wf=wf_response, rwf=rwf_response):
-            # Nothing could be started, so nothing will ever send us a Pod message
-            # to move this workflow on. Unless a step preparation error has
-            # already stopped the workflow, this workflow cannot run.
-            self._set_running_workflow_done_if_stalled(wf=wf_response, rwf=rwf_response)
+        # If nothing could be started the workflow is stopped, as it cannot run.
+        _ = self._launch_ready_steps(plan=plan, rwf=rwf_response)
 
     def _handle_workflow_stop_message(self, r_wfid: str) -> None:
         """Logic to handle a STOP message."""
@@ -270,35 +1437,34 @@ class WorkflowEngine:
         rwf_response, _ = self._wapi_adapter.get_running_workflow(
             running_workflow_id=r_wfid
         )
-        _LOGGER.debug(
-            "API.get_running_workflow(%s) returned: -\n%s", r_wfid, str(rwf_response)
+        log: RunningWorkflowLogger = RunningWorkflowLogger(
+            _LOGGER, rwf_response or {"id": r_wfid}
         )
+        log.debug("API.get_running_workflow(%s) returned: -\n%s", r_wfid, rwf_response)
         if not rwf_response:
-            _LOGGER.debug("Running workflow does not exist (%s)", r_wfid)
+            log.debug("Running workflow does not exist (%s)", r_wfid)
             return
         elif rwf_response["done"] is True:
-            _LOGGER.debug("Running workflow already stopped (%s)", r_wfid)
+            log.debug("Running workflow already stopped (%s)", r_wfid)
             return
 
         # For this version all we can do is check that no steps are running.
         # If no steps are running we can safely mark the running workflow as stopped.
         response, _ = self._wapi_adapter.get_running_steps(running_workflow_id=r_wfid)
-        _LOGGER.debug(
-            "API.get_running_steps(%s) returned: -\n%s", r_wfid, str(response)
-        )
+        log.debug("API.get_running_steps(%s) returned: -\n%s", r_wfid, response)
         if response:
             if count := response["count"]:
                 msg: str = "1 step is" if count == 1 else f"{count} steps are"
-                _LOGGER.debug("Ignoring STOP for %s. %s still running", r_wfid, msg)
+                log.debug("Ignoring STOP for %s. %s still running", r_wfid, msg)
             else:
-                self._wapi_adapter.set_running_workflow_done(
+                self._set_running_workflow_done(
                     running_workflow_id=r_wfid,
                     success=False,
                     error_num=1,
                     error_msg="User stopped",
                 )
 
-    def _handle_pod_message(self, msg: PodMessage) -> None:
+    def _handle_pod_message(self, msg: "PodMessage") -> None:
         """Handles a PodMessage. This is a message that signals the completion of a
         prior step Job within an existing running workflow.
 
@@ -320,87 +1486,111 @@ class WorkflowEngine:
         RunningWorkflowStep and RunningWorkflow status up to date."""
         assert msg
 
-        # The PodMessage has an 'instance', 'has_exit_code', and 'exit_code' values.
-        _LOGGER.info("PodMessage:\n%s", str(msg))
-
-        # Ignore anything without an exit code.
-        if not msg.has_exit_code:
-            _LOGGER.error("PodMessage has no exit code")
-            return
+        if pod_step := get_pod_step(wapi_adapter=self._wapi_adapter, msg=msg):
+            if plan := self._set_pod_step_done(pod_step):
+                self._progress_running_workflow(
+                    plan=plan, rwf=pod_step.rwf, finished_steps=[pod_step.step_name]
+                )
 
-        # The Instance tells us whether the Step (Job) was successful
-        # (i.e. we can simply check the 'exit_code').
-        instance_id: str = msg.instance
-        exit_code: int = msg.exit_code
-        response, _ = self._wapi_adapter.get_instance(instance_id=instance_id)
-        _LOGGER.debug(
-            "API.get_instance(%s) returned: -\n%s", instance_id, str(response)
-        )
-        r_wfsid: str | None = response.get("running_workflow_step_id")
-        assert r_wfsid
-        rwfs_response, _ = self._wapi_adapter.get_running_workflow_step(
-            running_workflow_step_id=r_wfsid
+    def get_instance_step(self, msg: "PodMessage") -> tuple[str, dict[str, Any]]:
+        """Returns the ID and the record of the RunningWorkflowStep the Instance
+        of a Pod message was launched for, without handling it. The record names
+        the running workflow, so this is used to route messages - every message
+        for a running workflow must be handled by the same engine
+        (see 'sharded_workflow_engine.py'). It can be given back to
+        'handle_messages()' with the message, so it's not read again."""
+        return get_instance_step(
+            wapi_adapter=self._wapi_adapter, instance_id=msg.instance
         )
-        _LOGGER.debug(
-            "API.get_running_workflow_step(%s) returned: -\n%s",
-            r_wfsid,
-            str(rwfs_response),
-        )
-        step_name: str = rwfs_response["name"]
 
-        # Get the step's running workflow record.
-        r_wfid: str = rwfs_response["running_workflow"]["id"]
-        assert r_wfid
-        rwf_response, _ = self._wapi_adapter.get_running_workflow(
-            running_workflow_id=r_wfid
-        )
-        _LOGGER.debug(
-            "API.get_running_workflow(%s) returned: -\n%s", r_wfid, str(rwf_response)
-        )
+    def _set_pod_step_done(self, pod_step: PodStep) -> WorkflowPlan | None:
+        """Records the end of the step (replica) a Pod message is for. The plan of
+        the running workflow is returned if the step was successful, otherwise
+        None is returned (and the step and running workflow will have been failed).
+        """
+        r_wfid: str = pod_step.rwf["id"]
+        r_wfsid: str = pod_step.running_workflow_step_id
 
         # If the Step failed there's no need for us to inspect the Workflow
         # (for the next step) as we simply stop here, reporting the appropriate status).
-        if exit_code:
+        if pod_step.exit_code:
             # The job was launched but it failed.
             # Set a step error,
             # This will also set a workflow error so we can leave.
-            self._set_step_error(step_name, r_wfid, r_wfsid, exit_code, "Job failed")
-            return
+            self._set_step_error(
+                pod_step.step_name, r_wfid, r_wfsid, pod_step.exit_code, "Job failed"
+            )
+            return None
 
         # If we get here the prior step completed successfully
         # so we mark the Step as DONE (successfully).
-        wfid = rwf_response["workflow"]["id"]
-        assert wfid
-        wf_response, _ = self._wapi_adapter.get_workflow(workflow_id=wfid)
-        _LOGGER.debug("API.get_workflow(%s) returned: -\n%s", wfid, str(wf_response))
+        plan: WorkflowPlan = self._get_workflow_plan(rwf=pod_step.rwf)
 
-        # We then inspect the Workflow to determine the next step.
-        _LOGGER.debug("End of RunningWorkflowStep %s (%s)", r_wfsid, r_wfid)
+        RunningWorkflowLogger(_LOGGER, pod_step.rwf).debug(
+            "End of RunningWorkflowStep %s (%s)", r_wfsid, r_wfid
+        )
         self._wapi_adapter.set_running_workflow_step_done(
             running_workflow_step_id=r_wfsid,
             success=True,
         )
+        if self._step_state_cache is not None:
+            _ = self._step_state_cache.record_done(
+                running_workflow_id=r_wfid,
+                instance_id=pod_step.instance_id,
+                success=True,
+            )
+        return plan
 
-        # A step has just finished, so steps that were waiting on it may now be
-        # READY. We re-assess the whole workflow and launch everything we can -
-        # this step may have been the last thing several steps were waiting for.
+    def _progress_running_workflow(
+        self, *, plan: WorkflowPlan, rwf: dict[str, Any], finished_steps: list[str]
+    ) -> None:
+        """Moves a running workflow on after one or more of its steps
+        have finished successfully."""
+        # Steps that were waiting on the finished steps may now be READY.
+        # We re-assess the steps that depend on them and launch everything
+        # we can - a finished step may have been the last thing several steps
+        # were waiting for.
         #
         # A major piece of work to accomplish is to get ourselves into a position
         # that allows us to check the step command can be executed.
         # We do this by compiling a map of variables we believe each step needs.
-        if self._launch_ready_steps(wf=wf_response, rwf=rwf_response):
-            # Something was started (or there was a launch error and the step
-            # and running workflow error will have been set).
-            # Regardless we can stop now - a Pod message will bring us back.
-            return
+        # If nothing is launched the workflow may have reached its end.
+        _ = self._launch_ready_steps(plan=plan, rwf=rwf, finished_steps=finished_steps)
+
+    def _get_workflow_plan(self, *, rwf: dict[str, Any]) -> WorkflowPlan:
+        """Returns the plan of a running workflow's Workflow definition.
+
+        A definition cannot change while a workflow is running, so we only
+        fetch it if it is not already in our cache. It's found using the workflow
+        ID and the fingerprint the DM can provide in the RunningWorkflow's
+        'workflow' block. If it does not, the RunningWorkflow ID is used in its
+        place, so the definition is fetched once for each workflow run - but its
+        plan is shared with every other run of a definition with the same content."""
+        wfid: str = rwf["workflow"]["id"]
+        assert wfid
+        fingerprint: str = rwf["workflow"].get("fingerprint") or rwf["id"]
+        if cached := self._workflow_cache.get(
+            workflow_id=wfid, fingerprint=fingerprint
+        ):
+            return cached.plan
 
-        # Nothing was launched. Either the workflow still has steps running
-        # (in which case their Pod messages will bring us back) or it has
-        # reached its end.
-        self._set_running_workflow_done_if_stalled(wf=wf_response, rwf=rwf_response)
+        wf_response, _ = self._wapi_adapter.get_workflow(workflow_id=wfid)
+        RunningWorkflowLogger(_LOGGER, rwf).debug(
+            "API.get_workflow(%s) returned: -\n%s", wfid, wf_response
+        )
+        if not wf_response:
+            # Never cache a definition that is missing
+            return build_workflow_plan(wf_response)
+        return self._workflow_cache.put(
+            workflow_id=wfid, fingerprint=fingerprint, definition=wf_response
+        ).plan
 
     def _set_running_workflow_done_if_stalled(
-        self, *, wf: dict[str, Any], rwf: dict[str, Any]
+        self,
+        *,
+        plan: WorkflowPlan,
+        rwf: dict[str, Any],
+        step_status_responses: dict[str, dict[str, Any]] | None = None,
     ) -> None:
         """Called when nothing could be launched. If any step is still running
         we do nothing - its Pod message will bring us back. Otherwise the running
@@ -408,8 +1598,10 @@ class WorkflowEngine:
 
         Every step launched and finished is a successful workflow. Anything else
         means steps remain that will never become READY - which a validated
-        workflow should make impossible, so it is an error rather than success."""
+        workflow should make impossible, so it is an error rather than success.
+        The status responses of every step are read, unless they're given."""
         r_wfid: str = rwf["id"]
+        log: RunningWorkflowLogger = RunningWorkflowLogger(_LOGGER, rwf)
 
         # Do nothing if the running workflow has already been stopped
         # (a step or preparation error will have done this).
@@ -417,23 +1609,25 @@ class WorkflowEngine:
             running_workflow_id=r_wfid
         )
         if rwf_response.get("done"):
-            _LOGGER.debug("Running workflow already stopped (%s)", r_wfid)
+            log.debug("Running workflow already stopped (%s)", r_wfid)
             return
 
-        step_states: dict[str, StepState] = self._get_step_states(wf=wf, rwf_id=r_wfid)
-        if any(state.launched and not state.done for state in step_states.values()):
-            _LOGGER.debug("Steps are still running for %s", r_wfid)
+        with self._tracer.span("get_step_states", {"running_workflow_id": r_wfid}):
+            step_states: dict[str, StepState] = (
+                self._get_step_states(plan=plan, rwf_id=r_wfid)
+                if step_status_responses is None
+                else get_step_states(
+                    step_names=plan.step_names, responses=step_status_responses
+                )
+            )
+        if (unrunnable := get_unlaunched_steps(step_states=step_states)) is None:
+            log.debug("Steps are still running for %s", r_wfid)
             return
 
-        if unrunnable := [
-            step_name for step_name, state in step_states.items() if not state.launched
-        ]:
-            msg: str = (
-                "The following steps could not be run:"
-                f" {', '.join(sorted(unrunnable))}"
-            )
-            _LOGGER.warning("%s (%s)", msg, r_wfid)
-            self._wapi_adapter.set_running_workflow_done(
+        if unrunnable:
+            msg: str = f"The following steps could not be run: {', '.join(unrunnable)}"
+            log.warning("%s (%s)", msg, r_wfid)
+            self._set_running_workflow_done(
                 running_workflow_id=r_wfid,
                 success=False,
                 error_num=6,
@@ -441,99 +1635,127 @@ class WorkflowEngine:
             )
             return
 
-        _LOGGER.debug("End of RunningWorkflow %s", r_wfid)
-        self._wapi_adapter.set_running_workflow_done(
+        log.debug("End of RunningWorkflow %s", r_wfid)
+        self._set_running_workflow_done(
             running_workflow_id=r_wfid,
             success=True,
         )
 
+    def _set_running_workflow_done(
+        self,
+        *,
+        running_workflow_id: str,
+        success: bool,
+        error_num: int | None = None,
+        error_msg: str | None = None,
+    ) -> None:
+        """Sets the running workflow as done (in the DM),
+        forgetting any step state we have for it."""
+        self._wapi_adapter.set_running_workflow_done(
+            running_workflow_id=running_workflow_id,
+            success=success,
+            error_num=error_num,
+            error_msg=error_msg,
+        )
+        if self._step_state_cache is not None:
+            self._step_state_cache.evict(running_workflow_id=running_workflow_id)
+
     def _get_step_states(
-        self, *, wf: dict[str, Any], rwf_id: str
+        self,
+        *,
+        plan: WorkflowPlan,
+        rwf_id: str,
+        step_names: list[str] | None = None,
     ) -> dict[str, StepState]:
         """Returns the execution state of every Step in the given Workflow,
-        indexed by step name. State is reconstructed from the DM's records -
-        the engine caches nothing between messages."""
-        states: dict[str, StepState] = {}
-        for step_name in get_step_names(wf):
-            response, _ = self._wapi_adapter.get_status_of_all_step_instances_by_name(
-                name=step_name,
-                running_workflow_id=rwf_id,
-            )
-            assert "count" in response
-            count: int = response["count"]
-            if not count:
-                states[step_name] = StepState(launched=False, done=False, success=False)
-                continue
-            # Every replica that was launched must exist and have finished
-            # before we can call the step 'done'. The 'replicas' value tells us
-            # how many to expect - a step that is still being fanned out will
-            # have fewer records than that.
-            statuses: list[dict[str, Any]] = response["status"]
-            expected_replicas: int = statuses[0].get("replicas", count)
-            done: bool = count == expected_replicas and all(
-                status["done"] for status in statuses
-            )
-            states[step_name] = StepState(
-                launched=True,
-                done=done,
-                success=done and all(status["success"] for status in statuses),
-            )
-        return states
-
-    def _get_ready_steps(
-        self, *, wf: dict[str, Any], step_states: dict[str, StepState]
-    ) -> list[dict[str, Any]]:
-        """Returns the definitions of every Step that can be launched right now.
-
-        A Step is READY when it has not already been launched and every step it
-        depends on has finished successfully. A Step that depends on nothing is
-        therefore READY the moment its workflow starts. Steps are returned in
-        definition order so that launches are deterministic."""
-        ready: list[dict[str, Any]] = []
-        for step in get_steps(wf):
-            step_name: str = step["name"]
-            # Never launch a step twice. The engine re-assesses every step on
-            # every message, so steps that have run are still sitting here.
-            if step_states[step_name].launched:
-                continue
-            # A dependency on a step that isn't in the workflow can never be
-            # satisfied, so the step is never READY. Validation should stop a
-            # definition like that reaching us, but if one does we leave the
-            # step unlaunched and let the caller report a stalled workflow -
-            # which is far kinder than launching it and failing an assertion
-            # while preparing its variables.
-            dependencies: set[str] = get_step_dependencies(step_definition=step)
-            if all(
-                dependency in step_states and step_states[dependency].success
-                for dependency in dependencies
-            ):
-                ready.append(step)
-        return ready
+        indexed by step name, or just those named in 'step_names'.
+        State is reconstructed from the DM's records - unless the engine
+        is stateful, when it comes from the state we keep."""
+        if step_names is None:
+            step_names = plan.step_names
+        responses: dict[str, dict[str, Any]] = self._step_status_reader.read(
+            plan=plan, running_workflow_id=rwf_id, step_names=step_names
+        )
+        return get_step_states(step_names=step_names, responses=responses)
 
-    def _launch_ready_steps(self, *, wf: dict[str, Any], rwf: dict[str, Any]) -> int:
+    def _launch_ready_steps(
+        self,
+        *,
+        plan: WorkflowPlan,
+        rwf: dict[str, Any],
+        finished_steps: list[str] | None = None,
+    ) -> int:
         """Finds every READY Step and launches it, returning the number of steps
         that were launched. Zero is not an error - it usually just means the
-        workflow is waiting on steps that are still running.
+        workflow is waiting on steps that are still running - but if nothing
+        was launched we check whether the workflow has stalled.
+
+        If we're told which steps have just finished, only the steps that depend on
+        them are assessed (see 'get_step_names_to_assess()'). Finished steps that
+        have replicas waiting for a place (see 'get_replica_releases()')
+        launch more of them.
 
         If a step cannot be prepared the running workflow is failed and we stop."""
         rwf_id: str = rwf["id"]
-        step_states: dict[str, StepState] = self._get_step_states(wf=wf, rwf_id=rwf_id)
-        ready_steps: list[dict[str, Any]] = self._get_ready_steps(
-            wf=wf, step_states=step_states
+        log: RunningWorkflowLogger = RunningWorkflowLogger(_LOGGER, rwf)
+        candidates, step_names = get_step_names_to_assess(
+            plan=plan, finished_steps=finished_steps
         )
-        _LOGGER.info(
+        if not step_names:
+            self._set_running_workflow_done_if_stalled(plan=plan, rwf=rwf)
+            return 0
+        # The responses are kept, to prepare the READY steps (and check for a stall)
+        with self._tracer.span("get_step_states", {"running_workflow_id": rwf_id}):
+            responses: dict[str, dict[str, Any]] = self._step_status_reader.read(
+                plan=plan, running_workflow_id=rwf_id, step_names=step_names
+            )
+            step_states: dict[str, StepState] = get_step_states(
+                step_names=step_names, responses=responses
+            )
+        with self._tracer.span("get_ready_steps", {"running_workflow_id": rwf_id}):
+            releases: dict[str, range] = get_replica_releases(
+                plan=plan, step_states=step_states, finished_steps=finished_steps
+            )
+            ready_steps: list[dict[str, Any]] = get_ready_steps(
+                plan=plan, step_states=step_states, candidates=candidates
+            )
+        log.info(
             "Ready steps for %s: %s",
             rwf_id,
             [step["name"] for step in ready_steps],
         )
-
+        if releases:
+            log.info("Released replicas for %s: %s", rwf_id, releases)
+        self._metrics.increment(READY_STEPS_TOTAL, len(ready_steps))
+
+        # The replicas of throttled steps come first (they've been waiting),
+        # then READY steps (launching their first replicas).
+        launches: list[tuple[dict[str, Any], range | None]] = [
+            (plan.steps[step_name], replicas)
+            for step_name, replicas in releases.items()
+        ] + [(step, None) for step in ready_steps]
+
+        # Steps prepared together often share a prior step (read its record once)
+        prior_steps: dict[str, dict[str, Any]] = {}
         launched: int = 0
-        for step in ready_steps:
-            sp_resp: StepPreparationResponse = self._prepare_step(
-                wf=wf, step_definition=step, rwf=rwf
-            )
+        already_launched: bool = False
+        for step, replicas in launches:
+            attributes: dict[str, Any] = {
+                "running_workflow_id": rwf_id,
+                "step_name": step["name"],
+            }
+            start: float = time.perf_counter()
+            with self._tracer.span("prepare_step", attributes):
+                sp_resp: StepPreparationResponse = self._prepare_step(
+                    plan=plan,
+                    step_definition=step,
+                    rwf=rwf,
+                    step_status_responses=responses,
+                    prior_steps=prior_steps,
+                )
+            self._metrics.observe(PREPARE_STEP_SECONDS, time.perf_counter() - start)
             if sp_resp.error_num:
-                self._wapi_adapter.set_running_workflow_done(
+                self._set_running_workflow_done(
                     running_workflow_id=rwf_id,
                     success=False,
                     error_num=sp_resp.error_num,
@@ -543,61 +1765,74 @@ class WorkflowEngine:
             if sp_resp.replicas == 0:
                 # Not an error - the step cannot be prepared yet,
                 # so we'll re-assess it when a later message arrives.
-                _LOGGER.info(
-                    "Step '%s' is not yet preparable - deferring", step["name"]
-                )
+                log.info("Step '%s' is not yet preparable - deferring", step["name"])
                 continue
-            if self._launch(
+            start = time.perf_counter()
+            with self._tracer.span("launch_step", attributes):
+                step_launched, step_already_launched = self._launch(
+                    rwf=rwf,
+                    step_definition=step,
+                    step_preparation_response=sp_resp,
+                    replicas=replicas,
+                )
+            self._metrics.observe(LAUNCH_SECONDS, time.perf_counter() - start)
+            launched += step_launched
+            already_launched = already_launched or step_already_launched
+
+        if not launched:
+            # The responses we read cannot be used if something else launched
+            # a step since we read them (they'd show it was never launched).
+            every_step: bool = not already_launched and (
+                self._step_status_reader.is_complete(plan=plan, step_names=step_names)
+            )
+            self._set_running_workflow_done_if_stalled(
+                plan=plan,
                 rwf=rwf,
-                step_definition=step,
-                step_preparation_response=sp_resp,
-            ):
-                launched += 1
-
+                step_status_responses=responses if every_step else None,
+            )
         return launched
 
-    def _get_step_job(self, *, step: dict[str, Any]) -> dict[str, Any]:
-        """Gets the Job definition for a given Step."""
-        # We get the Job from the step specification, which must contain
-        # the keys "collection", "job", and "version". Here we assume that
-        # the workflow definition has passed the RUN-level validation
-        # which means we can get these values.
-        #
-        # The validator should have verified the Job exists, but it might not
-        # when we need it - so this method might return '{}'.
+    def _get_step_job(
+        self, *, step: dict[str, Any], log: RunningWorkflowLogger
+    ) -> dict[str, Any]:
+        """Gets the Job definition for a given Step (via our cache). The step's
+        specification (from a RUN-level validated definition) names its Job,
+        but the Job might not exist when we need it, when '{}' is returned.
+        It's logged with the logger of the running workflow it's needed for."""
         assert "specification" in step
         step_spec: dict[str, Any] = step["specification"]
-        job_collection: str = step_spec["collection"]
-        job_job: str = step_spec["job"]
-        job_version: str = step_spec["version"]
-        job, _ = self._wapi_adapter.get_job(
-            collection=job_collection, job=job_job, version=job_version
+        job: dict[str, Any] = self._job_cache.get_job(
+            wapi_adapter=self._wapi_adapter,
+            collection=step_spec["collection"],
+            job=step_spec["job"],
+            version=step_spec["version"],
         )
-
-        _LOGGER.debug(
-            "API.get_job(%s, %s, %s) returned: -\n%s",
-            job_collection,
-            job_job,
-            job_version,
-            str(job),
-        )
-
+        log.debug("Job (%s): -\n%s", step_spec, job)
         return job
 
     def _prepare_step(
         self,
         *,
         step_definition: dict[str, Any],
-        wf: dict[str, Any],
+        plan: WorkflowPlan,
         rwf: dict[str, Any],
+        step_status_responses: dict[str, dict[str, Any]] | None = None,
+        prior_steps: dict[str, dict[str, Any]] | None = None,
     ) -> StepPreparationResponse:
         """Attempts to prepare a map of step variables. If variables cannot be
         presented to the step we return an object with 'iterations' set to zero.
         If there's a problem that means we should be able to proceed but cannot,
-        we set 'error_num' and 'error_msg'."""
+        we set 'error_num' and 'error_msg'.
+
+        The step status responses that were used to decide the step is READY
+        can be given (so they're not read again), as can a dictionary of prior
+        step records, which is added to. Both are indexed by step name."""
+        # pylint: disable-next=import-outside-toplevel
+        import decoder.decoder as job_definition_decoder
 
         step_name: str = step_definition["name"]
         rwf_id: str = rwf["id"]
+        log: RunningWorkflowLogger = RunningWorkflowLogger(_LOGGER, rwf)
 
         # Before we move on, are we a combiner?
         #
@@ -611,9 +1846,11 @@ class WorkflowEngine:
         # We are a combiner if a variable in our step's plumbing refers to an input
         # whose origin is of type 'files'.
 
-        _LOGGER.info("Preparing step '%s'...", step_name)
+        log.info("Preparing step '%s'...", step_name)
 
-        our_job_definition: dict[str, Any] = self._get_step_job(step=step_definition)
+        our_job_definition: dict[str, Any] = self._get_step_job(
+            step=step_definition, log=log
+        )
         if not our_job_definition:
             return StepPreparationResponse(
                 replicas=0,
@@ -626,74 +1863,31 @@ class WorkflowEngine:
         # get all our step connections that relate to prior steps.
         # If we're a combiner we will have variables based on prior steps.
         plumbing_of_prior_steps: dict[str, list[Connector]] = (
-            get_step_prior_step_connections(step_definition=step_definition)
+            plan.prior_step_connections[step_name]
         )
 
-        _LOGGER.debug("Step '%s' inputs=%s", step_name, our_inputs)
-        _LOGGER.debug(
+        log.debug("Step '%s' inputs=%s", step_name, our_inputs)
+        log.debug(
             "Step '%s' prior step plumbing=%s", step_name, plumbing_of_prior_steps
         )
 
-        # We are a combiner if a variable in our step's plumbing refers to one of
-        # our own inputs whose type is 'files'. Combiners handle their prior-step
-        # inputs differently (a directory glob rather than named files) and are
-        # never replicated, which is all this flag is used for.
-        #
-        # We do not need to check here that the steps we combine have finished.
-        # A step is only prepared once it is READY, and READY already requires
-        # every step it depends on to have completed successfully.
-        we_are_a_combiner: bool = any(
-            our_inputs.get(connector.out, {}).get("type") == "files"
-            for connections in plumbing_of_prior_steps.values()
-            for connector in connections
+        we_are_a_combiner: bool = is_combiner(
+            our_inputs=our_inputs, plumbing_of_prior_steps=plumbing_of_prior_steps
         )
 
-        _LOGGER.debug("Step '%s' is combiner (%s)", step_name, we_are_a_combiner)
+        log.debug("Step '%s' is combiner (%s)", step_name, we_are_a_combiner)
 
         # We can now compile a set of variables for the step.
-
-        # Inputs - a list of step files that are workflow inputs.
-        # These are project files that are copied into the step instance.
-        inputs: set[str] = set()
-        # Outputs - a list of step files that are workflow outputs.
-        # Any step can write files to the Project directory
-        # but this only consists of job outputs that are also workflow outputs.
-        outputs: set[str] = set()
-
+        #
         # Our initial set of variables begins with the variables provided in the step's
         # specification. It is a map that we will add to and then (eventually)
         # pass to the instance launcher. Here we refer to them as 'prime_variables'.
-        prime_variables: dict[str, Any] = step_definition["specification"].get(
-            "variables", {}
+        prime_variables, inputs, outputs = get_prime_variables(
+            plan=plan,
+            step_definition=step_definition,
+            rwf=rwf,
+            predefined_variables=self._predefined_variables,
         )
-        # The variables provided by the user when running the workflow
-        # (the running workflow variables)...
-        rwf_variables: dict[str, Any] = rwf.get("variables", {})
-
-        # Adjust our prime variables by adding any values
-        # from workflow variables that are mentioned in the step's "plumbing".
-        #
-        # The decoder gives us a list of 'Connectors' that are a par of variable
-        # names representing "in" (workflow) and "out" (step) variable names.
-        # "in" variables are workflow variables, and "out" variables
-        # are expected Step (Job) variables. We use these connections to
-        # take workflow variables and put them in our variables map.
-        for connector in get_step_workflow_variable_connections(
-            step_definition=step_definition
-        ):
-            assert connector.in_ in rwf_variables
-            prime_variables[connector.out] = rwf_variables[connector.in_]
-            if is_workflow_output_variable(wf, connector.in_):
-                outputs.add(rwf_variables[connector.in_])
-            elif is_workflow_input_variable(wf, connector.in_):
-                inputs.add(rwf_variables[connector.in_])
-
-        # Add any pre-defined variables used in the step's "plumbing"
-        for connector in get_step_predefined_variable_connections(
-            step_definition=step_definition
-        ):
-            assert connector.in_ in self._predefined_variables
-            prime_variables[connector.out] = self._predefined_variables[connector.in_]
 
         # Using the "plumbing" again so that we can add any variables
         # that relate to values used in prior steps.
@@ -703,12 +1897,13 @@ class WorkflowEngine:
         #
         # 'inputs' here are not copied to our step's instance directory,
         # instead we need to prefix any 'input' with the instance directory for the
-        # step the input belongs to. e.g. "file.txt" will become
-        # ".instance-0000/file.txt".
-        prior_step_plumbing: dict[str, list[Connector]] = (
-            get_step_prior_step_connections(step_definition=step_definition)
-        )
-        for prior_step_name, connections in prior_step_plumbing.items():
+        # step the input belongs to.
+        # The prior step records are kept, in case one of them replicates us.
+        if prior_steps is None:
+            prior_steps = {}
+        # The outputs of each prior step's Job (if we're not a combiner)
+        prior_job_outputs: dict[str, dict[str, Any]] = {}
+        for prior_step_name, connections in plumbing_of_prior_steps.items():
             # Retrieve the first prior "running" step in order to get the variables
             # that were used for it.
             #
@@ -718,45 +1913,44 @@ class WorkflowEngine:
             # have the same variables and values. Combiners handle inputs from
             # prior steps differently - i.e. they must use a directory 'glob'
             # due to the uncontrolled number of prior steps.
-            prior_step, _ = self._wapi_adapter.get_running_workflow_step_by_name(
-                name=prior_step_name,
-                running_workflow_id=rwf_id,
-            )
-            assert prior_step
-            _LOGGER.info(
+            if (prior_step := prior_steps.get(prior_step_name)) is None:
+                prior_step, _ = self._wapi_adapter.get_running_workflow_step_by_name(
+                    name=prior_step_name,
+                    running_workflow_id=rwf_id,
+                )
+                assert prior_step
+                prior_steps[prior_step_name] = prior_step
+            log.debug(
                 "API.get_running_workflow_step_by_name(%s) got %s\n",
                 prior_step_name,
-                str(prior_step),
+                prior_step,
             )
             assert "instance_id" in prior_step
             p_i_id: str = prior_step["instance_id"]
-            p_i_dir: str = f"{self._instance_id_dir_prefix}{p_i_id}"
             # Get prior step Job (to look for its outputs that are our inputs)
             # (if we're not a combiner)
-            p_job_outputs: dict[str, Any] = {}
             if not we_are_a_combiner:
-                p_step_spec: dict[str, Any] = get_step_specification(
-                    wf, prior_step_name
+                p_job: dict[str, Any] = self._get_step_job(
+                    step=plan.steps[prior_step_name], log=log
                 )
-                _LOGGER.info("get_step_specification() got %s\n", str(p_step_spec))
-                p_job, _ = self._wapi_adapter.get_job(
-                    collection=p_step_spec["collection"],
-                    job=p_step_spec["job"],
-                    version=p_step_spec["version"],
+                if not p_job:
+                    return StepPreparationResponse(
+                        replicas=0,
+                        error_num=4,
+                        error_msg=f"The Job for step '{prior_step_name}' is not present",
+                    )
+                prior_job_outputs[prior_step_name] = job_definition_decoder.get_outputs(
+                    p_job
                 )
-                _LOGGER.info("API.get_job() got %s\n", str(p_job))
-                assert p_job
-                p_job_outputs = job_definition_decoder.get_outputs(p_job)
             # Copy "in" value to "out"...
             # (prefixing inputs with instance directory if required)
-            assert "variables" in prior_step
-            for connector in connections:
-                assert connector.in_ in prior_step["variables"]
-                value: str = prior_step["variables"][connector.in_]
-                if not we_are_a_combiner and connector.in_ in p_job_outputs:
-                    # Prefix with prior-step's instance directory
-                    value = f"{p_i_dir}/{value}"
-                prime_variables[connector.out] = value
+            add_prior_step_variables(
+                prime_variables=prime_variables,
+                prior_step=prior_step,
+                connections=connections,
+                prior_job_outputs=prior_job_outputs.get(prior_step_name, {}),
+                prior_instance_directory=f"{self._instance_id_dir_prefix}{p_i_id}",
+            )
 
         # Our step's prime variables are now set.
 
@@ -769,11 +1963,11 @@ class WorkflowEngine:
             our_job_definition["command"],
             prime_variables,
             "command",
-            TextEncoding.JINJA2_3_0,
+            job_definition_decoder.TextEncoding.JINJA2_3_0,
         )
         if not success:
             msg = f"Failed command validation for step {step_name} error_msg={message}"
-            _LOGGER.warning(msg)
+            log.warning(msg)
             return StepPreparationResponse(replicas=0, error_num=3, error_msg=msg)
 
         # Do we replicate this step (run it more than once in parallel)?
@@ -787,69 +1981,38 @@ class WorkflowEngine:
         # (even if just once). The number of times we're expected to run is dictated
         # by the number of values (files) in the "files" variable.
         #
-        # In this engine we only act on the _first_ variable match, i.e. we do not
-        # expect and wil not act on more than one prior step variable that is of type
-        # "files".
-        #
         # If we do run more than once we'll set 'iter_variable' to the name of our
         # variable (that is to be given multiple values) and 'iter_values' will
         # be the list of files produced by the dependent step forming out inputs.
         # If the dependent step produces file1, file2, and file3 we'll run out step
         # 3 times, with each being given a different file as its input.
-        iter_values: list[str] = []
+        iter_values: Sequence[str] = []
         iter_variable: str | None = None
         iter_instance_id: str | None = None
         if not we_are_a_combiner:
-            for p_step_name, connections in plumbing_of_prior_steps.items():
-                # We need to get the Job definition for each step
-                # and then check whether the (output) variable is of type "files"...
-                wf_step: dict[str, Any] = get_step(wf, p_step_name)
-                assert wf_step
-                job_definition: dict[str, Any] = self._get_step_job(step=wf_step)
-                if not job_definition:
-                    return StepPreparationResponse(
-                        replicas=0,
-                        error_num=4,
-                        error_msg=f"The Job for step '{p_step_name}' is not present",
-                    )
-                jd_outputs: dict[str, Any] = job_definition_decoder.get_outputs(
-                    job_definition
+            # We check whether a prior step's (output) variable
+            # is of type "files"...
+            if replication := get_replication_connection(
+                plumbing_of_prior_steps=plumbing_of_prior_steps,
+                prior_job_outputs=prior_job_outputs,
+            ):
+                p_step_name, connector = replication
+                iter_variable = connector.out
+                # Get the prior running step's output values
+                response = prior_steps[p_step_name]
+                rwfs_id = response["id"]
+                assert rwfs_id
+                iter_instance_id = response["instance_id"]
+                assert iter_instance_id
+                iter_values = self._output_values_reader.read(
+                    running_workflow_step_id=rwfs_id, output_variable=connector.in_
                 )
-                for connector in connections:
-                    if jd_outputs.get(connector.in_, {}).get("type") == "files":
-                        iter_variable = connector.out
-                        # Get the prior running step's output values
-                        response, _ = (
-                            self._wapi_adapter.get_running_workflow_step_by_name(
-                                name=p_step_name,
-                                running_workflow_id=rwf_id,
-                            )
-                        )
-                        rwfs_id = response["id"]
-                        assert rwfs_id
-                        iter_instance_id = response["instance_id"]
-                        assert iter_instance_id
-                        result, _ = (
-                            self._wapi_adapter.get_running_workflow_step_output_values_for_output(
-                                running_workflow_step_id=rwfs_id,
-                                output_variable=connector.in_,
-                            )
-                        )
-                        _LOGGER.info(
-                            "API.get_running_workflow_step_output_values_for_output() got %s\n",
-                            str(result),
-                        )
-                        iter_values = result["output"].copy()
-                        break
-                # Stop if we've got an iteration variable
-                if iter_variable:
-                    break
 
         # If we've set an iteration variable we should have at least one value.
         # If not we cannot continue.
         if iter_variable and len(iter_values) == 0:
             msg = f"The step prior to step '{step_name}' had no outputs. At least one is needed"
-            _LOGGER.warning(msg)
+            log.warning(msg)
             return StepPreparationResponse(replicas=0, error_num=5, error_msg=msg)
 
         # Get the list of instances we depend upon.
@@ -859,10 +2022,15 @@ class WorkflowEngine:
         dependent_instances: set[str] = set()
         for p_step_name in plumbing_of_prior_steps:
             # Any step can depend on multiple instances
-            response, _ = self._wapi_adapter.get_status_of_all_step_instances_by_name(
-                name=p_step_name,
-                running_workflow_id=rwf_id,
-            )
+            if step_status_responses and p_step_name in step_status_responses:
+                response = step_status_responses[p_step_name]
+            else:
+                response, _ = (
+                    self._wapi_adapter.get_status_of_all_step_instances_by_name(
+                        name=p_step_name,
+                        running_workflow_id=rwf_id,
+                    )
+                )
             for step in response["status"]:
                 dependent_instances.add(step["instance_id"])
 
@@ -870,13 +2038,23 @@ class WorkflowEngine:
         # We have a set of prime variables,
         # a list of dependent step instances,
         # and we know how many steps replicas to run.
-        num_step_instances: int = max(1, len(iter_values))
+        # If we've been asked to, replicas are given several files (a chunk) each.
+        files_per_replica: int | None = get_step_files_per_replica(
+            step_definition=step_definition
+        )
+        num_step_instances: int = get_number_of_replicas(
+            replica_values=iter_values, files_per_replica=files_per_replica
+        )
         return StepPreparationResponse(
             variables=prime_variables,
             replicas=num_step_instances,
             replica_variable=iter_variable,
             replica_values=iter_values,
             replica_instance_id=iter_instance_id,
+            files_per_replica=files_per_replica,
+            replica_files_variables=get_replica_files_variables(
+                plan=plan, step_name=step_name
+            ),
             dependent_instances=dependent_instances,
             outputs=outputs,
             inputs=inputs,
@@ -888,87 +2066,55 @@ class WorkflowEngine:
         rwf: dict[str, Any],
         step_definition: dict[str, Any],
         step_preparation_response: StepPreparationResponse,
-    ) -> bool:
+        replicas: range | None = None,
+    ) -> tuple[bool, bool]:
         """Given a runningWorkflow record, a step definition (from the Workflow),
         and the step's variables (in a preparation object) this method launches
-        one or more instances of the given step. Returns True if at least one
-        instance was launched."""
-        step_name: str = step_definition["name"]
-        rwf_id: str = rwf["id"]
-        project_id = rwf["project"]["id"]
-
-        _LOGGER.info("SPR.variables=%s", step_preparation_response.variables)
-        _LOGGER.info(
-            "SPR.replica_variable=%s", step_preparation_response.replica_variable
-        )
-        _LOGGER.info("SPR.replica_values=%s", step_preparation_response.replica_values)
-        _LOGGER.info(
-            "SPR.dependent_instances=%s", step_preparation_response.dependent_instances
-        )
-        _LOGGER.info("SPR.inputs=%s", step_preparation_response.inputs)
-        _LOGGER.info("SPR.outputs=%s", step_preparation_response.outputs)
-
-        # Total replicas must be 1 or more
-        total_replicas: int = step_preparation_response.replicas
-        assert total_replicas >= 1
+        one or more instances of the given step. Returns whether at least one
+        instance was launched, and whether any had already been launched.
 
+        The replicas to launch can be given, otherwise the step's first replicas
+        are launched (see 'get_first_replicas()')."""
         launched: bool = False
-        variables = step_preparation_response.variables
-        for replica in range(step_preparation_response.replicas):
-
-            # If we are replicating this step more than once
-            # the 'replica_variable' will be set.
-            # We must replace the step's variable
-            # with a value expected for this iteration.
-            if step_preparation_response.replica_variable:
-                assert step_preparation_response.replica_values
-                iter_value: str = step_preparation_response.replica_values[replica]
-                _LOGGER.info(
-                    "Replicating step: %s replica=%s variable=%s value=%s origin=%s",
-                    step_name,
-                    replica,
-                    step_preparation_response.replica_variable,
-                    iter_value,
-                    step_preparation_response.replica_instance_id,
-                )
-                # Over-write the replicating variable
-                # and set the replication number to a unique +ve non-zero value...
-                variables[step_preparation_response.replica_variable] = (
-                    f"{self._instance_id_dir_prefix}"
-                    f"{step_preparation_response.replica_instance_id}"
-                    f"/{iter_value}"
-                )
-
-            _LOGGER.info(
-                "Launching step: %s RunningWorkflow=%s (name=%s)"
-                " step_variables=%s project=%s",
-                step_name,
-                rwf_id,
-                rwf["name"],
-                variables,
-                project_id,
+        already_launched: bool = False
+        for batch, launch_results in self._replica_launcher.launch_step_replicas(
+            rwf=rwf,
+            step_definition=step_definition,
+            step_preparation_response=step_preparation_response,
+            replicas=replicas,
+        ):
+            batch_launched, batch_already_launched = self._record_launch_results(
+                rwf=rwf,
+                step_definition=step_definition,
+                step_preparation_response=step_preparation_response,
+                replicas=batch,
+                launch_results=launch_results,
             )
+            launched = launched or batch_launched > 0
+            already_launched = already_launched or batch_already_launched > 0
+        return launched, already_launched
 
-            lp: LaunchParameters = LaunchParameters(
-                project_id=project_id,
-                name=step_name,
-                debug=rwf.get("debug"),
-                launching_user_name=rwf["running_user"],
-                launching_user_api_token=rwf["running_user_api_token"],
-                specification=step_definition["specification"],
-                variables=variables,
-                running_workflow_id=rwf_id,
-                step_name=step_name,
-                step_replication_number=replica,
-                total_number_of_replicas=total_replicas,
-                step_dependent_instances=list(
-                    step_preparation_response.dependent_instances
-                ),
-                step_project_inputs=list(step_preparation_response.inputs),
-                step_project_outputs=list(step_preparation_response.outputs),
-            )
-            lr: LaunchResult = self._instance_launcher.launch(launch_parameters=lp)
+    def _record_launch_results(
+        self,
+        *,
+        rwf: dict[str, Any],
+        step_definition: dict[str, Any],
+        step_preparation_response: StepPreparationResponse,
+        replicas: range,
+        launch_results: list[LaunchResult],
+    ) -> tuple[int, int]:
+        """Acts on the results of launching a batch of the replicas of a step,
+        returning the number of replicas that were launched and the number
+        that had already been launched.
+
+        Each replica is logged at DEBUG level, the batch is summarised at INFO."""
+        step_name: str = step_definition["name"]
+        rwf_id: str = rwf["id"]
+        log: RunningWorkflowLogger = RunningWorkflowLogger(_LOGGER, rwf)
 
+        launched: int = 0
+        already_launched: int = 0
+        for replica, lr in zip(replicas, launch_results):
             if lr.error_num:
                 self._set_step_error(
                     step_name,
@@ -981,23 +2127,49 @@ class WorkflowEngine:
                 # Not an error. We asked for a step that had already been
                 # launched, so nothing new is running and nothing new will
                 # report back. We simply lost a race with another launch.
-                _LOGGER.info(
+                already_launched += 1
+                log.debug(
                     "Step '%s' (replica %s) was already launched - ignoring",
                     step_name,
                     replica,
                 )
+                # Whatever launched it wasn't us,
+                # so any step state we have is no longer complete.
+                if self._step_state_cache is not None:
+                    self._step_state_cache.evict(running_workflow_id=rwf_id)
             else:
                 # No error - there must be a RunningWorkflowStep ID
                 assert lr.running_workflow_step_id
-                launched = True
-                _LOGGER.info(
+                launched += 1
+                if self._step_state_cache is not None:
+                    assert lr.instance_id
+                    self._step_state_cache.record_launch(
+                        running_workflow_id=rwf_id,
+                        step_name=step_name,
+                        instance_id=lr.instance_id,
+                        replicas=step_preparation_response.replicas,
+                    )
+                log.debug(
                     "Launched step '%s' step_id=%s (command=%s)",
                     step_name,
                     lr.running_workflow_step_id,
                     lr.command,
                 )
 
-        return launched
+        log.info(
+            "Launched step '%s' replicas %s-%s (of %s) RunningWorkflow=%s:"
+            " %s launched, %s already launched, %s failed",
+            step_name,
+            replicas.start,
+            replicas.stop - 1,
+            step_preparation_response.replicas,
+            rwf_id,
+            launched,
+            already_launched,
+            len(replicas) - launched - already_launched,
+        )
+        self._metrics.increment(REPLICAS_LAUNCHED_TOTAL, launched)
+        return launched, already_launched
 
     def _set_step_error(
         self,
@@ -1009,7 +2181,7 @@ class WorkflowEngine:
     ) -> None:
         """Set the error state for a running workflow step (and the running workflow).
         Calling this method essentially 'ends' the running workflow."""
-        _LOGGER.warning(
+        RunningWorkflowLogger(_LOGGER, {"id": r_wfid}).warning(
             "Failed to launch step '%s' (error_num=%d error_msg=%s)",
             step_name,
             error_num,
@@ -1025,7 +2197,7 @@ class WorkflowEngine:
                 error_msg=r_wf_error,
             )
         # We must also set the running workflow as done (failed)
-        self._wapi_adapter.set_running_workflow_done(
+        self._set_running_workflow_done(
             running_workflow_id=r_wfid,
             success=False,
             error_num=error_num,
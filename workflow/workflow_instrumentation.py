@@ -0,0 +1,151 @@
+"""Workflow API adapter call accounting.
+
+A module that provides the 'InstrumentedWorkflowAPIAdapter', which can be used
+in place of any 'WorkflowAPIAdapter' (it passes every call on to the adapter
+it's given) to record the calls the engine makes while it handles each message.
+
+Every call is recorded, in order, with a fingerprint of its arguments.
+A read (a 'get_' method) that is made again with the same arguments while one
+message is handled, with no write (any other method) between the two, is a
+repeated read - a query whose answer the engine already had. Repeated reads
+are logged (as warnings) when the message has been handled, and tests can use
+the call logs to set a budget for the number of calls a workflow needs,
+so a change that adds database round trips fails a test rather than being found
+in production.
+
+Module philosophy
+-----------------
+The adapter knows nothing of messages. Whoever gives the engine a message
+marks the start and end of it with the adapter's 'message()' context manager.
+Calls made outside a message are recorded in a log of their own.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+
+from workflow.workflow_abc import WorkflowAPIAdapter
+
+from .workflow_proxy import INSTRUMENTATION_LAYER, CallWrapper, MethodProxy
+
+_LOGGER: logging.Logger = logging.getLogger(__name__)
+
+# Methods whose names start with this are reads
+_READ_METHOD_PREFIX: str = "get_"
+
+
+def get_arguments_fingerprint(args: tuple[Any, ...], kwargs: dict[str, Any]) -> str:
+    """Returns a fingerprint of a call's arguments. Calls with the same
+    (positional and keyword) arguments have the same fingerprint."""
+    text: str = repr((args, sorted(kwargs.items())))
+    return hashlib.sha1(text.encode("utf-8"), usedforsecurity=False).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class AdapterCall:
+    """A call made to the adapter."""
+
+    method: str
+    fingerprint: str
+
+    @property
+    def is_read(self) -> bool:
+        """True if the call is a read."""
+        return self.method.startswith(_READ_METHOD_PREFIX)
+
+
+@dataclass
+class MessageCallLog:
+    """The calls made (in order) while one message was handled."""
+
+    label: str
+    calls: list[AdapterCall] = field(default_factory=list)
+
+    @property
+    def call_counts(self) -> dict[str, int]:
+        """The number of calls of each method."""
+        return dict(Counter(call.method for call in self.calls))
+
+    @property
+    def repeated_reads(self) -> dict[AdapterCall, int]:
+        """The reads that were repeated (with the same arguments, and without
+        a write between them), and the number of times each was repeated."""
+        repeats: Counter[AdapterCall] = Counter()
+        # The reads made since the last write
+        reads: set[AdapterCall] = set()
+        for call in self.calls:
+            if not call.is_read:
+                reads.clear()
+            elif call in reads:
+                repeats[call] += 1
+            else:
+                reads.add(call)
+        return dict(repeats)
+
+
+class InstrumentedWorkflowAPIAdapter(MethodProxy, CallWrapper):
+    """Passes every call on to the given adapter, recording it in the log of
+    the message being handled (see 'message()'). It's a proxy of the adapter
+    (see 'workflow_proxy.py') and the wrapper of its calls."""
+
+    layer: int = INSTRUMENTATION_LAYER
+
+    def __init__(self, wapi_adapter: WorkflowAPIAdapter):
+        super().__init__(wapi_adapter, [self])
+        self._lock: threading.Lock = threading.Lock()
+        # Calls made outside a message are recorded here
+        self._unattributed: MessageCallLog = MessageCallLog(label="")
+        self._current: MessageCallLog | None = None
+        self.message_logs: list[MessageCallLog] = []
+
+    @property
+    def calls(self) -> list[AdapterCall]:
+        """Every call made while a message was being handled, in order."""
+        return [call for log in self.message_logs for call in log.calls]
+
+    @property
+    def unattributed_calls(self) -> list[AdapterCall]:
+        """The calls made outside a message."""
+        return list(self._unattributed.calls)
+
+    @contextmanager
+    def message(self, label: str) -> Iterator[MessageCallLog]:
+        """Records the calls made (in the context) while a message is handled
+        in a new log (labelled with something that identifies the message),
+        and warns of any repeated reads when the message has been handled."""
+        log: MessageCallLog = MessageCallLog(label=label)
+        with self._lock:
+            assert self._current is None
+            self._current = log
+            self.message_logs.append(log)
+        try:
+            yield log
+        finally:
+            with self._lock:
+                self._current = None
+            for call, count in log.repeated_reads.items():
+                _LOGGER.warning(
+                    "Repeated read while handling %s: %s (%s) was repeated %s times",
+                    label,
+                    call.method,
+                    call.fingerprint,
+                    count,
+                )
+
+    def call(
+        self,
+        method: str,
+        function: Callable[..., Any],
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> Any:
+        call: AdapterCall = AdapterCall(
+            method=method, fingerprint=get_arguments_fingerprint(args, kwargs)
+        )
+        with self._lock:
+            (self._current or self._unattributed).calls.append(call)
+        return function(*args, **kwargs)
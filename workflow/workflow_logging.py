@@ -0,0 +1,63 @@
+"""Running workflow logging.
+
+A module that provides the logger the engines use for messages about
+a running workflow.
+
+The engines log through their module loggers, and leave it to the application
+to decide where (and which) records go - they add no handlers of their own.
+Records are formatted only when they're emitted, so adapter responses and other
+large objects are passed to the logger as arguments, never turned into
+strings beforehand.
+
+Module philosophy
+-----------------
+Records about a running workflow carry its ID (the 'running_workflow_id'
+record attribute) so that they can be selected, or formatted, by a handler
+without parsing the message. A step that is fanned out into thousands of replicas
+is summarised at INFO level, the detail of each replica is logged at DEBUG.
+
+Tracing can be turned on for one running workflow, without turning on DEBUG
+for every other one, using the running workflow's 'debug' value (the value that is
+also given to the Instances it launches). If it is set, the running workflow's
+DEBUG records are emitted at INFO level (and have a 'workflow_trace'
+record attribute that is True).
+"""
+
+import logging
+from collections.abc import MutableMapping
+from typing import Any
+
+
+class RunningWorkflowLogger(logging.LoggerAdapter[logging.Logger]):
+    """A logger for the messages about a running workflow (given its record),
+    adding the running workflow's ID to every record and, if the running
+    workflow's 'debug' is set, emitting its DEBUG records at INFO level."""
+
+    def __init__(self, logger: logging.Logger, rwf: dict[str, Any]):
+        super().__init__(logger, {"running_workflow_id": rwf.get("id")})
+        self.tracing: bool = bool(rwf.get("debug"))
+
+    def process(
+        self, msg: Any, kwargs: MutableMapping[str, Any]
+    ) -> tuple[Any, MutableMapping[str, Any]]:
+        """Adds the running workflow's attributes to a record's 'extra' ones."""
+        kwargs["extra"] = {
+            **(self.extra or {}),
+            "workflow_trace": self.tracing,
+            **kwargs.get("extra", {}),
+        }
+        return msg, kwargs
+
+    def isEnabledFor(self, level: int) -> bool:  # pylint: disable=invalid-name
+        """A traced running workflow's DEBUG records are (INFO records) enabled."""
+        if self.tracing and level < logging.INFO:
+            level = logging.INFO
+        return super().isEnabledFor(level)
+
+    def log(self, level: int, msg: Any, *args: Any, **kwargs: Any) -> None:
+        """Logs a record, at INFO level if it's a traced DEBUG record."""
+        if self.tracing and level < logging.INFO:
+            level = logging.INFO
+        # Records are attributed to our caller, not to this method
+        kwargs["stacklevel"] = kwargs.get("stacklevel", 1) + 1
+        super().log(level, msg, *args, **kwargs)
@@ -0,0 +1,309 @@
+"""Workflow engine metrics.
+
+A module that provides the 'MetricsSink' the engine records its measurements in,
+and two implementations of it - one that keeps them in memory (for tests)
+and one that presents them in the Prometheus text exposition format.
+
+The engine records: -
+
+- How long it takes to handle each message, by message type and outcome
+  (and each batch of messages given to 'handle_messages()', by outcome)
+- How long it takes to prepare and to launch steps
+- How long each call of the API adapter and Instance launcher takes, by method
+- The number of READY steps it finds, and the number of replicas it launches
+- The time between a Pod message being sent and it being handled (queue lag)
+
+Module philosophy
+-----------------
+A sink is given a name, a value, and (optional) labels. It's the sink that decides
+what to do with them. The 'MetricsSink' itself does nothing, and is what the engine
+uses if it's not given one, so an engine without metrics pays (almost) nothing.
+
+Durations are in seconds. Labels only ever have a small number of values
+(message types, outcomes, and method names) - never running workflow
+or step names. Sinks are used from more than one thread (see the engine's
+'launch_workers') so implementations must be thread-safe.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Callable, TypeVar
+
+from .workflow_proxy import METRICS_LAYER, CallWrapper, get_proxy
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# The names of the engine's metrics.
+# Histograms (of durations) end '_seconds', counters end '_total'.
+MESSAGE_SECONDS: str = "workflow_engine_message_seconds"
+MESSAGE_BATCH_SECONDS: str = "workflow_engine_message_batch_seconds"
+MESSAGE_LAG_SECONDS: str = "workflow_engine_message_lag_seconds"
+PREPARE_STEP_SECONDS: str = "workflow_engine_prepare_step_seconds"
+LAUNCH_SECONDS: str = "workflow_engine_launch_seconds"
+ADAPTER_CALL_SECONDS: str = "workflow_engine_adapter_call_seconds"
+LAUNCHER_CALL_SECONDS: str = "workflow_engine_launcher_call_seconds"
+READY_STEPS_TOTAL: str = "workflow_engine_ready_steps_total"
+REPLICAS_LAUNCHED_TOTAL: str = "workflow_engine_replicas_launched_total"
+
+# The upper bounds of the Prometheus histogram buckets (in seconds)
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+_T = TypeVar("_T")
+
+# A series is identified by its name and (sorted) labels
+_SeriesKey = tuple[str, tuple[tuple[str, str], ...]]
+
+
+def _get_series_key(name: str, labels: dict[str, str] | None) -> _SeriesKey:
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def get_message_lag(*, timestamp: str, now: datetime | None = None) -> float | None:
+    """Returns the number of seconds since a message's (ISO 8601, UTC) 'timestamp',
+    or None if the timestamp cannot be understood."""
+    try:
+        sent: datetime = datetime.fromisoformat(timestamp.removesuffix("Z"))
+    except ValueError:
+        return None
+    if sent.tzinfo is None:
+        sent = sent.replace(tzinfo=timezone.utc)
+    return ((now or datetime.now(timezone.utc)) - sent).total_seconds()
+
+
+class MetricsSink:
+    """The interface to the engine's metrics, which records nothing.
+    Implementations override 'observe()' and 'increment()'."""
+
+    def observe(
+        self, name: str, value: float, labels: dict[str, str] | None = None
+    ) -> None:
+        """Records a value (typically a duration in seconds) in a histogram."""
+        del name, value, labels
+
+    def increment(
+        self, name: str, amount: float = 1, labels: dict[str, str] | None = None
+    ) -> None:
+        """Adds to a counter."""
+        del name, amount, labels
+
+
+class _CallTimer(CallWrapper):
+    """Records the duration of every (proxied) call in a histogram,
+    labelled with the method's name."""
+
+    layer: int = METRICS_LAYER
+
+    def __init__(self, metrics: MetricsSink, name: str):
+        self._metrics: MetricsSink = metrics
+        self._name: str = name
+
+    def call(
+        self,
+        method: str,
+        function: Callable[..., Any],
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> Any:
+        start: float = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self._metrics.observe(
+                self._name, time.perf_counter() - start, {"method": method}
+            )
+
+
+def get_timed_proxy(target: _T, *, metrics: MetricsSink, name: str) -> _T:
+    """Returns an object that can be used in place of 'target' (an API adapter or
+    Instance launcher) that records the duration of each of its method calls
+    in the 'name' histogram (see 'workflow_proxy.py')."""
+    return get_proxy(target, _CallTimer(metrics, name))
+
+
+class InMemoryMetricsSink(MetricsSink):
+    """A sink that keeps every value it's given, for tests."""
+
+    def __init__(self) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._observations: dict[_SeriesKey, list[float]] = {}
+        self._counters: dict[_SeriesKey, float] = {}
+
+    def observe(
+        self, name: str, value: float, labels: dict[str, str] | None = None
+    ) -> None:
+        with self._lock:
+            self._observations.setdefault(_get_series_key(name, labels), []).append(
+                value
+            )
+
+    def increment(
+        self, name: str, amount: float = 1, labels: dict[str, str] | None = None
+    ) -> None:
+        key: _SeriesKey = _get_series_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def get_observations(
+        self, name: str, labels: dict[str, str] | None = None
+    ) -> list[float]:
+        """Returns the values recorded in a histogram with the given labels,
+        or (if no labels are given) the values of every series of the histogram."""
+        with self._lock:
+            if labels is not None:
+                return list(self._observations.get(_get_series_key(name, labels), []))
+            return [
+                value
+                for (series_name, _), values in self._observations.items()
+                if series_name == name
+                for value in values
+            ]
+
+    def get_count(self, name: str, labels: dict[str, str] | None = None) -> float:
+        """Returns the value of a counter with the given labels,
+        or (if no labels are given) the sum of every series of the counter."""
+        with self._lock:
+            if labels is not None:
+                return self._counters.get(_get_series_key(name, labels), 0)
+            return sum(
+                value
+                for (series_name, _), value in self._counters.items()
+                if series_name == name
+            )
+
+
+class _Histogram:
+    """The bucket counts, sum, and count of one histogram series."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.bucket_counts: list[int] = [0] * len(buckets)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+
+class PrometheusMetricsSink(MetricsSink):
+    """A sink that keeps histograms (with the given bucket upper bounds) and
+    counters, presented in the Prometheus text exposition format
+    by 'render()', and (if it's started) by an HTTP server."""
+
+    def __init__(self, *, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        assert buckets
+        assert list(buckets) == sorted(buckets)
+        self._buckets: tuple[float, ...] = buckets
+        self._lock: threading.Lock = threading.Lock()
+        self._histograms: dict[_SeriesKey, _Histogram] = {}
+        self._counters: dict[_SeriesKey, float] = {}
+
+    def observe(
+        self, name: str, value: float, labels: dict[str, str] | None = None
+    ) -> None:
+        key: _SeriesKey = _get_series_key(name, labels)
+        # The (first) bucket the value belongs in, values over the last bound
+        # are only counted in the '+Inf' bucket.
+        bucket: int = bisect_left(self._buckets, value)
+        with self._lock:
+            histogram: _Histogram | None = self._histograms.get(key)
+            if histogram is None:
+                histogram = _Histogram(self._buckets)
+                self._histograms[key] = histogram
+            if bucket < len(self._buckets):
+                histogram.bucket_counts[bucket] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def increment(
+        self, name: str, amount: float = 1, labels: dict[str, str] | None = None
+    ) -> None:
+        key: _SeriesKey = _get_series_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        lines: list[str] = []
+        with self._lock:
+            typed: set[str] = set()
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative_count: int = 0
+                for bound, count in zip(self._buckets, histogram.bucket_counts):
+                    cumulative_count += count
+                    lines.append(
+                        f"{name}_bucket{_format_labels(labels, le=repr(bound))}"
+                        f" {cumulative_count}"
+                    )
+                lines.append(
+                    f"{name}_bucket{_format_labels(labels, le='+Inf')} {histogram.count}"
+                )
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum!r}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{_format_labels(labels)} {value!r}")
+        return "".join(f"{line}\n" for line in lines)
+
+    def serve(self, *, port: int, address: str = "") -> "ThreadingHTTPServer":
+        """Starts an HTTP server (in a daemon thread) that responds to every GET
+        with the rendered metrics, returning it. Stop it with its 'shutdown()'."""
+        # Imported here, as only a served registry needs the (slow to import)
+        # HTTP server, and the engine imports this module
+        # pylint: disable-next=import-outside-toplevel
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        render: Callable[[], str] = self.render
+
+        class _MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                """Responds with the rendered metrics."""
+                body: bytes = render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                # pylint: disable=redefined-builtin
+                del format, args
+
+        server: ThreadingHTTPServer = ThreadingHTTPServer(
+            (address, port), _MetricsRequestHandler
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...], **extra_labels: str) -> str:
+    """Returns a series' labels (and any extra ones) as a Prometheus label set."""
+    pairs: list[tuple[str, str]] = list(labels) + list(extra_labels.items())
+    if not pairs:
+        return ""
+    formatted: str = ",".join(
+        f'{label}="{_escape_label_value(value)}"' for label, value in pairs
+    )
+    return f"{{{formatted}}}"
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,94 @@
+"""Wrapping the method calls of an API adapter or Instance launcher.
+
+A module that provides the 'MethodProxy', which can be used in place of an object
+(an API adapter or Instance launcher) and passes every call of one of the object's
+(public) methods on to it through a number of 'CallWrapper' objects. A wrapper does
+something around each call - the engine's metrics (see 'workflow_metrics.py')
+time it, its tracing (see 'workflow_tracing.py') records a span for it, and the
+'InstrumentedWorkflowAPIAdapter' (see 'workflow_instrumentation.py') records it.
+
+Module philosophy
+-----------------
+There is one proxy, whatever it's used for. A proxy given to 'get_proxy()'
+is not wrapped in another - the wrappers are added to it - so an adapter that is
+both timed and traced is called through one proxy, in which the order of
+the wrappers is decided by their 'layer' (the lowest is the outermost),
+not by the order in which they were added: -
+
+-   METRICS_LAYER - the duration of a call includes the time spent recording it
+-   TRACING_LAYER - the span of a call is started in the caller's span
+-   INSTRUMENTATION_LAYER - a call is recorded when it reaches the adapter
+
+The 'InstrumentedWorkflowAPIAdapter' is a proxy of its own, which is given
+to the engine (rather than created by it), so its wrapper is always the innermost.
+"""
+
+from collections.abc import Sequence
+from typing import Any, Callable, TypeVar, cast
+
+_T = TypeVar("_T")
+
+# The layers of the wrappers (the lowest is the outermost)
+METRICS_LAYER: int = 0
+TRACING_LAYER: int = 1
+INSTRUMENTATION_LAYER: int = 2
+
+
+class CallWrapper:
+    """Something done around each call of a proxied method, which does nothing.
+    Implementations set their 'layer' and override 'call()'."""
+
+    layer: int = 0
+
+    def call(
+        self,
+        method: str,
+        function: Callable[..., Any],
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> Any:
+        """Calls (and returns the result of) 'function', the (wrapped) method
+        called 'method', with the call's positional and keyword arguments."""
+        del method
+        return function(*args, **kwargs)
+
+
+def _get_wrapped(
+    wrapper: CallWrapper, method: str, function: Callable[..., Any]
+) -> Callable[..., Any]:
+    def wrapped(*args: Any, **kwargs: Any) -> Any:
+        return wrapper.call(method, function, args, kwargs)
+
+    return wrapped
+
+
+class MethodProxy:
+    """Passes on attribute access to a target object, calling each of its (public)
+    methods through the given wrappers, outermost (the lowest 'layer') first."""
+
+    def __init__(self, target: Any, wrappers: Sequence[CallWrapper]):
+        self._target: Any = target
+        self._wrappers: tuple[CallWrapper, ...] = tuple(
+            sorted(wrappers, key=lambda wrapper: wrapper.layer)
+        )
+
+    def __getattr__(self, attribute: str) -> Any:
+        value: Any = getattr(self._target, attribute)
+        if attribute.startswith("_") or not callable(value):
+            return value
+        function: Callable[..., Any] = value
+        for wrapper in reversed(self._wrappers):
+            function = _get_wrapped(wrapper, attribute, function)
+        return function
+
+
+def get_proxy(target: _T, wrapper: CallWrapper) -> _T:
+    """Returns an object that can be used in place of 'target' that calls each of
+    its methods through 'wrapper'. If 'target' is a proxy (a 'MethodProxy'
+    rather than something derived from one) the wrapper is added to its wrappers
+    (in a new proxy) in the place its layer gives it."""
+    proxy: Any = target
+    if type(proxy) is MethodProxy:  # pylint: disable=unidiomatic-typecheck
+        # pylint: disable-next=protected-access
+        return cast(_T, MethodProxy(proxy._target, proxy._wrappers + (wrapper,)))
+    return cast(_T, MethodProxy(target, [wrapper]))
@@ -0,0 +1,187 @@
+"""Running workflow state.
+
+A module that provides the in-memory step state the engine keeps
+for running workflows when it is used in its (optional) 'stateful' mode.
+
+By default the engine reconstructs the state of a running workflow's steps from
+the DM's RunningWorkflowStep records every time it handles a message. For a step
+that is fanned out into thousands of replicas that means thousands of Pod messages,
+each one re-reading the status of every replica. In stateful mode the engine
+keeps that state here instead, changing it as it launches steps and as their Pod
+messages arrive.
+
+Module philosophy
+-----------------
+The DM remains the record of truth. The engine writes every change to the DM
+(using its API adapter) before it records it here, and the state of a running
+workflow that is not here (because the engine has just started, or it has been
+evicted) is simply rebuilt from the DM. So losing an entry costs a query,
+never correctness.
+
+State is kept in the form of the DM's step status responses
+(see 'WorkflowAPIAdapter.get_status_of_all_step_instances_by_name()'),
+so the engine interprets it exactly as it does the DM's. Replicas are identified
+by their Instance ID, which is what a Pod message carries.
+
+The state of a running workflow is only valid while every message for it is handled
+by the same engine. The cache is bounded (the least recently used workflow is
+evicted when it is full), safe to use from more than one thread, and records its
+hits, misses, and evictions in a 'CacheStatistics' dataclass object.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Any
+
+from .workflow_cache import CacheStatistics
+
+
+@dataclass
+class ReplicaState:
+    """The state of one replica (Instance) of a step."""
+
+    replicas: int
+    done: bool = False
+    success: bool = False
+
+
+@dataclass
+class RunningWorkflowState:
+    """The state of every step replica of a running workflow,
+    indexed by step name and then by Instance ID."""
+
+    steps: dict[str, dict[str, ReplicaState]] = field(default_factory=dict)
+    # The name of the step each Instance belongs to
+    instance_steps: dict[str, str] = field(default_factory=dict)
+
+
+class RunningWorkflowStateCache:
+    """A least-recently-used cache of the step state of running workflows,
+    keyed by RunningWorkflow ID. A 'max_entries' of zero disables the cache."""
+
+    def __init__(self, *, max_entries: int = 1024):
+        assert max_entries >= 0
+
+        self._max_entries: int = max_entries
+        self._entries: OrderedDict[str, RunningWorkflowState] = OrderedDict()
+        self._statistics: CacheStatistics = CacheStatistics()
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, running_workflow_id: str) -> bool:
+        return running_workflow_id in self._entries
+
+    @property
+    def statistics(self) -> CacheStatistics:
+        """A copy of the cache's usage counters."""
+        with self._lock:
+            return replace(self._statistics)
+
+    def get_step_status_responses(
+        self, *, running_workflow_id: str
+    ) -> dict[str, dict[str, Any]] | None:
+        """Returns the status of every launched step of the running workflow,
+        indexed by step name, or None if the running workflow is not in the cache.
+        Each value is what 'get_status_of_all_step_instances_by_name()'
+        would return for the step."""
+        with self._lock:
+            state: RunningWorkflowState | None = self._entries.get(running_workflow_id)
+            if state is None:
+                self._statistics.misses += 1
+                return None
+            self._entries.move_to_end(running_workflow_id)
+            self._statistics.hits += 1
+            return {
+                step_name: {
+                    "count": len(replicas),
+                    "status": [
+                        {
+                            "done": replica.done,
+                            "success": replica.success,
+                            "replicas": replica.replicas,
+                            "instance_id": instance_id,
+                        }
+                        for instance_id, replica in replicas.items()
+                    ],
+                }
+                for step_name, replicas in state.steps.items()
+            }
+
+    def put_step_status_responses(
+        self, *, running_workflow_id: str, responses: dict[str, dict[str, Any]]
+    ) -> None:
+        """Sets the state of a running workflow from the DM's status of
+        every one of its launched steps (indexed by step name),
+        replacing anything already cached."""
+        if not self._max_entries:
+            return
+        state: RunningWorkflowState = RunningWorkflowState()
+        for step_name, response in responses.items():
+            replicas: dict[str, ReplicaState] = {}
+            for status in response["status"]:
+                instance_id: str = status["instance_id"]
+                replicas[instance_id] = ReplicaState(
+                    replicas=status.get("replicas", response["count"]),
+                    done=status["done"],
+                    success=status["success"],
+                )
+                state.instance_steps[instance_id] = step_name
+            if replicas:
+                state.steps[step_name] = replicas
+        with self._lock:
+            self._entries[running_workflow_id] = state
+            self._entries.move_to_end(running_workflow_id)
+            while len(self._entries) > self._max_entries:
+                _ = self._entries.popitem(last=False)
+                self._statistics.evictions += 1
+
+    def record_launch(
+        self,
+        *,
+        running_workflow_id: str,
+        step_name: str,
+        instance_id: str,
+        replicas: int,
+    ) -> None:
+        """Records the launch of a step replica (Instance).
+        Nothing is recorded if the running workflow is not in the cache."""
+        with self._lock:
+            if state := self._entries.get(running_workflow_id):
+                state.steps.setdefault(step_name, {})[instance_id] = ReplicaState(
+                    replicas=replicas
+                )
+                state.instance_steps[instance_id] = step_name
+
+    def record_done(
+        self, *, running_workflow_id: str, instance_id: str, success: bool
+    ) -> bool:
+        """Records the end of a step replica (Instance). False is returned
+        (and the running workflow is removed from the cache) if the running workflow
+        is cached but the Instance is not known - its state must have been
+        changed by something else, so it can no longer be relied upon."""
+        with self._lock:
+            state: RunningWorkflowState | None = self._entries.get(running_workflow_id)
+            if state is None:
+                return True
+            step_name: str | None = state.instance_steps.get(instance_id)
+            if step_name is None:
+                del self._entries[running_workflow_id]
+                return False
+            replica: ReplicaState = state.steps[step_name][instance_id]
+            replica.done = True
+            replica.success = success
+            return True
+
+    def evict(self, *, running_workflow_id: str) -> None:
+        """Removes a running workflow from the cache (if it is present).
+        The statistics only count evictions made to make room in the cache."""
+        with self._lock:
+            _ = self._entries.pop(running_workflow_id, None)
+
+    def clear(self) -> None:
+        """Removes every entry (the statistics are retained)."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,223 @@
+"""Workflow engine tracing.
+
+A module that provides the (OpenTelemetry-style) spans the engine can record
+around the phases of handling a message - and every API adapter call and
+Instance launch - so that the cause of a slow message can be found.
+
+A span has a name, a start and end time, attributes (the running workflow ID,
+step name, and replica, where they are known), and the IDs of its trace,
+itself, and its parent. Finished spans are given to a 'SpanExporter'.
+This module has no dependency on OpenTelemetry. An application that uses it
+provides an exporter that passes the spans on, and the 'InMemorySpanExporter'
+keeps them for tests.
+
+The context of the span that launches a step is given to its Instances
+(in the 'trace_context' of their 'LaunchParameters') as a W3C 'traceparent'
+so a Job's Pod can record its own spans in the same trace.
+
+Module philosophy
+-----------------
+An engine that isn't given a 'Tracer' uses one without an exporter, which
+records nothing, so spans cost (almost) nothing unless they're wanted.
+The current span is kept in a context variable, so spans started in different
+threads (or asyncio tasks) do not interfere, and the parent of a span is
+the span that is current when it starts.
+"""
+
+import contextvars
+import secrets
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable, ContextManager, Iterator, TypeVar
+
+from .workflow_proxy import TRACING_LAYER, CallWrapper, get_proxy
+
+_T = TypeVar("_T")
+
+# The attributes that identify what a span is for,
+# which a proxy's spans take from the span they're started in
+_IDENTIFYING_ATTRIBUTES: tuple[str, ...] = (
+    "running_workflow_id",
+    "step_name",
+    "replica",
+)
+
+# The (W3C Trace Context) version and flags ('sampled') of our 'traceparent'
+_TRACEPARENT_VERSION: str = "00"
+_TRACEPARENT_FLAGS: str = "01"
+
+
+@dataclass
+class Span:
+    """A timed operation. Times are in nanoseconds since the epoch,
+    'end_time_ns' is zero until the span ends. 'status' is 'OK', or 'ERROR'
+    if the operation raised an exception."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str | None = None
+    start_time_ns: int = 0
+    end_time_ns: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    status: str = "OK"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Sets (or replaces) an attribute of the span."""
+        self.attributes[key] = value
+
+
+_CURRENT_SPAN: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "workflow_current_span", default=None
+)
+
+
+def get_current_span() -> Span | None:
+    """Returns the span that's current (in this context), if there is one."""
+    return _CURRENT_SPAN.get()
+
+
+def get_trace_context() -> dict[str, str] | None:
+    """Returns the context of the current span as a W3C 'traceparent'
+    (in a dictionary, as it would be propagated in an HTTP header),
+    or None if no span is current."""
+    span: Span | None = _CURRENT_SPAN.get()
+    if span is None:
+        return None
+    return {
+        "traceparent": f"{_TRACEPARENT_VERSION}-{span.trace_id}"
+        f"-{span.span_id}-{_TRACEPARENT_FLAGS}"
+    }
+
+
+class SpanExporter:
+    """The interface that finished spans are given to, which exports nothing.
+    Implementations override 'export()'."""
+
+    def export(self, span: Span) -> None:
+        """Called (in the thread that ran it) when a span ends."""
+        del span
+
+
+class InMemorySpanExporter(SpanExporter):
+    """An exporter that keeps every span it's given, for tests."""
+
+    def __init__(self) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._spans: list[Span] = []
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    @property
+    def spans(self) -> list[Span]:
+        """The spans that have ended (in the order they ended)."""
+        with self._lock:
+            return list(self._spans)
+
+    def get_spans(self, name: str) -> list[Span]:
+        """Returns the spans that have the given name."""
+        return [span for span in self.spans if span.name == name]
+
+
+class Tracer:
+    """Creates spans, giving them to the exporter when they end.
+    A tracer without an exporter records nothing."""
+
+    def __init__(self, exporter: SpanExporter | None = None):
+        self._exporter: SpanExporter | None = exporter
+
+    @property
+    def enabled(self) -> bool:
+        """True if the tracer records spans."""
+        return self._exporter is not None
+
+    def span(
+        self, name: str, attributes: dict[str, Any] | None = None
+    ) -> ContextManager[Span | None]:
+        """Returns a context manager that makes a new span (a child of the current
+        span, or the root of a new trace) the current span while it's active.
+        The span is given to the exporter when it ends. If the tracer is not
+        enabled the context manager provides None."""
+        if self._exporter is None:
+            return nullcontext()
+        return self._span(name, attributes)
+
+    @contextmanager
+    def _span(self, name: str, attributes: dict[str, Any] | None) -> Iterator[Span]:
+        assert self._exporter
+        parent: Span | None = _CURRENT_SPAN.get()
+        span: Span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_span_id=parent.span_id if parent else None,
+            start_time_ns=time.time_ns(),
+            attributes=dict(attributes or {}),
+        )
+        token: contextvars.Token[Span | None] = _CURRENT_SPAN.set(span)
+        try:
+            yield span
+        except BaseException:
+            span.status = "ERROR"
+            raise
+        finally:
+            _CURRENT_SPAN.reset(token)
+            span.end_time_ns = time.time_ns()
+            self._exporter.export(span)
+
+
+def _get_call_attributes(kwargs: dict[str, Any]) -> dict[str, Any]:
+    """Returns the attributes of the span of a (proxied) call - the running
+    workflow ID, step name, and replica of the current span, replaced by
+    any the call's (keyword) arguments provide."""
+    span: Span | None = _CURRENT_SPAN.get()
+    attributes: dict[str, Any] = {
+        key: span.attributes[key]
+        for key in _IDENTIFYING_ATTRIBUTES
+        if span and key in span.attributes
+    }
+    if "running_workflow_id" in kwargs:
+        attributes["running_workflow_id"] = kwargs["running_workflow_id"]
+    launch_parameters: Any = kwargs.get("launch_parameters")
+    if isinstance(launch_parameters, list):
+        launch_parameters = launch_parameters[0] if launch_parameters else None
+    if launch_parameters is not None:
+        attributes["running_workflow_id"] = launch_parameters.running_workflow_id
+        attributes["step_name"] = launch_parameters.step_name
+        attributes["replica"] = launch_parameters.step_replication_number
+    return attributes
+
+
+class _CallTracer(CallWrapper):
+    """Records a span (named after the target's class and method) for every
+    (proxied) call. The span has the running workflow ID, step name, and replica
+    of the span it's started in, or of the call (see '_get_call_attributes()')."""
+
+    layer: int = TRACING_LAYER
+
+    def __init__(self, tracer: Tracer, prefix: str):
+        self._tracer: Tracer = tracer
+        self._prefix: str = prefix
+
+    def call(
+        self,
+        method: str,
+        function: Callable[..., Any],
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> Any:
+        with self._tracer.span(
+            f"{self._prefix}.{method}", _get_call_attributes(kwargs)
+        ):
+            return function(*args, **kwargs)
+
+
+def get_traced_proxy(target: _T, *, tracer: Tracer, prefix: str) -> _T:
+    """Returns an object that can be used in place of 'target' (an API adapter)
+    that records a span (named '<prefix>.<method>') for each of its method calls
+    (see 'workflow_proxy.py')."""
+    return get_proxy(target, _CallTracer(tracer, prefix))
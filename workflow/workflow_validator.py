@@ -36,23 +36,24 @@ used as a return object by the validation function. The module defines the
 'WorkflowValidator' class with one (class-level) function ... 'validate()'.
 The 'validate()' function ensures that the checks based on the validation level
 are executed and any breach is returned via a 'ValidationResult' instance.
+'validate_many()' does the same for a batch of definitions (a catalogue
+re-validated after a Job collection upgrade, say), returning a 'ValidationResult'
+for each. It runs the (CPU-bound) schema checks on a pool of processes and
+fetches each Job the definitions use just once.
 """
 
+import os
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any
+from typing import Any, Callable
 
 from workflow.workflow_abc import (
     WorkflowAPIAdapter,
 )
 
-from .decoder import (
-    get_step_names,
-    get_step_specification,
-    get_steps,
-    get_workflow_variable_names,
-    validate_schema,
-)
+from .decoder import WorkflowPlan, build_workflow_plan, validate_schema
+from .workflow_cache import JobDefinitionCache
 
 
 class ValidationLevel(Enum):
@@ -74,6 +75,26 @@ class ValidationResult:
 # Handy successful results
 _VALIDATION_SUCCESS = ValidationResult(error_num=0, error_msg=None)
 
+# A function that returns the definition of a Job,
+# given its collection, job and version (an empty dictionary if it's not known)
+JobGetter = Callable[[str, str, str], dict[str, Any]]
+
+
+def _get_schema_error(workflow_definition: dict[str, Any]) -> str | None:
+    """Returns the schema error of a definition (or None). A module-level
+    function, so it can be run in a process pool."""
+    return validate_schema(workflow_definition)
+
+
+def _get_job_keys(plan: WorkflowPlan) -> list[tuple[str, str, str]]:
+    """Returns the (collection, job, version) of the Job of each of
+    the plan's steps."""
+    keys: list[tuple[str, str, str]] = []
+    for step_name in plan.step_names:
+        step_spec: dict[str, Any] = plan.steps[step_name]["specification"]
+        keys.append((step_spec["collection"], step_spec["job"], step_spec["version"]))
+    return keys
+
 
 class WorkflowValidator:
     """The workflow validator. Typically used from the context of the API
@@ -88,30 +109,39 @@ class WorkflowValidator:
         workflow_definition: dict[str, Any],
         wapi_adapter: WorkflowAPIAdapter,
         variables: dict[str, Any] | None = None,
+        job_cache: JobDefinitionCache | None = None,
     ) -> ValidationResult:
-        """Validates the workflow definition (and inputs) based on the provided 'level'."""
+        """Validates the workflow definition (and inputs) based on the provided 'level'.
+        Job definitions needed by RUN level validation are obtained through
+        'job_cache' (typically the cache used by the engine) if one is provided."""
         assert level in ValidationLevel
         assert isinstance(workflow_definition, dict)
         assert wapi_adapter
         if variables:
             assert isinstance(variables, dict)
 
-        # ALl levels need to pass schema validation
+        # ALl levels need to pass schema validation.
+        # (Use 'decoder.iter_schema_errors()' to get every schema error)
         if error := validate_schema(workflow_definition):
             return ValidationResult(error_num=1, error_msg=[error])
 
-        # Now level-specific validation...
-        if level in (ValidationLevel.TAG, ValidationLevel.RUN):
-            level_result: ValidationResult = WorkflowValidator._validate_tag_level(
-                workflow_definition=workflow_definition,
-            )
-            if level_result.error_num:
-                return level_result
+        # Now level-specific validation,
+        # which works from the definition's compiled plan...
+        if level == ValidationLevel.CREATE:
+            return _VALIDATION_SUCCESS
+        plan: WorkflowPlan = build_workflow_plan(workflow_definition)
+        level_result: ValidationResult = WorkflowValidator._validate_tag_level(
+            plan=plan,
+        )
+        if level_result.error_num:
+            return level_result
         if level == ValidationLevel.RUN:
             level_result = WorkflowValidator._validate_run_level(
-                workflow_definition=workflow_definition,
-                wapi_adapter=wapi_adapter,
+                plan=plan,
                 variables=variables,
+                get_job=WorkflowValidator._get_job_getter(
+                    wapi_adapter=wapi_adapter, job_cache=job_cache
+                ),
             )
             if level_result.error_num:
                 return level_result
@@ -119,27 +149,135 @@ class WorkflowValidator:
         # OK if we get here
         return _VALIDATION_SUCCESS
 
+    @classmethod
+    def validate_many(
+        cls,
+        *,
+        level: ValidationLevel,
+        workflow_definitions: list[dict[str, Any]],
+        wapi_adapter: WorkflowAPIAdapter | None = None,
+        variables: list[dict[str, Any] | None] | None = None,
+        job_cache: JobDefinitionCache | None = None,
+        max_workers: int | None = None,
+    ) -> list[ValidationResult]:
+        """Validates a batch of workflow definitions (as 'validate()' would),
+        returning a result for each, in the same order. 'variables' (if provided)
+        holds the variables of each definition.
+
+        The schema checks are run on a pool of (up to 'max_workers') processes,
+        unless 'max_workers' is 1 or there's only one definition. For RUN level
+        validation every Job the definitions use is fetched once (through
+        'job_cache' if one is provided), however many definitions use it.
+        An API adapter is only needed for RUN level validation."""
+        assert level in ValidationLevel
+        assert isinstance(workflow_definitions, list)
+        assert level != ValidationLevel.RUN or wapi_adapter
+        if variables is not None:
+            assert len(variables) == len(workflow_definitions)
+        assert max_workers is None or max_workers > 0
+
+        # ALl levels need to pass schema validation...
+        schema_errors: list[str | None]
+        if max_workers == 1 or len(workflow_definitions) < 2:
+            schema_errors = [
+                _get_schema_error(workflow_definition)
+                for workflow_definition in workflow_definitions
+            ]
+        else:
+            workers: int = max_workers or os.process_cpu_count() or 1
+            # Send the definitions to the workers in chunks,
+            # about four for each worker
+            chunksize: int = max(1, len(workflow_definitions) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                schema_errors = list(
+                    executor.map(
+                        _get_schema_error, workflow_definitions, chunksize=chunksize
+                    )
+                )
+
+        # Then (as 'validate()') the level-specific validation.
+        # We keep the plans that need RUN level validation,
+        # which we do once we've got all the Jobs they need.
+        results: list[ValidationResult] = []
+        run_plans: dict[int, WorkflowPlan] = {}
+        for index, workflow_definition in enumerate(workflow_definitions):
+            if error := schema_errors[index]:
+                results.append(ValidationResult(error_num=1, error_msg=[error]))
+                continue
+            if level == ValidationLevel.CREATE:
+                results.append(_VALIDATION_SUCCESS)
+                continue
+            plan: WorkflowPlan = build_workflow_plan(workflow_definition)
+            level_result: ValidationResult = WorkflowValidator._validate_tag_level(
+                plan=plan,
+            )
+            if level == ValidationLevel.RUN and not level_result.error_num:
+                run_plans[index] = plan
+            results.append(level_result)
+        if not run_plans:
+            return results
+
+        assert wapi_adapter
+        get_job: JobGetter = WorkflowValidator._get_job_getter(
+            wapi_adapter=wapi_adapter, job_cache=job_cache
+        )
+        jobs: dict[tuple[str, str, str], dict[str, Any]] = {}
+        for plan in run_plans.values():
+            for key in _get_job_keys(plan):
+                if key not in jobs:
+                    jobs[key] = get_job(*key)
+        for index, plan in run_plans.items():
+            results[index] = WorkflowValidator._validate_run_level(
+                plan=plan,
+                variables=variables[index] if variables else None,
+                get_job=lambda collection, job, version: jobs[
+                    (collection, job, version)
+                ],
+            )
+        return results
+
+    @classmethod
+    def _get_job_getter(
+        cls,
+        *,
+        wapi_adapter: WorkflowAPIAdapter,
+        job_cache: JobDefinitionCache | None,
+    ) -> JobGetter:
+        """Returns a function that gets Jobs through the cache.
+        Without a cache of our own we use one just for these checks,
+        so that a Job used by more than one step is only fetched once."""
+        # (An empty cache is falsy - it has a length)
+        cache: JobDefinitionCache = (
+            JobDefinitionCache() if job_cache is None else job_cache
+        )
+
+        def get_job(collection: str, job: str, version: str) -> dict[str, Any]:
+            return cache.get_job(
+                wapi_adapter=wapi_adapter,
+                collection=collection,
+                job=job,
+                version=version,
+            )
+
+        return get_job
+
     @classmethod
     def _validate_tag_level(
         cls,
         *,
-        workflow_definition: dict[str, Any],
+        plan: WorkflowPlan,
     ) -> ValidationResult:
-        assert workflow_definition
+        assert plan
 
         # TAG level requires that each step name is unique,
         # and all the output variable names in the step are unique.
-        duplicate_names: set[str] = set()
-        all_step_names: set[str] = set()
-        for step in get_steps(workflow_definition):
-            step_name: str = step["name"]
-            if step_name not in duplicate_names and step_name in all_step_names:
-                duplicate_names.add(step_name)
-            all_step_names.add(step_name)
-        if duplicate_names:
+        if plan.duplicate_step_names:
             return ValidationResult(
                 error_num=2,
-                error_msg=[f"Duplicate step names found: {', '.join(duplicate_names)}"],
+                error_msg=[
+                    "Duplicate step names found:"
+                    f" {', '.join(plan.duplicate_step_names)}"
+                ],
             )
 
         return _VALIDATION_SUCCESS
@@ -148,14 +286,14 @@ class WorkflowValidator:
     def _validate_run_level(
         cls,
         *,
-        workflow_definition: dict[str, Any],
-        wapi_adapter: WorkflowAPIAdapter,
-        variables: dict[str, Any] | None = None,
+        plan: WorkflowPlan,
+        variables: dict[str, Any] | None,
+        get_job: JobGetter,
     ) -> ValidationResult:
-        assert workflow_definition
+        assert plan
 
         # We must have values for all the variables defined in the workflow.
-        wf_variables: set[str] = get_workflow_variable_names(workflow_definition)
+        wf_variables: set[str] = plan.workflow_variable_names
         missing_values: list[str] = []
         missing_values.extend(
             wf_variable
@@ -170,18 +308,12 @@ class WorkflowValidator:
                 ],
             )
 
-        # All of the jobs must be known to the DM
+        # All of the jobs must be known to the DM.
         errors: list[str] = []
-        for step_name in get_step_names(workflow_definition):
-            step_spec = get_step_specification(workflow_definition, step_name)
-            j_collection: str = step_spec["collection"]
-            j_job: str = step_spec["job"]
-            j_version: str = step_spec["version"]
-            job, _ = wapi_adapter.get_job(
-                collection=j_collection,
-                job=j_job,
-                version=j_version,
-            )
+        for step_name, (j_collection, j_job, j_version) in zip(
+            plan.step_names, _get_job_keys(plan)
+        ):
+            job: dict[str, Any] = get_job(j_collection, j_job, j_version)
             if not job:
                 errors.append(
                     f"The job for step '{step_name}' is not present"
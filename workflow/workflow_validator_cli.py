@@ -0,0 +1,108 @@
+"""The workflow validator's command-line interface.
+
+The 'workflow-validate' command validates every workflow definition (YAML) file
+in a directory (and its sub-directories), using 'WorkflowValidator.validate_many()',
+so the definitions' schema checks are run in parallel. It prints the errors
+of every definition that is not valid and exits with a non-zero status if there
+are any. A catalogue of workflows can be checked with: -
+
+    workflow-validate path/to/workflows
+
+RUN level validation needs the Data Manager (its Jobs and a running workflow's
+variables) so the command only offers CREATE and TAG level validation.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+from .decoder import load_workflow
+from .workflow_validator import ValidationLevel, ValidationResult, WorkflowValidator
+
+# The levels the command can validate at
+_LEVELS: dict[str, ValidationLevel] = {
+    "create": ValidationLevel.CREATE,
+    "tag": ValidationLevel.TAG,
+}
+
+
+def _load_definition(path: Path) -> tuple[dict[str, Any] | None, str | None]:
+    """Loads a workflow definition file, returning the definition,
+    or an error if it is not a (YAML) dictionary."""
+    try:
+        return load_workflow(path), None
+    except (OSError, yaml.YAMLError) as ex:
+        return None, f"Cannot load the file ({ex})"
+    except ValueError:
+        return None, "The file does not contain a workflow definition"
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Validates the workflow definitions in a directory (given command-line
+    arguments), returning the exit status - 1 if any are not valid."""
+    parser = argparse.ArgumentParser(
+        prog="workflow-validate",
+        description="Validates the workflow definition (YAML) files in a directory.",
+    )
+    parser.add_argument("directory", help="The directory of workflow definitions")
+    parser.add_argument(
+        "--level",
+        choices=list(_LEVELS),
+        default="tag",
+        help="The level to validate at (default: tag)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="The number of processes to use (default: one for each CPU)",
+    )
+    args = parser.parse_args(argv)
+    directory: Path = Path(args.directory)
+    if not directory.is_dir():
+        parser.error(f"'{directory}' is not a directory")
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    paths: list[Path] = sorted(
+        path
+        for pattern in ("*.yaml", "*.yml")
+        for path in directory.rglob(pattern)
+        if path.is_file()
+    )
+    errors: dict[Path, list[str]] = {}
+    loaded_paths: list[Path] = []
+    definitions: list[dict[str, Any]] = []
+    for path in paths:
+        definition, error = _load_definition(path)
+        if definition is None:
+            assert error
+            errors[path] = [error]
+            continue
+        loaded_paths.append(path)
+        definitions.append(definition)
+
+    results: list[ValidationResult] = WorkflowValidator.validate_many(
+        level=_LEVELS[args.level],
+        workflow_definitions=definitions,
+        max_workers=args.workers,
+    )
+    for path, result in zip(loaded_paths, results):
+        if result.error_num:
+            errors[path] = result.error_msg or [f"Error {result.error_num}"]
+
+    for path in sorted(errors):
+        print(f"{path}:")
+        for error in errors[path]:
+            print(f"  {error}")
+    print(
+        f"{len(paths) - len(errors)} of {len(paths)} workflow definitions are valid"
+        f" ({args.level.upper()} level)"
+    )
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())